@@ -8,6 +8,20 @@ Per configurare le API di Prep Business, imposta le seguenti variabili d'ambient
 3. PREP_BUSINESS_API_TIMEOUT - Timeout per le richieste API in secondi (opzionale)
 4. PREP_BUSINESS_MAX_RETRIES - Numero massimo di tentativi in caso di errore (opzionale)
 5. PREP_BUSINESS_RETRY_BACKOFF - Fattore di attesa tra i tentativi (opzionale)
+6. PREP_BUSINESS_POOL_MAXSIZE - Connessioni keep-alive mantenute dal client condiviso (opzionale)
+7. PREP_BUSINESS_CACHE_ENABLED / _MAXSIZE / _REDIS_URL / _TTLS - Cache delle risposte (opzionale)
+8. PREP_BUSINESS_RATE_LIMIT / _RATE_BURST / _MERCHANT_RATE_LIMIT / _MERCHANT_RATE_BURST - Rate limiter (opzionale)
+9. PREP_BUSINESS_CIRCUIT_FAILURES / _CIRCUIT_SLOW_SECONDS / _CIRCUIT_RESET_SECONDS - Circuit breaker (opzionale)
+10. PREP_BUSINESS_VALIDATION_MODE / PREP_BUSINESS_FAST_JSON - Parsing delle risposte (opzionale)
+11. PREP_BUSINESS_TRANSPORT - Registrazione/replay delle chiamate API, es. "record:/tmp/pb" (opzionale)
+12. PREP_BUSINESS_MIRROR_SYNC_SECONDS / _MIRROR_FULL_SYNC_HOUR - Sincronizzazione del mirror locale delle spedizioni (opzionale)
+13. PREP_BUSINESS_MERCHANT_REFRESH_SECONDS - Aggiornamento della directory dei merchant (opzionale)
+14. PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS / _WEBHOOK_STUCK_SECONDS - Recupero dei webhook rimasti in coda (opzionale)
+15. PREP_BUSINESS_WEBHOOK_LANES - Corsie ordinate per l'elaborazione parallela dei webhook (opzionale)
+16. PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS - Accorpamento delle raffiche di webhook della stessa spedizione (opzionale)
+17. PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS / _WEBHOOK_RETRY_BASE_SECONDS / _WEBHOOK_RETRY_MAX_SECONDS - Retry dei webhook falliti (opzionale)
+18. PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS / _WEBHOOK_ARCHIVE_PURGE_MONTHS - Archiviazione compressa dei payload dei webhook (opzionale)
+19. PREP_BUSINESS_ASYNC_MAX_CONCURRENCY - Richieste in parallelo del client asincrono nei download in blocco (opzionale)
 
 Puoi impostare queste variabili in uno dei seguenti modi:
 - Variabili d'ambiente del sistema
@@ -30,6 +44,80 @@ PREP_BUSINESS_API_TIMEOUT = int(os.getenv('PREP_BUSINESS_API_TIMEOUT', '30'))
 PREP_BUSINESS_MAX_RETRIES = int(os.getenv('PREP_BUSINESS_MAX_RETRIES', '3'))
 PREP_BUSINESS_RETRY_BACKOFF = float(os.getenv('PREP_BUSINESS_RETRY_BACKOFF', '0.5'))
 
+# Rate limiter del client condiviso (opt-in, richieste/secondo; 0 = disabilitato). I budget valgono
+# per processo: il tetto reale verso l'API è il budget moltiplicato per i processi gunicorn e Celery.
+# Il limite per merchant si applica solo con il limite globale attivo
+PREP_BUSINESS_RATE_LIMIT = float(os.getenv('PREP_BUSINESS_RATE_LIMIT', '0'))
+PREP_BUSINESS_RATE_BURST = int(os.getenv('PREP_BUSINESS_RATE_BURST', '20'))
+PREP_BUSINESS_MERCHANT_RATE_LIMIT = float(os.getenv('PREP_BUSINESS_MERCHANT_RATE_LIMIT', '0'))
+PREP_BUSINESS_MERCHANT_RATE_BURST = int(os.getenv('PREP_BUSINESS_MERCHANT_RATE_BURST', '10'))
+
+# Circuit breaker (opt-in): dopo N errori consecutivi le chiamate falliscono subito per
+# _RESET_SECONDS secondi; 0 = disabilitato. Le chiamate riuscite ma più lente di _SLOW_SECONDS
+# contano come errori solo se _SLOW_SECONDS > 0 (le pagine grandi sono lente ma sane)
+PREP_BUSINESS_CIRCUIT_FAILURES = int(os.getenv('PREP_BUSINESS_CIRCUIT_FAILURES', '0'))
+PREP_BUSINESS_CIRCUIT_SLOW_SECONDS = float(os.getenv('PREP_BUSINESS_CIRCUIT_SLOW_SECONDS', '0'))
+PREP_BUSINESS_CIRCUIT_RESET_SECONDS = float(os.getenv('PREP_BUSINESS_CIRCUIT_RESET_SECONDS', '30'))
+
+# Parsing delle risposte: 'validate' (model_validate completo) o 'lazy' (gli elementi delle
+# liste vengono validati al primo accesso); FAST_JSON decodifica con orjson se installato
+PREP_BUSINESS_VALIDATION_MODE = os.getenv('PREP_BUSINESS_VALIDATION_MODE', 'validate')
+PREP_BUSINESS_FAST_JSON = os.getenv('PREP_BUSINESS_FAST_JSON', 'false').lower() in ('1', 'true', 'yes')
+
+# Transport del client condiviso: vuoto = API reale, "record:<dir>" salva ogni scambio su disco,
+# "replay:<dir>" risponde solo dalle registrazioni (benchmark e test offline)
+PREP_BUSINESS_TRANSPORT = os.getenv('PREP_BUSINESS_TRANSPORT', '')
+
+# Mirror locale delle spedizioni: sincronizzazione incrementale ogni N secondi (0 = disabilitata)
+# e riconciliazione completa una volta al giorno all'ora indicata (-1 = disabilitata)
+PREP_BUSINESS_MIRROR_SYNC_SECONDS = int(os.getenv('PREP_BUSINESS_MIRROR_SYNC_SECONDS', '300'))
+PREP_BUSINESS_MIRROR_FULL_SYNC_HOUR = int(os.getenv('PREP_BUSINESS_MIRROR_FULL_SYNC_HOUR', '3'))
+
+# Directory locale dei merchant: aggiornamento dall'API ogni N secondi (0 = disabilitato)
+PREP_BUSINESS_MERCHANT_REFRESH_SECONDS = int(os.getenv('PREP_BUSINESS_MERCHANT_REFRESH_SECONDS', '900'))
+
+# Coda dei webhook: ogni N secondi rimette in coda i webhook non ancora presi da un worker
+# (0 = disabilitato) e quelli in elaborazione da più di _STUCK_SECONDS (worker morto).
+# _STUCK_SECONDS è anche il limite rigido dei task che elaborano i webhook
+PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS = int(os.getenv('PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS', '60'))
+PREP_BUSINESS_WEBHOOK_STUCK_SECONDS = int(os.getenv('PREP_BUSINESS_WEBHOOK_STUCK_SECONDS', '900'))
+# Corsie della coda webhook: i webhook della stessa spedizione finiscono sempre nella stessa
+# corsia e sono elaborati in ordine; corsie diverse vanno in parallelo sui worker
+PREP_BUSINESS_WEBHOOK_LANES = int(os.getenv('PREP_BUSINESS_WEBHOOK_LANES', '16'))
+# Raffiche di webhook della stessa spedizione: ognuno attende N secondi e, se nel frattempo ne
+# arriva uno più recente della stessa famiglia, viene superato (0 = disabilitato)
+PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS = int(os.getenv('PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS', '0'))
+# Webhook la cui elaborazione fallisce: nuovo tentativo con backoff esponenziale (base * 2^n,
+# al massimo _MAX_SECONDS, con jitter); dopo _MAX_ATTEMPTS tentativi finisce in dead letter
+PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS', '5'))
+PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS = int(os.getenv('PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS', '60'))
+PREP_BUSINESS_WEBHOOK_RETRY_MAX_SECONDS = int(os.getenv('PREP_BUSINESS_WEBHOOK_RETRY_MAX_SECONDS', '3600'))
+# Payload dei webhook elaborati da più di N giorni: spostati compressi nell'archivio, ogni notte
+# (0 = disabilitato); l'archivio dei mesi più vecchi di _PURGE_MONTHS viene eliminato (0 = mai)
+PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS = int(os.getenv('PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS', '30'))
+PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS = int(os.getenv('PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS', '0'))
+
+# Pool di connessioni del client condiviso (libs.prepbusiness.registry)
+PREP_BUSINESS_POOL_MAXSIZE = int(os.getenv('PREP_BUSINESS_POOL_MAXSIZE', '20'))
+# Client asincrono: richieste in volo contemporaneamente nei download in blocco (es. items di
+# molte spedizioni outbound), qualunque sia il numero di spedizioni richieste
+PREP_BUSINESS_ASYNC_MAX_CONCURRENCY = int(os.getenv('PREP_BUSINESS_ASYNC_MAX_CONCURRENCY', '10'))
+
+# Cache delle risposte per merchants, warehouses, services, channels e singoli item di inventario
+PREP_BUSINESS_CACHE_ENABLED = os.getenv('PREP_BUSINESS_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PREP_BUSINESS_CACHE_MAXSIZE = int(os.getenv('PREP_BUSINESS_CACHE_MAXSIZE', '512'))
+# Per quanti secondi dopo la scadenza una voce può ancora essere servita a circuito aperto
+PREP_BUSINESS_CACHE_STALE_TTL = int(os.getenv('PREP_BUSINESS_CACHE_STALE_TTL', '3600'))
+# Livello condiviso tra gunicorn e Celery: di default lo stesso Redis del broker
+PREP_BUSINESS_CACHE_REDIS_URL = os.getenv('PREP_BUSINESS_CACHE_REDIS_URL', os.getenv('REDIS_URL', ''))
+# TTL per endpoint in secondi, es. "merchants=3600,inventory_item=300"
+PREP_BUSINESS_CACHE_TTLS = {
+    name.strip(): int(ttl)
+    for name, ttl in (
+        pair.split('=', 1) for pair in os.getenv('PREP_BUSINESS_CACHE_TTLS', '').split(',') if '=' in pair
+    )
+}
+
 # Headers predefiniti
 DEFAULT_HEADERS = {
     'Authorization': f'Bearer {PREP_BUSINESS_API_KEY}',
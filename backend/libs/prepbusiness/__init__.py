@@ -3,8 +3,9 @@ PrepBusiness - Libreria client per l'API di Prep Business.
 """
 
 from .client import PrepBusinessClient
+from .async_client import AsyncPrepBusinessClient, HTTPX_AVAILABLE
 from .models import (
-    PrepBusinessError, AuthenticationError, PaginatedResponse,
+    PrepBusinessError, AuthenticationError, RateLimitError, CircuitOpenError, PaginatedResponse,
     Webhook, WebhooksResponse, WebhookResponse, DeleteWebhookResponse,
     WebhookTypes, InvoiceWebhookTypes, InboundShipmentWebhookTypes, 
     OutboundShipmentWebhookTypes, OrderWebhookTypes
@@ -15,8 +16,12 @@ __version__ = '1.0.0'
 
 __all__ = [
     'PrepBusinessClient',
+    'AsyncPrepBusinessClient',
+    'HTTPX_AVAILABLE',
     'PrepBusinessError',
     'AuthenticationError',
+    'RateLimitError',
+    'CircuitOpenError',
     'PaginatedResponse',
     'Webhook',
     'WebhooksResponse',
@@ -0,0 +1,695 @@
+"""
+Client asincrono per l'API di Prep Business.
+
+Espone come coroutine un sottoinsieme dei metodi di PrepBusinessClient, quelli
+dei flussi di lettura e delle spedizioni inbound, su uno stack HTTP asyncio
+(httpx) con un pool di connessioni condiviso e limitato, così che i flussi che
+oggi fanno decine di chiamate sequenziali (ricerca spedizioni, creazione
+residual) possano emetterle in parallelo da un solo worker. Per tutto il resto
+(canali, scritture su inventario e spedizioni outbound, singolo ordine, upload
+di ordini ed etichette, webhook, fatture, rettifiche, get_paginated e gli
+iteratori) si usa PrepBusinessClient.
+"""
+
+import asyncio
+import time
+import logging
+from typing import Optional, Dict, Any, List
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError as e:
+    # Log error but allow import to succeed for development without full dependencies
+    logging.error(f"httpx library not available: {e}")
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401 - richiesto da httpx per HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+from .client import PrepBusinessConfig
+from .ratelimit import AdaptiveRateLimiter, is_throttled, retry_after_seconds
+from .circuit import CircuitBreaker
+from .metrics import RequestMetrics, get_request_metrics
+from .parsing import parse_model, loads, ORJSON_AVAILABLE, VALIDATE, VALIDATION_MODES
+from .search import SearchQuery
+from .models import (
+    PrepBusinessError, AuthenticationError, RateLimitError, CircuitOpenError,
+    ChargesResponse, InventoryResponse, InventoryItemResponse, InventorySearchResponse,
+    InboundShipmentsResponse, InboundShipmentResponse, Carrier, CreateInboundShipmentResponse,
+    SubmitInboundShipmentResponse, RemoveItemFromShipmentResponse, AddItemToShipmentResponse,
+    ShipmentItemsResponse, ExpectedItemUpdate, ActualItemUpdate, UpdateShipmentItemResponse,
+    OutboundShipmentsResponse, OutboundShipmentResponse, OutboundShipmentItemsResponse,
+    OrdersResponse, ServicesResponse, WarehousesResponse, MerchantsResponse
+)
+
+logger = logging.getLogger('prep_business')
+
+
+class AsyncPrepBusinessClient:
+    """Asyncio client for the PrepBusiness API.
+
+    Provides a subset of the PrepBusinessClient methods as coroutines, with
+    the same signatures and response models:
+
+    - ``get``, ``post``
+    - ``get_charges``
+    - ``get_inventory``, ``get_inventory_item``, ``search_inventory``
+    - ``get_inbound_shipments``, ``get_inbound_shipment``, ``create_inbound_shipment``,
+      ``submit_inbound_shipment``, ``add_item_to_shipment``, ``remove_item_from_shipment``,
+      ``get_inbound_shipment_items`` (alias ``get_shipment_items``), ``update_shipment_item``
+    - ``get_outbound_shipments``, ``get_archived_outbound_shipments``, ``get_outbound_shipment``,
+      ``get_outbound_shipment_items``, ``get_many_outbound_shipment_items``
+    - ``get_orders``, ``get_services``, ``get_warehouses``, ``get_merchants``
+
+    Everything else (channels, inventory writes, the other inbound shipment
+    writes, outbound shipment writes, single orders, order and label uploads,
+    webhooks, invoices, adjustments, ``get_paginated`` and the ``iter_*`` /
+    ``stream_*`` iterators) is only on PrepBusinessClient.
+
+    All calls made through one instance share a single bounded connection
+    pool (HTTP/2 when the ``h2`` package is installed), so many requests can
+    be in flight concurrently without opening a new connection each time.
+
+    Usage::
+
+        async with AsyncPrepBusinessClient(api_key, domain, max_concurrency=10) as client:
+            results = await client.get_many_outbound_shipment_items(shipment_ids, merchant_id=mid)
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        company_domain: str,
+        timeout: Optional[int] = None,
+        use_query_auth: bool = False,
+        default_merchant_id: Optional[int] = None,
+        default_per_page: int = 50,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        max_concurrency: int = 10,
+        http2: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        validation_mode: str = VALIDATE,
+        fast_json: bool = False,
+        scheme: str = "https",
+        metrics: Optional[RequestMetrics] = None,
+        transport: Optional["httpx.AsyncBaseTransport"] = None
+    ) -> None:
+        """Initialize the async PrepBusiness client.
+
+        Args:
+            api_key: Your PrepBusiness API key
+            company_domain: Your company domain (e.g. portal.yourcompany.com)
+            timeout: Optional request timeout in seconds
+            use_query_auth: Whether to use query parameter authentication instead of Bearer token
+            default_merchant_id: Optional default merchant ID to use for requests
+            default_per_page: Default number of items per page for paginated requests
+            max_connections: Upper bound of concurrent connections in the shared pool
+            max_keepalive_connections: Idle connections kept open for reuse
+            max_concurrency: Requests in flight at once in the batch helpers
+                (get_many_outbound_shipment_items)
+            http2: Negotiate HTTP/2 when the ``h2`` package is available
+            max_retries: Retries of a request throttled by the API (429)
+            retry_backoff: Base backoff in seconds when the API sends no Retry-After
+            rate_limiter: Optional AdaptiveRateLimiter, e.g. shared with a sync client
+            circuit_breaker: Optional CircuitBreaker, e.g. shared with a sync client
+            validation_mode: 'validate' or 'lazy', as in PrepBusinessClient
+            fast_json: Decode response bodies with orjson when it is installed
+            scheme: URL scheme, 'https' (default) or 'http' for a local stand-in
+            metrics: Optional RequestMetrics registry; the process-wide one by default
+            transport: Optional httpx transport replacing the network one
+                (e.g. httpx.MockTransport in tests); the pool limits then do not apply
+
+        Raises:
+            ImportError: If httpx is not installed
+        """
+        if not HTTPX_AVAILABLE:
+            raise ImportError("httpx is required for AsyncPrepBusinessClient (pip install 'httpx[http2]')")
+
+        self.config = PrepBusinessConfig(
+            api_key=api_key,
+            company_domain=company_domain,
+            timeout=timeout or 30,
+            use_query_auth=use_query_auth,
+            default_merchant_id=default_merchant_id,
+            default_per_page=default_per_page,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            scheme=scheme
+        )
+        self._rate_limiter = rate_limiter
+        self._circuit = circuit_breaker
+        self._metrics = metrics
+        if validation_mode not in VALIDATION_MODES:
+            raise ValueError(f"validation_mode must be one of {VALIDATION_MODES}, got {validation_mode!r}")
+        self.validation_mode = validation_mode
+        self._fast_json = fast_json and ORJSON_AVAILABLE
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self._http2 = http2 and HTTP2_AVAILABLE
+        self._transport = transport
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def api_key(self) -> str:
+        return self.config.api_key
+
+    def _base_headers(self) -> Dict[str, str]:
+        """Headers shared by every request (no merchant scoping)."""
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        if not self.config.use_query_auth:
+            headers["Authorization"] = f"Bearer {self.config.api_key}"
+        return headers
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        """Return the shared httpx client, creating it on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.config.scheme}://{self.config.company_domain}/api/",
+                headers=self._base_headers(),
+                timeout=self.config.timeout,
+                limits=self._limits,
+                http2=self._http2,
+                transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "AsyncPrepBusinessClient":
+        self._get_client()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    async def _request(
+        self,
+        method: str,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        merchant_id: Optional[int] = None,
+        page: Optional[int] = None,
+        per_page: Optional[int] = None,
+        search_query: Optional[SearchQuery] = None
+    ) -> Dict[str, Any]:
+        """Make an HTTP request to the PrepBusiness API.
+
+        The merchant header is built per request, never stored on the shared
+        client, so concurrent coroutines for different merchants cannot
+        leak scoping into each other.
+
+        Args:
+            method: HTTP method (GET, POST, etc.)
+            endpoint: API endpoint path
+            params: Optional query parameters
+            json: Optional JSON body
+            headers: Optional custom headers
+            merchant_id: Optional merchant ID to use for this request
+            page: Optional page number for paginated requests
+            per_page: Optional number of items per page
+            search_query: Optional search query to filter results
+
+        Returns:
+            Dict containing the API response
+
+        Raises:
+            AuthenticationError: If authentication fails
+            PrepBusinessError: For other API errors with error details
+        """
+        request_params = dict(params or {})
+        if self.config.use_query_auth:
+            request_params["api_token"] = self.config.api_key
+        if page is not None:
+            request_params["page"] = page
+        if per_page is not None:
+            request_params["per_page"] = per_page
+        if search_query is not None:
+            query_str = search_query.build()
+            if query_str:
+                request_params["q"] = query_str
+
+        request_headers = {}
+        merchant_id = merchant_id or self.config.default_merchant_id
+        if merchant_id is not None:
+            request_headers["X-Selected-Client-Id"] = str(merchant_id)
+        if headers:
+            request_headers.update(headers)
+
+        request_started = time.monotonic()
+        response = None
+        attempt = 0
+        outcome = "error"
+        try:
+            while True:
+                response = None
+                if self._circuit is not None:
+                    self._circuit.before_call()
+                if self._rate_limiter is not None:
+                    wait = self._rate_limiter.reserve(merchant_id)
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                started = time.monotonic()
+                try:
+                    response = await self._get_client().request(
+                        method,
+                        endpoint.lstrip('/'),
+                        params=request_params,
+                        json=json,
+                        headers=request_headers
+                    )
+                except httpx.HTTPError as e:
+                    if self._circuit is not None:
+                        self._circuit.record_failure(e)
+                    raise PrepBusinessError(f"API request failed: {str(e)}") from e
+                except BaseException:
+                    # Task cancellato (es. gather interrotto): libera l'eventuale chiamata di prova
+                    if self._circuit is not None:
+                        self._circuit.release()
+                    raise
+                if self._circuit is not None:
+                    if response.status_code >= 500 and not is_throttled(response):
+                        self._circuit.record_failure(f"HTTP {response.status_code} su {endpoint}")
+                    else:
+                        self._circuit.record_success(time.monotonic() - started)
+
+                if not is_throttled(response):
+                    if self._rate_limiter is not None:
+                        self._rate_limiter.on_success(merchant_id)
+                    break
+
+                retry_after = retry_after_seconds(response, attempt, self.config.retry_backoff)
+                if self._rate_limiter is not None:
+                    self._rate_limiter.on_throttled(merchant_id, retry_after)
+                if attempt >= self.config.max_retries or retry_after > self.config.max_retry_wait:
+                    raise RateLimitError(
+                        f"API rate limit exceeded (Status: {response.status_code}, retry after {retry_after:.1f}s)",
+                        retry_after=retry_after
+                    )
+                attempt += 1
+                logger.warning(
+                    f"[AsyncPrepBusinessClient] Throttling {response.status_code} su {method} {endpoint}: "
+                    f"nuovo tentativo {attempt}/{self.config.max_retries} tra {retry_after:.1f}s"
+                )
+                if self._rate_limiter is None:
+                    await asyncio.sleep(retry_after)
+
+            if response.status_code == 401:
+                raise AuthenticationError("Invalid API key or authentication failed")
+
+            if response.status_code >= 400:
+                error_msg = "API request failed"
+                try:
+                    error_data = response.json()
+                    if isinstance(error_data, dict):
+                        error_msg = error_data.get('message', error_msg)
+                        if 'errors' in error_data:
+                            error_msg += f"\nDetails: {error_data['errors']}"
+                except ValueError:
+                    error_msg = response.text or error_msg
+
+                raise PrepBusinessError(f"{error_msg} (Status: {response.status_code})")
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        finally:
+            (self._metrics if self._metrics is not None else get_request_metrics()).observe(
+                method,
+                endpoint,
+                merchant_id,
+                response.status_code if response is not None else outcome,
+                time.monotonic() - request_started,
+                bytes_received=response.num_bytes_downloaded if response is not None else None,
+                retries=attempt,
+                client="AsyncPrepBusinessClient"
+            )
+
+        if self._fast_json:
+            return loads(response.content)
+        return response.json()
+
+    async def get(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        merchant_id: Optional[int] = None,
+        page: Optional[int] = None,
+        per_page: Optional[int] = None,
+        search_query: Optional[SearchQuery] = None
+    ) -> Dict[str, Any]:
+        """Make a GET request to the PrepBusiness API."""
+        return await self._request(
+            "GET",
+            endpoint,
+            params=params,
+            merchant_id=merchant_id,
+            page=page,
+            per_page=per_page,
+            search_query=search_query
+        )
+
+    async def post(
+        self,
+        endpoint: str,
+        json: Optional[Dict[str, Any]] = None,
+        merchant_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Make a POST request to the PrepBusiness API."""
+        return await self._request("POST", endpoint, json=json, merchant_id=merchant_id)
+
+    async def get_charges(
+        self,
+        merchant_id: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 100
+    ) -> ChargesResponse:
+        """Get a paginated list of charges. See PrepBusinessClient.get_charges."""
+        response = await self._request(
+            "GET",
+            "/billing/charges",
+            params={"page": page, "per_page": min(per_page, 100)},  # API limit is 100 items per page
+            merchant_id=merchant_id
+        )
+        return parse_model(ChargesResponse, response, self.validation_mode)
+
+    async def get_inventory(
+        self,
+        merchant_id: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 500,
+        search_query: Optional[SearchQuery] = None
+    ) -> InventoryResponse:
+        """Get a page of inventory items. See PrepBusinessClient.get_inventory."""
+        params = {
+            "page": page,
+            "per_page": min(per_page, 500)  # API limit is 500 items per page
+        }
+        if search_query:
+            params["search"] = str(search_query)
+
+        response = await self._request("GET", "/inventory", params=params, merchant_id=merchant_id)
+        return parse_model(InventoryResponse, response, self.validation_mode)
+
+    async def get_inventory_item(
+        self,
+        item_id: int,
+        merchant_id: Optional[int] = None
+    ) -> InventoryItemResponse:
+        """Get a single inventory item. See PrepBusinessClient.get_inventory_item."""
+        response = await self._request("GET", f"/inventory/{item_id}", merchant_id=merchant_id)
+        return parse_model(InventoryItemResponse, response, self.validation_mode)
+
+    async def search_inventory(self, query: str, merchant_id: Optional[int] = None) -> InventorySearchResponse:
+        """Search inventory by title, SKU or identifiers. See PrepBusinessClient.search_inventory."""
+        response = await self._request("POST", "/inventory/search", json={"q": query}, merchant_id=merchant_id)
+        return parse_model(InventorySearchResponse, response, self.validation_mode)
+
+    async def get_inbound_shipments(
+        self,
+        page: int = 1,
+        per_page: int = 20,
+        merchant_id: Optional[int] = None
+    ) -> InboundShipmentsResponse:
+        """Get a page of inbound shipments. See PrepBusinessClient.get_inbound_shipments."""
+        response = await self._request(
+            "GET",
+            "/shipments/inbound",
+            params={"page": page, "per_page": per_page},
+            merchant_id=merchant_id
+        )
+        return parse_model(InboundShipmentsResponse, response, self.validation_mode)
+
+    async def get_inbound_shipment(
+        self,
+        shipment_id: int,
+        merchant_id: Optional[int] = None
+    ) -> InboundShipmentResponse:
+        """Get a single inbound shipment. See PrepBusinessClient.get_inbound_shipment."""
+        response = await self._request("GET", f"/shipments/inbound/{shipment_id}", merchant_id=merchant_id)
+        return parse_model(InboundShipmentResponse, response, self.validation_mode)
+
+    async def create_inbound_shipment(
+        self,
+        name: str,
+        warehouse_id: int,
+        notes: Optional[str] = None,
+        merchant_id: Optional[int] = None
+    ) -> CreateInboundShipmentResponse:
+        """Create a new inbound shipment. See PrepBusinessClient.create_inbound_shipment."""
+        data = {
+            "name": name,
+            "warehouse_id": warehouse_id
+        }
+        if notes is not None:
+            data["notes"] = notes
+
+        response = await self._request("POST", "/shipments/inbound", json=data, merchant_id=merchant_id)
+        return parse_model(CreateInboundShipmentResponse, response, self.validation_mode)
+
+    async def submit_inbound_shipment(
+        self,
+        shipment_id: int,
+        tracking_numbers: Optional[List[str]] = None,
+        carrier: Optional[Carrier] = None,
+        merchant_id: Optional[int] = None
+    ) -> SubmitInboundShipmentResponse:
+        """Submit an inbound shipment. See PrepBusinessClient.submit_inbound_shipment."""
+        if tracking_numbers is None and carrier is None:
+            raise ValueError("Either tracking_numbers or carrier must be provided")
+
+        data = {}
+        if tracking_numbers is not None:
+            data["tracking_numbers"] = tracking_numbers
+        if carrier is not None:
+            data["carrier"] = carrier.value
+
+        response = await self._request(
+            "POST",
+            f"/shipments/inbound/{shipment_id}/submit",
+            json=data,
+            merchant_id=merchant_id
+        )
+        return parse_model(SubmitInboundShipmentResponse, response, self.validation_mode)
+
+    async def remove_item_from_shipment(
+        self,
+        shipment_id: int,
+        item_id: int,
+        merchant_id: Optional[int] = None
+    ) -> RemoveItemFromShipmentResponse:
+        """Remove an item from an inbound shipment. See PrepBusinessClient.remove_item_from_shipment."""
+        response = await self._request(
+            "POST",
+            f"/shipments/inbound/{shipment_id}/remove-item",
+            json={"item_id": item_id},
+            merchant_id=merchant_id
+        )
+        return parse_model(RemoveItemFromShipmentResponse, response, self.validation_mode)
+
+    async def add_item_to_shipment(
+        self,
+        shipment_id: int,
+        item_id: int,
+        quantity: int,
+        merchant_id: Optional[int] = None
+    ) -> AddItemToShipmentResponse:
+        """Add an item to an inbound shipment. See PrepBusinessClient.add_item_to_shipment."""
+        response = await self._request(
+            "POST",
+            f"/shipments/inbound/{shipment_id}/add-item",
+            json={"item_id": item_id, "quantity": quantity},
+            merchant_id=merchant_id
+        )
+        return parse_model(AddItemToShipmentResponse, response, self.validation_mode)
+
+    async def get_inbound_shipment_items(
+        self,
+        shipment_id: int,
+        merchant_id: Optional[int] = None
+    ) -> ShipmentItemsResponse:
+        """Get the items of an inbound shipment. See PrepBusinessClient.get_inbound_shipment_items."""
+        response = await self._request(
+            "GET",
+            f"/shipments/inbound/{shipment_id}/items",
+            merchant_id=merchant_id
+        )
+        return parse_model(ShipmentItemsResponse, response, self.validation_mode)
+
+    async def update_shipment_item(
+        self,
+        shipment_id: int,
+        item_id: int,
+        expected: ExpectedItemUpdate,
+        actual: ActualItemUpdate,
+        merchant_id: Optional[int] = None
+    ) -> UpdateShipmentItemResponse:
+        """Update an item of an inbound shipment. See PrepBusinessClient.update_shipment_item."""
+        data = {
+            "item_id": item_id,
+            "expected": expected.model_dump(),
+            "actual": actual.model_dump()
+        }
+        response = await self._request(
+            "POST",
+            f"/shipments/inbound/{shipment_id}/update-item",
+            json=data,
+            merchant_id=merchant_id
+        )
+        return parse_model(UpdateShipmentItemResponse, response, self.validation_mode)
+
+    async def get_outbound_shipments(
+        self,
+        page: int = 1,
+        per_page: int = 20,
+        merchant_id: Optional[int] = None
+    ) -> OutboundShipmentsResponse:
+        """Get a page of outbound shipments. See PrepBusinessClient.get_outbound_shipments."""
+        response = await self._request(
+            "GET",
+            "/shipments/outbound",
+            params={"page": page, "per_page": per_page},
+            merchant_id=merchant_id
+        )
+        return parse_model(OutboundShipmentsResponse, response, self.validation_mode)
+
+    async def get_archived_outbound_shipments(
+        self,
+        page: int = 1,
+        per_page: int = 20,
+        merchant_id: Optional[int] = None,
+        search_query: Optional[str] = None
+    ) -> OutboundShipmentsResponse:
+        """Get a page of archived outbound shipments. See PrepBusinessClient.get_archived_outbound_shipments."""
+        params = {
+            "page": page,
+            "per_page": per_page
+        }
+        if search_query:
+            params["q"] = search_query
+        response = await self._request(
+            "GET",
+            "/shipments/outbound/archived",
+            params=params,
+            merchant_id=merchant_id
+        )
+        return parse_model(OutboundShipmentsResponse, response, self.validation_mode)
+
+    async def get_outbound_shipment(
+        self,
+        shipment_id: int,
+        merchant_id: Optional[int] = None
+    ) -> OutboundShipmentResponse:
+        """Get a single outbound shipment. See PrepBusinessClient.get_outbound_shipment."""
+        response = await self._request("GET", f"/shipments/outbound/{shipment_id}", merchant_id=merchant_id)
+        return parse_model(OutboundShipmentResponse, response, self.validation_mode)
+
+    async def get_outbound_shipment_items(
+        self,
+        shipment_id: int,
+        merchant_id: Optional[int] = None
+    ) -> OutboundShipmentItemsResponse:
+        """Get the items of an outbound shipment. See PrepBusinessClient.get_outbound_shipment_items."""
+        response = await self._request(
+            "GET",
+            f"/shipments/outbound/{shipment_id}/outbound-shipment-item",
+            merchant_id=merchant_id
+        )
+        return parse_model(OutboundShipmentItemsResponse, response, self.validation_mode)
+
+    async def get_orders(
+        self,
+        page: int = 1,
+        per_page: int = 20,
+        status: Optional[str] = None,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        merchant_id: Optional[str] = None
+    ) -> OrdersResponse:
+        """Get a page of orders. See PrepBusinessClient.get_orders."""
+        params = {
+            "page": page,
+            "per_page": per_page
+        }
+        if status:
+            params["status"] = status
+        if from_date:
+            params["from_date"] = from_date
+        if to_date:
+            params["to_date"] = to_date
+        if merchant_id:
+            params["merchant_id"] = merchant_id
+
+        response = await self._request("GET", "/orders", params=params)
+        return OrdersResponse(**response)
+
+    async def get_services(self, merchant_id: Optional[int] = None) -> ServicesResponse:
+        """Get the warehouse services. See PrepBusinessClient.get_services."""
+        response = await self._request("GET", "/services", merchant_id=merchant_id)
+        return parse_model(ServicesResponse, response, self.validation_mode)
+
+    async def get_warehouses(self, merchant_id: Optional[int] = None) -> WarehousesResponse:
+        """Get the merchant warehouses. See PrepBusinessClient.get_warehouses."""
+        response = await self._request("GET", "/warehouses", merchant_id=merchant_id)
+        return parse_model(WarehousesResponse, response, self.validation_mode)
+
+    async def get_merchants(self) -> MerchantsResponse:
+        """Get all merchants. See PrepBusinessClient.get_merchants."""
+        response = await self._request("GET", "/merchants")
+        return parse_model(MerchantsResponse, response, self.validation_mode)
+
+    async def get_shipment_items(
+        self,
+        shipment_id: int,
+        merchant_id: Optional[int] = None
+    ) -> ShipmentItemsResponse:
+        """Alias di get_inbound_shipment_items, come in PrepBusinessClient."""
+        return await self.get_inbound_shipment_items(shipment_id, merchant_id=merchant_id)
+
+    async def get_many_outbound_shipment_items(
+        self,
+        shipment_ids: List[int],
+        merchant_id: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+    ) -> Dict[int, Any]:
+        """Fetch the items of several outbound shipments concurrently.
+
+        At most ``max_concurrency`` requests are in flight at once, however
+        many IDs are passed.
+
+        Args:
+            shipment_ids: IDs of the outbound shipments
+            merchant_id: Optional merchant ID to use for these requests
+            max_concurrency: Requests in flight at once (default: the client's max_concurrency)
+
+        Returns:
+            Dict mapping each shipment ID to its OutboundShipmentItemsResponse,
+            or to the exception raised while fetching it
+        """
+        semaphore = asyncio.Semaphore(max(max_concurrency or self.max_concurrency, 1))
+
+        async def fetch(shipment_id: int) -> OutboundShipmentItemsResponse:
+            async with semaphore:
+                return await self.get_outbound_shipment_items(shipment_id, merchant_id=merchant_id)
+
+        results = await asyncio.gather(*[fetch(sid) for sid in shipment_ids], return_exceptions=True)
+        return dict(zip(shipment_ids, results))
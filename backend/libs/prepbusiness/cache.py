@@ -0,0 +1,266 @@
+"""
+Cache delle risposte per gli endpoint PrepBusiness che cambiano raramente.
+
+Due livelli:
+- locale al processo: LRU limitato in dimensione, con TTL per endpoint;
+- condiviso (opzionale): Redis, così gunicorn e i worker Celery vedono le stesse voci.
+
+Le voci sono salvate come JSON serializzato: ogni lettura restituisce un dict
+nuovo, quindi i chiamanti possono modificarlo senza sporcare la cache.
+
+Scaduto il TTL una voce resta disponibile come "stale" per ``stale_ttl``
+secondi: non viene più servita normalmente, ma il client la usa quando il
+circuit breaker è aperto e l'API non è raggiungibile.
+"""
+
+import json
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError as e:
+    # Log error but allow import to succeed for development without full dependencies
+    logging.error(f"redis library not available: {e}")
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger('prep_business')
+
+# TTL predefiniti in secondi per ogni endpoint in cache
+DEFAULT_TTLS: Dict[str, int] = {
+    'merchants': 3600,
+    'warehouses': 3600,
+    'services': 3600,
+    'channels': 600,
+    'inventory_item': 300,
+}
+
+# Endpoint (path senza /api/) -> nome della voce di cache
+CACHEABLE_ENDPOINTS: List[Tuple[str, "re.Pattern"]] = [
+    ('merchants', re.compile(r'^merchants$')),
+    ('warehouses', re.compile(r'^warehouses$')),
+    ('services', re.compile(r'^services$')),
+    ('channels', re.compile(r'^channels$')),
+    ('inventory_item', re.compile(r'^inventory/\d+$')),
+]
+
+
+class ResponseCache:
+    """TTL + LRU cache for GET responses, with an optional shared Redis tier.
+
+    Keys have the form ``<namespace>:<name>:<merchant>:<path>?<params>`` so
+    entries can be invalidated per endpoint, per merchant or per resource.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        maxsize: int = 512,
+        redis_url: Optional[str] = None,
+        namespace: str = 'prepbusiness:cache',
+        stale_ttl: int = 3600
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            ttls: Per-endpoint TTLs in seconds, merged over DEFAULT_TTLS
+            maxsize: Maximum number of entries kept in the local LRU tier
+            redis_url: Optional Redis URL for the tier shared across processes
+            namespace: Prefix of every Redis key
+            stale_ttl: Seconds an expired entry is kept for get(allow_stale=True)
+        """
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'redis_hits': 0, 'misses': 0, 'stale_hits': 0, 'evictions': 0, 'invalidations': 0}
+
+        self._redis = None
+        self._redis_retry_at = 0.0
+        if redis_url and REDIS_AVAILABLE:
+            try:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+            except Exception as e:
+                logger.error(f"[ResponseCache] Redis non disponibile ({e}), uso solo la cache locale")
+                self._redis = None
+
+    def match(self, endpoint: str) -> Optional[str]:
+        """Return the cache name of an endpoint, or None if it is not cacheable."""
+        path = endpoint.strip('/')
+        for name, pattern in CACHEABLE_ENDPOINTS:
+            if name in self.ttls and self.ttls[name] > 0 and pattern.match(path):
+                return name
+        return None
+
+    def make_key(
+        self,
+        name: str,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        merchant_id: Optional[int] = None
+    ) -> str:
+        """Build the cache key of a request."""
+        path = endpoint.strip('/')
+        query = '&'.join(
+            f"{k}={v}" for k, v in sorted((params or {}).items()) if k != 'api_token'
+        )
+        merchant = merchant_id if merchant_id is not None else '-'
+        return f"{self.namespace}:{name}:{merchant}:{path}?{query}"
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """Return a fresh copy of the cached response, or None on miss.
+
+        Args:
+            key: Cache key built by make_key
+            allow_stale: Also return entries expired less than ``stale_ttl`` seconds ago
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return json.loads(payload)
+                if expires_at + self.stale_ttl <= now:
+                    del self._entries[key]
+                elif allow_stale:
+                    self._stats['stale_hits'] += 1
+                    return json.loads(payload)
+
+        if self._redis_usable():
+            try:
+                pipe = self._redis.pipeline()
+                pipe.get(key)
+                pipe.ttl(key)
+                payload, remaining = pipe.execute()
+            except Exception as e:
+                self._redis_failed(e)
+                payload = None
+            if payload is not None:
+                payload = payload.decode() if isinstance(payload, bytes) else payload
+                # In Redis la voce vive ttl + stale_ttl: la parte fresca è ciò che avanza oltre stale_ttl
+                fresh_for = (remaining if remaining and remaining > 0 else 0) - self.stale_ttl
+                if fresh_for > 0 or allow_stale:
+                    self._store_local(key, payload, fresh_for)
+                    with self._lock:
+                        self._stats['redis_hits' if fresh_for > 0 else 'stale_hits'] += 1
+                    return json.loads(payload)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a response in both tiers with the TTL of its endpoint."""
+        name = key[len(self.namespace) + 1:].split(':', 1)[0]
+        ttl = self.ttls.get(name, 0)
+        if ttl <= 0:
+            return
+        payload = json.dumps(value, default=str)
+        self._store_local(key, payload, ttl)
+        if self._redis_usable():
+            try:
+                self._redis.setex(key, ttl + self.stale_ttl, payload)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def invalidate(
+        self,
+        name: Optional[str] = None,
+        merchant_id: Optional[int] = None,
+        path: Optional[str] = None
+    ) -> int:
+        """Drop cached entries.
+
+        Args:
+            name: Cache name (e.g. 'merchants'); all endpoints if None
+            merchant_id: Only entries of this merchant; all merchants if None
+            path: Only entries of this resource path (e.g. 'inventory/123')
+
+        Returns:
+            Number of local entries removed
+        """
+        def matches(key: str) -> bool:
+            entry_name, entry_merchant, rest = key[len(self.namespace) + 1:].split(':', 2)
+            if name is not None and entry_name != name:
+                return False
+            if merchant_id is not None and entry_merchant != str(merchant_id):
+                return False
+            if path is not None and rest.split('?', 1)[0] != path.strip('/'):
+                return False
+            return True
+
+        with self._lock:
+            doomed = [key for key in self._entries if matches(key)]
+            for key in doomed:
+                del self._entries[key]
+            self._stats['invalidations'] += len(doomed)
+
+        if self._redis_usable():
+            pattern = (
+                f"{self.namespace}:{name or '*'}:"
+                f"{merchant_id if merchant_id is not None else '*'}:"
+                f"{path.strip('/') + '?' if path is not None else ''}*"
+            )
+            try:
+                keys = list(self._redis.scan_iter(match=pattern, count=500))
+                if keys:
+                    self._redis.delete(*keys)
+            except Exception as e:
+                self._redis_failed(e)
+
+        return len(doomed)
+
+    def invalidate_for_write(self, endpoint: str) -> None:
+        """Invalidate the cached resources affected by a write to ``endpoint``.
+
+        A write to ``inventory/123`` or ``inventory/123/identifier`` drops the
+        cached ``inventory/123``.
+        """
+        segments = endpoint.strip('/').split('/')
+        for length in range(len(segments), 0, -1):
+            candidate = '/'.join(segments[:length])
+            name = self.match(candidate)
+            if name is not None:
+                self.invalidate(name=name, path=candidate)
+
+    def clear(self) -> None:
+        """Drop every entry of both tiers."""
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size of the local tier."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        stats['maxsize'] = self.maxsize
+        stats['redis'] = self._redis is not None
+        return stats
+
+    def _redis_usable(self) -> bool:
+        """Redis is skipped for a while after an error, so an outage never slows down the API calls."""
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception) -> None:
+        logger.warning(f"[ResponseCache] Redis non raggiungibile ({error}), riprovo tra 30s")
+        self._redis_retry_at = time.monotonic() + 30
+
+    def _store_local(self, key: str, payload: str, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
@@ -0,0 +1,156 @@
+"""
+Circuit breaker per le chiamate all'API di Prep Business.
+
+Quando la dashboard è giù o lentissima, ogni chiamata aspetterebbe l'intero
+timeout tenendo occupate le greenlet di gunicorn e i worker Celery. Dopo N
+errori consecutivi (errori di rete, timeout, risposte 5xx) o N chiamate
+consecutive più lente della soglia, il circuito si apre: per ``reset_timeout``
+secondi le chiamate falliscono subito con CircuitOpenError. Poi una sola
+chiamata di prova (half-open) decide se richiudere o riaprire il circuito.
+"""
+
+import time
+import threading
+import logging
+from typing import Optional, Dict, Any
+
+from .models import CircuitOpenError
+
+logger = logging.getLogger('prep_business')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Consecutive-failure / slow-call circuit breaker, safe across threads and greenlets."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_seconds: Optional[float] = 10.0,
+        slow_call_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ) -> None:
+        """Initialize the breaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            slow_call_seconds: Latency above which a successful call counts as slow (None disables it)
+            slow_call_threshold: Consecutive slow calls that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call is let through
+        """
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._slow_calls = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._last_error: Optional[str] = None
+        self._stats = {'opened': 0, 'rejected': 0, 'failures': 0, 'slow_calls': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def before_call(self) -> None:
+        """Let a call through or fail fast.
+
+        Raises:
+            CircuitOpenError: If the circuit is open, or half-open with a trial call already in flight
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self._stats['rejected'] += 1
+            retry_after = max(self._opened_at + self.reset_timeout - now, 0.0)
+            last_error = self._last_error
+
+        raise CircuitOpenError(
+            f"PrepBusiness API circuit open, retry in {retry_after:.0f}s (last error: {last_error})",
+            retry_after=retry_after
+        )
+
+    def record_success(self, duration: float) -> None:
+        """Record a completed call; a slow one counts towards ``slow_call_threshold``."""
+        slow = self.slow_call_seconds is not None and duration > self.slow_call_seconds
+        with self._lock:
+            self._trial_in_flight = False
+            self._failures = 0
+            if slow:
+                self._stats['slow_calls'] += 1
+                self._slow_calls += 1
+                if self._state == HALF_OPEN or self._slow_calls >= self.slow_call_threshold:
+                    self._open(f"{self._slow_calls} chiamate lente (ultima {duration:.1f}s)")
+                return
+            self._slow_calls = 0
+            if self._state == HALF_OPEN:
+                logger.info("[CircuitBreaker] Chiamata di prova riuscita, circuito richiuso")
+                self._state = CLOSED
+
+    def record_failure(self, error: Any) -> None:
+        """Record a failed call (network error, timeout, 5xx)."""
+        with self._lock:
+            self._trial_in_flight = False
+            self._stats['failures'] += 1
+            self._failures += 1
+            self._last_error = str(error)[:200]
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(self._last_error)
+
+    def release(self) -> None:
+        """Give back a trial slot taken by before_call for a call that was never sent."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def reset(self) -> None:
+        """Force the circuit closed."""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._slow_calls = 0
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Current state, consecutive counters and totals."""
+        with self._lock:
+            now = time.monotonic()
+            stats = dict(self._stats)
+            stats['state'] = self._current_state(now)
+            stats['consecutive_failures'] = self._failures
+            stats['consecutive_slow_calls'] = self._slow_calls
+            stats['last_error'] = self._last_error
+            stats['retry_in'] = (
+                round(max(self._opened_at + self.reset_timeout - now, 0.0), 1)
+                if self._state == OPEN else 0.0
+            )
+        return stats
+
+    def _current_state(self, now: float) -> str:
+        # Trascorso reset_timeout il circuito aperto passa a half-open (una chiamata di prova)
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def _open(self, reason: Optional[str]) -> None:
+        # Le chiamate partite prima dell'apertura non prolungano il periodo di apertura
+        if self._state == OPEN:
+            return
+        logger.warning(f"[CircuitBreaker] Circuito aperto per {self.reset_timeout:.0f}s: {reason}")
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._stats['opened'] += 1
+        self._last_error = reason
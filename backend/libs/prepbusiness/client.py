@@ -1,24 +1,36 @@
-from typing import Optional, Dict, Any, List, Union, Tuple, TypeVar, Generic
+from typing import Optional, Dict, Any, List, Union, Tuple, TypeVar, Generic, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
+from types import SimpleNamespace
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
+import time
+import logging
 from pydantic import BaseModel, Field
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 from .search import SearchQuery
+from .cache import ResponseCache
+from .singleflight import SingleFlight
+from .ratelimit import AdaptiveRateLimiter, is_throttled, retry_after_seconds
+from .circuit import CircuitBreaker
+from .transport import build_transport
+from .metrics import RequestMetrics, get_request_metrics
+from .parsing import parse_model, loads, iter_json_items, JSONStreamError, ORJSON_AVAILABLE, IJSON_AVAILABLE, VALIDATE, VALIDATION_MODES
 from .models import (
-    PrepBusinessError, AuthenticationError, PaginatedResponse,
+    PrepBusinessError, AuthenticationError, RateLimitError, CircuitOpenError, PaginatedResponse,
     Channel, Listing, ListingResponse,
     Charge, ChargesResponse, ChargeDetailsResponse, InvoicesResponse, CreateInvoiceResponse,
-    InventoryResponse, InventoryItemResponse, InventorySearchResponse, InboundShipmentsResponse,
-    InboundShipmentResponse, Carrier, CreateInboundShipmentResponse, UpdateInboundShipmentResponse,
+    InventoryResponse, InventoryItem, InventoryItemResponse, InventorySearchResponse, InboundShipmentsResponse,
+    InboundShipment, InboundShipmentResponse, Carrier, CreateInboundShipmentResponse, UpdateInboundShipmentResponse,
     SubmitInboundShipmentResponse, ReceiveInboundShipmentResponse, BatchArchiveInboundShipmentsResponse,
     RemoveItemFromShipmentResponse, AddItemToShipmentResponse, ShipmentItemsResponse,
     ExpectedItemUpdate, ActualItemUpdate, UpdateShipmentItemResponse, OutboundShipmentsResponse,
     OutboundShipmentResponse, CreateOutboundShipmentResponse, AddOutboundShipmentAttachmentResponse,
     AddOutboundShipmentItemResponse, OutboundShipmentItemsResponse,
     UpdateOutboundShipmentItemResponse, ItemGroupConfigurationUpdate, OutboundShipment, OutboundShipmentItem,
-    OutboundShipmentItemUpdate, OrdersResponse, OrderResponse, UploadOrdersResponse, OrderUpload,
+    OutboundShipmentItemUpdate, Order, OrdersResponse, OrderResponse, UploadOrdersResponse, OrderUpload,
     Service, ServicesResponse, WarehousesResponse, AdjustmentReason, CreateAdjustmentResponse,
     Merchant, MerchantsResponse, Webhook, WebhooksResponse, WebhookResponse, DeleteWebhookResponse,
     WebhookTypes, InvoiceWebhookTypes, InboundShipmentWebhookTypes, OutboundShipmentWebhookTypes, OrderWebhookTypes
@@ -26,6 +38,8 @@ from .models import (
 
 T = TypeVar('T')
 
+logger = logging.getLogger('prep_business')
+
 class PrepBusinessConfig(BaseModel):
     """Configuration for the PrepBusiness client."""
     api_key: str = Field(..., description="API key for authentication")
@@ -43,6 +57,22 @@ class PrepBusinessConfig(BaseModel):
         default=50,
         description="Default number of items per page for paginated requests"
     )
+    max_retries: int = Field(
+        default=3,
+        description="Retries of a request throttled with 429 (or 503 with Retry-After)"
+    )
+    retry_backoff: float = Field(
+        default=0.5,
+        description="Base of the exponential backoff when the response has no Retry-After"
+    )
+    max_retry_wait: float = Field(
+        default=30.0,
+        description="Longest wait honoured before a retry; longer Retry-After values fail fast"
+    )
+    scheme: str = Field(
+        default="https",
+        description="URL scheme of the API (http only for local stand-ins)"
+    )
 
 class PrepBusinessClient:
     """Client for interacting with the PrepBusiness API."""
@@ -54,7 +84,24 @@ class PrepBusinessClient:
         timeout: Optional[int] = None,
         use_query_auth: bool = False,
         default_merchant_id: Optional[int] = None,
-        default_per_page: int = 50
+        default_per_page: int = 50,
+        pool_maxsize: int = 10,
+        cache: Optional[ResponseCache] = None,
+        coalesce_gets: bool = True,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        rate_limit: Optional[float] = None,
+        rate_burst: int = 20,
+        merchant_rate_limit: Optional[float] = None,
+        merchant_rate_burst: int = 10,
+        circuit_failure_threshold: Optional[int] = None,
+        circuit_slow_call_seconds: Optional[float] = None,
+        circuit_reset_timeout: float = 30.0,
+        validation_mode: str = VALIDATE,
+        fast_json: bool = False,
+        scheme: str = "https",
+        transport: Union[str, HTTPAdapter, None] = None,
+        metrics: Optional[RequestMetrics] = None
     ) -> None:
         """Initialize the PrepBusiness client.
         
@@ -65,23 +112,105 @@ class PrepBusinessClient:
             use_query_auth: Whether to use query parameter authentication instead of Bearer token
             default_merchant_id: Optional default merchant ID to use for requests
             default_per_page: Default number of items per page for paginated requests
-        """
+            pool_maxsize: Maximum number of keep-alive connections kept per host
+            cache: Optional ResponseCache for read-mostly endpoints (merchants,
+                warehouses, services, channels, single inventory items)
+            coalesce_gets: Share one upstream call among identical concurrent GETs
+            max_retries: Retries of a request throttled by the API (429)
+            retry_backoff: Base backoff in seconds when the API sends no Retry-After
+            rate_limit: Optional global requests/second budget (enables the rate limiter)
+            rate_burst: Global burst size of the rate limiter
+            merchant_rate_limit: Optional requests/second budget per merchant
+            merchant_rate_burst: Per-merchant burst size of the rate limiter
+            circuit_failure_threshold: Consecutive failures (network errors, timeouts,
+                5xx) or slow calls that open the circuit breaker; None disables it
+            circuit_slow_call_seconds: Latency above which a call counts as slow
+            circuit_reset_timeout: Seconds the circuit stays open before a trial call
+            validation_mode: 'validate' (full model_validate) or 'lazy' (list items
+                validated on first access, see parsing.py)
+            fast_json: Decode response bodies with orjson when it is installed
+            scheme: URL scheme, 'https' (default) or 'http' for a local stand-in
+            transport: Optional HTTPAdapter, or 'record:<dir>' / 'replay:<dir>' to
+                record real exchanges to disk or replay them offline (see transport.py)
+            metrics: Optional RequestMetrics registry; the process-wide one by default
+        """
+        if validation_mode not in VALIDATION_MODES:
+            raise ValueError(f"validation_mode must be one of {VALIDATION_MODES}, got {validation_mode!r}")
         self.config = PrepBusinessConfig(
             api_key=api_key,
             company_domain=company_domain,
             timeout=timeout or 30,
             use_query_auth=use_query_auth,
             default_merchant_id=default_merchant_id,
-            default_per_page=default_per_page
+            default_per_page=default_per_page,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            scheme=scheme
         )
+        self._cache = cache
+        self._metrics = metrics
+        self.validation_mode = validation_mode
+        self._fast_json = fast_json and ORJSON_AVAILABLE
+        self._rate_limiter = AdaptiveRateLimiter(
+            rate=rate_limit,
+            burst=rate_burst,
+            merchant_rate=merchant_rate_limit,
+            merchant_burst=merchant_rate_burst
+        ) if rate_limit else None
+        self._circuit = CircuitBreaker(
+            failure_threshold=circuit_failure_threshold,
+            slow_call_seconds=circuit_slow_call_seconds,
+            slow_call_threshold=circuit_failure_threshold,
+            reset_timeout=circuit_reset_timeout
+        ) if circuit_failure_threshold else None
+        self._singleflight = SingleFlight() if coalesce_gets else None
         self._session = requests.Session()
+        adapter, self.transport = build_transport(transport, pool_connections=1, pool_maxsize=pool_maxsize)
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
         self._update_headers()
 
-    def _update_headers(self, merchant_id: Optional[int] = None) -> None:
-        """Update session headers with current configuration.
-        
-        Args:
-            merchant_id: Optional merchant ID to use for this request
+    @property
+    def api_key(self) -> str:
+        return self.config.api_key
+
+    def close(self) -> None:
+        """Close the underlying session and its connection pool."""
+        self._session.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Return connection-reuse counters of the underlying urllib3 pools.
+
+        Returns:
+            Dict with the number of requests sent, new connections opened
+            (i.e. TCP/TLS handshakes) and requests served on a reused connection
+        """
+        requests_sent = 0
+        new_connections = 0
+        for adapter in set(self._session.adapters.values()):
+            pool_manager = getattr(adapter, "poolmanager", None)
+            if pool_manager is None:
+                continue
+            for pool_key in list(pool_manager.pools.keys()):
+                pool = pool_manager.pools.get(pool_key)
+                if pool is None:
+                    continue
+                requests_sent += getattr(pool, "num_requests", 0)
+                new_connections += getattr(pool, "num_connections", 0)
+        return {
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reused_connections": max(requests_sent - new_connections, 0),
+        }
+
+    def _update_headers(self) -> None:
+        """Set the headers shared by every request on the session.
+
+        Merchant scoping is deliberately not stored here: the session is
+        shared by concurrent requests, so X-Selected-Client-Id is built per
+        request in _build_headers.
         """
         headers = {
             "Content-Type": "application/json",
@@ -92,12 +221,29 @@ class PrepBusinessClient:
         if not self.config.use_query_auth:
             headers["Authorization"] = f"Bearer {self.config.api_key}"
             
-        # Add merchant header if specified
+        self._session.headers.update(headers)
+
+    def _build_headers(
+        self,
+        merchant_id: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        """Build the headers of a single request without touching the session.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            headers: Optional custom headers
+
+        Returns:
+            Dict with the session headers, the merchant header and the custom headers
+        """
+        request_headers = dict(self._session.headers)
         merchant_id = merchant_id or self.config.default_merchant_id
         if merchant_id is not None:
-            headers["X-Selected-Client-Id"] = str(merchant_id)
-            
-        self._session.headers.update(headers)
+            request_headers["X-Selected-Client-Id"] = str(merchant_id)
+        if headers:
+            request_headers.update(headers)
+        return request_headers
 
     def _request(
         self,
@@ -133,12 +279,13 @@ class PrepBusinessClient:
             
         Raises:
             AuthenticationError: If authentication fails
+            CircuitOpenError: If the circuit breaker is open and no cached copy is available
             PrepBusinessError: For other API errors with error details
         """
-        url = f"https://{self.config.company_domain}/api/{endpoint.lstrip('/')}"
+        url = self._url(endpoint)
         
         # Add API key to query params if using query auth
-        request_params = params or {}
+        request_params = dict(params or {})
         if self.config.use_query_auth:
             request_params["api_token"] = self.config.api_key
             
@@ -154,29 +301,143 @@ class PrepBusinessClient:
             if query_str:
                 request_params["q"] = query_str
             
-        # Update headers with merchant ID if specified
-        if merchant_id is not None:
-            self._update_headers(merchant_id)
-            
-        # Merge custom headers with session headers
-        request_headers = self._session.headers.copy()
-        if headers:
-            request_headers.update(headers)
+        # Merchant and custom headers are per request: the shared session is never mutated
+        request_headers = self._build_headers(merchant_id, headers)
         # Rimuovi Content-Type se files è presente
         if files and "Content-Type" in request_headers:
             del request_headers["Content-Type"]
-        
+
+        # Cache delle risposte per gli endpoint che cambiano raramente (solo GET)
+        cache_key = None
+        if self._cache is not None and method.upper() == "GET":
+            cache_name = self._cache.match(endpoint)
+            if cache_name is not None:
+                cache_key = self._cache.make_key(
+                    cache_name, endpoint, request_params, merchant_id or self.config.default_merchant_id
+                )
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        shared = False
         try:
-            response = self._session.request(
-                method=method,
-                url=url,
-                params=request_params,
-                json=json,
-                data=data,
-                files=files,
-                headers=request_headers,
-                timeout=self.config.timeout
-            )
+            if self._singleflight is not None and method.upper() == "GET":
+                # Richieste GET identiche già in volo condividono una sola chiamata upstream
+                flight_key = (
+                    url,
+                    repr(sorted(request_params.items())),
+                    request_headers.get("X-Selected-Client-Id")
+                )
+                result, shared = self._singleflight.do(
+                    flight_key,
+                    lambda: self._send(method, url, request_params, json, data, files, request_headers)
+                )
+            else:
+                result = self._send(method, url, request_params, json, data, files, request_headers)
+        except CircuitOpenError:
+            # Circuito aperto: meglio una copia scaduta dalla cache che nessuna risposta
+            if cache_key is not None:
+                stale = self._cache.get(cache_key, allow_stale=True)
+                if stale is not None:
+                    logger.warning(f"[PrepBusinessClient] Circuito aperto, servo {endpoint} dalla cache (scaduta)")
+                    return stale
+            raise
+
+        if self._cache is not None:
+            if cache_key is not None and not shared:
+                self._cache.set(cache_key, result)
+            elif method.upper() != "GET":
+                self._cache.invalidate_for_write(endpoint)
+        return result
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        params: Dict[str, Any],
+        json: Optional[Dict[str, Any]],
+        data: Optional[Dict[str, Any]],
+        files: Optional[Dict[str, Any]],
+        headers: Dict[str, str],
+        stream: bool = False
+    ) -> Any:
+        """Send a fully built request on the pooled session and decode the response.
+
+        With ``stream=True`` the body is not read: the still open response is
+        returned and the caller must close it.
+
+        Raises:
+            AuthenticationError: If authentication fails
+            CircuitOpenError: If the circuit breaker is open (no request is sent)
+            PrepBusinessError: For other API errors with error details
+        """
+        merchant_id = headers.get("X-Selected-Client-Id")
+        request_started = time.monotonic()
+        response = None
+        attempt = 0
+        outcome = "error"
+        try:
+            while True:
+                response = None
+                if self._circuit is not None:
+                    self._circuit.before_call()
+                if self._rate_limiter is not None:
+                    self._rate_limiter.acquire(merchant_id)
+
+                started = time.monotonic()
+                try:
+                    response = self._session.request(
+                        method=method,
+                        url=url,
+                        params=params,
+                        json=json,
+                        data=data,
+                        files=files,
+                        headers=headers,
+                        timeout=self.config.timeout,
+                        stream=stream
+                    )
+                except requests.exceptions.RequestException as e:
+                    if self._circuit is not None:
+                        self._circuit.record_failure(e)
+                    raise
+                except BaseException:
+                    # Errore non di rete (o timeout gevent): la chiamata non dice nulla sulla salute dell'API
+                    if self._circuit is not None:
+                        self._circuit.release()
+                    raise
+                if self._circuit is not None:
+                    if response.status_code >= 500 and not is_throttled(response):
+                        self._circuit.record_failure(f"HTTP {response.status_code} su {url}")
+                    else:
+                        self._circuit.record_success(time.monotonic() - started)
+
+                if not is_throttled(response):
+                    if self._rate_limiter is not None:
+                        self._rate_limiter.on_success(merchant_id)
+                    break
+
+                # 429: la richiesta non è stata elaborata, quindi è sicuro ripeterla (anche se non GET)
+                retry_after = retry_after_seconds(response, attempt, self.config.retry_backoff)
+                if self._rate_limiter is not None:
+                    self._rate_limiter.on_throttled(merchant_id, retry_after)
+                if attempt >= self.config.max_retries or retry_after > self.config.max_retry_wait:
+                    raise RateLimitError(
+                        f"API rate limit exceeded (Status: {response.status_code}, retry after {retry_after:.1f}s)",
+                        retry_after=retry_after
+                    )
+                attempt += 1
+                response.close()
+                logger.warning(
+                    f"[PrepBusinessClient] Throttling {response.status_code} su {method} {url}: "
+                    f"nuovo tentativo {attempt}/{self.config.max_retries} tra {retry_after:.1f}s"
+                )
+                if files:
+                    for file_tuple in files.values():
+                        if isinstance(file_tuple, tuple) and hasattr(file_tuple[1], 'seek'):
+                            file_tuple[1].seek(0)
+                if self._rate_limiter is None:
+                    time.sleep(retry_after)
             
             # Check for authentication errors
             if response.status_code == 401:
@@ -195,12 +456,96 @@ class PrepBusinessClient:
                     error_msg = response.text or error_msg
                 
                 raise PrepBusinessError(f"{error_msg} (Status: {response.status_code})")
-                
-            return response.json()
+
+            if stream:
+                # I byte del body in streaming vengono registrati da chi lo legge (_stream_pages)
+                outcome = "streaming"
+                return response
+            return self._decode(response)
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
         except requests.exceptions.RequestException as e:
             if isinstance(e, AuthenticationError):
                 raise
             raise PrepBusinessError(f"API request failed: {str(e)}") from e
+        finally:
+            self._metrics_registry().observe(
+                method,
+                url,
+                merchant_id,
+                response.status_code if response is not None else outcome,
+                time.monotonic() - request_started,
+                bytes_received=None if outcome == "streaming" or response is None else self._received_bytes(response),
+                retries=attempt
+            )
+
+    def _metrics_registry(self) -> RequestMetrics:
+        return self._metrics if self._metrics is not None else get_request_metrics()
+
+    @staticmethod
+    def _received_bytes(response: requests.Response) -> int:
+        """Body bytes read from the wire so far (compressed size when gzip)."""
+        try:
+            return int(response.raw.tell())
+        except (AttributeError, TypeError, ValueError, OSError):
+            return len(response.content or b"")
+
+    def request_metrics(self) -> Dict[str, Any]:
+        """Return the per-endpoint latency/size/retry histograms of this client's registry."""
+        return self._metrics_registry().snapshot()
+
+    def _url(self, endpoint: str) -> str:
+        """Absolute URL of an API endpoint."""
+        return f"{self.config.scheme}://{self.config.company_domain}/api/{endpoint.lstrip('/')}"
+
+    def _decode(self, response: requests.Response) -> Any:
+        """Decode a JSON response body (orjson on the raw bytes when fast_json is on)."""
+        if self._fast_json:
+            return loads(response.content)
+        return response.json()
+
+    def _parse(self, model: type, data: Any) -> Any:
+        """Build a response model according to ``validation_mode``."""
+        return parse_model(model, data, self.validation_mode)
+
+    def circuit_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the circuit breaker state, or None when the breaker is disabled."""
+        return self._circuit.stats() if self._circuit is not None else None
+
+    def rate_limiter_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the rate limiter state, or None when the limiter is disabled."""
+        return self._rate_limiter.stats() if self._rate_limiter is not None else None
+
+    def invalidate_cache(
+        self,
+        endpoint: Optional[str] = None,
+        merchant_id: Optional[int] = None,
+        path: Optional[str] = None
+    ) -> None:
+        """Drop cached responses (no-op when the client has no cache).
+
+        Args:
+            endpoint: Cache name ('merchants', 'warehouses', 'services', 'channels',
+                'inventory_item'); all endpoints if None
+            merchant_id: Only entries of this merchant; all merchants if None
+            path: Only entries of this resource path (e.g. 'inventory/123')
+        """
+        if self._cache is not None:
+            self._cache.invalidate(name=endpoint, merchant_id=merchant_id, path=path)
+
+    def coalescing_stats(self) -> Optional[Dict[str, int]]:
+        """Return the GET coalescing counters, or None when coalescing is disabled."""
+        return self._singleflight.stats() if self._singleflight is not None else None
+
+    @property
+    def coalesced_requests(self) -> int:
+        """Number of GET requests served by joining an identical call already in flight."""
+        return self._singleflight.stats()['coalesced'] if self._singleflight is not None else 0
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Return the response cache counters, or None when caching is disabled."""
+        return self._cache.stats() if self._cache is not None else None
 
     def get(
         self,
@@ -320,6 +665,125 @@ class PrepBusinessClient:
         """
         return self._request("POST", endpoint, json=json, data=data, merchant_id=merchant_id)
 
+    def _iter_pages(
+        self,
+        fetch_page: Callable[[int], Any],
+        get_items: Callable[[Any], List[Any]],
+        has_next_page: Callable[[Any, int], bool],
+        start_page: int = 1,
+        prefetch: bool = True
+    ) -> Iterator[Any]:
+        """Iterate over every item of a paginated endpoint.
+
+        While the items of page N are being consumed, page N+1 is already
+        being fetched on a background worker, so the caller never waits for
+        more than one round-trip at a time.
+
+        Args:
+            fetch_page: Callable returning the validated response for a page number
+            get_items: Callable extracting the list of items from a response
+            has_next_page: Callable telling, given a response and its page number,
+                whether another page exists
+            start_page: First page to fetch (default: 1)
+            prefetch: Whether to fetch the next page in the background (default: True)
+
+        Yields:
+            The validated item models, page by page
+
+        Raises:
+            PrepBusinessError: If any page request fails
+        """
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = start_page
+            response = fetch_page(page)
+            while True:
+                items = get_items(response) or []
+                more = bool(items) and has_next_page(response, page)
+
+                next_page = executor.submit(fetch_page, page + 1) if (more and executor) else None
+
+                for item in items:
+                    yield item
+
+                if not more:
+                    return
+                response = next_page.result() if next_page else fetch_page(page + 1)
+                page += 1
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _paginated_has_next(response: Any, page: int) -> bool:
+        """Next-page check for Laravel-style paginated responses."""
+        if getattr(response, 'next_page_url', None):
+            return True
+        last_page = getattr(response, 'last_page', None)
+        current_page = getattr(response, 'current_page', None) or page
+        return last_page is not None and current_page < last_page
+
+    def _stream_pages(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        items_key: str,
+        model: type,
+        merchant_id: Optional[int] = None,
+        start_page: int = 1
+    ) -> Iterator[Any]:
+        """Stream every item of a paginated endpoint, parsing it incrementally from the socket.
+
+        Items are validated and yielded one by one while the page is still
+        downloading, so memory stays flat whatever ``per_page`` is. The
+        pagination fields of the page are read as they are parsed and used to
+        decide whether to request the next one.
+
+        Args:
+            endpoint: API endpoint path
+            params: Query parameters, without ``page``
+            items_key: Top-level key holding the list of items (e.g. 'data')
+            model: Pydantic model of a single item
+            merchant_id: Optional merchant ID to use for this request
+            start_page: First page to fetch (default: 1)
+
+        Yields:
+            Validated item models
+
+        Raises:
+            PrepBusinessError: If a request fails or a body is not valid JSON
+        """
+        url = self._url(endpoint)
+        headers = self._build_headers(merchant_id, None)
+        page = start_page
+        while True:
+            request_params = dict(params, page=page)
+            if self.config.use_query_auth:
+                request_params["api_token"] = self.config.api_key
+
+            response = self._send("GET", url, request_params, None, None, None, headers, stream=True)
+            envelope: Dict[str, Any] = {}
+            count = 0
+            try:
+                # Il body può essere compresso (gzip): urllib3 lo decomprime durante la lettura
+                response.raw.decode_content = True
+                for raw_item in iter_json_items(response.raw, items_key, envelope):
+                    count += 1
+                    yield model.model_validate(raw_item)
+            except requests.exceptions.RequestException as e:
+                raise PrepBusinessError(f"API request failed while streaming {endpoint}: {str(e)}") from e
+            except JSONStreamError as e:
+                raise PrepBusinessError(f"Invalid JSON while streaming {endpoint}: {str(e)}") from e
+            finally:
+                self._metrics_registry().observe_bytes(
+                    "GET", url, response.status_code, self._received_bytes(response)
+                )
+                response.close()
+
+            if not count or not self._paginated_has_next(SimpleNamespace(**envelope), page):
+                return
+            page += 1
+
     def get_channels(
         self,
         merchant_id: Optional[int] = None,
@@ -427,7 +891,33 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return ChargesResponse.model_validate(response)
+        return self._parse(ChargesResponse, response)
+
+    def iter_charges(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 100,
+        prefetch: bool = True
+    ) -> Iterator[Charge]:
+        """Iterate over all charges of a merchant, across every page.
+
+        Args:
+            merchant_id: The ID of the merchant (required in header)
+            per_page: Number of items per page (default: 100, max: 100)
+            prefetch: Whether to fetch the next page in the background
+
+        Yields:
+            Charge models, one page at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        return self._iter_pages(
+            lambda page: self.get_charges(merchant_id=merchant_id, page=page, per_page=per_page),
+            lambda response: response.data,
+            self._paginated_has_next,
+            prefetch=prefetch
+        )
 
     def get_charge_details(self, charge_id: int) -> ChargeDetailsResponse:
         """
@@ -447,7 +937,7 @@ class PrepBusinessClient:
             f"/billing/charges/{charge_id}",
             merchant_id=self.config.default_merchant_id
         )
-        return ChargeDetailsResponse.model_validate(response)
+        return self._parse(ChargeDetailsResponse, response)
 
     def create_quick_adjustment(
         self,
@@ -478,7 +968,7 @@ class PrepBusinessClient:
             },
             merchant_id=merchant_id
         )
-        return ChargeDetailsResponse.model_validate(response)
+        return self._parse(ChargeDetailsResponse, response)
 
     def get_invoices(
         self,
@@ -512,7 +1002,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return InvoicesResponse.model_validate(response)
+        return self._parse(InvoicesResponse, response)
 
     def create_invoice(
         self,
@@ -539,7 +1029,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return CreateInvoiceResponse.model_validate(response)
+        return self._parse(CreateInvoiceResponse, response)
 
     def get_inventory(
         self,
@@ -578,7 +1068,67 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return InventoryResponse.model_validate(response)
+        return self._parse(InventoryResponse, response)
+
+    def iter_inventory(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 500,
+        search_query: Optional[SearchQuery] = None,
+        prefetch: bool = True
+    ) -> Iterator[InventoryItem]:
+        """Iterate over all inventory items, across every page.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            per_page: Number of items per page (default: 500, max: 500)
+            search_query: Optional search query to filter results
+            prefetch: Whether to fetch the next page in the background
+
+        Yields:
+            InventoryItem models, one page at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        return self._iter_pages(
+            lambda page: self.get_inventory(
+                merchant_id=merchant_id, page=page, per_page=per_page, search_query=search_query
+            ),
+            lambda response: response.data,
+            self._paginated_has_next,
+            prefetch=prefetch
+        )
+
+    def stream_inventory(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 500,
+        search_query: Optional[SearchQuery] = None
+    ) -> Iterator[InventoryItem]:
+        """Stream all inventory items, parsing each page incrementally as it downloads.
+
+        Falls back to iter_inventory (whole pages) when ijson is not installed.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            per_page: Number of items per page (default: 500, max: 500)
+            search_query: Optional search query to filter results
+
+        Yields:
+            InventoryItem models, one at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        if not IJSON_AVAILABLE:
+            yield from self.iter_inventory(merchant_id=merchant_id, per_page=per_page, search_query=search_query)
+            return
+
+        params: Dict[str, Any] = {"per_page": min(per_page, 500)}
+        if search_query:
+            params["search"] = str(search_query)
+        yield from self._stream_pages("/inventory", params, "data", InventoryItem, merchant_id=merchant_id)
 
     def get_inventory_item(
         self,
@@ -604,9 +1154,9 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return InventoryItemResponse.model_validate(response)
+        return self._parse(InventoryItemResponse, response)
 
-    def search_inventory(self, query: str) -> InventorySearchResponse:
+    def search_inventory(self, query: str, merchant_id: Optional[int] = None) -> InventorySearchResponse:
         """Search for inventory items by title, SKU, or identifiers.
 
         The search will return up to 10 items matching the title or SKU,
@@ -614,6 +1164,7 @@ class PrepBusinessClient:
 
         Args:
             query: The search query to match against title, SKU, or identifiers.
+            merchant_id: Optional merchant ID to scope the search to.
 
         Returns:
             InventorySearchResponse containing matching items.
@@ -624,9 +1175,10 @@ class PrepBusinessClient:
         response = self._request(
             "POST",
             "/inventory/search",
-            json={"q": query}
+            json={"q": query},
+            merchant_id=merchant_id
         )
-        return InventorySearchResponse.model_validate(response)
+        return self._parse(InventorySearchResponse, response)
 
     def create_inventory_item(
         self,
@@ -674,7 +1226,7 @@ class PrepBusinessClient:
         )
         
         print("Raw API Response:", response)  # Debug print
-        return InventoryItemResponse.model_validate(response)
+        return self._parse(InventoryItemResponse, response)
 
     def update_inventory_item(
         self,
@@ -716,7 +1268,7 @@ class PrepBusinessClient:
         )
         
         print("Raw Update API Response:", response)  # Debug print
-        return InventoryItemResponse.model_validate(response)
+        return self._parse(InventoryItemResponse, response)
 
     def add_inventory_identifier(
         self,
@@ -823,7 +1375,61 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return InboundShipmentsResponse.model_validate(response)
+        return self._parse(InboundShipmentsResponse, response)
+
+    def iter_inbound_shipments(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 100,
+        prefetch: bool = True
+    ) -> Iterator[InboundShipment]:
+        """Iterate over all inbound shipments, across every page.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            per_page: Number of items per page (default: 100)
+            prefetch: Whether to fetch the next page in the background
+
+        Yields:
+            InboundShipment models, one page at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        return self._iter_pages(
+            lambda page: self.get_inbound_shipments(page=page, per_page=per_page, merchant_id=merchant_id),
+            lambda response: response.data,
+            self._paginated_has_next,
+            prefetch=prefetch
+        )
+
+    def stream_inbound_shipments(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 500
+    ) -> Iterator[InboundShipment]:
+        """Stream all inbound shipments, parsing each page incrementally as it downloads.
+
+        Stopping early (e.g. at the first match) also stops the download.
+        Falls back to iter_inbound_shipments (whole pages) when ijson is not installed.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            per_page: Number of items per page (default: 500)
+
+        Yields:
+            InboundShipment models, one at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        if not IJSON_AVAILABLE:
+            yield from self.iter_inbound_shipments(merchant_id=merchant_id, per_page=per_page)
+            return
+
+        yield from self._stream_pages(
+            "/shipments/inbound", {"per_page": per_page}, "data", InboundShipment, merchant_id=merchant_id
+        )
 
     def get_inbound_shipment(
         self,
@@ -848,7 +1454,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return InboundShipmentResponse.model_validate(response)
+        return self._parse(InboundShipmentResponse, response)
 
     def create_inbound_shipment(
         self,
@@ -886,7 +1492,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return CreateInboundShipmentResponse.model_validate(response)
+        return self._parse(CreateInboundShipmentResponse, response)
 
     def create_inbound_shipment_with_items(self, shipment_data: Dict[str, Any]) -> CreateInboundShipmentResponse:
         """
@@ -963,7 +1569,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return SubmitInboundShipmentResponse.model_validate(response)
+        return self._parse(SubmitInboundShipmentResponse, response)
 
     def receive_inbound_shipment(
         self,
@@ -988,7 +1594,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return ReceiveInboundShipmentResponse.model_validate(response)
+        return self._parse(ReceiveInboundShipmentResponse, response)
 
     def batch_archive_inbound_shipments(
         self,
@@ -1018,7 +1624,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return BatchArchiveInboundShipmentsResponse.model_validate(response)
+        return self._parse(BatchArchiveInboundShipmentsResponse, response)
 
     def remove_item_from_shipment(
         self,
@@ -1050,7 +1656,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return RemoveItemFromShipmentResponse.model_validate(response)
+        return self._parse(RemoveItemFromShipmentResponse, response)
 
     def add_item_to_shipment(
         self,
@@ -1085,7 +1691,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return AddItemToShipmentResponse.model_validate(response)
+        return self._parse(AddItemToShipmentResponse, response)
 
     def get_inbound_shipment_items(
         self,
@@ -1110,7 +1716,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return ShipmentItemsResponse.model_validate(response)
+        return self._parse(ShipmentItemsResponse, response)
 
     def update_shipment_item(
         self,
@@ -1148,7 +1754,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return UpdateShipmentItemResponse.model_validate(response)
+        return self._parse(UpdateShipmentItemResponse, response)
 
     def get_outbound_shipments(
         self,
@@ -1181,7 +1787,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return OutboundShipmentsResponse.model_validate(response)
+        return self._parse(OutboundShipmentsResponse, response)
 
     def get_archived_outbound_shipments(
         self,
@@ -1216,7 +1822,45 @@ class PrepBusinessClient:
             params=params,
             merchant_id=merchant_id
         )
-        return OutboundShipmentsResponse.model_validate(response)
+        return self._parse(OutboundShipmentsResponse, response)
+
+    def iter_outbound_shipments(
+        self,
+        merchant_id: Optional[int] = None,
+        per_page: int = 50,
+        archived: bool = False,
+        search_query: Optional[str] = None,
+        prefetch: bool = True
+    ) -> Iterator[OutboundShipment]:
+        """Iterate over all outbound shipments (active or archived), across every page.
+
+        Args:
+            merchant_id: Optional merchant ID to use for this request
+            per_page: Number of items per page (default: 50)
+            archived: Iterate over archived shipments instead of active ones
+            search_query: Optional search query string, only for archived shipments
+            prefetch: Whether to fetch the next page in the background
+
+        Yields:
+            OutboundShipment models, one page at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        if archived:
+            fetch_page = lambda page: self.get_archived_outbound_shipments(
+                page=page, per_page=per_page, merchant_id=merchant_id, search_query=search_query
+            )
+        else:
+            fetch_page = lambda page: self.get_outbound_shipments(
+                page=page, per_page=per_page, merchant_id=merchant_id
+            )
+        return self._iter_pages(
+            fetch_page,
+            lambda response: response.data,
+            self._paginated_has_next,
+            prefetch=prefetch
+        )
 
     def get_outbound_shipment(
         self,
@@ -1241,7 +1885,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return OutboundShipmentResponse.model_validate(response)
+        return self._parse(OutboundShipmentResponse, response)
 
     def create_outbound_shipment(
         self,
@@ -1279,7 +1923,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return CreateOutboundShipmentResponse.model_validate(response)
+        return self._parse(CreateOutboundShipmentResponse, response)
 
     def add_outbound_shipment_attachment(
         self,
@@ -1344,7 +1988,7 @@ class PrepBusinessClient:
             print(f"Files: {files}")
             
             # Costruisci l'URL
-            url = f"https://{self.config.company_domain}/api/shipments/outbound/{shipment_id}/attachment"
+            url = self._url(f"/shipments/outbound/{shipment_id}/attachment")
             
             # Fai la richiesta direttamente con requests
             response = requests.post(
@@ -1368,7 +2012,7 @@ class PrepBusinessClient:
                 
                 raise PrepBusinessError(f"{error_msg} (Status: {response.status_code})")
             
-            return AddOutboundShipmentAttachmentResponse.model_validate(response.json())
+            return self._parse(AddOutboundShipmentAttachmentResponse, self._decode(response))
 
     def get_outbound_shipment_items(
         self,
@@ -1393,7 +2037,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return OutboundShipmentItemsResponse.model_validate(response)
+        return self._parse(OutboundShipmentItemsResponse, response)
 
     def add_outbound_shipment_item(
         self,
@@ -1433,7 +2077,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return AddOutboundShipmentItemResponse.model_validate(response)
+        return self._parse(AddOutboundShipmentItemResponse, response)
 
     def update_outbound_shipment_item(
         self,
@@ -1550,6 +2194,47 @@ class PrepBusinessClient:
         )
         return OrdersResponse(**response)
 
+    def iter_orders(
+        self,
+        per_page: int = 50,
+        status: Optional[str] = None,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        merchant_id: Optional[str] = None,
+        prefetch: bool = True
+    ) -> Iterator[Order]:
+        """Iterate over all orders matching the filters, across every page.
+
+        Args:
+            per_page: Number of items per page (default: 50)
+            status: Filter by order status
+            from_date: Filter orders created after this date (YYYY-MM-DD)
+            to_date: Filter orders created before this date (YYYY-MM-DD)
+            merchant_id: Filter by merchant ID
+            prefetch: Whether to fetch the next page in the background
+
+        Yields:
+            Order models, one page at a time
+
+        Raises:
+            PrepBusinessError: If the API request fails
+        """
+        def has_next_page(response: OrdersResponse, page: int) -> bool:
+            # La risposta degli ordini non ha last_page/next_page_url: usiamo total se presente
+            if response.total:
+                return page * per_page < response.total
+            return len(response.orders) >= per_page
+
+        return self._iter_pages(
+            lambda page: self.get_orders(
+                page=page, per_page=per_page, status=status,
+                from_date=from_date, to_date=to_date, merchant_id=merchant_id
+            ),
+            lambda response: response.orders,
+            has_next_page,
+            prefetch=prefetch
+        )
+
     def get_order(self, order_id: int) -> OrderResponse:
         """Get details for a specific order.
         
@@ -1614,7 +2299,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return UploadOrdersResponse.model_validate(response)
+        return self._parse(UploadOrdersResponse, response)
 
     def upload_shipping_label(
         self,
@@ -1717,7 +2402,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return ServicesResponse.model_validate(response)
+        return self._parse(ServicesResponse, response)
         
     def get_warehouses(
         self,
@@ -1740,7 +2425,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return WarehousesResponse.model_validate(response)
+        return self._parse(WarehousesResponse, response)
 
     def create_adjustment(
         self,
@@ -1784,7 +2469,7 @@ class PrepBusinessClient:
             merchant_id=merchant_id
         )
         
-        return CreateAdjustmentResponse.model_validate(response)
+        return self._parse(CreateAdjustmentResponse, response)
         
     def get_merchants(self) -> MerchantsResponse:
         """Get a list of all merchants.
@@ -1800,7 +2485,7 @@ class PrepBusinessClient:
             "/merchants"
         )
         
-        return MerchantsResponse.model_validate(response)
+        return self._parse(MerchantsResponse, response)
         
     def get_webhooks(self) -> WebhooksResponse:
         """Get a list of service provider webhooks.
@@ -1818,7 +2503,7 @@ class PrepBusinessClient:
             "/webhooks"
         )
         
-        return WebhooksResponse.model_validate(response)
+        return self._parse(WebhooksResponse, response)
         
     def get_merchant_webhooks(self, merchant_id: Optional[int] = None) -> WebhooksResponse:
         """Get a list of webhooks for a specific merchant.
@@ -1843,7 +2528,7 @@ class PrepBusinessClient:
             f"/merchants/{merchant_id}/webhooks"
         )
         
-        return WebhooksResponse.model_validate(response)
+        return self._parse(WebhooksResponse, response)
         
     def create_webhook(
         self,
@@ -1910,7 +2595,7 @@ class PrepBusinessClient:
             json=webhook_data
         )
         
-        return WebhookResponse.model_validate(response)
+        return self._parse(WebhookResponse, response)
         
     def create_merchant_webhook(
         self,
@@ -1979,7 +2664,7 @@ class PrepBusinessClient:
             json=webhook_data
         )
         
-        return WebhookResponse.model_validate(response)
+        return self._parse(WebhookResponse, response)
         
     def update_webhook(
         self,
@@ -2048,7 +2733,7 @@ class PrepBusinessClient:
             json=webhook_data
         )
         
-        return WebhookResponse.model_validate(response)
+        return self._parse(WebhookResponse, response)
         
     def update_merchant_webhook(
         self,
@@ -2119,7 +2804,7 @@ class PrepBusinessClient:
             json=webhook_data
         )
         
-        return WebhookResponse.model_validate(response)
+        return self._parse(WebhookResponse, response)
         
     def delete_webhook(self, webhook_id: int) -> DeleteWebhookResponse:
         """Delete a service provider webhook.
@@ -2138,7 +2823,7 @@ class PrepBusinessClient:
             f"/webhooks/{webhook_id}"
         )
         
-        return DeleteWebhookResponse.model_validate(response)
+        return self._parse(DeleteWebhookResponse, response)
         
     def delete_merchant_webhook(self, merchant_id: int, webhook_id: int) -> DeleteWebhookResponse:
         """Delete a merchant webhook.
@@ -2158,7 +2843,7 @@ class PrepBusinessClient:
             f"/merchants/{merchant_id}/webhooks/{webhook_id}"
         )
         
-        return DeleteWebhookResponse.model_validate(response) 
+        return self._parse(DeleteWebhookResponse, response) 
 
     def get_shipment_items(
         self,
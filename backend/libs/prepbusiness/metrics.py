@@ -0,0 +1,285 @@
+"""
+Metriche per-processo delle chiamate all'API PrepBusiness.
+
+Ogni chiamata upstream dei client (sync e async) registra latenza, byte
+ricevuti e numero di tentativi ripetuti in istogrammi a bucket fissi,
+raggruppati per metodo, endpoint normalizzato (gli id numerici diventano
+``{id}``) e status HTTP. Lo stesso evento viene emesso come record di log
+strutturato sul logger ``prep_business.requests`` (campi in ``extra``): il
+merchant compare solo lì, non nelle serie, che restano poche e non elencano
+i merchant a chi legge l'endpoint.
+
+Le metriche si leggono con ``get_request_metrics().snapshot()`` (JSON) o
+``render_prometheus()`` (formato testo di Prometheus); vedi l'endpoint
+``api/prepbusiness/metrics/``. Dopo un fork il figlio riparte da zero.
+"""
+
+import os
+import re
+import threading
+import logging
+from bisect import bisect_left
+from typing import Optional, Dict, Any, List, Tuple, Union
+from urllib.parse import urlsplit
+
+request_logger = logging.getLogger('prep_business.requests')
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2)
+RETRY_BUCKETS = (0, 1, 2, 3, 5)
+
+# Oltre questo numero di serie le nuove combinazioni di etichette vengono scartate
+MAX_SERIES = 2000
+
+_PROMETHEUS_HELP = {
+    'latency_seconds': 'Latency of PrepBusiness API requests, retries included',
+    'response_bytes': 'Bytes received from PrepBusiness API responses',
+    'retries': 'Retries of throttled PrepBusiness API requests',
+}
+
+_ID_SEGMENT = re.compile(r'^\d+$')
+
+Labels = Tuple[str, str, str]
+
+
+def endpoint_template(url_or_path: str) -> str:
+    """Normalise an endpoint: no scheme/host, no ``/api`` prefix, numeric segments as ``{id}``.
+
+    ``https://x/api/shipments/outbound/123/outbound-shipment-item`` becomes
+    ``shipments/outbound/{id}/outbound-shipment-item``.
+    """
+    path = urlsplit(url_or_path).path.strip('/')
+    if path.startswith('api/'):
+        path = path[4:]
+    return '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in path.split('/'))
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus semantics: cumulative ``le`` buckets)."""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, cumulative count) pairs, ending with ``+Inf``."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append(('+Inf' if bound == float('inf') else _number(bound), total))
+        return pairs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (the max for the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'max': round(self.max, 4),
+            'p50': _round(self.quantile(0.5)),
+            'p95': _round(self.quantile(0.95)),
+            'buckets': dict(self.cumulative()),
+        }
+
+
+class _Series:
+    __slots__ = ('latency', 'bytes', 'retries')
+
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.bytes = Histogram(BYTES_BUCKETS)
+        self.retries = Histogram(RETRY_BUCKETS)
+
+
+class RequestMetrics:
+    """Thread-safe registry of per-endpoint request histograms."""
+
+    def __init__(self, max_series: int = MAX_SERIES) -> None:
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._series: Dict[Labels, _Series] = {}
+        self.dropped = 0
+
+    def observe(
+        self,
+        method: str,
+        url: str,
+        merchant_id: Optional[Union[int, str]],
+        status: Union[int, str],
+        latency: float,
+        bytes_received: Optional[int] = None,
+        retries: int = 0,
+        client: str = 'PrepBusinessClient'
+    ) -> None:
+        """Record one upstream request and emit its structured log record.
+
+        Args:
+            method: HTTP method
+            url: Request URL or endpoint path
+            merchant_id: X-Selected-Client-Id of the request, if any (log record only)
+            status: HTTP status, or 'error' / 'circuit_open' when no response arrived
+            latency: Seconds spent, throttling retries included
+            bytes_received: Body bytes read from the wire; None if not read yet
+                (streamed bodies, see observe_bytes)
+            retries: Retries after 429/503 responses
+            client: Name of the client class, for the log record
+        """
+        labels = (method.upper(), endpoint_template(url), str(status))
+        with self._lock:
+            series = self._get_series(labels)
+            if series is not None:
+                series.latency.observe(latency)
+                series.retries.observe(retries)
+                if bytes_received is not None:
+                    series.bytes.observe(bytes_received)
+
+        level = logging.INFO if isinstance(status, int) and status < 400 else logging.WARNING
+        if request_logger.isEnabledFor(level):
+            request_logger.log(
+                level,
+                f"[{client}] {labels[0]} {labels[1]} -> {status} in {latency * 1000:.0f}ms"
+                + (f", {bytes_received} byte" if bytes_received is not None else '')
+                + (f", {retries} retry" if retries else ''),
+                extra={
+                    'method': labels[0],
+                    'endpoint': labels[1],
+                    'merchant_id': str(merchant_id) if merchant_id else None,
+                    'status': status,
+                    'latency_ms': round(latency * 1000, 1),
+                    'bytes_received': bytes_received,
+                    'retries': retries,
+                    'client': client,
+                }
+            )
+
+    def observe_bytes(
+        self,
+        method: str,
+        url: str,
+        status: Union[int, str],
+        bytes_received: int
+    ) -> None:
+        """Record the size of a streamed body once it has been read."""
+        labels = (method.upper(), endpoint_template(url), str(status))
+        with self._lock:
+            series = self._get_series(labels)
+            if series is not None:
+                series.bytes.observe(bytes_received)
+
+    def _get_series(self, labels: Labels) -> Optional[_Series]:
+        series = self._series.get(labels)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                self.dropped += 1
+                return None
+            series = self._series[labels] = _Series()
+        return series
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All series as JSON-friendly dicts, slowest endpoints (total latency) first."""
+        with self._lock:
+            items = [
+                (labels, series.latency.snapshot(), series.bytes.snapshot(), series.retries.snapshot())
+                for labels, series in self._series.items()
+            ]
+            dropped = self.dropped
+
+        series_list = [
+            {
+                'method': method,
+                'endpoint': endpoint,
+                'status': status,
+                'latency_seconds': latency,
+                'bytes_received': received,
+                'retries': retries,
+            }
+            for (method, endpoint, status), latency, received, retries in items
+        ]
+        series_list.sort(key=lambda s: s['latency_seconds']['sum'], reverse=True)
+        return {'pid': os.getpid(), 'dropped_series': dropped, 'series': series_list}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            rows = [
+                (labels, {
+                    'latency_seconds': (series.latency.cumulative(), series.latency.sum, series.latency.count),
+                    'response_bytes': (series.bytes.cumulative(), series.bytes.sum, series.bytes.count),
+                    'retries': (series.retries.cumulative(), series.retries.sum, series.retries.count),
+                })
+                for labels, series in sorted(self._series.items())
+            ]
+
+        lines = []
+        for name, help_text in _PROMETHEUS_HELP.items():
+            metric = f'prepbusiness_request_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (method, endpoint, status), histograms in rows:
+                buckets, total, count = histograms[name]
+                base = f'method="{method}",endpoint="{_escape(endpoint)}",status="{status}"'
+                for le, cumulative in buckets:
+                    lines.append(f'{metric}_bucket{{{base},le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{base}}} {_number(total)}')
+                lines.append(f'{metric}_count{{{base}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+            self.dropped = 0
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def _number(value: float) -> str:
+    # Niente notazione a 6 cifre di :g, che arrotonda i limiti e le somme grandi (1048576 -> 1.04858e+06)
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_request_metrics = RequestMetrics()
+
+
+def get_request_metrics() -> RequestMetrics:
+    """Return the process-wide registry shared by all clients."""
+    return _request_metrics
+
+
+def _reset_after_fork() -> None:
+    """Il figlio riparte con metriche vuote e un lock nuovo."""
+    global _request_metrics
+    _request_metrics = RequestMetrics(_request_metrics.max_series)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -13,6 +13,20 @@ class AuthenticationError(PrepBusinessError):
     """Raised when authentication fails."""
     pass
 
+class RateLimitError(PrepBusinessError):
+    """Raised when the API keeps throttling (429) after all retries."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(PrepBusinessError):
+    """Raised without calling the API while the circuit breaker is open."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 T = TypeVar('T')
 
 class PaginatedResponse(BaseModel, Generic[T]):
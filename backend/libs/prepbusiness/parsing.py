@@ -0,0 +1,247 @@
+"""
+Decodifica JSON e costruzione dei modelli Pydantic per le risposte PrepBusiness.
+
+Due modalità di validazione:
+- ``validate`` (default): ``model_validate`` completo, come sempre;
+- ``lazy``: viene validato subito solo l'involucro della risposta (paginazione,
+  messaggi, ...); le liste di modelli (``data``, ``items``, ...) restano JSON
+  grezzo e ogni elemento viene validato con ``model_validate`` al primo accesso.
+  Chi scorre una pagina da 500 e si ferma alla prima corrispondenza valida solo
+  gli elementi che ha effettivamente letto; ``model_dump()`` e
+  ``model_dump_json()`` validano prima tutti quelli ancora in sospeso.
+
+Un ``model_construct`` ricorsivo (nessuna validazione) non conviene: la
+validazione di pydantic-core è in Rust ed è più veloce della costruzione
+ricorsiva in Python (vedi ``manage.py benchmark_prepbusiness_parsing``).
+
+Con ``orjson`` installato il JSON viene decodificato direttamente dai bytes.
+Con ``ijson`` le pagine grandi possono essere lette in streaming dal socket,
+un elemento alla volta (``iter_json_items``).
+"""
+
+import json
+import logging
+import typing
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError as e:
+    # Log error but allow import to succeed for development without full dependencies
+    logging.error(f"orjson library not available: {e}")
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError as e:
+    # Log error but allow import to succeed for development without full dependencies
+    logging.error(f"ijson library not available: {e}")
+    ijson = None
+    IJSON_AVAILABLE = False
+
+VALIDATE = 'validate'
+LAZY = 'lazy'
+VALIDATION_MODES = (VALIDATE, LAZY)
+
+M = TypeVar('M', bound=BaseModel)
+
+# Modello -> {nome campo: (chiavi accettate, modello degli elementi)} per i campi List[Model]
+_lazy_fields: Dict[type, Dict[str, tuple]] = {}
+# Modello -> sottoclasse usata per le risposte lazy (valida gli elementi prima di serializzare)
+_lazy_classes: Dict[type, type] = {}
+
+
+def loads(content: bytes) -> Any:
+    """Decode a JSON body, with orjson when available."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+_SCALAR_EVENTS = ('string', 'number', 'boolean', 'null')
+
+
+class JSONStreamError(ValueError):
+    """Raised when a streamed body is not valid (or is truncated) JSON."""
+
+
+def iter_json_items(fp: BinaryIO, items_key: str, envelope: Dict[str, Any]) -> Iterator[Any]:
+    """Yield the elements of the top-level array ``items_key`` while ``fp`` is being read.
+
+    Top-level scalar fields (e.g. ``current_page``, ``last_page``,
+    ``next_page_url``) are stored into ``envelope`` as they are met, so once
+    the iteration ends it holds the pagination info of the page. Requires ijson.
+
+    Args:
+        fp: File-like object with the JSON body (e.g. ``response.raw``)
+        items_key: Top-level key of the array to stream
+        envelope: Dict filled with the top-level scalar fields
+
+    Yields:
+        Each array element as plain Python objects
+
+    Raises:
+        JSONStreamError: If the body is not valid JSON or ends prematurely
+    """
+    item_prefix = f'{items_key}.item'
+    builder = None
+    events = ijson.parse(fp, use_float=True)
+    while True:
+        try:
+            prefix, event, value = next(events)
+        except StopIteration:
+            return
+        except ijson.JSONError as e:
+            raise JSONStreamError(str(e)) from e
+
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == item_prefix and event in ('end_map', 'end_array'):
+                yield builder.value
+                builder = None
+        elif prefix == item_prefix:
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                yield value
+        elif event in _SCALAR_EVENTS and prefix and '.' not in prefix:
+            envelope[prefix] = value
+
+
+class LazyModelList(list):
+    """List of raw JSON objects validated into ``model`` on first access.
+
+    Indexing and iteration return validated models (each element is validated
+    once and replaced in place); ``len()`` and truthiness never validate.
+    """
+
+    __slots__ = ('_model',)
+
+    def __init__(self, model: Type[BaseModel], raw: List[Any]) -> None:
+        super().__init__(raw)
+        self._model = model
+
+    def _load(self, index: int) -> Any:
+        value = list.__getitem__(self, index)
+        if isinstance(value, dict):
+            value = self._model.model_validate(value)
+            list.__setitem__(self, index, value)
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._load(i) for i in range(*index.indices(len(self)))]
+        return self._load(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._load(i)
+
+    def pending(self) -> int:
+        """Number of elements not validated yet."""
+        return sum(1 for value in list.__iter__(self) if isinstance(value, dict))
+
+    def validate_all(self) -> None:
+        """Validate every element still pending."""
+        for i in range(len(self)):
+            self._load(i)
+
+
+def parse_model(model: Type[M], data: Any, mode: str = VALIDATE) -> M:
+    """Build ``model`` from decoded JSON.
+
+    Args:
+        model: Pydantic model class
+        data: Decoded JSON (usually a dict)
+        mode: ``validate`` for a full model_validate, ``lazy`` to defer list items
+
+    Returns:
+        Model instance
+    """
+    if mode == LAZY and isinstance(data, dict):
+        lazy_fields = _lazy_plan(model)
+        if lazy_fields:
+            return _parse_lazy(model, data, lazy_fields)
+    return model.model_validate(data)
+
+
+def _parse_lazy(model: Type[M], data: Dict[str, Any], lazy_fields: Dict[str, tuple]) -> M:
+    envelope = dict(data)
+    deferred = {}
+    for name, (keys, item_model) in lazy_fields.items():
+        for key in keys:
+            raw = envelope.get(key)
+            if isinstance(raw, list):
+                # L'involucro viene validato con una lista vuota; gli elementi arrivano dopo
+                deferred[name] = LazyModelList(item_model, raw)
+                envelope[key] = []
+                break
+    instance = _lazy_class(model).model_validate(envelope)
+    instance.__dict__.update(deferred)
+    return instance
+
+
+def _validate_pending(instance: BaseModel) -> None:
+    for value in instance.__dict__.values():
+        if isinstance(value, LazyModelList):
+            value.validate_all()
+
+
+def _lazy_class(model: Type[M]) -> Type[M]:
+    """Subclass of ``model`` whose dumps validate the pending list elements first.
+
+    The pydantic serializer reads the list storage directly, so without this
+    model_dump() / model_dump_json() would emit the raw, unvalidated dicts.
+    """
+    cls = _lazy_classes.get(model)
+    if cls is None:
+        def model_dump(self, **kwargs):
+            _validate_pending(self)
+            return model.model_dump(self, **kwargs)
+
+        def model_dump_json(self, **kwargs):
+            _validate_pending(self)
+            return model.model_dump_json(self, **kwargs)
+
+        cls = type(model.__name__, (model,), {
+            '__module__': model.__module__,
+            '__qualname__': model.__qualname__,
+            '__doc__': model.__doc__,
+            'model_dump': model_dump,
+            'model_dump_json': model_dump_json,
+        })
+        _lazy_classes[model] = cls
+    return cls
+
+
+def _lazy_plan(model: type) -> Dict[str, tuple]:
+    plan = _lazy_fields.get(model)
+    if plan is None:
+        plan = {}
+        for name, field in model.model_fields.items():
+            item_model = _list_item_model(field.annotation)
+            if item_model is not None:
+                keys = (field.alias, name) if field.alias and field.alias != name else (name,)
+                plan[name] = (keys, item_model)
+        _lazy_fields[model] = plan
+    return plan
+
+
+def _list_item_model(annotation: Any) -> Optional[type]:
+    """Return ``Model`` for List[Model] / Optional[List[Model]] annotations, else None."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        non_none = [arg for arg in args if arg is not type(None)]
+        return _list_item_model(non_none[0]) if len(non_none) == 1 else None
+    if origin is list and args:
+        item = args[0]
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            return item
+    return None
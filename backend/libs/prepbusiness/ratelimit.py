@@ -0,0 +1,200 @@
+"""
+Rate limiter adattivo per le chiamate all'API di Prep Business.
+
+Un token bucket globale più un token bucket per merchant. Quando l'API
+risponde 429 il limiter dimezza i rate (fino a un minimo) e sospende tutte
+le richieste per il tempo indicato da Retry-After; a ogni risposta buona i
+rate risalgono gradualmente verso i valori configurati (AIMD).
+"""
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+
+
+def is_throttled(response: Any) -> bool:
+    """Whether the API asked us to slow down (429, or 503 with Retry-After).
+
+    Works with both requests and httpx responses.
+    """
+    return response.status_code == 429 or (
+        response.status_code == 503 and "Retry-After" in response.headers
+    )
+
+
+def retry_after_seconds(response: Any, attempt: int, backoff: float) -> float:
+    """Seconds to wait before retrying a throttled request.
+
+    Honours Retry-After (delta-seconds or HTTP date); without it falls back
+    to exponential backoff with jitter.
+
+    Args:
+        response: The throttled requests or httpx response
+        attempt: Number of retries already made (0 for the first one)
+        backoff: Base backoff in seconds
+
+    Returns:
+        Seconds to wait, never negative
+    """
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(header)
+                return max(retry_at.timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    delay = backoff * (2 ** attempt)
+    return delay + random.uniform(0, delay)
+
+
+class TokenBucket:
+    """Thread-safe token bucket with reservation semantics.
+
+    ``reserve()`` always takes a token and returns how long the caller must
+    wait before using it, so concurrent callers are queued fairly instead of
+    spinning.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def reserve(self) -> float:
+        """Take one token and return the seconds to wait before it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+
+class AdaptiveRateLimiter:
+    """Global and per-merchant token buckets that adapt to upstream throttling."""
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: int = 20,
+        merchant_rate: Optional[float] = 5.0,
+        merchant_burst: int = 10,
+        min_rate: float = 0.5,
+        decrease_factor: float = 0.5,
+        increase_step: float = 0.1
+    ) -> None:
+        """Initialize the limiter.
+
+        Args:
+            rate: Requests per second allowed globally
+            burst: Global bucket capacity
+            merchant_rate: Requests per second allowed per merchant (None disables it)
+            merchant_burst: Per-merchant bucket capacity
+            min_rate: Lower bound of the adapted rates
+            decrease_factor: Rate multiplier applied on a 429
+            increase_step: Rate added back after each successful response
+        """
+        self.base_rate = rate
+        self.base_merchant_rate = merchant_rate
+        self.merchant_burst = merchant_burst
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step
+
+        self._global = TokenBucket(rate, burst)
+        self._merchants: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._stats = {'acquired': 0, 'delayed': 0, 'waited_seconds': 0.0, 'throttled': 0}
+
+    def _merchant_bucket(self, merchant_id: Optional[Any]) -> Optional[TokenBucket]:
+        if merchant_id is None or self.base_merchant_rate is None:
+            return None
+        key = str(merchant_id)
+        with self._lock:
+            bucket = self._merchants.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.base_merchant_rate, self.merchant_burst)
+                self._merchants[key] = bucket
+            return bucket
+
+    def acquire(self, merchant_id: Optional[Any] = None) -> float:
+        """Block until a request for ``merchant_id`` may be sent.
+
+        Returns:
+            Seconds waited
+        """
+        wait = self.reserve(merchant_id)
+        if wait > 0:
+            # Con gevent time.sleep è cooperativo: cede il controllo alle altre greenlet
+            time.sleep(wait)
+        return wait
+
+    def reserve(self, merchant_id: Optional[Any] = None) -> float:
+        """Reserve a slot for ``merchant_id`` without sleeping.
+
+        Returns:
+            Seconds the caller must wait before sending (asyncio callers await it)
+        """
+        wait = max(self._paused_until - time.monotonic(), 0.0)
+        wait = max(wait, self._global.reserve())
+        bucket = self._merchant_bucket(merchant_id)
+        if bucket is not None:
+            wait = max(wait, bucket.reserve())
+
+        with self._lock:
+            self._stats['acquired'] += 1
+            if wait > 0:
+                self._stats['delayed'] += 1
+                self._stats['waited_seconds'] += wait
+        return wait
+
+    def on_throttled(self, merchant_id: Optional[Any] = None, retry_after: float = 0.0) -> None:
+        """Record a 429: slow down and pause every request for ``retry_after`` seconds."""
+        with self._lock:
+            self._stats['throttled'] += 1
+            if retry_after > 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._global.set_rate(max(self.min_rate, self._global.rate * self.decrease_factor))
+        bucket = self._merchant_bucket(merchant_id)
+        if bucket is not None:
+            bucket.set_rate(max(self.min_rate, bucket.rate * self.decrease_factor))
+
+    def on_success(self, merchant_id: Optional[Any] = None) -> None:
+        """Record a non-throttled response: recover rates towards the configured values."""
+        if self._global.rate < self.base_rate:
+            self._global.set_rate(min(self.base_rate, self._global.rate + self.increase_step))
+        bucket = self._merchant_bucket(merchant_id)
+        if bucket is not None and bucket.rate < self.base_merchant_rate:
+            bucket.set_rate(min(self.base_merchant_rate, bucket.rate + self.increase_step))
+
+    def stats(self) -> Dict[str, Any]:
+        """Current rates, pause and counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['waited_seconds'] = round(stats['waited_seconds'], 3)
+            merchants = {key: round(bucket.rate, 3) for key, bucket in self._merchants.items()}
+        stats['global_rate'] = round(self._global.rate, 3)
+        stats['paused_for'] = round(max(self._paused_until - time.monotonic(), 0.0), 3)
+        stats['merchant_rates'] = {k: v for k, v in merchants.items() if v < (self.base_merchant_rate or 0)}
+        stats['merchants_tracked'] = len(merchants)
+        return stats
@@ -0,0 +1,160 @@
+"""
+Registro per-processo dei client PrepBusiness.
+
+Un client (e quindi una requests.Session con il suo pool di connessioni
+keep-alive) per ogni configurazione, condiviso da tutte le greenlet gevent e
+da tutti i task Celery dello stesso processo. Dopo un fork (gunicorn con
+preload_app, worker prefork di Celery) il registro del figlio riparte vuoto,
+così nessun socket viene condiviso tra processi.
+"""
+
+import os
+import threading
+import logging
+from typing import Optional, Dict, Any, Tuple
+
+from .client import PrepBusinessClient
+from .cache import ResponseCache
+
+logger = logging.getLogger('prep_business')
+
+_lock = threading.Lock()
+_clients: Dict[Tuple, PrepBusinessClient] = {}
+_caches: Dict[Tuple, ResponseCache] = {}
+_stats = {'hits': 0, 'misses': 0}
+_owner_pid = os.getpid()
+
+
+def _reset_after_fork() -> None:
+    """Svuota il registro nel processo figlio dopo un fork."""
+    global _lock, _owner_pid
+    _lock = threading.Lock()
+    _clients.clear()
+    _caches.clear()
+    _stats['hits'] = 0
+    _stats['misses'] = 0
+    _owner_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_shared_client(
+    api_key: str,
+    company_domain: str,
+    timeout: Optional[int] = None,
+    use_query_auth: bool = False,
+    default_merchant_id: Optional[int] = None,
+    default_per_page: int = 50,
+    **client_kwargs: Any
+) -> PrepBusinessClient:
+    """Return the process-wide client for this configuration, creating it once.
+
+    Args:
+        api_key: Your PrepBusiness API key
+        company_domain: Your company domain (e.g. portal.yourcompany.com)
+        timeout: Optional request timeout in seconds
+        use_query_auth: Whether to use query parameter authentication instead of Bearer token
+        default_merchant_id: Optional default merchant ID to use for requests
+        default_per_page: Default number of items per page for paginated requests
+        **client_kwargs: Extra PrepBusinessClient options, also part of the key
+
+    Returns:
+        The shared PrepBusinessClient instance
+    """
+    # Difesa aggiuntiva per piattaforme senza os.register_at_fork
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    key = (
+        api_key, company_domain, timeout or 30, use_query_auth,
+        default_merchant_id, default_per_page, tuple(sorted(client_kwargs.items()))
+    )
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _stats['hits'] += 1
+            return client
+
+        _stats['misses'] += 1
+        client = PrepBusinessClient(
+            api_key=api_key,
+            company_domain=company_domain,
+            timeout=timeout,
+            use_query_auth=use_query_auth,
+            default_merchant_id=default_merchant_id,
+            default_per_page=default_per_page,
+            **client_kwargs
+        )
+        _clients[key] = client
+        logger.info(f"[ClientRegistry] Nuovo client condiviso per {company_domain} (pid={os.getpid()})")
+        return client
+
+
+def get_shared_cache(
+    maxsize: int = 512,
+    redis_url: Optional[str] = None,
+    ttls: Optional[Dict[str, int]] = None,
+    stale_ttl: int = 3600
+) -> ResponseCache:
+    """Return the process-wide ResponseCache for this configuration, creating it once.
+
+    Passing the same instance to get_shared_client keeps the client key stable.
+    """
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    key = (maxsize, redis_url or '', tuple(sorted((ttls or {}).items())), stale_ttl)
+    with _lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ResponseCache(ttls=ttls, maxsize=maxsize, redis_url=redis_url, stale_ttl=stale_ttl)
+            _caches[key] = cache
+        return cache
+
+
+def get_registry_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the registry and connection reuse of every pooled client.
+
+    ``new_connections`` counts TCP/TLS handshakes; ``reused_connections`` counts
+    requests served on an already open keep-alive connection.
+    """
+    with _lock:
+        clients = list(_clients.items())
+        hits, misses = _stats['hits'], _stats['misses']
+
+    total_lookups = hits + misses
+    client_stats = []
+    for key, client in clients:
+        api_key, company_domain = key[0], key[1]
+        entry = {
+            'company_domain': company_domain,
+            'api_key': f"...{api_key[-4:]}" if api_key else '',
+            'transport': client.transport,
+        }
+        entry.update(client.connection_stats())
+        entry['cache'] = client.cache_stats()
+        entry['coalescing'] = client.coalescing_stats()
+        entry['rate_limiter'] = client.rate_limiter_stats()
+        entry['circuit'] = client.circuit_stats()
+        client_stats.append(entry)
+
+    return {
+        'pid': os.getpid(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total_lookups, 4) if total_lookups else 0.0,
+        'clients': client_stats,
+    }
+
+
+def clear_registry() -> None:
+    """Chiude e rimuove tutti i client condivisi (utile nei test e al cambio di configurazione)."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _caches.clear()
+        _stats['hits'] = 0
+        _stats['misses'] = 0
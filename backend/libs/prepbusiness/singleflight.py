@@ -0,0 +1,90 @@
+"""
+Coalescenza delle richieste identiche in volo ("singleflight").
+
+Quando più greenlet/thread chiedono la stessa risorsa nello stesso momento,
+solo il primo esegue la chiamata upstream; gli altri attendono e ricevono
+lo stesso risultato (o la stessa eccezione).
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'followers')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Any = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share the same key.
+
+    Followers receive a deep copy of a snapshot taken before the leader
+    returns, so a caller that mutates its response (as get_paginated does)
+    cannot affect the others.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run ``fn`` once for all concurrent callers of ``key``.
+
+        Args:
+            key: Identity of the call (e.g. URL, query string and merchant)
+            fn: Zero-argument callable performing the upstream request
+
+        Returns:
+            Tuple of (result, shared) where ``shared`` is True for followers
+
+        Raises:
+            Whatever ``fn`` raised, for the leader and every follower
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        result = None
+        try:
+            result = fn()
+            return result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                followers = call.followers
+            # Il finally gira prima che il leader restituisca il risultato: nessuno l'ha ancora
+            # modificato. I follower copiano questa istantanea, mai l'oggetto del leader
+            if followers and call.error is None:
+                call.result = copy.deepcopy(result)
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Upstream calls executed, requests coalesced into them and calls in flight."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
@@ -0,0 +1,519 @@
+"""
+Stand-in locale dell'API Prep Business per benchmark e prove offline.
+
+Serve ``/merchants``, ``/inventory``, ``/shipments/inbound`` e
+``/shipments/outbound`` (più i dettagli e gli item delle spedizioni) con dati
+sintetici deterministici, nella stessa forma delle risposte reali, con
+latenza, volumi e tasso di errore configurabili. Gli elementi vengono
+calcolati dall'indice a ogni richiesta, quindi anche volumi grandi non
+occupano memoria.
+
+Le scritture (POST/PUT/PATCH/DELETE) vengono accettate e rispondono con un
+messaggio e un ``shipment_id`` progressivo, senza modificare i dati.
+
+Uso tipico::
+
+    with StandInServer(StandInData(inbound_per_merchant=5000), latency_ms=80) as server:
+        client = PrepBusinessClient(api_key='x', company_domain=server.netloc, scheme='http')
+"""
+
+import json
+import random
+import threading
+import time
+import logging
+import itertools
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger('prep_business')
+
+# Gli id codificano merchant, tipo ed indice: merchant * _ID_SPAN + base del tipo + indice
+_ID_SPAN = 10_000_000
+_ID_BASES = {'inventory': 0, 'inbound': 5_000_000, 'outbound': 7_000_000}
+_EPOCH = datetime(2024, 1, 1)
+
+
+def _ts(minutes: int) -> str:
+    return (_EPOCH + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%S.000000Z')
+
+
+class StandInData:
+    """Deterministic synthetic dataset, generated on demand from indexes."""
+
+    def __init__(
+        self,
+        merchants: int = 3,
+        inventory_per_merchant: int = 2000,
+        inbound_per_merchant: int = 1000,
+        outbound_per_merchant: int = 1000,
+        items_per_shipment: int = 20,
+        first_merchant_id: int = 101
+    ) -> None:
+        self.merchant_ids = list(range(first_merchant_id, first_merchant_id + merchants))
+        self.inventory_per_merchant = inventory_per_merchant
+        self.inbound_per_merchant = inbound_per_merchant
+        self.outbound_per_merchant = outbound_per_merchant
+        self.items_per_shipment = items_per_shipment
+
+    # --- identificativi -------------------------------------------------
+
+    @staticmethod
+    def make_id(merchant_id: int, kind: str, index: int) -> int:
+        return merchant_id * _ID_SPAN + _ID_BASES[kind] + index + 1
+
+    def split_id(self, object_id: int, kind: str) -> Optional[Tuple[int, int]]:
+        """(merchant_id, index) of an id of ``kind``, or None if it does not exist."""
+        merchant_id, rest = divmod(object_id, _ID_SPAN)
+        index = rest - _ID_BASES[kind] - 1
+        limit = {
+            'inventory': self.inventory_per_merchant,
+            'inbound': self.inbound_per_merchant,
+            'outbound': self.outbound_per_merchant,
+        }[kind]
+        if merchant_id not in self.merchant_ids or not 0 <= index < limit:
+            return None
+        return merchant_id, index
+
+    # --- elementi ---------------------------------------------------------
+
+    def merchant(self, merchant_id: int) -> Dict[str, Any]:
+        n = merchant_id - self.merchant_ids[0] + 1
+        return {
+            'id': merchant_id,
+            'name': f'Merchant {n:03d}',
+            'notes': None,
+            'primaryEmail': f'merchant{n:03d}@example.com',
+            'billingCycle': 'monthly',
+            'perItemAdjustment': 0.0,
+            'photoUrl': None,
+            'enabled': True,
+            'isOrdersEnabled': True,
+            'isAmazonShipmentsEnabled': True,
+        }
+
+    def identifiers(self, merchant_id: int, index: int) -> str:
+        """SKU, FNSKU and ASIN of an inventory item, space separated."""
+        return f'SKU-{merchant_id}-{index:06d} X{merchant_id:03d}{index:06d} B0{merchant_id:03d}{index:05d}'
+
+    def inventory_item(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        item_id = self.make_id(merchant_id, 'inventory', index)
+        sku, fnsku, asin = self.identifiers(merchant_id, index).split()
+        return {
+            'id': item_id,
+            'created_at': _ts(index),
+            'updated_at': _ts(index + 1),
+            'team_id': merchant_id,
+            'merchant_sku': sku,
+            'title': f'Prodotto di prova {index} del merchant {merchant_id} con un titolo realistico',
+            'condition': 'NewItem',
+            'condition_note': None,
+            'bundle_id': None,
+            'length_mm': 300, 'width_mm': 200, 'height_mm': 100, 'weight_gm': 850,
+            'quantity_in_stock': index % 50,
+            'available_quantity': index % 40,
+            'allocated_quantity': index % 5,
+            'unavailable_quantity': 0,
+            'inbound_quantity': index % 7,
+            'fnsku': fnsku,
+            'asin': asin,
+            'searchableIdentifiers': self.identifiers(merchant_id, index),
+            'prep_instructions': [],
+            'images': [{
+                'id': item_id,
+                'path': f'images/{item_id}.jpg',
+                'large_url': f'https://cdn.example.com/images/{item_id}-large.jpg',
+                'thumbnail_url': f'https://cdn.example.com/images/{item_id}-thumb.jpg',
+                'imageable_id': item_id,
+                'imageable_type': 'App\\Models\\Item',
+            }],
+            'identifiers': [
+                {'id': item_id * 2, 'created_at': _ts(index), 'updated_at': _ts(index),
+                 'item_id': item_id, 'identifier': asin, 'identifier_type': 'ASIN'},
+                {'id': item_id * 2 + 1, 'created_at': _ts(index), 'updated_at': _ts(index),
+                 'item_id': item_id, 'identifier': fnsku, 'identifier_type': 'FNSKU'},
+            ],
+            'bundle': None,
+            'listings': [],
+            'item_group_configurations': [{
+                'id': item_id, 'created_at': _ts(index), 'updated_at': _ts(index),
+                'item_id': item_id, 'quantity': 12, 'type': 'case', 'weight_gm': 10200,
+                'length_mm': 600, 'width_mm': 400, 'height_mm': 300, 'contains': None, 'default': True,
+            }],
+            'tags': [],
+        }
+
+    def shipment_name(self, merchant_id: int, index: int) -> str:
+        # Inbound e outbound con lo stesso indice hanno lo stesso nome, come nel flusso reale
+        return f'Spedizione {merchant_id}-{index:05d}'
+
+    def outbound_archived(self, index: int) -> bool:
+        return index % 4 == 0
+
+    def inbound_shipment(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        return {
+            'id': self.make_id(merchant_id, 'inbound', index),
+            'created_at': _ts(index * 3),
+            'updated_at': _ts(index * 3 + 1),
+            'team_id': merchant_id,
+            'name': self.shipment_name(merchant_id, index),
+            'notes': None,
+            'warehouse_id': 1,
+            'received_at': None,
+            'internal_notes': None,
+            'archived_at': None,
+            'shipped_at': None,
+            'checked_in_at': None,
+            'deleted_at': None,
+            'currency': 'EUR',
+            'eta': None,
+            'reference_id': f'REF-{merchant_id}-{index:05d}',
+            'migrated': False,
+            'status': ('draft', 'shipped', 'received', 'open')[index % 4],
+        }
+
+    def outbound_shipment(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        archived = self.outbound_archived(index)
+        return {
+            'id': self.make_id(merchant_id, 'outbound', index),
+            'created_at': _ts(index * 3),
+            'updated_at': _ts(index * 3 + 2),
+            'team_id': merchant_id,
+            'status': 'archived' if archived else ('open', 'shipped', 'closed')[index % 3],
+            'notes': None,
+            'name': self.shipment_name(merchant_id, index),
+            'warehouse_id': 1,
+            'shipped_at': None,
+            'internal_notes': None,
+            'ship_from_address_id': None,
+            'archived_at': _ts(index * 3 + 2) if archived else None,
+            'currency': 'EUR',
+            'is_case_forwarding': False,
+            'sku_count': self.items_per_shipment,
+            'shipped_items_count': None,
+            'searchable_identifiers': '',
+            'searchable_tags': [],
+            'tags': [],
+            'fba_transport_plans': [],
+        }
+
+    def inbound_detail(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        items = self.inbound_items(merchant_id, index)['items']
+        quantity = sum(item['expected']['quantity'] for item in items)
+        return {
+            **self.inbound_shipment(merchant_id, index),
+            'expected_quantity': quantity,
+            'sku_count': len(items),
+            'actual_quantity': quantity,
+            'unsellable_quantity': 0,
+            'received_quantity': quantity,
+            'tracking_numbers': [],
+            'attachments': [],
+            'service_lines': [],
+            'warehouse': {
+                'id': 1,
+                'name': 'Magazzino stand-in',
+                'default_address': {
+                    'id': 1, 'address_line_1': 'Via Roma 1', 'city': 'Milano', 'state_province': 'MI',
+                    'country_code': 'IT', 'postal_code': '20100', 'is_residential': False,
+                },
+            },
+            'tags': [],
+        }
+
+    def outbound_detail(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        return {
+            **self.outbound_shipment(merchant_id, index),
+            'is_case_packed': False,
+            'outbound_items': self.outbound_items(merchant_id, index)['items'],
+        }
+
+    def _shipment_item_indexes(self, index: int) -> List[int]:
+        start = index * self.items_per_shipment
+        return [(start + j) % self.inventory_per_merchant for j in range(self.items_per_shipment)]
+
+    def inbound_items(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        shipment_id = self.make_id(merchant_id, 'inbound', index)
+        items = []
+        for position, item_index in enumerate(self._shipment_item_indexes(index)):
+            line_id = shipment_id * 100 + position
+            quantity = 1 + (index + position) % 24
+            items.append({
+                'id': line_id,
+                'item_id': self.make_id(merchant_id, 'inventory', item_index),
+                'shipment_id': shipment_id,
+                'expected': {'quantity': quantity, 'item_group_configurations': [], 'id': line_id},
+                'actual': {'quantity': quantity, 'item_group_configurations': [], 'moves': [], 'id': line_id},
+                'unsellable': {'quantity': 0},
+                'item': self.inventory_item(merchant_id, item_index),
+            })
+        return {'items': items}
+
+    def outbound_items(self, merchant_id: int, index: int) -> Dict[str, Any]:
+        shipment_id = self.make_id(merchant_id, 'outbound', index)
+        items = []
+        for position, item_index in enumerate(self._shipment_item_indexes(index)):
+            items.append({
+                'id': shipment_id * 100 + position,
+                'created_at': _ts(index * 3),
+                'updated_at': _ts(index * 3 + 1),
+                'shipment_id': shipment_id,
+                'item_id': self.make_id(merchant_id, 'inventory', item_index),
+                # Quantità leggermente diverse dall'inbound, così i residuali non sono vuoti
+                'quantity': max(1, (index + position) % 24 - position % 2),
+                'case_quantity': None,
+                'expiry_date': None,
+                'cost_per_item': 3.5,
+                'item': self.inventory_item(merchant_id, item_index),
+                'bundle': None,
+                'item_group_configurations': [],
+                'moves': [],
+                'company_services': [],
+            })
+        return {'items': items}
+
+    # --- pagine -----------------------------------------------------------
+
+    def page(
+        self,
+        path: str,
+        indexes: List[int],
+        build: Any,
+        merchant_id: int,
+        page: int,
+        per_page: int
+    ) -> Dict[str, Any]:
+        """Laravel-style paginated envelope over ``indexes``."""
+        total = len(indexes)
+        last_page = max(1, -(-total // per_page))
+        start = (page - 1) * per_page
+        chunk = indexes[start:start + per_page]
+        url = f'https://stand-in.local/api/{path}'
+        return {
+            'current_page': page,
+            'data': [build(merchant_id, index) for index in chunk],
+            'first_page_url': f'{url}?page=1',
+            'from': start + 1 if chunk else None,
+            'last_page': last_page,
+            'last_page_url': f'{url}?page={last_page}',
+            'links': [{'url': f'{url}?page={page}', 'label': str(page), 'active': True}],
+            'next_page_url': f'{url}?page={page + 1}' if page < last_page else None,
+            'path': url,
+            'per_page': per_page,
+            'prev_page_url': f'{url}?page={page - 1}' if page > 1 else None,
+            'to': start + len(chunk) if chunk else None,
+            'total': total,
+        }
+
+    def search_inventory(self, merchant_id: int, query: str) -> List[int]:
+        """Indexes of the items whose SKU, FNSKU or ASIN contains ``query``."""
+        query = query.lower()
+        return [
+            index for index in range(self.inventory_per_merchant)
+            if query in self.identifiers(merchant_id, index).lower()
+        ]
+
+    def inventory_page(self, merchant_id: int, page: int = 1, per_page: int = 500) -> Dict[str, Any]:
+        return self.page(
+            'inventory', range(self.inventory_per_merchant), self.inventory_item, merchant_id, page, per_page
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'PrepBusinessStandIn/1.0'
+
+    def do_GET(self):
+        self.server.standin.handle(self, 'GET')
+
+    def do_POST(self):
+        self.server.standin.handle(self, 'POST')
+
+    def do_PUT(self):
+        self.server.standin.handle(self, 'PUT')
+
+    def do_PATCH(self):
+        self.server.standin.handle(self, 'PATCH')
+
+    def do_DELETE(self):
+        self.server.standin.handle(self, 'DELETE')
+
+    def log_message(self, format, *args):
+        logger.debug(f"[StandIn] {self.address_string()} {format % args}")
+
+
+class StandInServer:
+    """Threaded local HTTP server imitating the PrepBusiness API."""
+
+    def __init__(
+        self,
+        data: Optional[StandInData] = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0
+    ) -> None:
+        """Create the server (not started yet).
+
+        Args:
+            data: Dataset to serve (default StandInData())
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            latency_ms: Delay added to every response
+            jitter_ms: Random extra delay, uniform in [0, jitter_ms]
+            error_rate: Fraction of requests answered with 503
+            seed: Seed of latency jitter and injected errors
+        """
+        self.data = data or StandInData()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._write_ids = itertools.count(9_000_000)
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def netloc(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'{host}:{port}'
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as PREP_BUSINESS_API_URL."""
+        return f'http://{self.netloc}/api'
+
+    def start(self) -> 'StandInServer':
+        """Serve in a background daemon thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='prepbusiness-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving (if started with start()) and close the socket."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'StandInServer':
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    # --- gestione richieste -----------------------------------------------
+
+    def handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        parts = urlsplit(handler.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        path = parts.path.strip('/')
+        if path.startswith('api/'):
+            path = path[4:]
+
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+
+        with self._random_lock:
+            delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            failing = self.error_rate > 0 and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+
+        if failing:
+            status, payload, route = 503, {'message': 'Service Unavailable (stand-in)'}, 'error'
+        elif method == 'POST' and path == 'inventory/search':
+            try:
+                search = (json.loads(body or b'{}').get('q') or '')
+            except ValueError:
+                search = ''
+            merchant_id = self._merchant(handler.headers.get('X-Selected-Client-Id'))
+            indexes = self.data.search_inventory(merchant_id, search)[:100] if merchant_id else []
+            status, route = 200, 'inventory_search'
+            payload = {'items': [self.data.inventory_item(merchant_id, i) for i in indexes]}
+        elif method != 'GET':
+            status, route = 200, 'write'
+            payload = {'message': 'ok (stand-in)', 'shipment_id': next(self._write_ids)}
+        else:
+            status, payload, route = self._route(path, query, handler.headers.get('X-Selected-Client-Id'))
+
+        with self._stats_lock:
+            self.stats[route] = self.stats.get(route, 0) + 1
+
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _merchant(self, merchant_header: Optional[str]) -> Optional[int]:
+        if not merchant_header or not merchant_header.isdigit():
+            return self.data.merchant_ids[0]
+        merchant_id = int(merchant_header)
+        return merchant_id if merchant_id in self.data.merchant_ids else None
+
+    def _route(self, path: str, query: Dict[str, str], merchant_header: Optional[str]) -> Tuple[int, Any, str]:
+        data = self.data
+        merchant_id = self._merchant(merchant_header)
+        if merchant_id is None:
+            return 404, {'message': 'Merchant not found'}, 'not_found'
+        page = max(1, int(query.get('page', 1)))
+        per_page = max(1, min(int(query.get('per_page', 20)), 500))
+        segments = path.split('/')
+
+        if path == 'merchants':
+            return 200, {'data': [data.merchant(m) for m in data.merchant_ids]}, 'merchants'
+
+        if path == 'inventory':
+            if query.get('q'):
+                indexes = data.search_inventory(merchant_id, query['q'])
+                return 200, data.page(path, indexes, data.inventory_item, merchant_id, page, per_page), 'inventory'
+            return 200, data.inventory_page(merchant_id, page, per_page), 'inventory'
+        if len(segments) == 2 and segments[0] == 'inventory' and segments[1].isdigit():
+            found = data.split_id(int(segments[1]), 'inventory')
+            if found:
+                return 200, {'data': data.inventory_item(*found)}, 'inventory_item'
+
+        if path == 'shipments/inbound':
+            indexes = range(data.inbound_per_merchant)
+            return 200, data.page(path, indexes, data.inbound_shipment, merchant_id, page, per_page), 'inbound'
+
+        if path in ('shipments/outbound', 'shipments/outbound/archived'):
+            archived = path.endswith('archived')
+            search = (query.get('q') or '').lower()
+            indexes = [
+                i for i in range(data.outbound_per_merchant)
+                if data.outbound_archived(i) == archived
+                and (not search or search in data.shipment_name(merchant_id, i).lower())
+            ]
+            route = 'outbound_archived' if archived else 'outbound'
+            return 200, data.page(path, indexes, data.outbound_shipment, merchant_id, page, per_page), route
+
+        if len(segments) >= 3 and segments[0] == 'shipments' and segments[2].isdigit():
+            kind = segments[1]
+            found = data.split_id(int(segments[2]), kind) if kind in ('inbound', 'outbound') else None
+            if found:
+                if len(segments) == 3:
+                    build = data.inbound_detail if kind == 'inbound' else data.outbound_detail
+                    return 200, {'shipment': build(*found)}, f'{kind}_detail'
+                if kind == 'inbound' and segments[3:] == ['items']:
+                    return 200, data.inbound_items(*found), 'inbound_items'
+                if kind == 'outbound' and segments[3:] == ['outbound-shipment-item']:
+                    return 200, data.outbound_items(*found), 'outbound_items'
+
+        return 404, {'message': f'Not found (stand-in): /{path}'}, 'not_found'
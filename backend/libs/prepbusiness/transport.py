@@ -0,0 +1,194 @@
+"""
+Transport registrabili per PrepBusinessClient.
+
+- ``RecordingAdapter``: inoltra le richieste all'API vera e salva ogni scambio
+  (richiesta + risposta) come file JSON in una directory;
+- ``ReplayAdapter``: risponde solo dalle registrazioni, senza rete, nello
+  stesso ordine in cui sono state registrate.
+
+Le credenziali non vengono mai salvate: l'header Authorization è escluso e il
+parametro ``api_token`` viene tolto dalla query prima di calcolare la chiave.
+"""
+
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from typing import Optional, Dict, Any, List, Tuple, Union
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+logger = logging.getLogger('prep_business')
+
+# Header di risposta conservati nelle registrazioni
+_KEPT_RESPONSE_HEADERS = ('content-type', 'retry-after')
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """Raised by ReplayAdapter when no recording matches a request."""
+
+
+def exchange_key(request: requests.PreparedRequest) -> str:
+    """Stable identity of a request: method, path, query without credentials, merchant and body."""
+    parts = urlsplit(request.url)
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if k != 'api_token'))
+    merchant = request.headers.get('X-Selected-Client-Id', '')
+    body = request.body or b''
+    if isinstance(body, str):
+        body = body.encode()
+    body_hash = hashlib.sha1(body).hexdigest()[:12] if body else ''
+    return f"{request.method} {parts.path}?{query} merchant={merchant} body={body_hash}"
+
+
+def _file_prefix(key: str) -> str:
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _build_response(
+    adapter: HTTPAdapter,
+    request: requests.PreparedRequest,
+    status: int,
+    headers: Dict[str, str],
+    body: bytes
+) -> requests.Response:
+    # Risposta urllib3 non precaricata: funziona sia con response.json() sia con stream=True (ijson)
+    raw = HTTPResponse(
+        body=io.BytesIO(body),
+        headers=headers,
+        status=status,
+        preload_content=False,
+        decode_content=False
+    )
+    return adapter.build_response(request, raw)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that sends requests for real and records every exchange to ``directory``."""
+
+    def __init__(self, directory: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sequence: Dict[str, int] = {}
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        # Il body viene letto per intero anche con stream=True: va salvato e poi riservito
+        body = response.content
+        elapsed = time.monotonic() - started
+
+        key = exchange_key(request)
+        headers = {k: v for k, v in response.headers.items() if k.lower() in _KEPT_RESPONSE_HEADERS}
+        with self._lock:
+            sequence = self._next_sequence(key)
+            path = os.path.join(self.directory, f"{_file_prefix(key)}-{sequence:04d}.json")
+            with open(path, 'w', encoding='utf-8') as fh:
+                json.dump({
+                    'key': key,
+                    'sequence': sequence,
+                    'request': {'method': request.method, 'url': key.split(' ', 1)[1]},
+                    'response': {
+                        'status': response.status_code,
+                        'headers': headers,
+                        'body': body.decode('utf-8', errors='replace'),
+                        'elapsed': round(elapsed, 4),
+                    },
+                }, fh, ensure_ascii=False)
+
+        return _build_response(self, request, response.status_code, headers, body)
+
+    def _next_sequence(self, key: str) -> int:
+        if key not in self._sequence:
+            # Riprende dopo le registrazioni già presenti per la stessa richiesta
+            prefix = _file_prefix(key)
+            existing = [name for name in os.listdir(self.directory) if name.startswith(prefix)]
+            self._sequence[key] = len(existing)
+        sequence = self._sequence[key]
+        self._sequence[key] = sequence + 1
+        return sequence
+
+
+class ReplayAdapter(HTTPAdapter):
+    """HTTPAdapter that answers only from recordings made by RecordingAdapter.
+
+    Repeated identical requests get the recorded responses in order; once
+    they are exhausted the last one is served again.
+    """
+
+    def __init__(self, directory: str, replay_latency: bool = False, **kwargs: Any) -> None:
+        """Load the recordings.
+
+        Args:
+            directory: Directory written by RecordingAdapter
+            replay_latency: Sleep for the recorded duration of each exchange
+        """
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._exchanges: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self.misses = 0
+
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name), encoding='utf-8') as fh:
+                exchange = json.load(fh)
+            self._exchanges.setdefault(exchange['key'], []).append(exchange)
+        for exchanges in self._exchanges.values():
+            exchanges.sort(key=lambda e: e['sequence'])
+        logger.info(f"[ReplayAdapter] Caricati {sum(len(v) for v in self._exchanges.values())} scambi da {directory}")
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        key = exchange_key(request)
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                self.misses += 1
+                raise ReplayMissError(f"Nessuna registrazione per {key}", request=request)
+            index = min(self._cursor.get(key, 0), len(exchanges) - 1)
+            self._cursor[key] = index + 1
+            recorded = exchanges[index]['response']
+
+        if self.replay_latency and recorded.get('elapsed'):
+            time.sleep(recorded['elapsed'])
+        return _build_response(
+            self, request, recorded['status'], recorded.get('headers', {}), recorded['body'].encode('utf-8')
+        )
+
+
+def build_transport(spec: Union[str, HTTPAdapter, None], **adapter_kwargs: Any) -> Tuple[Optional[HTTPAdapter], str]:
+    """Build the adapter described by ``spec``.
+
+    Args:
+        spec: An HTTPAdapter, or a string: '' / 'live' (default transport),
+            'record:<dir>', 'replay:<dir>' or 'replay-latency:<dir>'
+        **adapter_kwargs: HTTPAdapter options (pool sizes) for recording
+
+    Returns:
+        Tuple of (adapter or None for the default one, transport name)
+    """
+    if spec is None or spec == '' or spec == 'live':
+        return None, 'live'
+    if isinstance(spec, HTTPAdapter):
+        return spec, type(spec).__name__
+
+    mode, _, directory = spec.partition(':')
+    if not directory:
+        raise ValueError(f"Transport '{spec}' non valido: atteso 'record:<dir>' o 'replay:<dir>'")
+    if mode == 'record':
+        return RecordingAdapter(directory, **adapter_kwargs), 'record'
+    if mode == 'replay':
+        return ReplayAdapter(directory), 'replay'
+    if mode == 'replay-latency':
+        return ReplayAdapter(directory, replay_latency=True), 'replay'
+    raise ValueError(f"Transport '{spec}' non valido: modalità '{mode}' sconosciuta")
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.schedules import crontab
 from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
@@ -43,5 +44,50 @@ app.conf.task_soft_time_limit = 3000  # 50 minutes
 
 # Configure task routing
 app.conf.task_routes = {
+    # I webhook hanno una coda dedicata: non aspettano dietro alle ricerche lunghe
+    'prep_management.tasks.drain_webhook_lane': {'queue': 'webhooks'},
+    'prep_management.tasks.process_webhook_update': {'queue': 'webhooks'},
     'prep_management.tasks.*': {'queue': 'prep_management'},
-} 
\ No newline at end of file
+}
+
+# Task periodici (celery beat)
+from libs.config import (
+    PREP_BUSINESS_MIRROR_SYNC_SECONDS, PREP_BUSINESS_MIRROR_FULL_SYNC_HOUR, PREP_BUSINESS_MERCHANT_REFRESH_SECONDS,
+    PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS, PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS
+)
+
+app.conf.beat_schedule = {}
+if PREP_BUSINESS_MIRROR_SYNC_SECONDS > 0:
+    # Sincronizzazione incrementale del mirror locale delle spedizioni
+    app.conf.beat_schedule['sync-shipment-mirror'] = {
+        'task': 'prep_management.tasks.sync_shipment_mirror',
+        'schedule': PREP_BUSINESS_MIRROR_SYNC_SECONDS,
+        'options': {'expires': PREP_BUSINESS_MIRROR_SYNC_SECONDS},
+    }
+if PREP_BUSINESS_MIRROR_FULL_SYNC_HOUR >= 0:
+    # Riconciliazione completa notturna (recupera anche le spedizioni perse dall'incrementale)
+    app.conf.beat_schedule['sync-shipment-mirror-full'] = {
+        'task': 'prep_management.tasks.sync_shipment_mirror',
+        'schedule': crontab(hour=PREP_BUSINESS_MIRROR_FULL_SYNC_HOUR, minute=30),
+        'kwargs': {'full': True},
+    }
+if PREP_BUSINESS_MERCHANT_REFRESH_SECONDS > 0:
+    # Directory locale dei merchant (nomi ed email per webhook e notifiche)
+    app.conf.beat_schedule['refresh-merchant-directory'] = {
+        'task': 'prep_management.tasks.refresh_merchant_directory',
+        'schedule': PREP_BUSINESS_MERCHANT_REFRESH_SECONDS,
+        'options': {'expires': PREP_BUSINESS_MERCHANT_REFRESH_SECONDS},
+    }
+if PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS > 0:
+    # Recupero dei webhook rimasti in coda (broker giù alla ricezione, worker morto)
+    app.conf.beat_schedule['sweep-webhook-updates'] = {
+        'task': 'prep_management.tasks.sweep_webhook_updates',
+        'schedule': PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS,
+        'options': {'expires': PREP_BUSINESS_WEBHOOK_SWEEP_SECONDS},
+    }
+if PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS > 0:
+    # Archiviazione compressa dei payload dei webhook vecchi (tabella dei webhook più leggera)
+    app.conf.beat_schedule['archive-webhook-payloads'] = {
+        'task': 'prep_management.tasks.archive_webhook_payloads',
+        'schedule': crontab(hour=4, minute=15),
+    }
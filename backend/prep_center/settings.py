@@ -217,6 +217,9 @@ LOGGING = {
             'format': '[{levelname}] {asctime} {module} {message}',
             'style': '{',
         },
+        'structured': {
+            '()': 'prep_center.logging_formatters.StructuredFormatter',
+        },
     },
     'handlers': {
         'console': {
@@ -258,6 +261,13 @@ LOGGING = {
             'formatter': 'verbose',
             'mode': 'a',
             'filters': ['truncate_long_messages'],
+        },
+        # Una riga JSON per ogni chiamata all'API PrepBusiness (endpoint, merchant, status, latenza, byte, retry)
+        'prep_business_requests_file': {
+            'class': 'logging.FileHandler',
+            'filename': os.path.join(LOG_DIR, 'prep_business_requests.log'),
+            'formatter': 'structured',
+            'mode': 'a',
         }
     },
     'root': {
@@ -285,6 +295,11 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        'prep_business.requests': {
+            'handlers': ['prep_business_requests_file'],
+            'level': os.getenv('PREP_BUSINESS_REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
         'prep_management': {
             'handlers': ['console', 'prep_management_file'],
             'level': 'DEBUG',
@@ -332,6 +347,18 @@ CELERY_BROKER_URL = os.environ.get("REDIS_URL") or os.environ.get("CELERY_BROKER
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Cache Django: con CACHE_REDIS_URL è condivisa tra i processi gunicorn e i worker Celery
+# (deduplicazione dei webhook, indice inventario, lock); senza resta in memoria del processo
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'prep_center',
+        }
+    }
+
 # =============================================================================
 # CONFIGURAZIONE TELEGRAM BOT
 # =============================================================================
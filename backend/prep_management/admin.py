@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import PrepBusinessConfig, AmazonSPAPIConfig, ShipmentStatusUpdate, OutgoingMessage, SearchResultItem, IncomingMessage, TelegramNotification, TelegramMessage
+from .models import MirrorShipment, MirrorShipmentItem, MirrorSyncState, MerchantDirectoryEntry, WebhookLane, WebhookPayloadArchive
 
 @admin.register(PrepBusinessConfig)
 class PrepBusinessConfigAdmin(admin.ModelAdmin):
@@ -123,13 +124,13 @@ class AmazonSPAPIConfigAdmin(admin.ModelAdmin):
 
 @admin.register(ShipmentStatusUpdate)
 class ShipmentStatusUpdateAdmin(admin.ModelAdmin):
-    list_display = ('shipment_id', 'event_type', 'new_status', 'merchant_name', 'created_at', 'processed')
-    list_filter = ('event_type', 'new_status', 'processed', 'created_at', 'entity_type')
+    list_display = ('shipment_id', 'event_type', 'new_status', 'merchant_name', 'created_at', 'processing_status', 'attempts', 'processed')
+    list_filter = ('event_type', 'new_status', 'processing_status', 'processed', 'payload_archived', 'created_at', 'entity_type')
     search_fields = ('shipment_id', 'merchant_name', 'tracking_number')
-    readonly_fields = ('created_at', 'payload')
+    readonly_fields = ('created_at', 'stored_payload')
     fieldsets = (
         (None, {
-            'fields': ('shipment_id', 'event_type', 'entity_type', 'processed')
+            'fields': ('shipment_id', 'event_type', 'entity_type', 'processing_status', 'processed')
         }),
         ('Stati', {
             'fields': ('previous_status', 'new_status')
@@ -139,12 +140,16 @@ class ShipmentStatusUpdateAdmin(admin.ModelAdmin):
         }),
         ('Dati tecnici', {
             'classes': ('collapse',),
-            'fields': ('created_at', 'payload')
+            'fields': ('created_at', 'stored_payload')
         }),
     )
     list_per_page = 20
     date_hierarchy = 'created_at'
-    actions = ['mark_as_processed', 'mark_as_unprocessed']
+    actions = ['mark_as_processed', 'mark_as_unprocessed', 'requeue_updates']
+    
+    def stored_payload(self, obj):
+        return obj.get_payload()
+    stored_payload.short_description = "Payload completo"
     
     def mark_as_processed(self, request, queryset):
         updated = queryset.update(processed=True)
@@ -155,6 +160,14 @@ class ShipmentStatusUpdateAdmin(admin.ModelAdmin):
         updated = queryset.update(processed=False)
         self.message_user(request, f"{updated} aggiornamenti di stato contrassegnati come non elaborati.")
     mark_as_unprocessed.short_description = "Segna come non elaborati"
+    
+    def requeue_updates(self, request, queryset):
+        from .utils.webhook_queue import enqueue, replay
+        ids = list(queryset.values_list('id', flat=True))
+        requeued = replay(ids)
+        enqueue(ids)
+        self.message_user(request, f"{requeued} aggiornamenti di stato rimessi in coda di elaborazione.")
+    requeue_updates.short_description = "Rimetti in coda di elaborazione"
 
 @admin.register(IncomingMessage)
 class IncomingMessageAdmin(admin.ModelAdmin):
@@ -305,3 +318,49 @@ class TelegramMessageAdmin(admin.ModelAdmin):
         updated = queryset.update(status='sent', sent_at=timezone.now())
         self.message_user(request, f"{updated} messaggi contrassegnati come inviati.")
     mark_as_sent.short_description = "Segna come inviati"
+
+
+class MirrorShipmentItemInline(admin.TabularInline):
+    model = MirrorShipmentItem
+    extra = 0
+    readonly_fields = ('line_id', 'item_id', 'merchant_sku', 'asin', 'fnsku', 'title', 'quantity', 'actual_quantity')
+    can_delete = False
+
+
+@admin.register(MirrorShipment)
+class MirrorShipmentAdmin(admin.ModelAdmin):
+    list_display = ('shipment_id', 'shipment_type', 'name', 'merchant_id', 'status', 'archived', 'remote_updated_at', 'source', 'items_updated_at')
+    list_filter = ('shipment_type', 'status', 'archived', 'source')
+    search_fields = ('shipment_id', 'name', 'merchant_id')
+    readonly_fields = ('synced_at', 'payload')
+    inlines = [MirrorShipmentItemInline]
+    list_per_page = 50
+
+
+@admin.register(MirrorSyncState)
+class MirrorSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('key', 'watermark', 'last_run_at', 'last_success_at', 'shipments_synced', 'last_error')
+    search_fields = ('key',)
+
+
+@admin.register(MerchantDirectoryEntry)
+class MerchantDirectoryEntryAdmin(admin.ModelAdmin):
+    list_display = ('merchant_id', 'name', 'email', 'enabled', 'name_score', 'refreshed_at')
+    list_filter = ('enabled',)
+    search_fields = ('merchant_id', 'name', 'email')
+    readonly_fields = ('refreshed_at', 'payload')
+
+
+@admin.register(WebhookLane)
+class WebhookLaneAdmin(admin.ModelAdmin):
+    list_display = ('lane', 'owner', 'lease_expires_at', 'last_drained_at', 'processed_count')
+
+
+@admin.register(WebhookPayloadArchive)
+class WebhookPayloadArchiveAdmin(admin.ModelAdmin):
+    list_display = ('update', 'month', 'codec', 'raw_size', 'archived_at')
+    list_filter = ('month', 'codec')
+    search_fields = ('update__shipment_id',)
+    exclude = ('data',)
+    readonly_fields = ('update', 'month', 'codec', 'raw_size', 'archived_at')
+    list_per_page = 50
@@ -7,6 +7,11 @@ from libs.prepbusiness.client import PrepBusinessClient
 from libs.prepbusiness.models import PrepBusinessError, AuthenticationError, Carrier, ExpectedItemUpdate, ActualItemUpdate
 
 from .models import ShipmentStatusUpdate, PrepBusinessConfig
+from .utils.clients import get_configured_client
+from .utils import inventory_index
+from .utils.merchant_directory import get_merchant_directory
+from .utils.mirror import find_shipment_by_name
+from .utils.payload_archive import restore_payload
 from .services import format_shipment_notification
 from .tasks import send_telegram_notification
 
@@ -25,22 +30,12 @@ class WebhookEventProcessor:
             logger.error("ERRORE CRITICO: WebhookEventProcessor non è riuscito a inizializzare il client ufficiale.")
 
     def _initialize_client(self) -> Optional[PrepBusinessClient]:
-        """Inizializza il client ufficiale leggendo la config dal DB o dalle variabili d'ambiente."""
+        """Restituisce il client condiviso del processo (config dal DB o dalle variabili d'ambiente)."""
         try:
-            config = PrepBusinessConfig.objects.filter(is_active=True).first()
-            if config and config.api_url and config.api_key:
-                logger.info("Inizializzazione client da configurazione DB.")
-                domain = config.api_url.replace('https://', '').split('/api')[0]
-                return PrepBusinessClient(api_key=config.api_key, company_domain=domain, timeout=config.api_timeout)
-            
-            logger.warning("Configurazione DB non trovata. Fallback su variabili d'ambiente.")
-            from libs.config import PREP_BUSINESS_API_URL, PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_TIMEOUT
-            if PREP_BUSINESS_API_KEY and PREP_BUSINESS_API_URL:
-                domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-                return PrepBusinessClient(api_key=PREP_BUSINESS_API_KEY, company_domain=domain, timeout=PREP_BUSINESS_API_TIMEOUT)
-            
-            logger.error("Nessuna configurazione API valida trovata (né DB, né .env). Client non creato.")
-            return None
+            client = get_configured_client()
+            if client is None:
+                logger.error("Nessuna configurazione API valida trovata (né DB, né .env). Client non creato.")
+            return client
         except Exception as e:
             logger.error(f"Errore critico durante l'inizializzazione del client: {e}", exc_info=True)
             return None
@@ -52,6 +47,9 @@ class WebhookEventProcessor:
         except ShipmentStatusUpdate.DoesNotExist:
             return {'success': False, 'message': f'Update {update_id} non trovato.'}
 
+        # Rielaborazione di un webhook vecchio: il payload torna dall'archivio compresso
+        restore_payload(update)
+
         if not self.client:
             return {'success': False, 'message': 'Client non disponibile. Elaborazione annullata.'}
 
@@ -72,6 +70,7 @@ class WebhookEventProcessor:
         update.process_success = result.get('success', False)
         update.process_result = result
         update.processed_at = timezone.now()
+        update.processing_status = 'done' if update.process_success else 'failed'
         update.save()
         
         logger.info(f"Fine elaborazione ID={update.id}. Successo: {update.process_success}")
@@ -89,13 +88,11 @@ class WebhookEventProcessor:
         merchant_id = int(data.get('team_id'))
 
         try:
-            inbound_response = self.client.get_inbound_shipments(merchant_id=merchant_id, per_page=500)
-            active_inbounds = inbound_response.data if inbound_response else []
-            
-            matching_shipment = next((s for s in active_inbounds if s.name.lower() == shipment_name.lower()), None)
+            # Lookup per nome normalizzato sul mirror locale degli inbound del merchant
+            matching_shipment = find_shipment_by_name(self.client, merchant_id, 'inbound', shipment_name)
             
             if matching_shipment:
-                msg = f"Trovata corrispondenza inbound: ID {matching_shipment.id}"
+                msg = f"Trovata corrispondenza inbound: ID {matching_shipment.shipment_id}"
                 logger.info(msg)
                 return {'success': True, 'message': msg}
             else:
@@ -120,25 +117,22 @@ class WebhookEventProcessor:
             outbound_items = [i.model_dump() for i in outbound_items_resp.items] if outbound_items_resp and outbound_items_resp.items else []
             logger.info(f"✅ Step 1 completato: Recuperati {len(outbound_items)} items da outbound {outbound_id}")
 
-            # 2. Cerco l'inbound originale corrispondente
-            logger.info(f"🔍 Step 2: Cerco inbound corrispondenti per merchant {merchant_id}")
-            inbound_resp = self.client.get_inbound_shipments(merchant_id=merchant_id, per_page=500)
-            if not (inbound_resp and inbound_resp.data):
-                logger.warning(f"⚠️ Step 2: Nessun inbound trovato per merchant {merchant_id}")
-                return {'success': True, 'message': f"Nessun inbound trovato per merchant {merchant_id}."}
-            
-            logger.info(f"✅ Step 2 completato: Trovati {len(inbound_resp.data)} inbound totali")
-            
-            # Filtra per nome
-            logger.info(f"🔍 Step 2b: Filtro inbound per nome '{shipment_name}'")
-            matching_inbounds = [s for s in inbound_resp.data if s.name.lower() == shipment_name.lower()]
-            if not matching_inbounds:
-                logger.warning(f"⚠️ Step 2b: Nessun inbound corrispondente a '{shipment_name}' trovato")
+            # 2. Cerco l'inbound originale corrispondente (lookup per nome normalizzato sul mirror locale)
+            logger.info(f"🔍 Step 2: Cerco inbound '{shipment_name}' per merchant {merchant_id}")
+            inbound_original = find_shipment_by_name(self.client, merchant_id, 'inbound', shipment_name)
+
+            if inbound_original is None:
+                logger.warning(f"⚠️ Step 2: Nessun inbound corrispondente a '{shipment_name}' trovato")
                 return {'success': True, 'message': f"Nessun inbound corrispondente a '{shipment_name}' trovato."}
             
-            inbound_original_model = matching_inbounds[0]
-            inbound_original_id = inbound_original_model.id
-            logger.info(f"✅ Step 2b completato: Trovato inbound corrispondente ID {inbound_original_id}")
+            inbound_original_id = inbound_original.shipment_id
+            warehouse_id = (inbound_original.payload or {}).get('warehouse_id')
+            if warehouse_id is None:
+                # Spedizione arrivata nel mirror da un webhook senza warehouse_id
+                warehouse_id = self.client.get_inbound_shipment(
+                    shipment_id=inbound_original_id, merchant_id=merchant_id
+                ).shipment.warehouse_id
+            logger.info(f"✅ Step 2 completato: Trovato inbound corrispondente ID {inbound_original_id}")
             
             # 3. Recupero items dall'inbound originale
             logger.info(f"🔍 Step 3: Recupero items da inbound originale {inbound_original_id} per merchant {merchant_id}")
@@ -146,6 +140,9 @@ class WebhookEventProcessor:
             inbound_items = [i.model_dump() for i in inbound_items_resp.items] if inbound_items_resp and inbound_items_resp.items else []
             logger.info(f"✅ Step 3 completato: Recuperati {len(inbound_items)} items da inbound originale {inbound_original_id}")
 
+            # Gli items appena scaricati aggiornano l'indice SKU → item_id del merchant
+            inventory_index.remember_items(merchant_id, inbound_items + outbound_items)
+
             # 4. Calcolo residuali e partial (ottimizzato per evitare doppio calcolo)
             residual_items_data = self._calculate_residual_items(inbound_items, outbound_items)
             partial_items_data = self._calculate_partial_items_optimized(outbound_items, residual_items_data)
@@ -162,10 +159,10 @@ class WebhookEventProcessor:
             # 5a. Crea RESIDUAL se necessario
             if create_residual:
                 logger.info(f"Calcolati {len(residual_items_data)} items residuali.")
-                residual_result = self._create_shipment(
+                residual_result = self._existing_created_shipment(update, merchant_id, f"{shipment_name} - RESIDUAL") or self._create_shipment(
                     shipment_name=f"{shipment_name} - RESIDUAL",
                     items_data=residual_items_data,
-                    warehouse_id=inbound_original_model.warehouse_id,
+                    warehouse_id=warehouse_id,
                     outbound_id=outbound_id,
                     merchant_id=merchant_id,
                     creation_type="residual"
@@ -178,10 +175,10 @@ class WebhookEventProcessor:
             # 5b. Crea PARTIAL se necessario
             if create_partial:
                 logger.info(f"Calcolati {len(partial_items_data)} items partial.")
-                partial_result = self._create_shipment(
+                partial_result = self._existing_created_shipment(update, merchant_id, f"{shipment_name} - PARTIAL") or self._create_shipment(
                     shipment_name=f"{shipment_name} - PARTIAL",
                     items_data=partial_items_data,
-                    warehouse_id=inbound_original_model.warehouse_id,
+                    warehouse_id=warehouse_id,
                     outbound_id=outbound_id,
                     merchant_id=merchant_id,
                     creation_type="partial"
@@ -207,6 +204,19 @@ class WebhookEventProcessor:
             logger.error(f"Errore in _process_outbound_shipment_closed: {e}", exc_info=True)
             return {'success': False, 'message': str(e)}
 
+    def _existing_created_shipment(self, update: ShipmentStatusUpdate, merchant_id: int, shipment_name: str) -> Optional[dict]:
+        """
+        Su un nuovo tentativo dello stesso webhook (retry o replay) la spedizione RESIDUAL/PARTIAL
+        può essere già stata creata dal tentativo precedente: in quel caso non va duplicata.
+        """
+        if not getattr(update, 'processed', False):
+            return None
+        existing = find_shipment_by_name(self.client, merchant_id, 'inbound', shipment_name)
+        if existing is None:
+            return None
+        logger.warning(f"⚠️ '{shipment_name}' già creata da un tentativo precedente (ID {existing.shipment_id}), non la ricreo")
+        return {'success': True, 'shipment_id': existing.shipment_id, 'message': 'Spedizione già esistente'}
+
     def _create_shipment(self, shipment_name: str, items_data: list, warehouse_id: int, outbound_id: int, merchant_id: int, creation_type: str) -> dict:
         """Helper method per creare un singolo shipment con i suoi items."""
         try:
@@ -229,21 +239,30 @@ class WebhookEventProcessor:
                 
                 logger.info(f"Aggiungendo item {sku} con quantità expected: {expected_qty}, actual: {actual_qty}")
                 
-                # Cerca l'item nel sistema per ottenere l'item_id
-                inventory_resp = self.client.search_inventory(sku)
-                if not inventory_resp.items:
-                    logger.error(f"Item con SKU {sku} non trovato nell'inventario")
+                # item_id dalla riga di origine; altrimenti dall'indice SKU → item_id del merchant
+                item_id = item_data.get('item_id')
+                from_index = item_id is None
+                if from_index:
+                    item_id = inventory_index.resolve_item_id(
+                        self.client, merchant_id, sku, item_data.get('fnsku'), item_data.get('asin')
+                    )
+                if item_id is None:
+                    logger.error(f"Item con SKU {sku} non trovato nell'inventario del merchant {merchant_id}")
                     continue
-                    
-                item_id = inventory_resp.items[0].id
                 
                 # Step 2a: Aggiungi l'item con la quantità expected
-                add_response = self.client.add_item_to_shipment(
-                    shipment_id=shipment_id,
-                    item_id=item_id,
-                    quantity=expected_qty,
-                    merchant_id=merchant_id
-                )
+                try:
+                    add_response = self.client.add_item_to_shipment(
+                        shipment_id=shipment_id,
+                        item_id=item_id,
+                        quantity=expected_qty,
+                        merchant_id=merchant_id
+                    )
+                except PrepBusinessError:
+                    if from_index:
+                        # L'item_id in cache potrebbe non essere più valido: alla prossima volta lo si ricerca
+                        inventory_index.forget(merchant_id, sku, item_data.get('fnsku'), item_data.get('asin'))
+                    raise
                 logger.info(f"Item {sku} aggiunto con quantità expected: {expected_qty}")
                 
                 # Step 2b: IMMEDIATAMENTE aggiorna con quantità actual corretta
@@ -371,6 +390,7 @@ class WebhookEventProcessor:
                 
                 residual_data = {
                     "sku": sku,
+                    "item_id": item.get('item_id'),
                     "expected_quantity": max(0, residual_expected),  # Non può essere negativo
                     "actual_quantity": max(0, residual_actual),     # Non può essere negativo
                     "name": item_data.get('title') or item_data.get('name'),
@@ -418,6 +438,7 @@ class WebhookEventProcessor:
             
             partial_data = {
                 "sku": sku,
+                "item_id": item.get('item_id'),
                 "expected_quantity": shipped_qty,  # Attesi = Spediti
                 "actual_quantity": shipped_qty,    # Ricevuti = Spediti  
                 "name": item_data.get('title') or item_data.get('name'),
@@ -507,12 +528,7 @@ class WebhookEventProcessor:
 
     def _get_merchant_email(self, merchant_id: str) -> Optional[str]:
         try:
-            merchants_resp = self.client.get_merchants()
-            if merchants_resp and merchants_resp.data:
-                # Cerca il merchant specifico nella lista
-                merchant = next((m for m in merchants_resp.data if str(m.id) == str(merchant_id)), None)
-                if merchant:
-                    return merchant.primaryEmail
+            return get_merchant_directory().email(merchant_id)
         except Exception as e:
             logger.error(f"Impossibile recuperare email per merchant {merchant_id}: {e}")
         return None
@@ -520,12 +536,7 @@ class WebhookEventProcessor:
     def _get_merchant_name(self, merchant_id: str) -> Optional[str]:
         """Ottiene il nome del merchant dal suo ID."""
         try:
-            merchants_resp = self.client.get_merchants()
-            if merchants_resp and merchants_resp.data:
-                # Cerca il merchant specifico nella lista
-                merchant = next((m for m in merchants_resp.data if str(m.id) == str(merchant_id)), None)
-                if merchant:
-                    return merchant.name
+            return get_merchant_directory().name(merchant_id)
         except Exception as e:
             logger.error(f"Impossibile recuperare nome per merchant {merchant_id}: {e}")
-        return None 
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+Archiviazione compressa dei payload dei webhook delle spedizioni (vedi utils/payload_archive.py).
+Di solito la fa ogni notte il task ``archive_webhook_payloads``.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from libs.config import PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS, PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS
+from prep_management.utils.payload_archive import ZSTD_AVAILABLE, archive_payloads, archive_stats, purge_archive
+
+
+class Command(BaseCommand):
+    help = 'Sposta compressi nell\'archivio i payload dei webhook elaborati da più di N giorni'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS or 30,
+                            help='Archivia i webhook ricevuti da più di N giorni (default: PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Webhook per transazione (default: 500)')
+        parser.add_argument('--limit', type=int, help='Numero massimo di webhook da archiviare')
+        parser.add_argument('--purge-months', type=int, default=PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS,
+                            help='Elimina l\'archivio dei mesi più vecchi di N mesi (default: PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS, 0 = mai)')
+        parser.add_argument('--stats', action='store_true', help='Mostra solo il riepilogo dell\'archivio per mese')
+
+    def handle(self, *args, **options):
+        if not options['stats']:
+            if options['days'] < 0:
+                raise CommandError('--days non può essere negativo')
+            self.stdout.write(f"🗜️ Archiviazione payload più vecchi di {options['days']} giorni ({'zstd' if ZSTD_AVAILABLE else 'zlib'})")
+            start = time.perf_counter()
+            stats = archive_payloads(days=options['days'], batch_size=options['batch_size'], limit=options['limit'])
+            ratio = stats['raw_bytes'] / stats['compressed_bytes'] if stats['compressed_bytes'] else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {stats['archived']} payload archiviati in {time.perf_counter() - start:.1f} s: "
+                f"{stats['raw_bytes'] / 1024:.0f} KB → {stats['compressed_bytes'] / 1024:.0f} KB ({ratio:.1f}x)"
+            ))
+            purged = purge_archive(options['purge_months'])
+            if purged:
+                self.stdout.write(self.style.WARNING(f"🗑️ {purged} payload archiviati eliminati (più vecchi di {options['purge_months']} mesi)"))
+
+        self.stdout.write(f'\n{"mese":<10}{"payload":>10}{"JSON KB":>12}{"compressi KB":>15}')
+        for month, row in archive_stats().items():
+            self.stdout.write(f"{month:<10}{row['count']:>10}{row['raw_bytes'] / 1024:>12.0f}{row['compressed_bytes'] / 1024:>15.0f}")
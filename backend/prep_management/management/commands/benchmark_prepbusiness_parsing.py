@@ -0,0 +1,202 @@
+"""
+Benchmark del parsing delle risposte PrepBusiness.
+
+Confronta tempo CPU e picco di memoria di decodifica JSON + costruzione dei
+modelli su pagine sintetiche di inventario e di item di spedizione outbound:
+solo involucro, scansione dei primi N elementi (come gli iteratori che si
+fermano alla prima corrispondenza), tutti gli elementi e model_dump (come
+fanno event handler e task).
+"""
+
+import gc
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from libs.prepbusiness.models import InventoryResponse, OutboundShipmentItemsResponse
+from libs.prepbusiness.parsing import parse_model, loads, ORJSON_AVAILABLE, VALIDATE, LAZY
+
+
+def _ts(base, offset):
+    return (base + timedelta(minutes=offset)).strftime('%Y-%m-%dT%H:%M:%S.000000Z')
+
+
+def _inventory_item(i, base):
+    return {
+        'id': 100000 + i,
+        'created_at': _ts(base, i),
+        'updated_at': _ts(base, i + 1),
+        'team_id': 42,
+        'merchant_sku': f'SKU-{i:06d}',
+        'title': f'Prodotto di prova numero {i} con un titolo abbastanza lungo da essere realistico',
+        'condition': 'NewItem',
+        'condition_note': None,
+        'bundle_id': None,
+        'length_mm': 300, 'width_mm': 200, 'height_mm': 100, 'weight_gm': 850,
+        'quantity_in_stock': i % 50,
+        'available_quantity': i % 40,
+        'allocated_quantity': i % 5,
+        'unavailable_quantity': 0,
+        'inbound_quantity': i % 7,
+        'fnsku': f'X00{i:07d}',
+        'asin': f'B0{i:08d}',
+        'searchableIdentifiers': f'SKU-{i:06d} X00{i:07d} B0{i:08d}',
+        'prep_instructions': [],
+        'images': [{
+            'id': 500000 + i,
+            'path': f'images/{i}.jpg',
+            'large_url': f'https://cdn.example.com/images/{i}-large.jpg',
+            'thumbnail_url': f'https://cdn.example.com/images/{i}-thumb.jpg',
+            'imageable_id': 100000 + i,
+            'imageable_type': 'App\\Models\\Item',
+        }],
+        'identifiers': [
+            {'id': 700000 + i * 2, 'created_at': _ts(base, i), 'updated_at': _ts(base, i),
+             'item_id': 100000 + i, 'identifier': f'B0{i:08d}', 'identifier_type': 'ASIN'},
+            {'id': 700001 + i * 2, 'created_at': _ts(base, i), 'updated_at': _ts(base, i),
+             'item_id': 100000 + i, 'identifier': f'X00{i:07d}', 'identifier_type': 'FNSKU'},
+        ],
+        'bundle': None,
+        'listings': [],
+        'item_group_configurations': [{
+            'id': 900000 + i, 'created_at': _ts(base, i), 'updated_at': _ts(base, i),
+            'item_id': 100000 + i, 'quantity': 12, 'type': 'case', 'weight_gm': 10200,
+            'length_mm': 600, 'width_mm': 400, 'height_mm': 300, 'contains': None, 'default': True,
+        }],
+        'tags': [],
+    }
+
+
+def build_inventory_page(size):
+    """Pagina di inventario sintetica con ``size`` item."""
+    base = datetime(2024, 1, 1)
+    return {
+        'current_page': 1,
+        'data': [_inventory_item(i, base) for i in range(size)],
+        'first_page_url': 'https://example.com/api/inventory?page=1',
+        'from': 1,
+        'last_page': 10,
+        'last_page_url': 'https://example.com/api/inventory?page=10',
+        'links': [{'url': None, 'label': '&laquo; Previous', 'active': False},
+                  {'url': 'https://example.com/api/inventory?page=1', 'label': '1', 'active': True}],
+        'next_page_url': 'https://example.com/api/inventory?page=2',
+        'path': 'https://example.com/api/inventory',
+        'per_page': size,
+        'prev_page_url': None,
+        'to': size,
+        'total': size * 10,
+    }
+
+
+def build_outbound_items_page(size):
+    """Risposta sintetica di get_outbound_shipment_items con ``size`` item."""
+    base = datetime(2024, 1, 1)
+    items = []
+    for i in range(size):
+        items.append({
+            'id': 300000 + i,
+            'created_at': _ts(base, i),
+            'updated_at': _ts(base, i + 1),
+            'shipment_id': 1234,
+            'item_id': 100000 + i,
+            'quantity': 1 + i % 24,
+            'case_quantity': None,
+            'expiry_date': None,
+            'cost_per_item': 3.5,
+            'item': _inventory_item(i, base),
+            'bundle': None,
+            'item_group_configurations': [],
+            'moves': [],
+            'company_services': [{
+                'id': 11, 'created_at': _ts(base, 0), 'updated_at': _ts(base, 0),
+                'name': 'FBA Prep', 'type': 'item', 'unit': 'unit', 'when_to_charge': 'on_ship',
+                'charge': '0.50', 'advanced_options': [], 'service_provider_id': 1, 'price_records': [],
+                'archived_at': None,
+                'pivot': {'outbound_shipment_item_id': 300000 + i, 'company_service_id': 11,
+                          'created_at': _ts(base, i), 'updated_at': _ts(base, i)},
+            }],
+        })
+    return {'items': items}
+
+
+def _items(response):
+    return response.data if hasattr(response, 'data') else response.items
+
+
+class Command(BaseCommand):
+    help = 'Benchmark di decodifica JSON e validazione Pydantic delle risposte PrepBusiness (validate vs lazy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=500, help='Item per pagina (default: 500)')
+        parser.add_argument('--iterations', type=int, default=20, help='Ripetizioni per la misura CPU (default: 20)')
+        parser.add_argument('--scan', type=int, default=10, help='Item letti nello scenario "scansione" (default: 10)')
+
+    def handle(self, *args, **options):
+        size = options['items']
+        iterations = options['iterations']
+        scan = options['scan']
+
+        payloads = [
+            ('inventory', InventoryResponse, json.dumps(build_inventory_page(size)).encode()),
+            ('outbound_items', OutboundShipmentItemsResponse, json.dumps(build_outbound_items_page(size)).encode()),
+        ]
+
+        decoders = [('json', json.loads)]
+        if ORJSON_AVAILABLE:
+            decoders.append(('orjson', loads))
+        else:
+            self.stdout.write(self.style.WARNING('⚠️ orjson non installato: confronto solo con json della stdlib'))
+        variants = [
+            (f'{decoder_name} + {mode}', decoder, mode)
+            for mode in (VALIDATE, LAZY)
+            for decoder_name, decoder in decoders
+        ]
+
+        for name, model, body in payloads:
+            self.stdout.write(f'\n📦 {name}: {size} item, {len(body) / 1024:.0f} KiB, {iterations} iterazioni')
+            self.stdout.write(
+                f'{"variante":<20}{"decode ms":>11}{"parse ms":>10}{f"scan {scan} ms":>12}'
+                f'{"tutti ms":>10}{"+dump ms":>10}{"picco KiB":>11}'
+            )
+            for label, decode, mode in variants:
+                decode_ms = self._cpu_ms(lambda: decode(body), iterations)
+                parse_ms = self._cpu_ms(lambda: parse_model(model, decode(body), mode), iterations)
+                scan_ms = self._cpu_ms(
+                    lambda: list(islice(_items(parse_model(model, decode(body), mode)), scan)), iterations
+                )
+                all_ms = self._cpu_ms(lambda: list(_items(parse_model(model, decode(body), mode))), iterations)
+                dump_ms = self._cpu_ms(
+                    lambda: [i.model_dump() for i in _items(parse_model(model, decode(body), mode))], iterations
+                )
+                peak_kib = self._peak_kib(lambda: list(_items(parse_model(model, decode(body), mode))))
+                self.stdout.write(
+                    f'{label:<20}{decode_ms:>11.1f}{parse_ms:>10.1f}{scan_ms:>12.1f}'
+                    f'{all_ms:>10.1f}{dump_ms:>10.1f}{peak_kib:>11.0f}'
+                )
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark completato'))
+
+    @staticmethod
+    def _cpu_ms(fn, iterations):
+        fn()  # riscaldamento (piani lazy, cache di pydantic)
+        gc.collect()
+        start = time.process_time()
+        for _ in range(iterations):
+            fn()
+        return (time.process_time() - start) * 1000 / iterations
+
+    @staticmethod
+    def _peak_kib(fn):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del result
+        return peak / 1024
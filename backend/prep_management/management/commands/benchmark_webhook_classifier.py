@@ -0,0 +1,64 @@
+"""
+Benchmark della classificazione dei webhook delle spedizioni.
+
+Confronta, al crescere del numero di items nel payload, il classificatore a
+regole (utils/webhook_classifier.py) con la ricerca del marcatore "outbound"
+in ``str(payload).lower()`` fatta in precedenza dalla view a ogni webhook.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from prep_management.utils.webhook_classifier import classify
+from .benchmark_prepbusiness_parsing import build_outbound_items_page
+
+
+def _webhook_data(items):
+    """Campi di primo livello di un webhook outbound con ``items`` righe (come /shipments/outbound)."""
+    return {
+        'id': 61234, 'created_at': '2025-03-04T09:12:33.000000Z', 'updated_at': '2025-03-04T10:01:47.000000Z',
+        'team_id': 101, 'status': 'closed', 'notes': '', 'name': 'Spedizione 101-00042', 'warehouse_id': 1,
+        'shipped_at': '2025-03-05T08:00:00.000000Z', 'internal_notes': None, 'ship_from_address_id': None,
+        'archived_at': None, 'currency': 'EUR', 'is_case_forwarding': False, 'sku_count': items,
+        'shipped_items_count': None, 'searchable_identifiers': '', 'searchable_tags': [], 'tags': [],
+        'fba_transport_plans': [],
+        'outbound_items': build_outbound_items_page(items)['items'],
+    }
+
+
+def _stringify_marker(data):
+    return 'outbound' in str(data).lower()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark del classificatore dei webhook (regole sui campi vs stringificazione del payload)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='0,10,100,1000', help='Numero di items dei payload (default: 0,10,100,1000)')
+        parser.add_argument('--iterations', type=int, default=200, help='Ripetizioni per misura (default: 200)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        iterations = options['iterations']
+
+        self.stdout.write(f'\n📨 Classificazione webhook outbound.closed, {iterations} iterazioni')
+        self.stdout.write(f'{"items":>8}{"str(payload) µs":>18}{"regole µs":>12}{"rapporto":>10}')
+        for size in sizes:
+            data = _webhook_data(size)
+            if classify(data).event_type != 'outbound_shipment.closed':
+                self.stdout.write(self.style.ERROR(f'❌ Classificazione inattesa con {size} items'))
+                return
+            legacy_us = self._cpu_us(lambda: _stringify_marker(data), iterations)
+            rules_us = self._cpu_us(lambda: classify(data), iterations)
+            self.stdout.write(f'{size:>8}{legacy_us:>18.1f}{rules_us:>12.1f}{legacy_us / rules_us:>9.0f}x')
+
+        self.stdout.write(self.style.SUCCESS('\n✅ Benchmark completato'))
+
+    @staticmethod
+    def _cpu_us(fn, iterations):
+        fn()
+        start = time.process_time()
+        for _ in range(iterations):
+            fn()
+        return (time.process_time() - start) * 1_000_000 / iterations
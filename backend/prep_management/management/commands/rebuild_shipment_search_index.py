@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from prep_management.utils.search_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice full-text delle spedizioni del mirror locale (nome e titolo/SKU/ASIN/FNSKU degli items)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Spedizioni lette dal database per volta (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Indice ricostruito: {count} spedizioni in {time.perf_counter() - start:.1f} s')
+        )
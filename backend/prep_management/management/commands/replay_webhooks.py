@@ -0,0 +1,107 @@
+"""
+Rielaborazione in blocco dei webhook delle spedizioni (tipicamente quelli in
+dead letter dopo un disservizio dell'API PrepBusiness).
+
+I webhook selezionati tornano in coda con un nuovo budget di tentativi e
+vengono elaborati corsia per corsia: l'ordine per spedizione resta quello di
+arrivo, corsie diverse vanno in parallelo. Senza ``--enqueue`` l'elaborazione
+gira in questo processo con il client condiviso: se ``PREP_BUSINESS_RATE_LIMIT``
+è impostato, tutte le corsie passano dallo stesso rate limiter.
+"""
+
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from prep_management.models import ShipmentStatusUpdate
+from prep_management.utils.webhook_queue import drain_lane, enqueue, replay
+
+
+def _drain(lane, owner):
+    try:
+        # Svuota la corsia anche oltre MAX_UPDATES_PER_DRAIN: il replay deve finire qui
+        total = 0
+        while True:
+            result = drain_lane(lane, owner)
+            total += result.get('processed', 0)
+            if result.get('skipped') or result.get('lease_lost') or not result.get('processed'):
+                return lane, total, result
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Rielabora in blocco i webhook falliti o in dead letter (filtrabili per stato, evento, merchant e data)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', default='failed,dead_letter',
+                            help='Stati da rielaborare, separati da virgola (default: failed,dead_letter)')
+        parser.add_argument('--event-type', help='Solo questo tipo di evento (es. outbound_shipment.closed)')
+        parser.add_argument('--merchant', help='Solo questo merchant_id')
+        parser.add_argument('--since-hours', type=int, help='Solo webhook ricevuti nelle ultime N ore')
+        parser.add_argument('--ids', help='Id specifici separati da virgola (ignora gli altri filtri)')
+        parser.add_argument('--limit', type=int, default=500, help='Numero massimo di webhook (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=4, help='Corsie elaborate in parallelo (default: 4)')
+        parser.add_argument('--enqueue', action='store_true', help='Accoda ai worker Celery invece di elaborare qui')
+        parser.add_argument('--dry-run', action='store_true', help='Mostra cosa verrebbe rielaborato senza modificare nulla')
+
+    def handle(self, *args, **options):
+        if options['ids']:
+            try:
+                ids = [int(value) for value in options['ids'].split(',') if value.strip()]
+            except ValueError:
+                raise CommandError('--ids deve contenere id numerici separati da virgola')
+            updates = ShipmentStatusUpdate.objects.filter(id__in=ids)
+        else:
+            statuses = [value.strip() for value in options['status'].split(',') if value.strip()]
+            updates = ShipmentStatusUpdate.objects.filter(processing_status__in=statuses)
+            if options['event_type']:
+                updates = updates.filter(event_type=options['event_type'])
+            if options['merchant']:
+                updates = updates.filter(merchant_id=options['merchant'])
+            if options['since_hours']:
+                updates = updates.filter(created_at__gte=timezone.now() - timedelta(hours=options['since_hours']))
+
+        selected = list(updates.exclude(processing_status='processing').order_by('id').values_list('id', 'lane')[:options['limit']])
+        if not selected:
+            self.stdout.write(self.style.WARNING('⚠️ Nessun webhook da rielaborare'))
+            return
+
+        ids = [update_id for update_id, _ in selected]
+        lanes = sorted({lane for _, lane in selected if lane is not None})
+        self.stdout.write(f'🔁 {len(ids)} webhook selezionati su {len(lanes)} corsie')
+        if options['dry_run']:
+            for status, count in Counter(ShipmentStatusUpdate.objects.filter(id__in=ids).values_list('processing_status', flat=True)).items():
+                self.stdout.write(f'   {status}: {count}')
+            self.stdout.write(self.style.SUCCESS('✅ Dry run: nessuna modifica'))
+            return
+
+        requeued = replay(ids)
+        self.stdout.write(f'📥 {requeued} webhook rimessi in coda')
+
+        if options['enqueue']:
+            dispatched = enqueue(ids)
+            self.stdout.write(self.style.SUCCESS(f'✅ {dispatched} corsie accodate ai worker'))
+            return
+
+        owner = f'replay:{uuid.uuid4().hex[:12]}'
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            for lane, processed, result in executor.map(lambda lane: _drain(lane, owner), lanes):
+                if result.get('skipped'):
+                    self.stdout.write(self.style.WARNING(f'⚠️ Corsia {lane} occupata da un worker: i suoi webhook li elabora lui'))
+                else:
+                    self.stdout.write(f'   corsia {lane}: {processed} elaborati')
+
+        outcome = Counter(ShipmentStatusUpdate.objects.filter(id__in=ids).values_list('processing_status', flat=True))
+        self.stdout.write(f'\n📊 Esito dopo {time.perf_counter() - start:.1f} s:')
+        for status, count in sorted(outcome.items()):
+            self.stdout.write(f'   {status}: {count}')
+        style = self.style.SUCCESS if not outcome.get('dead_letter') else self.style.WARNING
+        self.stdout.write(style(f"✅ Replay completato ({outcome.get('done', 0)}/{len(ids)} elaborati con successo)"))
@@ -0,0 +1,63 @@
+"""
+Avvia lo stand-in locale dell'API PrepBusiness (libs.prepbusiness.standin).
+
+Per usarlo al posto dell'API vera::
+
+    PREP_BUSINESS_API_URL=http://127.0.0.1:8765/api python manage.py runserver
+
+Per registrare o riprodurre gli scambi vedi PREP_BUSINESS_TRANSPORT.
+"""
+
+from django.core.management.base import BaseCommand
+
+from libs.prepbusiness.standin import StandInServer, StandInData
+
+
+class Command(BaseCommand):
+    help = "Avvia uno stand-in HTTP locale dell'API PrepBusiness con latenza e volumi configurabili"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interfaccia (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Porta (default: 8765)')
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Latenza fissa per risposta in ms')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='Latenza casuale aggiuntiva massima in ms')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Frazione di risposte 503 (0-1)')
+        parser.add_argument('--merchants', type=int, default=3, help='Numero di merchant (default: 3)')
+        parser.add_argument('--inventory', type=int, default=2000, help='Item di inventario per merchant')
+        parser.add_argument('--inbound', type=int, default=1000, help='Spedizioni inbound per merchant')
+        parser.add_argument('--outbound', type=int, default=1000, help='Spedizioni outbound per merchant')
+        parser.add_argument('--items', type=int, default=20, help='Item per spedizione')
+        parser.add_argument('--seed', type=int, default=0, help='Seed per jitter ed errori')
+
+    def handle(self, *args, **options):
+        data = StandInData(
+            merchants=options['merchants'],
+            inventory_per_merchant=options['inventory'],
+            inbound_per_merchant=options['inbound'],
+            outbound_per_merchant=options['outbound'],
+            items_per_shipment=options['items'],
+        )
+        server = StandInServer(
+            data,
+            host=options['host'],
+            port=options['port'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'🚀 Stand-in PrepBusiness in ascolto su {server.url}'))
+        self.stdout.write(f'🏪 Merchant: {", ".join(str(m) for m in data.merchant_ids)}')
+        self.stdout.write(
+            f'📦 Per merchant: {data.inventory_per_merchant} item, {data.inbound_per_merchant} inbound, '
+            f'{data.outbound_per_merchant} outbound, {data.items_per_shipment} item per spedizione'
+        )
+        self.stdout.write(self.style.WARNING(f'💡 Usa PREP_BUSINESS_API_URL={server.url}'))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f'\n⏹️ Stand-in fermato. Richieste servite: {server.stats}'))
+        finally:
+            server.stop()
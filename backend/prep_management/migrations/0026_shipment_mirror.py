@@ -0,0 +1,91 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0025_add_marketplace_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MirrorShipment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shipment_type', models.CharField(choices=[('inbound', 'Inbound'), ('outbound', 'Outbound')], max_length=10, verbose_name='Tipo spedizione')),
+                ('shipment_id', models.BigIntegerField(verbose_name='ID Spedizione PrepBusiness')),
+                ('merchant_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID Merchant')),
+                ('name', models.CharField(blank=True, default='', max_length=255, verbose_name='Nome')),
+                ('status', models.CharField(blank=True, default='', max_length=50, verbose_name='Stato')),
+                ('notes', models.TextField(blank=True, null=True, verbose_name='Note')),
+                ('archived', models.BooleanField(default=False, verbose_name='Archiviata')),
+                ('remote_created_at', models.DateTimeField(blank=True, null=True, verbose_name='Creata su PrepBusiness')),
+                ('remote_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='Aggiornata su PrepBusiness')),
+                ('shipped_at', models.DateTimeField(blank=True, null=True, verbose_name='Data spedizione')),
+                ('received_at', models.DateTimeField(blank=True, null=True, verbose_name='Data ricezione')),
+                ('payload', models.JSONField(blank=True, null=True, verbose_name='Dati spedizione')),
+                ('source', models.CharField(choices=[('webhook', 'Webhook'), ('sync', 'Sincronizzazione')], default='sync', max_length=10, verbose_name='Origine ultimo aggiornamento')),
+                ('items_updated_at', models.DateTimeField(blank=True, help_text='updated_at della spedizione a cui corrispondono gli items locali (vuoto = da scaricare)', null=True, verbose_name='Versione items')),
+                ('synced_at', models.DateTimeField(auto_now=True, verbose_name='Ultima sincronizzazione')),
+            ],
+            options={
+                'verbose_name': 'Spedizione (mirror)',
+                'verbose_name_plural': 'Spedizioni (mirror)',
+                'ordering': ['-remote_updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MirrorSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='<tipo>:<merchant_id>', max_length=100, unique=True, verbose_name='Chiave')),
+                ('watermark', models.DateTimeField(blank=True, help_text='updated_at più recente già sincronizzato', null=True, verbose_name='Watermark')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='Ultima esecuzione')),
+                ('last_success_at', models.DateTimeField(blank=True, null=True, verbose_name='Ultima esecuzione riuscita')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='Ultimo errore')),
+                ('shipments_synced', models.PositiveIntegerField(default=0, verbose_name='Spedizioni aggiornate (ultima esecuzione)')),
+            ],
+            options={
+                'verbose_name': 'Stato sincronizzazione mirror',
+                'verbose_name_plural': 'Stati sincronizzazione mirror',
+            },
+        ),
+        migrations.CreateModel(
+            name='MirrorShipmentItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('line_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID riga PrepBusiness')),
+                ('item_id', models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='ID item inventario')),
+                ('merchant_sku', models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='SKU')),
+                ('asin', models.CharField(blank=True, db_index=True, max_length=50, null=True, verbose_name='ASIN')),
+                ('fnsku', models.CharField(blank=True, db_index=True, max_length=50, null=True, verbose_name='FNSKU')),
+                ('title', models.CharField(blank=True, max_length=500, null=True, verbose_name='Titolo')),
+                ('quantity', models.IntegerField(default=0, help_text='Quantità outbound, o quantità attesa per gli inbound', verbose_name='Quantità')),
+                ('actual_quantity', models.IntegerField(blank=True, null=True, verbose_name='Quantità ricevuta')),
+                ('shipment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='prep_management.mirrorshipment', verbose_name='Spedizione')),
+            ],
+            options={
+                'verbose_name': 'Item spedizione (mirror)',
+                'verbose_name_plural': 'Items spedizioni (mirror)',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='mirrorshipment',
+            index=models.Index(fields=['merchant_id', 'shipment_type', 'status'], name='mirror_ship_merchant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mirrorshipment',
+            index=models.Index(fields=['shipment_type', 'remote_updated_at'], name='mirror_ship_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mirrorshipment',
+            index=models.Index(fields=['name'], name='mirror_ship_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='mirrorshipment',
+            constraint=models.UniqueConstraint(fields=('shipment_type', 'shipment_id'), name='unique_mirror_shipment'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Indice full-text per la ricerca spedizioni sul mirror locale
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Crea la tabella dell'indice full-text delle spedizioni del mirror:
+    tsvector + GIN su PostgreSQL, tabella virtuale FTS5 su SQLite.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS prep_management_mirrorshipment_search (
+                shipment_pk bigint PRIMARY KEY
+                    REFERENCES prep_management_mirrorshipment (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+                merchant_id bigint NULL,
+                shipment_type varchar(10) NOT NULL,
+                archived boolean NOT NULL DEFAULT false,
+                document tsvector NOT NULL
+            );
+        """)
+        schema_editor.execute("""
+            CREATE INDEX IF NOT EXISTS mirror_ship_search_doc_idx
+            ON prep_management_mirrorshipment_search USING GIN (document);
+        """)
+        schema_editor.execute("""
+            CREATE INDEX IF NOT EXISTS mirror_ship_search_merchant_idx
+            ON prep_management_mirrorshipment_search (merchant_id, shipment_type);
+        """)
+        print("✅ Indice full-text spedizioni creato (PostgreSQL tsvector + GIN)")
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS prep_management_mirrorshipment_fts USING fts5(
+                    name, titles, codes,
+                    merchant_id UNINDEXED, shipment_type UNINDEXED, archived UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                );
+            """)
+            print("✅ Indice full-text spedizioni creato (SQLite FTS5)")
+        except Exception as e:
+            print(f"⚠️ FTS5 non disponibile, la ricerca userà l'ORM: {e}")
+    else:
+        print(f"ℹ️ Migrazione saltata: indice full-text non supportato su {vendor}")
+        return
+
+    MirrorShipment = apps.get_model('prep_management', 'MirrorShipment')
+    if MirrorShipment.objects.exists():
+        print("ℹ️ Spedizioni già presenti nel mirror: esegui 'python manage.py rebuild_shipment_search_index'")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP TABLE IF EXISTS prep_management_mirrorshipment_search;")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS prep_management_mirrorshipment_fts;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0026_shipment_mirror'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
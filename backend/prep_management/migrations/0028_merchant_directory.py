@@ -0,0 +1,32 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0027_mirror_shipment_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantDirectoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('merchant_id', models.BigIntegerField(unique=True, verbose_name='ID Merchant')),
+                ('name', models.CharField(blank=True, default='', max_length=255, verbose_name='Nome')),
+                ('email', models.CharField(blank=True, default='', max_length=255, verbose_name='Email principale')),
+                ('email_lower', models.CharField(blank=True, db_index=True, default='', max_length=255, verbose_name='Email (minuscolo)')),
+                ('enabled', models.BooleanField(default=True, verbose_name='Attivo')),
+                ('name_score', models.IntegerField(default=0, help_text='Tra più merchant con la stessa email vince il punteggio più alto', verbose_name='Punteggio nome')),
+                ('payload', models.JSONField(blank=True, null=True, verbose_name='Dati merchant')),
+                ('refreshed_at', models.DateTimeField(auto_now=True, verbose_name='Ultimo aggiornamento')),
+            ],
+            options={
+                'verbose_name': 'Merchant (directory)',
+                'verbose_name_plural': 'Merchants (directory)',
+                'ordering': ['name'],
+            },
+        ),
+    ]
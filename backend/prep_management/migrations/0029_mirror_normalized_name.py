@@ -0,0 +1,37 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+def fill_normalized_name(apps, schema_editor):
+    """Calcola normalized_name per le spedizioni già presenti nel mirror."""
+    MirrorShipment = apps.get_model('prep_management', 'MirrorShipment')
+    batch = []
+    for shipment in MirrorShipment.objects.only('id', 'name').iterator(chunk_size=1000):
+        shipment.normalized_name = ' '.join((shipment.name or '').split()).casefold()[:255]
+        batch.append(shipment)
+        if len(batch) >= 1000:
+            MirrorShipment.objects.bulk_update(batch, ['normalized_name'])
+            batch = []
+    if batch:
+        MirrorShipment.objects.bulk_update(batch, ['normalized_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0028_merchant_directory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mirrorshipment',
+            name='normalized_name',
+            field=models.CharField(blank=True, default='', help_text='Nome in minuscolo e con spazi compattati, per il match outbound → inbound', max_length=255, verbose_name='Nome normalizzato'),
+        ),
+        migrations.AddIndex(
+            model_name='mirrorshipment',
+            index=models.Index(fields=['merchant_id', 'shipment_type', 'normalized_name'], name='mirror_ship_norm_name_idx'),
+        ),
+        migrations.RunPython(fill_normalized_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:41
+
+from django.db import migrations, models
+
+
+def mark_existing_updates(apps, schema_editor):
+    """
+    I webhook già presenti sono stati elaborati in modo sincrono dalla view:
+    non vanno rimessi in coda dallo sweeper.
+    """
+    ShipmentStatusUpdate = apps.get_model('prep_management', 'ShipmentStatusUpdate')
+    ShipmentStatusUpdate.objects.filter(processed=True).exclude(process_success=False).update(processing_status='done')
+    ShipmentStatusUpdate.objects.exclude(processing_status='done').update(processing_status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0029_mirror_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Inizio elaborazione'),
+        ),
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='processing_status',
+            field=models.CharField(choices=[('queued', 'In coda'), ('processing', 'In elaborazione'), ('done', 'Elaborato'), ('failed', 'Fallito'), ('duplicate', 'Duplicato')], db_index=True, default='queued', max_length=20, verbose_name='Stato coda'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentstatusupdate',
+            index=models.Index(fields=['processing_status', 'created_at'], name='ssu_processing_status_idx'),
+        ),
+        migrations.RunPython(mark_existing_updates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0030_webhook_processing_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 di tipo evento e dati del webhook', max_length=64, null=True, verbose_name='Chiave di idempotenza'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentstatusupdate',
+            index=models.Index(fields=['shipment_id', 'event_type', 'created_at'], name='ssu_dedup_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shipmentstatusupdate',
+            constraint=models.UniqueConstraint(fields=('idempotency_key',), name='ssu_idempotency_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:46
+
+import zlib
+
+from django.db import migrations, models
+
+# Default di PREP_BUSINESS_WEBHOOK_LANES: la migrazione non dipende dalla configurazione.
+# Con un numero di corsie diverso l'ordine vale per i webhook nuovi (come per lane_for);
+# quelli assegnati qui vengono comunque svuotati dalla loro corsia
+LANES = 16
+
+
+def assign_lanes(apps, schema_editor):
+    """Corsia dei webhook ancora da elaborare (gli altri restano sulla corsia 0)."""
+    ShipmentStatusUpdate = apps.get_model('prep_management', 'ShipmentStatusUpdate')
+    pending = ShipmentStatusUpdate.objects.filter(processing_status__in=('queued', 'processing'))
+    for update in pending.only('id', 'shipment_id').iterator(chunk_size=1000):
+        lane = zlib.crc32(str(update.shipment_id).encode('utf-8')) % LANES
+        ShipmentStatusUpdate.objects.filter(id=update.id).update(lane=lane)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0031_webhook_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookLane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lane', models.PositiveSmallIntegerField(unique=True, verbose_name='Corsia')),
+                ('owner', models.CharField(blank=True, help_text='ID del task che tiene il lease', max_length=255, null=True, verbose_name='Worker')),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Scadenza lease')),
+                ('last_drained_at', models.DateTimeField(blank=True, null=True, verbose_name='Ultimo svuotamento')),
+                ('processed_count', models.PositiveIntegerField(default=0, verbose_name='Webhook elaborati')),
+            ],
+            options={
+                'verbose_name': 'Corsia webhook',
+                'verbose_name_plural': 'Corsie webhook',
+                'ordering': ['lane'],
+            },
+        ),
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='lane',
+            field=models.PositiveSmallIntegerField(default=0, help_text='crc32(shipment_id) % numero di corsie: i webhook di una corsia sono elaborati in ordine', verbose_name='Corsia'),
+        ),
+        migrations.AddIndex(
+            model_name='shipmentstatusupdate',
+            index=models.Index(fields=['lane', 'processing_status', 'id'], name='ssu_lane_queue_idx'),
+        ),
+        migrations.RunPython(assign_lanes, migrations.RunPython.noop),
+    ]
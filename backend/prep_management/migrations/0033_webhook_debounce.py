@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0032_webhook_lanes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='not_before',
+            field=models.DateTimeField(blank=True, help_text='Fine della finestra di accorpamento (debounce) del webhook', null=True, verbose_name='Elabora non prima di'),
+        ),
+        migrations.AlterField(
+            model_name='shipmentstatusupdate',
+            name='processing_status',
+            field=models.CharField(choices=[('queued', 'In coda'), ('processing', 'In elaborazione'), ('done', 'Elaborato'), ('failed', 'Fallito'), ('duplicate', 'Duplicato'), ('superseded', 'Superato da un webhook più recente')], db_index=True, default='queued', max_length=20, verbose_name='Stato coda'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0033_webhook_debounce'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Tentativi'),
+        ),
+        migrations.AlterField(
+            model_name='shipmentstatusupdate',
+            name='not_before',
+            field=models.DateTimeField(blank=True, help_text='Fine della finestra di accorpamento (debounce) o del backoff prima del prossimo tentativo', null=True, verbose_name='Elabora non prima di'),
+        ),
+        migrations.AlterField(
+            model_name='shipmentstatusupdate',
+            name='processing_status',
+            field=models.CharField(choices=[('queued', 'In coda'), ('processing', 'In elaborazione'), ('done', 'Elaborato'), ('failed', 'Fallito'), ('duplicate', 'Duplicato'), ('superseded', 'Superato da un webhook più recente'), ('dead_letter', 'Fallito definitivamente (dead letter)')], db_index=True, default='queued', max_length=20, verbose_name='Stato coda'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.13 on 2026-10-17 04:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0034_webhook_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shipmentstatusupdate',
+            name='payload_archived',
+            field=models.BooleanField(default=False, help_text='Il payload è stato spostato compresso in WebhookPayloadArchive', verbose_name='Payload archiviato'),
+        ),
+        migrations.CreateModel(
+            name='WebhookPayloadArchive',
+            fields=[
+                ('update', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload_archive', serialize=False, to='prep_management.shipmentstatusupdate', verbose_name='Aggiornamento')),
+                ('month', models.CharField(help_text='YYYY-MM', max_length=7, verbose_name='Mese di ricezione')),
+                ('codec', models.CharField(choices=[('zlib', 'zlib'), ('zstd', 'zstd')], max_length=10, verbose_name='Compressione')),
+                ('data', models.BinaryField(verbose_name='Payload compresso')),
+                ('raw_size', models.PositiveIntegerField(verbose_name='Dimensione JSON (byte)')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Data archiviazione')),
+            ],
+            options={
+                'verbose_name': 'Payload webhook archiviato',
+                'verbose_name_plural': 'Payload webhook archiviati',
+                'indexes': [models.Index(fields=['month'], name='wpa_month_idx')],
+            },
+        ),
+    ]
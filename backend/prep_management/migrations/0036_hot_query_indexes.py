@@ -0,0 +1,33 @@
+# Generated by Django 4.2.13 on 2026-10-17 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0035_webhook_payload_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='incomingmessage',
+            index=models.Index(fields=['session_id', 'processed', 'message_type'], name='im_session_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingmessage',
+            index=models.Index(condition=models.Q(('consumed', False)), fields=['created_at'], name='om_pending_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outgoingmessage',
+            index=models.Index(condition=models.Q(('consumed', True)), fields=['consumed_at'], name='om_consumed_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchresultitem',
+            index=models.Index(fields=['search_id', 'id'], name='sri_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='telegramnotification',
+            index=models.Index(fields=['email', 'is_active'], name='tn_email_active_idx'),
+        ),
+    ]
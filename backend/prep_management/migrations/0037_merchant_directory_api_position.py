@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-17 05:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prep_management', '0036_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='merchantdirectoryentry',
+            name='api_position',
+            field=models.PositiveIntegerField(default=0, help_text="A parità di punteggio vince il merchant che l'API elenca per primo", verbose_name="Posizione nella lista dell'API"),
+        ),
+    ]
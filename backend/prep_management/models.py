@@ -184,6 +184,17 @@ class ShipmentStatusUpdate(models.Model):
         ('other', 'Altro'),
     ]
     
+    # Stato della coda di elaborazione (il webhook viene accettato e processato da un worker)
+    PROCESSING_STATUS_CHOICES = [
+        ('queued', 'In coda'),
+        ('processing', 'In elaborazione'),
+        ('done', 'Elaborato'),
+        ('failed', 'Fallito'),
+        ('duplicate', 'Duplicato'),
+        ('superseded', 'Superato da un webhook più recente'),
+        ('dead_letter', 'Fallito definitivamente (dead letter)'),
+    ]
+    
     shipment_id = models.CharField(verbose_name="ID Spedizione", max_length=100)
     event_type = models.CharField(verbose_name="Tipo evento", max_length=100, choices=EVENT_TYPES, default='other')
     previous_status = models.CharField(verbose_name="Stato precedente", max_length=50, choices=STATUS_CHOICES, null=True, blank=True)
@@ -196,6 +207,8 @@ class ShipmentStatusUpdate(models.Model):
                                   help_text="Tipo di entità (inbound_shipment, outbound_shipment, order, invoice)")
     notes = models.TextField(verbose_name="Note", null=True, blank=True)
     payload = models.JSONField(verbose_name="Payload completo", null=True, blank=True)
+    payload_archived = models.BooleanField(verbose_name="Payload archiviato", default=False,
+                                           help_text="Il payload è stato spostato compresso in WebhookPayloadArchive")
     created_at = models.DateTimeField(verbose_name="Data ricezione", auto_now_add=True)
     
     # Campi per l'elaborazione
@@ -204,6 +217,16 @@ class ShipmentStatusUpdate(models.Model):
     process_success = models.BooleanField(verbose_name="Elaborazione riuscita", null=True, blank=True)
     process_message = models.TextField(verbose_name="Messaggio elaborazione", null=True, blank=True)
     process_result = models.JSONField(verbose_name="Risultato elaborazione", null=True, blank=True)
+    processing_status = models.CharField(verbose_name="Stato coda", max_length=20, choices=PROCESSING_STATUS_CHOICES,
+                                         default='queued', db_index=True)
+    processing_started_at = models.DateTimeField(verbose_name="Inizio elaborazione", null=True, blank=True)
+    not_before = models.DateTimeField(verbose_name="Elabora non prima di", null=True, blank=True,
+                                      help_text="Fine della finestra di accorpamento (debounce) o del backoff prima del prossimo tentativo")
+    attempts = models.PositiveSmallIntegerField(verbose_name="Tentativi", default=0)
+    lane = models.PositiveSmallIntegerField(verbose_name="Corsia", default=0,
+                                            help_text="crc32(shipment_id) % numero di corsie: i webhook di una corsia sono elaborati in ordine")
+    idempotency_key = models.CharField(verbose_name="Chiave di idempotenza", max_length=64, null=True, blank=True,
+                                       editable=False, help_text="SHA-256 di tipo evento e dati del webhook")
     
     # Campi per relazioni
     related_shipment_id = models.CharField(verbose_name="ID Spedizione correlata", max_length=100, null=True, blank=True,
@@ -213,6 +236,18 @@ class ShipmentStatusUpdate(models.Model):
         verbose_name = "Aggiornamento stato spedizione"
         verbose_name_plural = "Aggiornamenti stato spedizioni"
         ordering = ['-created_at']
+        indexes = [
+            # Sweeper: webhook rimasti in coda o bloccati in elaborazione, dai più vecchi
+            models.Index(fields=['processing_status', 'created_at'], name='ssu_processing_status_idx'),
+            # Deduplicazione nella finestra di 5 minuti quando la cache non è condivisa
+            models.Index(fields=['shipment_id', 'event_type', 'created_at'], name='ssu_dedup_idx'),
+            # Prossimo webhook in coda di una corsia
+            models.Index(fields=['lane', 'processing_status', 'id'], name='ssu_lane_queue_idx'),
+        ]
+        constraints = [
+            # La stessa consegna ripetuta dal mittente viene rifiutata alla ricezione
+            models.UniqueConstraint(fields=['idempotency_key'], name='ssu_idempotency_key_uniq'),
+        ]
         # Constraint per evitare webhook duplicati - RIMOSSO per evitare problemi
         # constraints = [
         #     models.UniqueConstraint(
@@ -233,6 +268,15 @@ class ShipmentStatusUpdate(models.Model):
         """Restituisce l'etichetta del nuovo stato."""
         return dict(self.STATUS_CHOICES).get(self.new_status, self.new_status)
 
+    def get_payload(self):
+        """Payload del webhook, letto dall'archivio compresso se è già stato archiviato."""
+        if not self.payload_archived:
+            return self.payload
+        if not hasattr(self, '_archived_payload'):
+            from .utils.payload_archive import load_payload
+            self._archived_payload = load_payload(self.id)
+        return self._archived_payload
+
 class OutgoingMessage(models.Model):
     """Coda di messaggi per la comunicazione con l'estensione Chrome."""
     MESSAGE_TYPES = [
@@ -249,6 +293,14 @@ class OutgoingMessage(models.Model):
     class Meta:
         verbose_name = "Messaggio in coda"
         verbose_name_plural = "Messaggi in coda"
+        indexes = [
+            # Indici parziali: il filtro sul booleano diventa "WHERE NOT consumed" / "WHERE consumed",
+            # che SQLite non sa usare come prima colonna di un indice composto.
+            # Polling dell'estensione: messaggi non consumati in ordine di creazione, pulizia dei vecchi
+            models.Index(fields=['created_at'], condition=models.Q(consumed=False), name='om_pending_created_idx'),
+            # Pulizia dei messaggi consumati
+            models.Index(fields=['consumed_at'], condition=models.Q(consumed=True), name='om_consumed_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.message_id} ({self.id})"
@@ -275,6 +327,10 @@ class IncomingMessage(models.Model):
         verbose_name = "Messaggio in entrata"
         verbose_name_plural = "Messaggi in entrata"
         ordering = ['-created_at']
+        indexes = [
+            # Attesa della risposta dell'estensione per una sessione (eventualmente di un solo tipo)
+            models.Index(fields=['session_id', 'processed', 'message_type'], name='im_session_pending_idx'),
+        ]
 
     def __str__(self):
         return f"{self.message_type} ({self.session_id or self.id})"
@@ -305,6 +361,10 @@ class SearchResultItem(models.Model):
         ordering = ['shipment_name', 'product_title']
         verbose_name = "Risultato Ricerca Item"
         verbose_name_plural = "Risultati Ricerca Items"
+        indexes = [
+            # Risultati di una ricerca, dal più recente
+            models.Index(fields=['search_id', 'id'], name='sri_search_idx'),
+        ]
 
 
 class TelegramNotification(models.Model):
@@ -372,6 +432,10 @@ class TelegramNotification(models.Model):
         # Una persona può registrarsi più volte con email diversa, 
         # ma stesso chat_id può avere solo una email
         unique_together = [['email', 'chat_id']]
+        indexes = [
+            # Destinatari attivi delle notifiche di un merchant (chat_id è già unique)
+            models.Index(fields=['email', 'is_active'], name='tn_email_active_idx'),
+        ]
     
     def __str__(self):
         return f"{self.email} -> @{self.username or 'N/A'}"
@@ -598,3 +662,193 @@ class AdminActiveConversation(models.Model):
         if self.active_conversation:
             return f"Admin {self.admin_chat_id} -> {self.active_conversation.customer_email}"
         return f"Admin {self.admin_chat_id} (nessuna conversazione attiva)"
+
+
+class MirrorShipment(models.Model):
+    """
+    Copia locale di una spedizione PrepBusiness (inbound o outbound).
+    Aggiornata dai webhook e riconciliata dal task di sincronizzazione incrementale.
+    """
+    SHIPMENT_TYPES = [
+        ('inbound', 'Inbound'),
+        ('outbound', 'Outbound'),
+    ]
+    SOURCES = [
+        ('webhook', 'Webhook'),
+        ('sync', 'Sincronizzazione'),
+    ]
+
+    shipment_type = models.CharField(verbose_name="Tipo spedizione", max_length=10, choices=SHIPMENT_TYPES)
+    shipment_id = models.BigIntegerField(verbose_name="ID Spedizione PrepBusiness")
+    merchant_id = models.BigIntegerField(verbose_name="ID Merchant", null=True, blank=True)
+    name = models.CharField(verbose_name="Nome", max_length=255, blank=True, default='')
+    normalized_name = models.CharField(
+        verbose_name="Nome normalizzato", max_length=255, blank=True, default='',
+        help_text="Nome in minuscolo e con spazi compattati, per il match outbound → inbound"
+    )
+    status = models.CharField(verbose_name="Stato", max_length=50, blank=True, default='')
+    notes = models.TextField(verbose_name="Note", null=True, blank=True)
+    archived = models.BooleanField(verbose_name="Archiviata", default=False)
+    remote_created_at = models.DateTimeField(verbose_name="Creata su PrepBusiness", null=True, blank=True)
+    remote_updated_at = models.DateTimeField(verbose_name="Aggiornata su PrepBusiness", null=True, blank=True)
+    shipped_at = models.DateTimeField(verbose_name="Data spedizione", null=True, blank=True)
+    received_at = models.DateTimeField(verbose_name="Data ricezione", null=True, blank=True)
+    payload = models.JSONField(verbose_name="Dati spedizione", null=True, blank=True)
+    source = models.CharField(verbose_name="Origine ultimo aggiornamento", max_length=10, choices=SOURCES, default='sync')
+    items_updated_at = models.DateTimeField(
+        verbose_name="Versione items", null=True, blank=True,
+        help_text="updated_at della spedizione a cui corrispondono gli items locali (vuoto = da scaricare)"
+    )
+    synced_at = models.DateTimeField(verbose_name="Ultima sincronizzazione", auto_now=True)
+
+    class Meta:
+        verbose_name = "Spedizione (mirror)"
+        verbose_name_plural = "Spedizioni (mirror)"
+        ordering = ['-remote_updated_at']
+        constraints = [
+            models.UniqueConstraint(fields=['shipment_type', 'shipment_id'], name='unique_mirror_shipment'),
+        ]
+        indexes = [
+            models.Index(fields=['merchant_id', 'shipment_type', 'status'], name='mirror_ship_merchant_idx'),
+            models.Index(fields=['shipment_type', 'remote_updated_at'], name='mirror_ship_updated_idx'),
+            models.Index(fields=['name'], name='mirror_ship_name_idx'),
+            models.Index(fields=['merchant_id', 'shipment_type', 'normalized_name'], name='mirror_ship_norm_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.shipment_type} #{self.shipment_id}: {self.name}"
+
+    @property
+    def items_stale(self):
+        """True se gli items locali non riflettono l'ultima versione nota della spedizione."""
+        if self.items_updated_at is None:
+            return True
+        return self.remote_updated_at is not None and self.items_updated_at < self.remote_updated_at
+
+
+class MirrorShipmentItem(models.Model):
+    """Riga (prodotto) di una spedizione del mirror locale."""
+    shipment = models.ForeignKey(
+        MirrorShipment,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name="Spedizione"
+    )
+    line_id = models.BigIntegerField(verbose_name="ID riga PrepBusiness", null=True, blank=True)
+    item_id = models.BigIntegerField(verbose_name="ID item inventario", null=True, blank=True, db_index=True)
+    merchant_sku = models.CharField(verbose_name="SKU", max_length=255, null=True, blank=True, db_index=True)
+    asin = models.CharField(verbose_name="ASIN", max_length=50, null=True, blank=True, db_index=True)
+    fnsku = models.CharField(verbose_name="FNSKU", max_length=50, null=True, blank=True, db_index=True)
+    title = models.CharField(verbose_name="Titolo", max_length=500, null=True, blank=True)
+    quantity = models.IntegerField(
+        verbose_name="Quantità", default=0,
+        help_text="Quantità outbound, o quantità attesa per gli inbound"
+    )
+    actual_quantity = models.IntegerField(verbose_name="Quantità ricevuta", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Item spedizione (mirror)"
+        verbose_name_plural = "Items spedizioni (mirror)"
+
+    def __str__(self):
+        return f"{self.merchant_sku or self.item_id} x{self.quantity}"
+
+
+class MirrorSyncState(models.Model):
+    """Stato (watermark) della sincronizzazione incrementale del mirror, per merchant e tipo."""
+    key = models.CharField(verbose_name="Chiave", max_length=100, unique=True, help_text="<tipo>:<merchant_id>")
+    watermark = models.DateTimeField(
+        verbose_name="Watermark", null=True, blank=True,
+        help_text="updated_at più recente già sincronizzato"
+    )
+    last_run_at = models.DateTimeField(verbose_name="Ultima esecuzione", null=True, blank=True)
+    last_success_at = models.DateTimeField(verbose_name="Ultima esecuzione riuscita", null=True, blank=True)
+    last_error = models.TextField(verbose_name="Ultimo errore", null=True, blank=True)
+    shipments_synced = models.PositiveIntegerField(verbose_name="Spedizioni aggiornate (ultima esecuzione)", default=0)
+
+    class Meta:
+        verbose_name = "Stato sincronizzazione mirror"
+        verbose_name_plural = "Stati sincronizzazione mirror"
+
+    def __str__(self):
+        return f"{self.key} @ {self.watermark}"
+
+
+class MerchantDirectoryEntry(models.Model):
+    """
+    Copia locale dell'anagrafica merchant di PrepBusiness (vedi utils/merchant_directory.py).
+    Aggiornata dal task periodico refresh_merchant_directory.
+    """
+    merchant_id = models.BigIntegerField(verbose_name="ID Merchant", unique=True)
+    name = models.CharField(verbose_name="Nome", max_length=255, blank=True, default='')
+    email = models.CharField(verbose_name="Email principale", max_length=255, blank=True, default='')
+    email_lower = models.CharField(verbose_name="Email (minuscolo)", max_length=255, blank=True, default='', db_index=True)
+    enabled = models.BooleanField(verbose_name="Attivo", default=True)
+    name_score = models.IntegerField(
+        verbose_name="Punteggio nome", default=0,
+        help_text="Tra più merchant con la stessa email vince il punteggio più alto"
+    )
+    api_position = models.PositiveIntegerField(
+        verbose_name="Posizione nella lista dell'API", default=0,
+        help_text="A parità di punteggio vince il merchant che l'API elenca per primo"
+    )
+    payload = models.JSONField(verbose_name="Dati merchant", null=True, blank=True)
+    refreshed_at = models.DateTimeField(verbose_name="Ultimo aggiornamento", auto_now=True)
+
+    class Meta:
+        verbose_name = "Merchant (directory)"
+        verbose_name_plural = "Merchants (directory)"
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.merchant_id}: {self.name}"
+
+
+class WebhookLane(models.Model):
+    """
+    Lease di una corsia della coda webhook (vedi utils/webhook_queue.py): un solo
+    worker alla volta elabora i webhook della corsia, in ordine di arrivo.
+    """
+    lane = models.PositiveSmallIntegerField(verbose_name="Corsia", unique=True)
+    owner = models.CharField(verbose_name="Worker", max_length=255, null=True, blank=True,
+                             help_text="ID del task che tiene il lease")
+    lease_expires_at = models.DateTimeField(verbose_name="Scadenza lease", null=True, blank=True)
+    last_drained_at = models.DateTimeField(verbose_name="Ultimo svuotamento", null=True, blank=True)
+    processed_count = models.PositiveIntegerField(verbose_name="Webhook elaborati", default=0)
+
+    class Meta:
+        verbose_name = "Corsia webhook"
+        verbose_name_plural = "Corsie webhook"
+        ordering = ['lane']
+
+    def __str__(self):
+        return f"Corsia {self.lane} ({self.owner or 'libera'})"
+
+
+class WebhookPayloadArchive(models.Model):
+    """
+    Payload compresso di un ShipmentStatusUpdate archiviato (vedi utils/payload_archive.py).
+    Le righe sono raggruppate per mese di ricezione: un mese si elimina con una sola query.
+    """
+    CODEC_CHOICES = [
+        ('zlib', 'zlib'),
+        ('zstd', 'zstd'),
+    ]
+
+    update = models.OneToOneField(ShipmentStatusUpdate, verbose_name="Aggiornamento", on_delete=models.CASCADE,
+                                  primary_key=True, related_name='payload_archive')
+    month = models.CharField(verbose_name="Mese di ricezione", max_length=7, help_text="YYYY-MM")
+    codec = models.CharField(verbose_name="Compressione", max_length=10, choices=CODEC_CHOICES)
+    data = models.BinaryField(verbose_name="Payload compresso")
+    raw_size = models.PositiveIntegerField(verbose_name="Dimensione JSON (byte)")
+    archived_at = models.DateTimeField(verbose_name="Data archiviazione", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Payload webhook archiviato"
+        verbose_name_plural = "Payload webhook archiviati"
+        indexes = [
+            models.Index(fields=['month'], name='wpa_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payload #{self.update_id} ({self.month}, {self.codec})"
@@ -1,6 +1,7 @@
 import requests
 from typing import Optional
 from libs.prepbusiness.client import PrepBusinessClient
+from libs.prepbusiness.registry import get_shared_client
 from libs.config import PREP_BUSINESS_API_URL
 
 class PrepBusinessAPI:
@@ -17,7 +18,7 @@ class PrepBusinessAPI:
         # Inizializza il client PrepBusiness
         # Estrai il dominio dall'URL API
         domain = PREP_BUSINESS_API_URL.replace('https://', '').replace('http://', '').split('/')[0]
-        self.client = PrepBusinessClient(
+        self.client = get_shared_client(
             api_key=api_key,
             company_domain=domain
         )
@@ -134,8 +135,9 @@ ADMIN_EMAIL = "info@fbaprepcenteritaly.com"
 
 def get_merchant_name_by_email(email: str) -> Optional[str]:
     """
-    Ottiene il nome del merchant dall'email utilizzando l'API PrepBusiness.
-    Sceglie il nome più appropriato se ci sono multipli match.
+    Ottiene il nome del merchant dall'email usando la directory dei merchant.
+    Se più merchant condividono l'email restituisce il nome più appropriato
+    (punteggio precalcolato, vedi utils.merchant_directory.name_score).
     
     Args:
         email: Email del merchant
@@ -144,106 +146,17 @@ def get_merchant_name_by_email(email: str) -> Optional[str]:
         Nome del merchant o None se non trovato
     """
     try:
-        from .utils.clients import get_client
-        
+        from .utils.merchant_directory import get_merchant_directory
+
         # Normalizza l'email in minuscolo
         email = email.lower().strip() if email else None
         if not email:
             return None
-        
-        # Ottieni tutti i merchants
-        client = get_client()
-        merchants_response = client.get_merchants()
-        # Gestisci la risposta Pydantic
-        
-        # Cerca tutti i merchants con questa email
-        matching_merchants = []
-        # Converti oggetti Pydantic in dict se necessario
-        merchant_dicts = []
-        # Gestisci la risposta - può essere una lista diretta o un oggetto Pydantic
-        logger.info(f"[get_merchant_name_by_email] Tipo di risposta ricevuta: {type(merchants_response)}")
-        
-        if isinstance(merchants_response, list):
-            # Risposta diretta come lista
-            merchant_list = merchants_response
-            logger.info(f"[get_merchant_name_by_email] Risposta diretta come lista: {len(merchant_list)} merchants")
-        elif hasattr(merchants_response, 'data'):
-            # La risposta ha un attributo 'data' che potrebbe contenere la lista
-            if hasattr(merchants_response.data, 'data'):
-                # Struttura annidata: response.data.data
-                merchant_list = merchants_response.data.data
-                logger.info(f"[get_merchant_name_by_email] Estratti {len(merchant_list)} merchants da response.data.data")
-            elif isinstance(merchants_response.data, list):
-                # Struttura semplice: response.data è già la lista
-                merchant_list = merchants_response.data
-                logger.info(f"[get_merchant_name_by_email] Estratti {len(merchant_list)} merchants da response.data")
-            else:
-                logger.warning(f"[get_merchant_name_by_email] response.data non è una lista: {type(merchants_response.data)}")
-                merchant_list = []
-        else:
-            logger.warning(f"[get_merchant_name_by_email] Tipo di risposta non riconosciuto: {type(merchants_response)}")
-            merchant_list = []
-        
-        for merchant in merchant_list:
-            if hasattr(merchant, 'model_dump'):
-                merchant_dicts.append(merchant.model_dump())
-            elif isinstance(merchant, dict):
-                merchant_dicts.append(merchant)
-            else:
-                merchant_dicts.append(dict(merchant))
-        
-        # Cerca tutti i merchants con questa email
-        for merchant in merchant_dicts:
-            merchant_email = merchant.get('primaryEmail')
-            if merchant_email and merchant_email.lower() == email:
-                matching_merchants.append(merchant)
-        
-        if not matching_merchants:
+
+        name = get_merchant_directory().name_for_email(email)
+        if name is None:
             logger.warning(f"Merchant non trovato per email: {email}")
-            return None
-        
-        # Se c'è solo un match, restituiscilo
-        if len(matching_merchants) == 1:
-            return matching_merchants[0].get('name')
-        
-        # Se ci sono multipli match, scegli il più appropriato
-        logger.info(f"Trovati {len(matching_merchants)} merchants per {email}: {[m.get('name') for m in matching_merchants]}")
-        
-        # Priorità di selezione:
-        # 1. Nome senza suffissi tipo "- GERMANIA", "- NO", etc.
-        # 2. Nome più corto
-        # 3. Primo trovato
-        
-        best_merchant = None
-        best_score = -1
-        
-        for merchant in matching_merchants:
-            name = merchant.get('name', '')
-            score = 0
-            
-            # Penalizza nomi con suffissi geografici o "NO"
-            if not any(suffix in name.upper() for suffix in [' - ', '- ', ' -', 'GERMANIA', 'FRANCIA', 'SPAGNA', ' NO']):
-                score += 100
-            
-            # Preferisci nomi più corti (meno specifici)
-            score += max(0, 50 - len(name))
-            
-            # Preferisci nomi che non contengono caratteri speciali
-            if name.replace(' ', '').replace('.', '').isalnum():
-                score += 10
-            
-            logger.info(f"Merchant {merchant.get('id')}: '{name}' - Score: {score}")
-            
-            if score > best_score:
-                best_score = score
-                best_merchant = merchant
-        
-        if best_merchant:
-            logger.info(f"Selezionato merchant per {email}: '{best_merchant.get('name')}' (Score: {best_score})")
-            return best_merchant.get('name')
-        
-        # Fallback: primo merchant trovato
-        return matching_merchants[0].get('name')
+        return name
         
     except Exception as e:
         logger.error(f"Errore nel recuperare nome merchant per {email}: {str(e)}")
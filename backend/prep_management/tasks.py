@@ -1,11 +1,19 @@
+import asyncio
 import logging
+from itertools import islice
 from celery import shared_task
 from django.db import transaction
 from django.core.cache import cache
-from .models import SearchResultItem, TelegramNotification
+from .models import MirrorShipmentItem, SearchResultItem, TelegramNotification
 from .utils.extractors import extract_product_info_from_dict
+from .utils import search_index
+from .utils.mirror import is_mirror_ready
+from .utils.webhook_queue import DRAIN_TIME_LIMIT
 from libs.prepbusiness.client import PrepBusinessClient as OfficialPrepBusinessClient
-from libs.config import PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_URL, PREP_BUSINESS_API_TIMEOUT
+from libs.prepbusiness.async_client import AsyncPrepBusinessClient, HTTPX_AVAILABLE
+from libs.config import (
+    PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_URL, PREP_BUSINESS_API_TIMEOUT, PREP_BUSINESS_ASYNC_MAX_CONCURRENCY
+)
 from .utils.clients import get_client
 import traceback
 from django.utils import timezone
@@ -15,18 +23,65 @@ from .services import send_telegram_notification as send_notification_service
 logger = logging.getLogger(__name__)
 
 def _get_client():
-    """Helper to initialize the official client in a Celery task."""
+    """Helper returning the process-wide shared official client in a Celery task."""
     try:
-        domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-        return OfficialPrepBusinessClient(
-            api_key=PREP_BUSINESS_API_KEY,
-            company_domain=domain,
-            timeout=PREP_BUSINESS_API_TIMEOUT
-        )
+        return get_client()
     except Exception as e:
         logger.error(f"Errore inizializzazione client PrepBusiness in Celery task: {e}")
         return None
 
+def _prefetch_outbound_items(shipment_ids, merchant_id, max_connections=10):
+    """
+    Scarica in parallelo gli items di più spedizioni outbound usando il client asincrono
+    (un solo pool di connessioni condiviso). Restituisce {shipment_id: OutboundShipmentItemsResponse}
+    solo per le spedizioni scaricate con successo: per le altre il chiamante ricade sulla
+    chiamata sincrona.
+    """
+    if not HTTPX_AVAILABLE or not shipment_ids:
+        return {}
+
+    # Stesso rate limiter e circuit breaker del client sincrono condiviso: il prefetch parallelo non deve
+    # scavalcare il budget di richieste del processo né martellare un'API già data per giù
+    shared_client = _get_client()
+    if shared_client is not None and shared_client.transport != 'live':
+        # Registrazione/replay passano solo dal client sincrono (HTTPAdapter di requests)
+        return {}
+    rate_limiter = getattr(shared_client, '_rate_limiter', None) if shared_client else None
+    circuit_breaker = getattr(shared_client, '_circuit', None) if shared_client else None
+    validation_mode = getattr(shared_client, 'validation_mode', 'validate') if shared_client else 'validate'
+    fast_json = getattr(shared_client, '_fast_json', False) if shared_client else False
+
+    async def _fetch_all():
+        domain = PREP_BUSINESS_API_URL.replace('https://', '').replace('http://', '').split('/api')[0]
+        async with AsyncPrepBusinessClient(
+            api_key=PREP_BUSINESS_API_KEY,
+            company_domain=domain,
+            scheme=shared_client.config.scheme if shared_client else 'https',
+            timeout=PREP_BUSINESS_API_TIMEOUT,
+            max_connections=max_connections,
+            max_concurrency=PREP_BUSINESS_ASYNC_MAX_CONCURRENCY,
+            rate_limiter=rate_limiter,
+            circuit_breaker=circuit_breaker,
+            validation_mode=validation_mode,
+            fast_json=fast_json
+        ) as async_client:
+            return await async_client.get_many_outbound_shipment_items(shipment_ids, merchant_id=merchant_id)
+
+    try:
+        results = asyncio.run(_fetch_all())
+    except Exception as e:
+        logger.error(f"[PREFETCH_ITEMS] Errore nel prefetch parallelo degli items: {e}")
+        return {}
+
+    prefetched = {}
+    for shipment_id, result in results.items():
+        if isinstance(result, Exception):
+            logger.warning(f"[PREFETCH_ITEMS] Prefetch fallito per shipment {shipment_id}: {result}")
+            continue
+        prefetched[shipment_id] = result
+    logger.info(f"[PREFETCH_ITEMS] Prefetch items completato: {len(prefetched)}/{len(shipment_ids)} spedizioni")
+    return prefetched
+
 @shared_task(bind=True, max_retries=3)
 def process_shipment_batch(self, search_id, shipment_ids, merchant_id, shipment_type='outbound'):
     logger.info(f"[CELERY_TASK] ==============> INIZIO task process_shipment_batch <==============")
@@ -247,51 +302,97 @@ def echo_task(message):
     logger.info(f"[CELERY_ECHO] ========================= FINE ECHO ========================")
     return {"status": "echo_success", "message": message, "timestamp": str(timezone.now())}
 
+def _search_shipments_in_index(search_id, keywords_list, search_type, merchant_id, shipment_status, max_results):
+    """
+    Ricerca sull'indice full-text del mirror: tutte le spedizioni outbound del merchant,
+    le max_results più rilevanti. Restituisce il numero di SearchResultItem creati.
+    """
+    shipments = search_index.search(
+        keywords_list,
+        search_type=search_type,
+        merchant_id=merchant_id,
+        shipment_type='outbound',
+        archived=(shipment_status == 'archived'),
+        limit=max_results,
+    )
+    cache.set(f"search_{search_id}_total_to_analyze", len(shipments), timeout=3600)
+    items_by_shipment = {}
+    for item in MirrorShipmentItem.objects.filter(shipment__in=shipments).order_by('pk'):
+        items_by_shipment.setdefault(item.shipment_id, []).append(item)
+    # La view mostra i risultati per id decrescente: la spedizione più rilevante va creata per ultima
+    rows = [
+        SearchResultItem(
+            search_id=search_id,
+            shipment_type='outbound',
+            shipment_name=shipment.name or f"Spedizione {shipment.shipment_id}",
+            product_title=item.title or '',
+            product_sku=item.merchant_sku or '',
+            product_asin=item.asin or '',
+            product_fnsku=item.fnsku or '',
+            product_quantity=item.quantity,
+        )
+        for shipment in reversed(shipments)
+        for item in reversed(items_by_shipment.get(shipment.pk, []))
+    ]
+    SearchResultItem.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
 @shared_task(bind=True, max_retries=3)
-def process_shipment_search_task(self, search_id, search_terms, merchant_id, shipment_status, max_shipments_to_analyze):
+def process_shipment_search_task(self, search_id, search_terms, merchant_id, shipment_status, max_shipments_to_analyze, search_type='OR'):
     """
     Task Celery che esegue la ricerca delle spedizioni per parole chiave, merchant, status, ecc.
-    Scarica le spedizioni, filtra per keyword (su nome e items), salva i risultati come SearchResultItem.
+    Se il mirror locale del merchant è pronto interroga l'indice full-text su tutte le
+    spedizioni; altrimenti scarica le prime max_shipments_to_analyze spedizioni e filtra
+    per keyword (su nome e items). search_type: 'OR' (almeno una keyword) o 'AND' (tutte).
+    Salva i risultati come SearchResultItem.
     """
     import time
     start_time = time.time()
-    logger.info(f"[CELERY_SEARCH_TASK] INIZIO: search_id={search_id}, merchant_id={merchant_id}, status={shipment_status}, max={max_shipments_to_analyze}")
-    client = _get_client()
-    shipments_collected_from_api = []
-    current_api_page = 1
+    logger.info(f"[CELERY_SEARCH_TASK] INIZIO: search_id={search_id}, merchant_id={merchant_id}, status={shipment_status}, max={max_shipments_to_analyze}, tipo={search_type}")
     shipments_matching_criteria = []
-    keywords_list = [kw.strip().lower() for kw in search_terms.split(',') if kw.strip()]
+    keywords_list = search_index.parse_keywords(search_terms)
+    match_keywords = all if str(search_type).upper() == 'AND' else any
     
     try:
         SearchResultItem.objects.all().delete()
-        while len(shipments_collected_from_api) < int(max_shipments_to_analyze):
-            if shipment_status == 'archived':
-                shipments_page_response = client.get_archived_outbound_shipments(
-                    merchant_id=merchant_id, page=current_api_page, per_page=50
-                )
-            else:
-                shipments_page_response = client.get_outbound_shipments(
-                    merchant_id=merchant_id, page=current_api_page, per_page=50
-                )
-            if not shipments_page_response or not shipments_page_response.data:
-                break
-            shipments_collected_from_api.extend(shipments_page_response.data)
-            if not shipments_page_response.next_page_url:
-                break
-            current_api_page += 1
-        shipments_to_actually_analyze = shipments_collected_from_api[:int(max_shipments_to_analyze)]
+        if merchant_id and is_mirror_ready(merchant_id, 'outbound'):
+            records_created = _search_shipments_in_index(
+                search_id, keywords_list, search_type, merchant_id, shipment_status, int(max_shipments_to_analyze)
+            )
+            logger.info(
+                f"[CELERY_SEARCH_TASK] FINE (indice): creati {records_created} record per search_id={search_id} "
+                f"in {time.time() - start_time:.3f} s"
+            )
+            cache.set(f"{search_id}_done", True, timeout=600)
+            return
+        client = _get_client()
+        # L'iteratore pagina da solo e scarica la pagina successiva mentre consumiamo la corrente
+        shipments_to_actually_analyze = list(islice(
+            client.iter_outbound_shipments(
+                merchant_id=merchant_id, per_page=50, archived=(shipment_status == 'archived')
+            ),
+            int(max_shipments_to_analyze)
+        ))
         cache.set(f"search_{search_id}_total_to_analyze", len(shipments_to_actually_analyze), timeout=3600)
         logger.info(f"[CELERY_SEARCH_TASK] Scaricate {len(shipments_to_actually_analyze)} spedizioni da analizzare")
+        # Gli items servono sia per il match sui titoli sia per salvare i risultati: li scarichiamo
+        # tutti in parallelo una sola volta invece di farne due giri sequenziali.
+        prefetched_items = _prefetch_outbound_items(
+            [getattr(s, 'id', None) for s in shipments_to_actually_analyze if getattr(s, 'id', None) is not None],
+            merchant_id
+        )
         for idx, shipment_obj in enumerate(shipments_to_actually_analyze):
             shipment_name = getattr(shipment_obj, 'name', '')
             shipment_id = getattr(shipment_obj, 'id', None)
             shipment_name_lower = str(shipment_name).lower()
-            found_match_in_name = any(kw in shipment_name_lower for kw in keywords_list)
+            found_match_in_name = match_keywords(kw in shipment_name_lower for kw in keywords_list)
             if found_match_in_name:
                 shipments_matching_criteria.append(shipment_obj)
                 continue
             try:
-                items_response = client.get_outbound_shipment_items(shipment_id=shipment_id, merchant_id=merchant_id)
+                items_response = prefetched_items.get(shipment_id)
+                if items_response is None:
+                    items_response = client.get_outbound_shipment_items(shipment_id=shipment_id, merchant_id=merchant_id)
                 logger.info(f"[CELERY_SEARCH_TASK] items_response per shipment_id={shipment_id}: {items_response} (type={type(items_response)})")
                 items_list = []
                 if isinstance(items_response, dict):
@@ -303,16 +404,20 @@ def process_shipment_search_task(self, search_id, search_terms, merchant_id, shi
                 if items_list and hasattr(items_list[0], 'model_dump'):
                     items_list = [i.model_dump() for i in items_list]
                 logger.info(f"[CELERY_SEARCH_TASK] items_list per shipment_id={shipment_id}: {items_list} (len={len(items_list)})")
+                # Nome e titoli/codici di tutti gli items insieme: in AND ogni keyword può
+                # comparire in un item diverso
+                searchable_text = [shipment_name_lower]
                 for item_data in items_list:
-                    item_title = ''
                     inner_item = item_data.get('item')
-                    if inner_item and isinstance(inner_item, dict):
-                        item_title = str(inner_item.get('title', '')).lower()
-                    else:
-                        item_title = str(item_data.get('title') or item_data.get('name', '')).lower()
-                    if any(kw in item_title for kw in keywords_list):
-                        shipments_matching_criteria.append(shipment_obj)
-                        break
+                    if not (inner_item and isinstance(inner_item, dict)):
+                        inner_item = item_data
+                    searchable_text.append(str(inner_item.get('title') or item_data.get('name') or '').lower())
+                    searchable_text.extend(
+                        str(inner_item.get(field) or '').lower() for field in ('merchant_sku', 'sku', 'asin', 'fnsku')
+                    )
+                searchable_text = '\n'.join(searchable_text)
+                if match_keywords(kw in searchable_text for kw in keywords_list):
+                    shipments_matching_criteria.append(shipment_obj)
             except Exception as e_items:
                 logger.error(f"[CELERY_SEARCH_TASK] Errore items per shipment {shipment_id}: {e_items}")
         logger.info(f"[CELERY_SEARCH_TASK] Trovate {len(shipments_matching_criteria)} spedizioni che matchano i criteri")
@@ -322,7 +427,9 @@ def process_shipment_search_task(self, search_id, search_terms, merchant_id, shi
             try:
                 shipment_id = getattr(shipment_obj, 'id', 'N/A')
                 shipment_name = getattr(shipment_obj, 'name', f"Spedizione {shipment_id}")
-                items_response = client.get_outbound_shipment_items(shipment_id=shipment_id, merchant_id=merchant_id)
+                items_response = prefetched_items.get(shipment_id)
+                if items_response is None:
+                    items_response = client.get_outbound_shipment_items(shipment_id=shipment_id, merchant_id=merchant_id)
                 logger.info(f"[CELERY_SEARCH_TASK] items_response per shipment_id={shipment_id}: {items_response}")
                 items_list = []
                 if isinstance(items_response, dict):
@@ -434,4 +541,90 @@ def notify_telegram_users_about_shipment(merchant_id: str, message: str, event_t
             )
 
     except Exception as e:
-        logger.error(f"Errore durante l'invio di notifiche per merchant {merchant_id}: {e}", exc_info=True) 
\ No newline at end of file
+        logger.error(f"Errore durante l'invio di notifiche per merchant {merchant_id}: {e}", exc_info=True)
+
+
+@shared_task(bind=True, max_retries=0)
+def sync_shipment_mirror(self, full=False):
+    """
+    Riconcilia il mirror locale delle spedizioni con PrepBusiness (vedi utils/mirror.py).
+    Incrementale di default; full=True riscorre tutte le liste (riconciliazione notturna).
+    Un lock in cache evita esecuzioni sovrapposte quando una sincronizzazione dura più dell'intervallo.
+    """
+    from .utils.mirror import sync_all
+
+    lock_key = 'prep_management:mirror_sync_lock'
+    if not cache.add(lock_key, self.request.id or 'local', timeout=3000):
+        logger.info("[MIRROR_SYNC] Sincronizzazione già in corso, salto questa esecuzione")
+        return {'skipped': True}
+
+    try:
+        client = _get_client()
+        if client is None:
+            return {'skipped': True, 'error': 'client non disponibile'}
+        summary = sync_all(client, full=full)
+        logger.info(
+            f"[MIRROR_SYNC] Completata (full={full}): {summary['updated']} spedizioni aggiornate, "
+            f"{summary['items_refreshed']} items riscaricati, {len(summary['errors'])} errori"
+        )
+        return {k: v for k, v in summary.items() if k != 'results'}
+    finally:
+        cache.delete(lock_key)
+
+
+@shared_task(bind=True)
+def refresh_merchant_directory(self):
+    """
+    Aggiorna dall'API la directory locale dei merchant (vedi utils/merchant_directory.py).
+    Gli altri processi rileggono la tabella entro RELOAD_SECONDS.
+    """
+    from .utils.merchant_directory import get_merchant_directory
+
+    client = _get_client()
+    if client is None:
+        return {'skipped': True, 'error': 'client non disponibile'}
+    count = get_merchant_directory().refresh(client)
+    logger.info(f"[MERCHANT_DIRECTORY] Aggiornamento periodico completato: {count} merchant")
+    return {'merchants': count}
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, time_limit=DRAIN_TIME_LIMIT)
+def drain_webhook_lane(self, lane):
+    """
+    Elabora in ordine i webhook in coda di una corsia (vedi utils/webhook_queue.py).
+    Gira sulla coda dedicata 'webhooks'; acks_late + lease della corsia + presa in
+    carico atomica danno semantica at-least-once senza doppie elaborazioni.
+    """
+    from .utils.webhook_queue import drain_lane
+
+    return drain_lane(lane, owner=self.request.id or f'local:{lane}')
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, time_limit=DRAIN_TIME_LIMIT)
+def process_webhook_update(self, update_id):
+    """Elabora un webhook passando dalla sua corsia, così l'ordine per spedizione resta garantito."""
+    from .models import ShipmentStatusUpdate
+    from .utils.webhook_queue import drain_lane
+
+    lane = ShipmentStatusUpdate.objects.filter(id=update_id).values_list('lane', flat=True).first()
+    if lane is None:
+        return {'skipped': True, 'update_id': update_id}
+    return drain_lane(lane, owner=self.request.id or f'local:{lane}')
+
+
+@shared_task(bind=True)
+def sweep_webhook_updates(self):
+    """Rimette in coda i webhook non presi da nessun worker o bloccati in elaborazione."""
+    from .utils.webhook_queue import sweep
+
+    return sweep()
+
+
+@shared_task(bind=True)
+def archive_webhook_payloads(self):
+    """Sposta nell'archivio compresso i payload dei webhook vecchi ed elimina i mesi scaduti."""
+    from .utils.payload_archive import archive_payloads, purge_archive
+
+    stats = archive_payloads()
+    stats['purged'] = purge_archive()
+    return stats
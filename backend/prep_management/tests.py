@@ -1,2 +1,2883 @@
-from django.test import TestCase
-# Create your tests here.
+import asyncio
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from unittest import mock, skipIf, skipUnless
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from libs.prepbusiness.client import PrepBusinessClient
+from libs.prepbusiness.models import PrepBusinessError
+from libs.prepbusiness.transport import RecordingAdapter
+from prep_management.models import (
+    IncomingMessage, OutgoingMessage, SearchResultItem, ShipmentStatusUpdate, TelegramNotification, WebhookLane
+)
+from prep_management.utils import webhook_queue as wq
+from prep_management.utils.webhook_classifier import classify, infer_event_type
+
+
+class _EchoAdapter(HTTPAdapter):
+    """Transport finto: risponde con l'header merchant effettivamente ricevuto."""
+
+    def send(self, request, **kwargs):
+        # Piccola attesa casuale per mescolare le richieste concorrenti
+        time.sleep(random.uniform(0, 0.002))
+        query = parse_qs(urlparse(request.url).query)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps({
+            'expected': query.get('expected', [None])[0],
+            'received': request.headers.get('X-Selected-Client-Id'),
+        }).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class _ScriptedAdapter(HTTPAdapter):
+    """Transport finto: ``handler(request)`` restituisce (status, body JSON, headers) di ogni richiesta."""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, body, headers = self.handler(request)
+        response = requests.Response()
+        response.status_code = status
+        response.headers['Content-Type'] = 'application/json'
+        response.headers.update(headers or {})
+        response._content = json.dumps(body).encode()
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def _scripted_client(handler, **kwargs):
+    client = PrepBusinessClient(api_key='test-key', company_domain='prepbusiness.test', **kwargs)
+    adapter = _ScriptedAdapter(handler)
+    client._session.mount('https://', adapter)
+    client._session.mount('http://', adapter)
+    return client, adapter
+
+
+def _requests_response(status, headers):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers)
+    return response
+
+
+class MerchantHeaderConcurrencyTest(SimpleTestCase):
+    """Un client condiviso non deve mai inviare l'header di un altro merchant."""
+
+    THREADS = 32
+    REQUESTS_PER_THREAD = 60
+
+    def setUp(self):
+        self.client_api = PrepBusinessClient(api_key='test-key', company_domain='prepbusiness.test')
+        adapter = _EchoAdapter()
+        self.client_api._session.mount('https://', adapter)
+        self.client_api._session.mount('http://', adapter)
+
+    def test_no_request_carries_another_merchant_header(self):
+        mismatches = []
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def worker(thread_index):
+            try:
+                start.wait()
+                for _ in range(self.REQUESTS_PER_THREAD):
+                    merchant_id = random.choice([None, 101, 202, 303, 404, 505, thread_index + 1000])
+                    expected = '' if merchant_id is None else str(merchant_id)
+                    response = self.client_api.get('echo', params={'expected': expected}, merchant_id=merchant_id)
+                    received = response['received'] or ''
+                    if received != expected:
+                        mismatches.append((thread_index, expected, received))
+            except Exception as e:  # pragma: no cover - riportato sotto
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(mismatches, [])
+        self.assertNotIn('X-Selected-Client-Id', self.client_api._session.headers)
+
+    def test_default_merchant_is_used_when_none_given(self):
+        self.client_api.config.default_merchant_id = 77
+        response = self.client_api.get('echo', params={'expected': '77'})
+        self.assertEqual(response['received'], '77')
+        response = self.client_api.get('echo', params={'expected': '88'}, merchant_id=88)
+        self.assertEqual(response['received'], '88')
+
+
+def _inbound_payload(**fields):
+    """Webhook inbound come inviato da PrepBusiness (campi di primo livello di /shipments/inbound)."""
+    data = {
+        'id': 51234, 'created_at': '2025-03-04T09:12:33.000000Z', 'updated_at': '2025-03-04T09:15:02.000000Z',
+        'team_id': 101, 'name': 'Spedizione 101-00042', 'notes': None, 'warehouse_id': 1,
+        'received_at': None, 'internal_notes': None, 'archived_at': None, 'shipped_at': None,
+        'checked_in_at': None, 'deleted_at': None, 'currency': 'EUR', 'eta': None,
+        'reference_id': 'REF-101-00042', 'migrated': False, 'status': 'open',
+        'items': [{'id': 1, 'item_id': 9001, 'quantity': 12, 'item': {'merchant_sku': 'SKU-1', 'title': 'Tazza'}}],
+    }
+    data.update(fields)
+    return data
+
+
+def _outbound_payload(**fields):
+    """Webhook outbound come inviato da PrepBusiness (campi di primo livello di /shipments/outbound)."""
+    data = {
+        'id': 61234, 'created_at': '2025-03-04T09:12:33.000000Z', 'updated_at': '2025-03-04T10:01:47.000000Z',
+        'team_id': 101, 'status': 'open', 'notes': None, 'name': 'Spedizione 101-00042', 'warehouse_id': 1,
+        'shipped_at': None, 'internal_notes': None, 'ship_from_address_id': None, 'archived_at': None,
+        'currency': 'EUR', 'is_case_forwarding': False, 'sku_count': 1, 'shipped_items_count': None,
+        'searchable_identifiers': '', 'searchable_tags': [], 'tags': [], 'fba_transport_plans': [],
+        'outbound_items': [{'id': 7, 'item_id': 9001, 'quantity': 12, 'item': {'merchant_sku': 'SKU-1'}}],
+    }
+    data.update(fields)
+    return data
+
+
+# (descrizione, data del webhook, event_type atteso): risultati del classificatore storico
+# della view shipment_status_webhook, che il classificatore a regole deve riprodurre
+# (con note o status nulli quello storico andava in errore: qui valgono come stringa vuota)
+GOLDEN_WEBHOOKS = [
+    ('inbound aperto', _inbound_payload(), 'inbound_shipment.created'),
+    ('inbound spedito', _inbound_payload(status='shipped', shipped_at='2025-03-05T08:00:00.000000Z'), 'inbound_shipment.shipped'),
+    ('inbound ricevuto', _inbound_payload(status='received', shipped_at='2025-03-05T08:00:00.000000Z',
+                                          received_at='2025-03-07T11:00:00.000000Z'), 'inbound_shipment.received'),
+    ('inbound in bozza', _inbound_payload(status='draft'), 'inbound_shipment.updated'),
+    ('inbound senza items', {k: v for k, v in _inbound_payload(status='draft').items() if k != 'items'}, 'inbound_shipment.updated'),
+    ('outbound aperto', _outbound_payload(), 'outbound_shipment.created'),
+    ('outbound spedito', _outbound_payload(status='shipped', shipped_at='2025-03-05T08:00:00.000000Z'), 'outbound_shipment.shipped'),
+    ('outbound chiuso', _outbound_payload(status='closed', shipped_at='2025-03-05T08:00:00.000000Z'), 'outbound_shipment.closed'),
+    ('outbound chiuso senza shipped_at', _outbound_payload(status='closed'), 'outbound_shipment.updated'),
+    ('outbound archiviato', _outbound_payload(status='archived', archived_at='2025-03-06T08:00:00.000000Z'), 'outbound_shipment.updated'),
+    ('outbound senza items, chiuso e spedito',
+     {k: v for k, v in _outbound_payload(status='closed', shipped_at='2025-03-05T08:00:00.000000Z').items()
+      if k != 'outbound_items'}, 'outbound_shipment.closed'),
+    ('outbound riconosciuto da ship_from_address_id',
+     {k: v for k, v in _outbound_payload(status='draft').items() if k != 'outbound_items'}, 'outbound_shipment.updated'),
+    ('outbound case forwarding senza campi outbound',
+     _inbound_payload(status='open', is_case_forwarding=True), 'outbound_shipment.created'),
+    ('note che citano un outbound', _inbound_payload(notes='Merce per outbound 61234'), 'outbound_shipment.created'),
+    ('RESIDUAL nel nome con outbound_items', _outbound_payload(name='RESIDUAL Spedizione 101-00042', status='open'),
+     'inbound_shipment.created'),
+    ('residual nelle note, chiuso e spedito', _inbound_payload(notes='Residual di 61234', status='closed',
+                                                                shipped_at='2025-03-05T08:00:00.000000Z'), 'inbound_shipment.shipped'),
+    ('PARTIAL nel nome ricevuto', _outbound_payload(name='PARTIAL Spedizione 101-00042', status='received'),
+     'inbound_shipment.received'),
+    ('note e status nulli', _inbound_payload(notes=None, status=None), 'inbound_shipment.updated'),
+]
+
+
+class _UntouchableItems(list):
+    """Lista di items che fallisce se qualcuno la scorre, la misura o la converte in stringa."""
+
+    def _touched(self, *args):
+        raise AssertionError('il classificatore non deve leggere gli items')
+
+    __iter__ = __len__ = __getitem__ = __repr__ = __str__ = _touched
+
+
+class WebhookClassifierGoldenTest(SimpleTestCase):
+    """Il classificatore a regole riproduce i tipi di evento dei webhook reali."""
+
+    def test_golden_payloads(self):
+        for description, data, expected in GOLDEN_WEBHOOKS:
+            with self.subTest(description):
+                self.assertEqual(infer_event_type(data), expected)
+
+    def test_items_are_never_inspected(self):
+        for description, data, expected in GOLDEN_WEBHOOKS:
+            guarded = dict(data)
+            for key in ('items', 'outbound_items'):
+                if key in guarded:
+                    guarded[key] = _UntouchableItems()
+            with self.subTest(description):
+                self.assertEqual(classify(guarded).event_type, expected)
+
+    def test_item_titles_do_not_change_direction(self):
+        data = _inbound_payload(items=[{'id': 1, 'quantity': 1, 'item': {'title': 'Etichette outbound FBA'}}])
+        self.assertEqual(classify(data).event_type, 'inbound_shipment.created')
+        self.assertIsNone(classify(data).rule)
+
+
+class HotQueryIndexTest(TestCase):
+    """Le query frequenti di prep_management usano i loro indici composti (EXPLAIN su un dataset di esempio)."""
+
+    ROWS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        ShipmentStatusUpdate.objects.bulk_create(
+            ShipmentStatusUpdate(
+                shipment_id=str(i % 400), event_type=('inbound_shipment.created', 'outbound_shipment.closed')[i % 2],
+                new_status='created', processing_status='done', lane=i % 16, idempotency_key=f'{i:064d}'
+            )
+            for i in range(cls.ROWS)
+        )
+        IncomingMessage.objects.bulk_create(
+            IncomingMessage(session_id=f'session-{i % 300}', processed=i % 10 != 0,
+                            message_type=IncomingMessage.MESSAGE_TYPES[i % 4][0])
+            for i in range(cls.ROWS)
+        )
+        OutgoingMessage.objects.bulk_create(
+            OutgoingMessage(message_id='BOX_SERVICES_REQUEST', consumed=i % 20 != 0,
+                            consumed_at=now - timedelta(seconds=i) if i % 20 else None)
+            for i in range(cls.ROWS)
+        )
+        TelegramNotification.objects.bulk_create(
+            TelegramNotification(email=f'merchant{i % 500}@example.com', chat_id=100000 + i, is_active=i % 7 != 0)
+            for i in range(cls.ROWS)
+        )
+        SearchResultItem.objects.bulk_create(
+            SearchResultItem(search_id=f'{i % 50:036d}', shipment_name=f'Spedizione {i}') for i in range(cls.ROWS)
+        )
+        # Solo PostgreSQL: sqlite_stat1 conserva la media delle righe per valore e con un booleano
+        # sbilanciato (pochi messaggi non consumati) preferirebbe la scansione della tabella
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # Su poche migliaia di righe il planner sceglierebbe comunque la scansione sequenziale
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'Piano senza {index_name}:\n{plan}')
+
+    def test_webhook_dedup_window(self):
+        now = timezone.now()
+        self.assertUsesIndex(ShipmentStatusUpdate.objects.filter(
+            shipment_id='42', event_type='inbound_shipment.created',
+            created_at__gte=now - timedelta(minutes=5), created_at__lte=now, id__lt=1000,
+        ).order_by('-id'), 'ssu_dedup_idx')
+
+    def test_incoming_messages_of_session(self):
+        pending = IncomingMessage.objects.filter(session_id='session-7', processed=False)
+        self.assertUsesIndex(pending.order_by('created_at'), 'im_session_pending_idx')
+        self.assertUsesIndex(pending.filter(message_type='USER_RESPONSE').order_by('created_at'), 'im_session_pending_idx')
+
+    def test_outgoing_message_polling_and_cleanup(self):
+        now = timezone.now()
+        self.assertUsesIndex(OutgoingMessage.objects.filter(consumed=False).order_by('created_at'), 'om_pending_created_idx')
+        self.assertUsesIndex(OutgoingMessage.objects.filter(consumed=True, consumed_at__lt=now - timedelta(seconds=10)),
+                             'om_consumed_at_idx')
+
+    def test_telegram_recipients(self):
+        self.assertUsesIndex(TelegramNotification.objects.filter(email='merchant7@example.com', is_active=True),
+                             'tn_email_active_idx')
+        # chat_id è unique: basta il suo indice
+        plan = TelegramNotification.objects.filter(chat_id=100007).explain()
+        self.assertRegex(plan, r'(?i)index', plan)
+        self.assertNotRegex(plan, r'(?i)seq scan|SCAN prep_management_telegramnotification\b(?! USING)', plan)
+
+    def test_search_results(self):
+        self.assertUsesIndex(SearchResultItem.objects.filter(search_id=f'{7:036d}').order_by('-id'), 'sri_search_idx')
+
+
+def _channel(channel_id):
+    return {'id': channel_id, 'team_id': 1, 'type': 'amazon', 'nickname': f'Canale {channel_id}',
+            'connection_status': 'active'}
+
+
+class _FakeRedis:
+    """Redis finto per il livello condiviso della cache: get/ttl/setex/scan_iter/delete sull'orologio ``clock``."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.values = {}
+        self.fail = False
+        self.calls = 0
+
+    def _check(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError('Redis giù')
+
+    def _alive(self, key):
+        entry = self.values.get(key)
+        if entry is not None and entry[1] <= self.clock[0]:
+            del self.values[key]
+            entry = None
+        return entry
+
+    def get(self, key):
+        self._check()
+        entry = self._alive(key)
+        return entry[0].encode() if entry else None
+
+    def ttl(self, key):
+        self._check()
+        entry = self._alive(key)
+        return int(entry[1] - self.clock[0]) if entry else -2
+
+    def setex(self, key, ttl, value):
+        self._check()
+        self.values[key] = (value, self.clock[0] + ttl)
+
+    def scan_iter(self, match, count=None):
+        import fnmatch
+
+        self._check()
+        return [key.encode() for key in list(self.values) if fnmatch.fnmatchcase(key, match)]
+
+    def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.values.pop(key.decode() if isinstance(key, bytes) else key, None)
+
+    def pipeline(self):
+        redis, calls = self, []
+
+        class _Pipeline:
+            def get(self, key):
+                calls.append(lambda: redis.get(key))
+
+            def ttl(self, key):
+                calls.append(lambda: redis.ttl(key))
+
+            def execute(self):
+                return [call() for call in calls]
+
+        return _Pipeline()
+
+
+class ResponseCacheTest(SimpleTestCase):
+    """Cache delle risposte: TTL, LRU, invalidazione dopo le scritture, copie scadute e livello Redis."""
+
+    def setUp(self):
+        from types import SimpleNamespace
+
+        self.clock = [1000.0]
+        patcher = mock.patch('libs.prepbusiness.cache.time', SimpleNamespace(monotonic=lambda: self.clock[0]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _cache(self, redis=None, **kwargs):
+        from libs.prepbusiness.cache import ResponseCache
+
+        cache = ResponseCache(**kwargs)
+        cache._redis = redis
+        return cache
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = self._cache(ttls={'merchants': 60}, stale_ttl=300)
+        key = cache.make_key('merchants', '/merchants', {'api_token': 'segreto'})
+        self.assertNotIn('segreto', key)
+        cache.set(key, {'data': [{'id': 101}]})
+
+        self.clock[0] += 59
+        cached = cache.get(key)
+        self.assertEqual(cached, {'data': [{'id': 101}]})
+        # Ogni lettura restituisce una copia nuova
+        cached['data'].clear()
+        self.assertEqual(cache.get(key), {'data': [{'id': 101}]})
+
+        self.clock[0] += 2
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.get(key, allow_stale=True), {'data': [{'id': 101}]})
+
+        self.clock[0] += 300
+        self.assertIsNone(cache.get(key, allow_stale=True))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['stale_hits'], stats['misses'], stats['size']), (2, 1, 2, 0))
+
+    def test_only_cacheable_endpoints_with_a_ttl_are_stored(self):
+        cache = self._cache(ttls={'services': 0})
+        self.assertEqual(cache.match('/inventory/123'), 'inventory_item')
+        self.assertEqual(cache.match('merchants/'), 'merchants')
+        self.assertIsNone(cache.match('inventory'))
+        self.assertIsNone(cache.match('shipments/inbound'))
+        self.assertIsNone(cache.match('services'))
+
+        key = cache.make_key('services', 'services')
+        cache.set(key, {'data': []})
+        self.assertIsNone(cache.get(key))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self._cache(maxsize=2)
+        first, second, third = (cache.make_key('inventory_item', f'inventory/{i}') for i in (1, 2, 3))
+        cache.set(first, {'id': 1})
+        cache.set(second, {'id': 2})
+        cache.get(first)
+        cache.set(third, {'id': 3})
+
+        self.assertEqual(cache.get(first), {'id': 1})
+        self.assertIsNone(cache.get(second))
+        self.assertEqual(cache.get(third), {'id': 3})
+        self.assertEqual((cache.stats()['size'], cache.stats()['evictions']), (2, 1))
+
+    def test_invalidate_by_endpoint_merchant_and_path(self):
+        cache = self._cache()
+        keys = {
+            'merchants': cache.make_key('merchants', 'merchants'),
+            '101/1': cache.make_key('inventory_item', 'inventory/1', merchant_id=101),
+            '101/2': cache.make_key('inventory_item', 'inventory/2', merchant_id=101),
+            '202/1': cache.make_key('inventory_item', 'inventory/1', merchant_id=202),
+            '202/12': cache.make_key('inventory_item', 'inventory/12', merchant_id=202),
+        }
+        for key in keys.values():
+            cache.set(key, {'key': key})
+
+        self.assertEqual(cache.invalidate(merchant_id=101), 2)
+        # Una scrittura su un sotto-percorso invalida la risorsa, solo quella
+        cache.invalidate_for_write('/inventory/1/identifier')
+        cache.invalidate_for_write('shipments/inbound/5/submit')
+        remaining = {name for name, key in keys.items() if cache.get(key) is not None}
+        self.assertEqual(remaining, {'merchants', '202/12'})
+
+        self.assertEqual(cache.invalidate(name='merchants'), 1)
+        cache.clear()
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_client_serves_gets_from_cache_and_invalidates_after_writes(self):
+        from libs.prepbusiness.cache import ResponseCache
+
+        client, adapter = _scripted_client(lambda request: (200, {'id': 5, 'sku': 'SKU-5'}, {}), cache=ResponseCache())
+        self.assertEqual(client.get('inventory/5', merchant_id=101), {'id': 5, 'sku': 'SKU-5'})
+        self.assertEqual(client.get('inventory/5', merchant_id=101), {'id': 5, 'sku': 'SKU-5'})
+        client.get('inventory/5', merchant_id=202)
+        self.assertEqual(len(adapter.requests), 2)
+
+        client.post('inventory/5/identifier', json={'identifier': 'X'}, merchant_id=101)
+        client.get('inventory/5', merchant_id=101)
+        client.get('inventory/5', merchant_id=202)
+        self.assertEqual([request.method for request in adapter.requests], ['GET', 'GET', 'POST', 'GET', 'GET'])
+
+        client.invalidate_cache('inventory_item', merchant_id=101)
+        client.get('inventory/5', merchant_id=101)
+        self.assertEqual(len(adapter.requests), 6)
+
+    def test_client_serves_stale_entries_while_the_circuit_is_open(self):
+        from libs.prepbusiness.cache import ResponseCache
+
+        client, adapter = _scripted_client(
+            lambda request: (503, {'message': 'giù'}, {}),
+            cache=ResponseCache(ttls={'merchants': 60}, stale_ttl=300), circuit_failure_threshold=1
+        )
+        key = client._cache.make_key('merchants', 'merchants')
+        client._cache.set(key, {'data': []})
+        self.clock[0] += 120
+
+        with self.assertRaises(PrepBusinessError):
+            client.get('merchants')
+        # Circuito aperto: la copia scaduta è meglio di nessuna risposta
+        self.assertEqual(client.get('merchants'), {'data': []})
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_redis_tier_is_shared_between_processes(self):
+        redis = _FakeRedis(self.clock)
+        web, worker = (self._cache(redis, ttls={'merchants': 60}, stale_ttl=300) for _ in range(2))
+        key = web.make_key('merchants', 'merchants')
+        web.set(key, {'data': [{'id': 101}]})
+        self.assertEqual(redis.ttl(key), 360)
+
+        self.assertEqual(worker.get(key), {'data': [{'id': 101}]})
+        self.assertEqual(worker.get(key), {'data': [{'id': 101}]})
+        self.assertEqual((worker.stats()['redis_hits'], worker.stats()['hits']), (1, 1))
+
+        # Scaduta in Redis resta disponibile solo come copia stale
+        self.clock[0] += 61
+        late = self._cache(redis, ttls={'merchants': 60}, stale_ttl=300)
+        self.assertIsNone(late.get(key))
+        self.assertEqual(late.get(key, allow_stale=True), {'data': [{'id': 101}]})
+
+        web.invalidate(name='merchants')
+        self.assertEqual(redis.values, {})
+        self.assertIsNone(self._cache(redis).get(key, allow_stale=True))
+
+    def test_redis_outage_falls_back_to_the_local_tier(self):
+        redis = _FakeRedis(self.clock)
+        cache = self._cache(redis)
+        key = cache.make_key('merchants', 'merchants')
+        redis.fail = True
+        cache.set(key, {'data': []})
+        self.assertEqual(cache.get(key), {'data': []})
+        self.assertIsNone(cache.get(cache.make_key('warehouses', 'warehouses')))
+
+        # Dopo un errore Redis viene saltato per 30 secondi
+        calls = redis.calls
+        cache.get(cache.make_key('services', 'services'))
+        self.assertEqual(redis.calls, calls)
+        redis.fail = False
+        self.clock[0] += 31
+        cache.get(cache.make_key('services', 'services'))
+        self.assertGreater(redis.calls, calls)
+
+
+class RequestMetricsTest(SimpleTestCase):
+    """Istogrammi delle chiamate PrepBusiness, formato Prometheus, tetto alle serie e log strutturati."""
+
+    def test_endpoint_template(self):
+        from libs.prepbusiness.metrics import endpoint_template
+
+        self.assertEqual(
+            endpoint_template('https://x.test/api/shipments/outbound/123/outbound-shipment-item?page=2'),
+            'shipments/outbound/{id}/outbound-shipment-item'
+        )
+        self.assertEqual(endpoint_template('/inventory/55/'), 'inventory/{id}')
+        self.assertEqual(endpoint_template('merchants'), 'merchants')
+
+    def test_histogram_buckets_and_quantiles(self):
+        from libs.prepbusiness.metrics import Histogram
+
+        histogram = Histogram((0.1, 0.5, 1.0))
+        for value in (0.05, 0.1, 0.3, 0.7, 4.0):
+            histogram.observe(value)
+        # I bucket sono cumulativi e il limite è incluso (le = "minore o uguale")
+        self.assertEqual(histogram.cumulative(), [('0.1', 2), ('0.5', 3), ('1', 4), ('+Inf', 5)])
+        self.assertEqual((histogram.count, round(histogram.sum, 2), histogram.max), (5, 5.15, 4.0))
+        self.assertEqual(histogram.quantile(0.5), 0.5)
+        self.assertEqual(histogram.quantile(0.4), 0.1)
+        self.assertEqual(histogram.quantile(0.95), 4.0)
+        self.assertIsNone(Histogram((1,)).quantile(0.5))
+
+    def test_snapshot_and_prometheus_output(self):
+        from libs.prepbusiness.metrics import RequestMetrics
+
+        metrics = RequestMetrics()
+        metrics.observe('get', 'https://x.test/api/inventory/1', 101, 200, 0.2, bytes_received=2048)
+        metrics.observe('GET', 'https://x.test/api/inventory/2', 202, 200, 0.4, bytes_received=512, retries=1)
+        metrics.observe('GET', 'https://x.test/api/inventory/3', 101, 'error', 3.0)
+        metrics.observe_bytes('GET', 'https://x.test/api/inventory/3', 'error', 100)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['dropped_series'], 0)
+        self.assertEqual([(s['endpoint'], s['status']) for s in snapshot['series']],
+                         [('inventory/{id}', 'error'), ('inventory/{id}', '200')])
+        ok = snapshot['series'][1]
+        self.assertEqual((ok['latency_seconds']['count'], ok['latency_seconds']['sum']), (2, 0.6))
+        self.assertEqual(ok['bytes_received']['buckets'], {'1024': 1, '10240': 2, '102400': 2, '1048576': 2,
+                                                           '10485760': 2, '+Inf': 2})
+        self.assertEqual(ok['retries']['max'], 1)
+        self.assertNotIn('merchant_id', ok)
+
+        text = metrics.render_prometheus()
+        self.assertIn('# TYPE prepbusiness_request_latency_seconds histogram', text)
+        self.assertIn('prepbusiness_request_latency_seconds_bucket{method="GET",endpoint="inventory/{id}",'
+                      'status="200",le="0.25"} 1', text)
+        self.assertIn('prepbusiness_request_latency_seconds_bucket{method="GET",endpoint="inventory/{id}",'
+                      'status="200",le="+Inf"} 2', text)
+        self.assertIn('prepbusiness_request_response_bytes_count{method="GET",endpoint="inventory/{id}",status="error"} 1', text)
+        self.assertIn('prepbusiness_request_retries_sum{method="GET",endpoint="inventory/{id}",status="200"} 1', text)
+        self.assertNotIn('merchant', text)
+        self.assertNotIn('101', text)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_series_are_capped(self):
+        from libs.prepbusiness.metrics import RequestMetrics
+
+        metrics = RequestMetrics(max_series=2)
+        for status in (200, 404, 500, 500):
+            metrics.observe('GET', 'merchants', None, status, 0.1)
+        metrics.observe('GET', 'merchants', None, 200, 0.1)
+        snapshot = metrics.snapshot()
+        self.assertEqual(sorted(s['status'] for s in snapshot['series']), ['200', '404'])
+        self.assertEqual(snapshot['dropped_series'], 2)
+        self.assertEqual(next(s for s in snapshot['series'] if s['status'] == '200')['latency_seconds']['count'], 2)
+
+        # Il merchant non apre serie nuove
+        metrics = RequestMetrics(max_series=1)
+        for merchant_id in range(100):
+            metrics.observe('GET', 'inventory', merchant_id, 200, 0.1)
+        self.assertEqual((len(metrics.snapshot()['series']), metrics.dropped), (1, 0))
+
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()['series'], [])
+
+    def test_structured_log_records(self):
+        from libs.prepbusiness.metrics import RequestMetrics
+        from prep_center.logging_formatters import StructuredFormatter
+
+        metrics = RequestMetrics()
+        with self.assertLogs('prep_business.requests', level='INFO') as logs:
+            metrics.observe('GET', 'https://x.test/api/inventory/7', 101, 200, 0.25, bytes_received=300)
+            metrics.observe('POST', 'https://x.test/api/shipments/inbound', None, 429, 1.5, retries=3,
+                            client='AsyncPrepBusinessClient')
+
+        ok, throttled = logs.records
+        self.assertEqual(ok.levelname, 'INFO')
+        self.assertEqual(throttled.levelname, 'WARNING')
+
+        record = json.loads(StructuredFormatter().format(ok))
+        self.assertEqual(record['logger'], 'prep_business.requests')
+        self.assertEqual(record['message'], '[PrepBusinessClient] GET inventory/{id} -> 200 in 250ms, 300 byte')
+        self.assertEqual({key: record[key] for key in ('method', 'endpoint', 'merchant_id', 'status', 'latency_ms',
+                                                        'bytes_received', 'retries', 'client')},
+                         {'method': 'GET', 'endpoint': 'inventory/{id}', 'merchant_id': '101', 'status': 200,
+                          'latency_ms': 250.0, 'bytes_received': 300, 'retries': 0, 'client': 'PrepBusinessClient'})
+        self.assertNotIn('args', record)
+
+        record = json.loads(StructuredFormatter().format(throttled))
+        self.assertEqual((record['level'], record['merchant_id'], record['retries'], record['client']),
+                         ('WARNING', None, 3, 'AsyncPrepBusinessClient'))
+
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            error = logging.getLogger('prep_business').makeRecord(
+                'prep_business', logging.ERROR, __file__, 1, 'fallito %s', ('qui',), sys.exc_info(), extra={'job': 7}
+            )
+        record = json.loads(StructuredFormatter().format(error))
+        self.assertEqual((record['message'], record['job']), ('fallito qui', 7))
+        self.assertIn('ValueError: boom', record['exc_info'])
+
+    def test_client_records_every_request(self):
+        from libs.prepbusiness.metrics import RequestMetrics
+
+        responses = [(429, {}, {'Retry-After': '0'}), (200, {'ok': True}, {}), (404, {'message': 'No'}, {})]
+        metrics = RequestMetrics()
+        client, _ = _scripted_client(lambda request: responses.pop(0), metrics=metrics)
+        client.get('inventory/9', merchant_id=101)
+        with self.assertRaises(PrepBusinessError):
+            client.get('inventory/10', merchant_id=101)
+
+        series = {s['status']: s for s in client.request_metrics()['series']}
+        self.assertEqual(set(series), {'200', '404'})
+        self.assertEqual(series['200']['endpoint'], 'inventory/{id}')
+        self.assertEqual((series['200']['retries']['sum'], series['404']['retries']['sum']), (1, 0))
+
+    def test_metrics_view(self):
+        from libs.prepbusiness.metrics import RequestMetrics
+
+        metrics = RequestMetrics()
+        metrics.observe('GET', 'merchants', 101, 200, 0.1)
+        with mock.patch('libs.prepbusiness.metrics.get_request_metrics', return_value=metrics):
+            response = Client(HTTP_HOST='localhost').get(reverse('prepbusiness_metrics'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['metrics']['series'][0]['endpoint'], 'merchants')
+
+            response = Client(HTTP_HOST='localhost').get(reverse('prepbusiness_metrics'), {'output': 'prometheus'})
+            self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+            self.assertIn(b'prepbusiness_request_latency_seconds_count{method="GET",endpoint="merchants",status="200"} 1',
+                          response.content)
+
+
+class ClientRegistryTest(SimpleTestCase):
+    """Un client condiviso per configurazione e per processo, con contatori e riuso delle connessioni."""
+
+    def setUp(self):
+        from libs.prepbusiness import registry
+
+        self.registry = registry
+        registry.clear_registry()
+        self.addCleanup(registry.clear_registry)
+
+    def test_same_configuration_shares_one_client(self):
+        get = self.registry.get_shared_client
+        client = get('key-1234', 'prepbusiness.test', coalesce_gets=False, pool_maxsize=5)
+        self.assertIs(get('key-1234', 'prepbusiness.test', pool_maxsize=5, coalesce_gets=False), client)
+        self.assertIs(get('key-1234', 'prepbusiness.test', timeout=30, pool_maxsize=5, coalesce_gets=False), client)
+
+        others = [
+            get('key-5678', 'prepbusiness.test', coalesce_gets=False, pool_maxsize=5),
+            get('key-1234', 'other.test', coalesce_gets=False, pool_maxsize=5),
+            get('key-1234', 'prepbusiness.test', default_merchant_id=101, coalesce_gets=False, pool_maxsize=5),
+            get('key-1234', 'prepbusiness.test', coalesce_gets=False, pool_maxsize=20),
+        ]
+        self.assertEqual(len({id(client)} | {id(other) for other in others}), 5)
+
+        stats = self.registry.get_registry_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (2, 5, round(2 / 7, 4)))
+        self.assertEqual(len(stats['clients']), 5)
+        self.assertEqual(stats['clients'][0]['api_key'], '...1234')
+        self.assertNotIn('key-1234', json.dumps(stats))
+
+    def test_shared_cache_per_configuration(self):
+        cache = self.registry.get_shared_cache(maxsize=64, ttls={'merchants': 60})
+        self.assertIs(self.registry.get_shared_cache(maxsize=64, ttls={'merchants': 60}), cache)
+        self.assertIsNot(self.registry.get_shared_cache(maxsize=128, ttls={'merchants': 60}), cache)
+        # Passare la stessa istanza tiene stabile la chiave del client
+        client = self.registry.get_shared_client('key', 'prepbusiness.test', cache=cache)
+        self.assertIs(self.registry.get_shared_client('key', 'prepbusiness.test', cache=cache), client)
+
+    def test_registry_restarts_empty_after_fork(self):
+        client = self.registry.get_shared_client('key', 'prepbusiness.test')
+        cache = self.registry.get_shared_cache()
+        self.registry.get_shared_client('key', 'prepbusiness.test')
+
+        # Un pid diverso da quello del proprietario è un figlio nato da fork (anche senza register_at_fork)
+        with mock.patch.object(self.registry, '_owner_pid', -1):
+            child_client = self.registry.get_shared_client('key', 'prepbusiness.test')
+            self.assertIsNot(child_client, client)
+            stats = self.registry.get_registry_stats()
+            self.assertEqual((stats['hits'], stats['misses'], len(stats['clients'])), (0, 1, 1))
+            self.assertEqual(self.registry._owner_pid, os.getpid())
+
+        with mock.patch.object(self.registry, '_owner_pid', -1):
+            self.assertIsNot(self.registry.get_shared_cache(), cache)
+
+        # Lo stesso reset che os.register_at_fork esegue nel figlio
+        self.registry.get_shared_client('key', 'prepbusiness.test')
+        self.registry._reset_after_fork()
+        self.assertEqual(self.registry.get_registry_stats()['clients'], [])
+
+    def test_connection_stats_count_reused_connections(self):
+        from libs.prepbusiness.standin import StandInData, StandInServer
+
+        with StandInServer(StandInData(merchants=1, inbound_per_merchant=3)) as server:
+            client = self.registry.get_shared_client('key', server.netloc, scheme='http', coalesce_gets=False)
+            for _ in range(3):
+                self.registry.get_shared_client('key', server.netloc, scheme='http', coalesce_gets=False).get('merchants')
+            stats = self.registry.get_registry_stats()
+            self.assertEqual(client.connection_stats(), {'requests': 3, 'new_connections': 1, 'reused_connections': 2})
+            self.registry.clear_registry()
+
+        entry = stats['clients'][0]
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+        self.assertEqual((entry['company_domain'], entry['transport']), (server.netloc, 'live'))
+        self.assertEqual((entry['requests'], entry['new_connections'], entry['reused_connections']), (3, 1, 2))
+        self.assertEqual(self.registry.get_registry_stats()['clients'], [])
+
+
+class SingleFlightTest(SimpleTestCase):
+    """GET identiche in volo condividono una chiamata senza condividere l'oggetto risposta."""
+
+    def _run_coalesced(self, body, call):
+        holder = {}
+
+        def handler(request):
+            # Il leader risponde solo quando l'altra chiamata si è accodata come follower
+            deadline = time.monotonic() + 5
+            while holder['client'].coalescing_stats()['coalesced'] < 1 and time.monotonic() < deadline:
+                time.sleep(0.005)
+            return 200, body, {}
+
+        client, adapter = _scripted_client(handler)
+        holder['client'] = client
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(call(client))
+            except Exception as e:  # pragma: no cover - riportato sotto
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(adapter.requests), 1)
+        self.assertEqual(client.coalescing_stats()['coalesced'], 1)
+        return results
+
+    def test_coalesced_paginated_calls_get_independent_results(self):
+        from libs.prepbusiness.models import Channel
+
+        body = {'data': [_channel(1), _channel(2)], 'current_page': 1, 'from': 1, 'to': 2, 'total': 2,
+                'last_page': 1, 'per_page': 50}
+        # get_paginated sostituisce response['data'] con i modelli: il follower non deve vederli
+        results = self._run_coalesced(body, lambda c: c.get_paginated('inventory', response_model=Channel))
+        for response in results:
+            self.assertEqual([channel.id for channel in response.data], [1, 2])
+        self.assertIsNot(results[0].data[0], results[1].data[0])
+
+    def test_coalesced_get_channels(self):
+        results = self._run_coalesced({'channels': [_channel(1), _channel(2)]}, lambda c: c.get_channels())
+        for response in results:
+            self.assertEqual([channel.id for channel in response.data], [1, 2])
+
+    def test_followers_receive_the_leader_error(self):
+        from libs.prepbusiness.singleflight import SingleFlight
+
+        flight = SingleFlight()
+        joined = threading.Event()
+        outcomes = []
+
+        def leader():
+            def fail():
+                joined.wait(5)
+                # Il follower si è accodato: nessun'altra chiamata può diventare leader
+                while flight.stats()['coalesced'] < 1:
+                    time.sleep(0.001)
+                raise ValueError('upstream')
+            try:
+                flight.do('key', fail)
+            except ValueError as e:
+                outcomes.append(('leader', str(e)))
+
+        def follower():
+            while flight.stats()['in_flight'] < 1:
+                time.sleep(0.001)
+            joined.set()
+            try:
+                flight.do('key', lambda: 'mai eseguita')
+            except ValueError as e:
+                outcomes.append(('follower', str(e)))
+
+        threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(outcomes), [('follower', 'upstream'), ('leader', 'upstream')])
+
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Apertura dopo errori consecutivi, chiamata di prova half-open e ripiego sulla cache scaduta."""
+
+    def _breaker(self, **kwargs):
+        from libs.prepbusiness.circuit import CircuitBreaker
+
+        options = {'failure_threshold': 2, 'slow_call_seconds': None, 'reset_timeout': 0.05}
+        options.update(kwargs)
+        return CircuitBreaker(**options)
+
+    def test_opens_after_consecutive_failures(self):
+        from libs.prepbusiness.models import CircuitOpenError
+
+        breaker = self._breaker(reset_timeout=60)
+        breaker.before_call()
+        breaker.record_failure('HTTP 502')
+        breaker.before_call()
+        breaker.record_success(0.1)
+        breaker.before_call()
+        breaker.record_failure('HTTP 502')
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+        breaker.record_failure('HTTP 503')
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.before_call()
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_half_open_lets_one_trial_through(self):
+        from libs.prepbusiness.models import CircuitOpenError
+
+        breaker = self._breaker(failure_threshold=1)
+        breaker.record_failure('timeout')
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, 'half_open')
+        breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_failed_trial_reopens(self):
+        breaker = self._breaker(failure_threshold=3)
+        for _ in range(3):
+            breaker.record_failure('timeout')
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_failure('timeout')
+        self.assertEqual(breaker.state, 'open')
+
+    def test_slow_calls_only_count_when_configured(self):
+        breaker = self._breaker()
+        for _ in range(5):
+            breaker.record_success(120.0)
+        self.assertEqual(breaker.state, 'closed')
+
+        slow_breaker = self._breaker(slow_call_seconds=1.0, slow_call_threshold=2)
+        slow_breaker.record_success(5.0)
+        slow_breaker.record_success(5.0)
+        self.assertEqual(slow_breaker.state, 'open')
+
+    def test_client_serves_stale_cache_while_open(self):
+        from libs.prepbusiness.cache import ResponseCache
+        from libs.prepbusiness.models import CircuitOpenError
+
+        status = {'code': 200}
+        client, adapter = _scripted_client(
+            lambda request: (status['code'], {'data': [{'id': 1}]} if status['code'] == 200 else {}, {}),
+            cache=ResponseCache(), circuit_failure_threshold=2, circuit_reset_timeout=60
+        )
+        self.assertEqual(client.get('warehouses'), {'data': [{'id': 1}]})
+        # La voce scade ma resta disponibile come "stale"
+        for key, (expires_at, payload) in list(client._cache._entries.items()):
+            client._cache._entries[key] = (time.monotonic() - 1, payload)
+
+        status['code'] = 502
+        for _ in range(2):
+            with self.assertRaises(PrepBusinessError):
+                client.get('warehouses')
+        self.assertEqual(client.circuit_stats()['state'], 'open')
+
+        sent = len(adapter.requests)
+        self.assertEqual(client.get('warehouses'), {'data': [{'id': 1}]})
+        with self.assertRaises(CircuitOpenError):
+            client.get('services')
+        self.assertEqual(len(adapter.requests), sent)
+
+    @skipIf('PREP_BUSINESS_CIRCUIT_FAILURES' in os.environ, 'circuit breaker configurato dall\'ambiente')
+    def test_disabled_by_default(self):
+        from libs import config
+        from prep_management.utils.clients import _client_options
+
+        self.assertEqual(config.PREP_BUSINESS_CIRCUIT_FAILURES, 0)
+        self.assertIsNone(_client_options()['circuit_failure_threshold'])
+        self.assertIsNone(_client_options()['circuit_slow_call_seconds'])
+
+
+class RateLimiterTest(SimpleTestCase):
+    """Token bucket globale e per merchant, rallentamento sui 429 e recupero (AIMD)."""
+
+    def _limiter(self, **kwargs):
+        from libs.prepbusiness.ratelimit import AdaptiveRateLimiter
+
+        options = {'rate': 10.0, 'burst': 2, 'merchant_rate': 5.0, 'merchant_burst': 1}
+        options.update(kwargs)
+        return AdaptiveRateLimiter(**options)
+
+    def test_burst_then_waits_for_tokens(self):
+        limiter = self._limiter(merchant_rate=None)
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertAlmostEqual(limiter.reserve(), 0.1, delta=0.02)
+        self.assertAlmostEqual(limiter.reserve(), 0.2, delta=0.02)
+        self.assertEqual(limiter.stats()['delayed'], 2)
+
+    def test_merchant_budget_is_separate(self):
+        limiter = self._limiter(burst=100)
+        self.assertEqual(limiter.reserve(101), 0.0)
+        self.assertAlmostEqual(limiter.reserve(101), 0.2, delta=0.02)
+        self.assertEqual(limiter.reserve(202), 0.0)
+
+    def test_throttling_halves_rates_and_pauses(self):
+        limiter = self._limiter(burst=100, merchant_burst=100)
+        limiter.on_throttled(101, retry_after=2.0)
+        self.assertEqual(limiter.stats()['global_rate'], 5.0)
+        self.assertEqual(limiter.stats()['merchant_rates'], {'101': 2.5})
+        self.assertAlmostEqual(limiter.reserve(202), 2.0, delta=0.05)
+
+        for _ in range(100):
+            limiter.on_success(101)
+        self.assertEqual(limiter.stats()['global_rate'], 10.0)
+        self.assertEqual(limiter.stats()['merchant_rates'], {})
+
+    def test_rates_never_drop_below_minimum(self):
+        limiter = self._limiter(min_rate=0.5)
+        for _ in range(20):
+            limiter.on_throttled()
+        self.assertEqual(limiter.stats()['global_rate'], 0.5)
+
+    @skipIf('PREP_BUSINESS_RATE_LIMIT' in os.environ, 'rate limiter configurato dall\'ambiente')
+    def test_disabled_by_default(self):
+        from prep_management.utils.clients import _client_options
+
+        self.assertIsNone(_client_options()['rate_limit'])
+        self.assertIsNone(PrepBusinessClient(api_key='k', company_domain='prepbusiness.test').rate_limiter_stats())
+
+
+class ThrottlingRetryTest(SimpleTestCase):
+    """Ciclo di retry di ``_send`` sulle risposte 429 (o 503 con Retry-After)."""
+
+    def _client(self, responses, **kwargs):
+        queue = list(responses)
+
+        def handler(request):
+            return queue.pop(0) if len(queue) > 1 else queue[0]
+
+        return _scripted_client(handler, **kwargs)
+
+    def test_retries_after_retry_after_then_succeeds(self):
+
+        client, adapter = self._client([(429, {}, {'Retry-After': '2'}), (200, {'ok': True}, {})])
+        with mock.patch('libs.prepbusiness.client.time.sleep') as sleep:
+            self.assertEqual(client.get('inventory'), {'ok': True})
+        sleep.assert_called_once_with(2.0)
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_503_with_retry_after_is_retried_and_post_too(self):
+
+        client, adapter = self._client([(503, {}, {'Retry-After': '1'}), (200, {'id': 7}, {})])
+        with mock.patch('libs.prepbusiness.client.time.sleep'):
+            self.assertEqual(client.post('inventory', json={'sku': 'A'}), {'id': 7})
+        self.assertEqual(len(adapter.requests), 2)
+
+    def test_gives_up_after_max_retries(self):
+        from libs.prepbusiness.models import RateLimitError
+
+        client, adapter = self._client([(429, {}, {})], max_retries=2, retry_backoff=0.01)
+        with mock.patch('libs.prepbusiness.client.time.sleep') as sleep:
+            with self.assertRaises(RateLimitError):
+                client.get('inventory')
+        self.assertEqual(len(adapter.requests), 3)
+        # Senza Retry-After: backoff esponenziale con jitter (base * 2^n .. 2 * base * 2^n)
+        waits = [call.args[0] for call in sleep.call_args_list]
+        self.assertTrue(0.01 <= waits[0] <= 0.02 and 0.02 <= waits[1] <= 0.04, waits)
+
+    def test_long_retry_after_fails_fast(self):
+        from libs.prepbusiness.models import RateLimitError
+
+        client, adapter = self._client([(429, {}, {'Retry-After': '600'})])
+        with mock.patch('libs.prepbusiness.client.time.sleep') as sleep:
+            with self.assertRaises(RateLimitError) as raised:
+                client.get('inventory')
+        self.assertEqual(raised.exception.retry_after, 600.0)
+        sleep.assert_not_called()
+        self.assertEqual(len(adapter.requests), 1)
+
+    def test_limiter_absorbs_the_wait(self):
+
+        client, adapter = self._client(
+            [(429, {}, {'Retry-After': '0.05'}), (200, {'ok': True}, {})], rate_limit=100, merchant_rate_limit=50
+        )
+        started = time.monotonic()
+        self.assertEqual(client.get('inventory', merchant_id=101), {'ok': True})
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        stats = client.rate_limiter_stats()
+        self.assertEqual(stats['throttled'], 1)
+        self.assertEqual(stats['global_rate'], 50.1)
+
+
+class _ScriptedRecordingAdapter(RecordingAdapter, _ScriptedAdapter):
+    """RecordingAdapter sopra il transport finto: registra su disco le risposte di ``handler``."""
+
+
+class PaginationReplayTest(SimpleTestCase):
+    """Paginazione con prefetch, uscita anticipata e ripiego senza ijson, su registrazioni del transport replay."""
+
+    PAGES = 3
+    PER_PAGE = 2
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+        def handler(request):
+            page = int(parse_qs(urlparse(request.url).query)['page'][0])
+            first = (page - 1) * self.PER_PAGE
+            data = [
+                json.loads(_inbound_shipment(first + index + 1, timezone.now()).model_dump_json(by_alias=True))
+                for index in range(self.PER_PAGE)
+            ]
+            base = 'https://prepbusiness.test/api/shipments/inbound'
+            return 200, {
+                'current_page': page, 'data': data, 'first_page_url': f'{base}?page=1', 'from': first + 1,
+                'last_page': self.PAGES, 'last_page_url': f'{base}?page={self.PAGES}', 'links': [],
+                'next_page_url': f'{base}?page={page + 1}' if page < self.PAGES else None, 'path': base,
+                'per_page': self.PER_PAGE, 'prev_page_url': None, 'to': first + self.PER_PAGE,
+                'total': self.PAGES * self.PER_PAGE,
+            }, {}
+
+        recorder = PrepBusinessClient(
+            api_key='test-key', company_domain='prepbusiness.test',
+            transport=_ScriptedRecordingAdapter(self.directory, handler=handler)
+        )
+        self.expected = [shipment.id for shipment in recorder.iter_inbound_shipments(per_page=self.PER_PAGE, prefetch=False)]
+        self.assertEqual(self.expected, list(range(1, self.PAGES * self.PER_PAGE + 1)))
+
+    def _client(self):
+        """Client che risponde solo dalle registrazioni e annota le pagine richieste."""
+        client = PrepBusinessClient(api_key='test-key', company_domain='prepbusiness.test', transport=f'replay:{self.directory}')
+        adapter = client._session.get_adapter('https://prepbusiness.test')
+        requested = []
+
+        def send(request, **kwargs):
+            requested.append(int(parse_qs(urlparse(request.url).query)['page'][0]))
+            return type(adapter).send(adapter, request, **kwargs)
+
+        adapter.send = send
+        return client, requested
+
+    def _wait_for(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return condition()
+
+    def test_prefetch_yields_pages_in_order_fetching_one_ahead(self):
+        client, requested = self._client()
+        shipments = client.iter_inbound_shipments(per_page=self.PER_PAGE)
+
+        self.assertEqual(next(shipments).id, 1)
+        # Mentre si consuma la pagina 1 la 2 è già in arrivo, la 3 non ancora
+        self.assertTrue(self._wait_for(lambda: 2 in requested))
+        self.assertNotIn(3, requested)
+
+        self.assertEqual([1] + [shipment.id for shipment in shipments], self.expected)
+        self.assertEqual(requested, [1, 2, 3])
+
+    def test_without_prefetch_pages_are_fetched_on_demand(self):
+        client, requested = self._client()
+        shipments = client.iter_inbound_shipments(per_page=self.PER_PAGE, prefetch=False)
+
+        self.assertEqual([next(shipments).id, next(shipments).id], [1, 2])
+        self.assertEqual(requested, [1])
+        self.assertEqual([1, 2] + [shipment.id for shipment in shipments], self.expected)
+
+    def test_early_exit_shuts_down_the_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        client, requested = self._client()
+        executors = []
+
+        class _TrackedExecutor(ThreadPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.shutdown_calls = []
+                executors.append(self)
+
+            def shutdown(self, wait=True, *, cancel_futures=False):
+                self.shutdown_calls.append({'wait': wait, 'cancel_futures': cancel_futures})
+                super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+        with mock.patch('libs.prepbusiness.client.ThreadPoolExecutor', _TrackedExecutor):
+            shipments = client.iter_inbound_shipments(per_page=self.PER_PAGE)
+            for shipment in shipments:
+                break
+            shipments.close()
+
+        self.assertEqual(shipment.id, 1)
+        self.assertEqual(len(executors), 1)
+        self.assertEqual(executors[0].shutdown_calls, [{'wait': False, 'cancel_futures': True}])
+        # Il prefetch della pagina 2 termina senza che ne partano altri
+        self.assertTrue(self._wait_for(lambda: not any(thread.is_alive() for thread in executors[0]._threads)))
+        self.assertEqual(requested, [1, 2])
+
+    @skipUnless(importlib.util.find_spec('ijson'), 'ijson non installato')
+    def test_stream_parses_the_recorded_pages(self):
+        client, requested = self._client()
+        with mock.patch.object(PrepBusinessClient, 'iter_inbound_shipments') as iter_inbound:
+            self.assertEqual([shipment.id for shipment in client.stream_inbound_shipments(per_page=self.PER_PAGE)], self.expected)
+        iter_inbound.assert_not_called()
+        self.assertEqual(requested, [1, 2, 3])
+
+    def test_stream_falls_back_to_whole_pages_without_ijson(self):
+        client, requested = self._client()
+        with mock.patch('libs.prepbusiness.client.IJSON_AVAILABLE', False), \
+                mock.patch.object(PrepBusinessClient, 'iter_inbound_shipments',
+                                  autospec=True, side_effect=PrepBusinessClient.iter_inbound_shipments) as iter_inbound:
+            shipments = client.stream_inbound_shipments(per_page=self.PER_PAGE)
+            self.assertEqual([shipment.id for shipment in shipments], self.expected)
+        iter_inbound.assert_called_once_with(client, merchant_id=None, per_page=self.PER_PAGE)
+        self.assertEqual(sorted(requested), [1, 2, 3])
+
+
+@skipUnless(importlib.util.find_spec('httpx'), 'httpx non installato')
+class AsyncClientTest(SimpleTestCase):
+    """Retry sui 429, Retry-After, paginazione e download in blocco degli items del client asincrono."""
+
+    def _client(self, handler, **kwargs):
+        import httpx
+        from libs.prepbusiness.async_client import AsyncPrepBusinessClient
+        from libs.prepbusiness.metrics import RequestMetrics
+
+        options = {'retry_backoff': 0.01, 'metrics': RequestMetrics()}
+        options.update(kwargs)
+        return AsyncPrepBusinessClient(
+            api_key='test-key', company_domain='prepbusiness.test', transport=httpx.MockTransport(handler), **options
+        )
+
+    def _scripted(self, responses):
+        """Handler che restituisce in ordine le risposte (status, body JSON, headers) e annota le richieste."""
+        import httpx
+
+        requests_seen = []
+        responses = list(responses)
+
+        def handler(request):
+            requests_seen.append(request)
+            status, body, headers = responses.pop(0) if len(responses) > 1 else responses[0]
+            return httpx.Response(status, json=body, headers=headers)
+
+        return handler, requests_seen
+
+    async def test_retries_throttled_requests_honouring_retry_after(self):
+        handler, seen = self._scripted([
+            (429, {}, {'Retry-After': '0.05'}), (503, {}, {'Retry-After': '0.05'}), (200, {'ok': True}, {}),
+        ])
+        started = time.monotonic()
+        async with self._client(handler) as client:
+            self.assertEqual(await client.get('inventory', merchant_id=101), {'ok': True})
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(len(seen), 3)
+        self.assertEqual({request.headers['X-Selected-Client-Id'] for request in seen}, {'101'})
+        self.assertEqual(seen[0].headers['Authorization'], 'Bearer test-key')
+
+    async def test_gives_up_after_max_retries(self):
+        from libs.prepbusiness.models import RateLimitError
+
+        handler, seen = self._scripted([(429, {}, {'Retry-After': '0'})])
+        async with self._client(handler, max_retries=2) as client:
+            with self.assertRaises(RateLimitError):
+                await client.get('inventory')
+        self.assertEqual(len(seen), 3)
+
+    async def test_retry_after_longer_than_max_wait_fails_fast(self):
+        from libs.prepbusiness.models import RateLimitError
+
+        handler, seen = self._scripted([(429, {}, {'Retry-After': '3600'})])
+        async with self._client(handler) as client:
+            with self.assertRaises(RateLimitError) as raised:
+                await client.get('inventory')
+        self.assertEqual(raised.exception.retry_after, 3600)
+        self.assertEqual(len(seen), 1)
+
+    async def test_errors_are_not_retried(self):
+        handler, seen = self._scripted([(500, {'message': 'Boom'}, {}), (200, {'ok': True}, {})])
+        async with self._client(handler) as client:
+            with self.assertRaisesRegex(PrepBusinessError, 'Boom'):
+                await client.get('inventory')
+        self.assertEqual(len(seen), 1)
+
+    def test_retry_after_parsing(self):
+        """Lo stesso parsing per le risposte httpx del client asincrono e requests di quello sincrono."""
+        from email.utils import format_datetime
+        import httpx
+        from libs.prepbusiness.ratelimit import is_throttled, retry_after_seconds
+
+        later = format_datetime(timezone.now() + timedelta(seconds=30), usegmt=True)
+        for build in (lambda status, headers: httpx.Response(status, headers=headers), _requests_response):
+            with self.subTest(response=build):
+                self.assertTrue(is_throttled(build(429, {})))
+                self.assertTrue(is_throttled(build(503, {'Retry-After': '1'})))
+                self.assertFalse(is_throttled(build(503, {})))
+                self.assertEqual(retry_after_seconds(build(429, {'Retry-After': '2.5'}), 0, 0.5), 2.5)
+                self.assertAlmostEqual(retry_after_seconds(build(429, {'Retry-After': later}), 0, 0.5), 30, delta=2)
+                self.assertEqual(retry_after_seconds(build(429, {'Retry-After': '-4'}), 0, 0.5), 0.0)
+                # Senza Retry-After (o illeggibile): backoff esponenziale con jitter
+                for attempt in range(3):
+                    wait = retry_after_seconds(build(429, {'Retry-After': 'presto'}), attempt, 0.5)
+                    self.assertTrue(0.5 * 2 ** attempt <= wait <= 2 * 0.5 * 2 ** attempt)
+
+    def test_pagination_against_the_stand_in(self):
+        from libs.prepbusiness.async_client import AsyncPrepBusinessClient
+        from libs.prepbusiness.metrics import RequestMetrics
+        from libs.prepbusiness.standin import StandInData, StandInServer
+
+        async def all_pages(netloc):
+            ids, pages = [], 0
+            async with AsyncPrepBusinessClient(
+                api_key='test-key', company_domain=netloc, scheme='http', metrics=RequestMetrics()
+            ) as client:
+                page = 1
+                while True:
+                    response = await client.get_inbound_shipments(page=page, per_page=20, merchant_id=101)
+                    pages += 1
+                    self.assertEqual(response.current_page, page)
+                    ids.extend(shipment.id for shipment in response.data)
+                    if not response.next_page_url:
+                        return ids, pages, response.last_page
+                    page += 1
+
+        data = StandInData(merchants=1, inbound_per_merchant=45)
+        with StandInServer(data) as server:
+            ids, pages, last_page = asyncio.run(all_pages(server.netloc))
+        self.assertEqual((pages, last_page), (3, 3))
+        self.assertEqual(ids, [data.make_id(101, 'inbound', index) for index in range(45)])
+
+    async def test_get_many_outbound_shipment_items_bounds_concurrency(self):
+        import httpx
+        from libs.prepbusiness.standin import StandInData
+
+        data = StandInData(merchants=1, items_per_shipment=2)
+        shipment_ids = [data.make_id(101, 'outbound', index) for index in range(12)] + [404]
+        in_flight, peak = 0, 0
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                await asyncio.sleep(0.01)
+                shipment_id = int(request.url.path.split('/')[-2])
+                found = data.split_id(shipment_id, 'outbound')
+                if found is None:
+                    return httpx.Response(404, json={'message': 'Not found'})
+                return httpx.Response(200, json=data.outbound_items(*found))
+            finally:
+                in_flight -= 1
+
+        async with self._client(handler, max_concurrency=3) as client:
+            results = await client.get_many_outbound_shipment_items(shipment_ids, merchant_id=101)
+            self.assertEqual(peak, 3)
+
+            peak = 0
+            await client.get_many_outbound_shipment_items(shipment_ids[:6], merchant_id=101, max_concurrency=1)
+            self.assertEqual(peak, 1)
+
+        self.assertEqual(list(results), shipment_ids)
+        self.assertIsInstance(results[404], PrepBusinessError)
+        for shipment_id in shipment_ids[:-1]:
+            self.assertEqual(len(results[shipment_id].items), 2)
+
+
+class LazyParsingTest(SimpleTestCase):
+    """Modalità di validazione 'lazy': involucro subito, elementi delle liste al primo accesso."""
+
+    def setUp(self):
+        from libs.prepbusiness.standin import StandInData
+
+        self.data = StandInData(merchants=1, inbound_per_merchant=5)
+        self.page = self.data.page('shipments/inbound', range(5), self.data.inbound_shipment, 101, 1, 20)
+
+    def _parse(self, payload, mode='lazy'):
+        from libs.prepbusiness.models import InboundShipmentsResponse
+        from libs.prepbusiness.parsing import parse_model
+
+        return parse_model(InboundShipmentsResponse, payload, mode)
+
+    def test_items_are_validated_on_access(self):
+        from libs.prepbusiness.models import InboundShipment, InboundShipmentsResponse
+
+        response = self._parse(self.page)
+        self.assertIsInstance(response, InboundShipmentsResponse)
+        self.assertEqual((response.current_page, response.total), (1, 5))
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data.pending(), 5)
+
+        self.assertIsInstance(response.data[1], InboundShipment)
+        self.assertEqual(response.data.pending(), 4)
+        self.assertEqual([shipment.id for shipment in response.data[:2]], [shipment.id for shipment in response.data][:2])
+        self.assertEqual(response.data.pending(), 0)
+        self.assertIs(response.data[1], response.data[1])
+
+    def test_invalid_items_fail_only_when_read(self):
+        from pydantic import ValidationError
+
+        self.page['data'][3]['created_at'] = 'ieri'
+        response = self._parse(self.page)
+        self.assertEqual([shipment.id for shipment in response.data[:3]], [self.data.make_id(101, 'inbound', i) for i in range(3)])
+        with self.assertRaises(ValidationError):
+            response.data[3]
+        with self.assertRaises(ValidationError):
+            self._parse(self.page, mode='validate')
+        # L'involucro invece è validato subito
+        with self.assertRaises(ValidationError):
+            self._parse(dict(self.page, current_page='prima'))
+
+    def test_dumps_validate_pending_items(self):
+        import warnings
+
+        eager = self._parse(self.page, mode='validate')
+        for dump in ('model_dump', 'model_dump_json'):
+            with self.subTest(dump=dump):
+                response = self._parse(self.page)
+                response.data[0]
+                with warnings.catch_warnings():
+                    warnings.simplefilter('error')
+                    self.assertEqual(getattr(response, dump)(), getattr(eager, dump)())
+                self.assertEqual(response.data.pending(), 0)
+        self.assertIsInstance(self._parse(self.page).model_dump()['data'][4]['created_at'], datetime)
+
+    def test_client_in_lazy_mode(self):
+        from libs.prepbusiness.models import MerchantsResponse
+
+        merchants = [dict(self.data.merchant(101), name=f'Merchant {n}', id=100 + n) for n in range(1, 4)]
+        client, _ = _scripted_client(lambda request: (200, {'data': merchants}, {}),
+                                     validation_mode='lazy')
+        response = client.get_merchants()
+        self.assertIsInstance(response, MerchantsResponse)
+        self.assertEqual(response.data.pending(), 3)
+        self.assertEqual(response.model_dump()['data'][2]['name'], 'Merchant 3')
+        self.assertEqual(response.data.pending(), 0)
+
+        with self.assertRaises(ValueError):
+            _scripted_client(lambda request: (200, {}, {}), validation_mode='pigra')
+
+
+class RecordReplayTransportTest(SimpleTestCase):
+    """Registrazione degli scambi con lo stand-in e replay offline, senza credenziali su disco."""
+
+    def setUp(self):
+        from libs.prepbusiness.standin import StandInData
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.data = StandInData(merchants=2, inventory_per_merchant=30, inbound_per_merchant=25, outbound_per_merchant=8)
+
+    def _run(self, client):
+        """Il flusso registrato: merchants, inbound paginate, un item, le spedizioni outbound e una scrittura."""
+        return {
+            'merchants': [merchant.name for merchant in client.get_merchants().data],
+            'inbound': [shipment.id for shipment in client.iter_inbound_shipments(merchant_id=102, per_page=10)],
+            'item': client.get_inventory_item(self.data.make_id(101, 'inventory', 4), merchant_id=101).data.merchant_sku,
+            'outbound': [shipment.id for shipment in client.get_outbound_shipments(per_page=50, merchant_id=101).data],
+            'created': client.post('shipments/inbound', json={'name': 'Nuova', 'warehouse_id': 1}, merchant_id=101),
+        }
+
+    def _record(self, **kwargs):
+        from libs.prepbusiness.standin import StandInServer
+
+        with StandInServer(self.data) as server:
+            client = PrepBusinessClient(api_key='segretissima', company_domain=server.netloc, scheme='http',
+                                        transport=f'record:{self.directory}', **kwargs)
+            result = self._run(client)
+            stats = dict(server.stats)
+        return result, stats
+
+    def _replay(self, spec='replay'):
+        # Il dominio non esiste: nessuna richiesta può uscire verso la rete
+        return PrepBusinessClient(api_key='un-altra-chiave', company_domain='127.0.0.1:9', scheme='http',
+                                  transport=f'{spec}:{self.directory}')
+
+    def test_replay_reproduces_the_recorded_run(self):
+        recorded, stats = self._record()
+        self.assertEqual(recorded['merchants'], ['Merchant 001', 'Merchant 002'])
+        self.assertEqual(len(recorded['inbound']), 25)
+        self.assertEqual(stats['inbound'], 3)
+
+        client = self._replay()
+        self.assertEqual(client.transport, 'replay')
+        self.assertEqual(self._run(client), recorded)
+
+    def test_recordings_hold_no_credentials(self):
+        self._record(use_query_auth=True)
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 7)
+        for name in names:
+            with open(os.path.join(self.directory, name), encoding='utf-8') as fh:
+                content = fh.read()
+            self.assertNotIn('segretissima', content)
+            self.assertNotIn('api_token', content)
+            exchange = json.loads(content)
+            self.assertEqual(set(exchange), {'key', 'sequence', 'request', 'response'})
+            self.assertTrue(name.startswith(hashlib.sha1(exchange['key'].encode()).hexdigest()[:16]))
+
+        # La query di autenticazione non entra nella chiave: il replay risponde anche con un'altra chiave
+        client = PrepBusinessClient(api_key='altra', company_domain='127.0.0.1:9', scheme='http', use_query_auth=True,
+                                    transport=f'replay:{self.directory}')
+        self.assertEqual(len(client.get_merchants().data), 2)
+
+    def test_request_without_recording_fails(self):
+        from libs.prepbusiness.transport import ReplayMissError
+
+        self._record()
+        client = self._replay()
+        for call in (
+            lambda: client.get_inventory_item(self.data.make_id(101, 'inventory', 5), merchant_id=101),
+            lambda: client.get('merchants', merchant_id=101),
+            lambda: client.post('shipments/inbound', json={'name': 'Diversa', 'warehouse_id': 1}, merchant_id=101),
+        ):
+            with self.assertRaises(PrepBusinessError) as raised:
+                call()
+            self.assertIsInstance(raised.exception.__cause__, ReplayMissError)
+        adapter = client._session.get_adapter('http://127.0.0.1:9')
+        self.assertEqual(adapter.misses, 3)
+
+    def test_repeated_requests_are_served_in_recorded_order(self):
+        from libs.prepbusiness.transport import RecordingAdapter
+
+        bodies = iter([{'n': 1}, {'n': 2}])
+
+        class _Recorder(RecordingAdapter, _ScriptedAdapter):
+            pass
+
+        recorder = PrepBusinessClient(api_key='k', company_domain='prepbusiness.test', coalesce_gets=False,
+                                      transport=_Recorder(self.directory, handler=lambda request: (200, next(bodies), {})))
+        self.assertEqual([recorder.get('merchants'), recorder.get('merchants')], [{'n': 1}, {'n': 2}])
+
+        client = PrepBusinessClient(api_key='k', company_domain='prepbusiness.test', coalesce_gets=False,
+                                    transport=f'replay:{self.directory}')
+        # Finite le registrazioni si continua a servire l'ultima
+        self.assertEqual([client.get('merchants') for _ in range(3)], [{'n': 1}, {'n': 2}, {'n': 2}])
+
+    def test_replay_latency(self):
+        from libs.prepbusiness.transport import exchange_key
+
+        request = requests.Request('GET', 'https://prepbusiness.test/api/merchants').prepare()
+        key = exchange_key(request)
+        self.assertEqual(key, 'GET /api/merchants? merchant= body=')
+        with open(os.path.join(self.directory, 'merchants-0000.json'), 'w', encoding='utf-8') as fh:
+            json.dump({'key': key, 'sequence': 0, 'request': {'method': 'GET', 'url': key.split(' ', 1)[1]},
+                       'response': {'status': 200, 'headers': {}, 'body': '{"data": []}', 'elapsed': 0.05}}, fh)
+
+        for spec, slow in (('replay', False), ('replay-latency', True)):
+            with self.subTest(spec=spec):
+                started = time.monotonic()
+                self.assertEqual(self._replay(spec).get('merchants'), {'data': []})
+                self.assertEqual(time.monotonic() - started >= 0.05, slow)
+
+    def test_invalid_transport_specs(self):
+        from libs.prepbusiness.transport import build_transport
+
+        self.assertEqual(build_transport(None), (None, 'live'))
+        self.assertEqual(build_transport('live'), (None, 'live'))
+        for spec in ('record', 'replay:', 'tape:/tmp/x'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                build_transport(spec)
+
+
+class StandInServerTest(SimpleTestCase):
+    """Rotte, paginazione, merchant, scritture ed errori iniettati dello stand-in dell'API."""
+
+    @classmethod
+    def setUpClass(cls):
+        from libs.prepbusiness.standin import StandInData, StandInServer
+
+        super().setUpClass()
+        cls.data = StandInData(merchants=2, inventory_per_merchant=30, inbound_per_merchant=45, outbound_per_merchant=12,
+                               items_per_shipment=3)
+        cls.server = StandInServer(cls.data).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def _get(self, path, merchant_id=None, **params):
+        headers = {'X-Selected-Client-Id': str(merchant_id)} if merchant_id else {}
+        response = requests.get(f'{self.server.url}/{path}', params=params, headers=headers, timeout=5)
+        return response.status_code, response.json()
+
+    def test_pagination(self):
+        pages = [self._get('shipments/inbound', 101, page=page, per_page=20)[1] for page in (1, 2, 3, 4)]
+        self.assertEqual([len(page['data']) for page in pages], [20, 20, 5, 0])
+        self.assertEqual({page['last_page'] for page in pages}, {3})
+        self.assertEqual({page['total'] for page in pages}, {45})
+        self.assertEqual([page['from'] for page in pages], [1, 21, 41, None])
+        self.assertTrue(pages[1]['next_page_url'].endswith('page=3'))
+        self.assertIsNone(pages[2]['next_page_url'])
+        self.assertTrue(pages[2]['prev_page_url'].endswith('page=2'))
+        ids = [shipment['id'] for page in pages for shipment in page['data']]
+        self.assertEqual(ids, [self.data.make_id(101, 'inbound', index) for index in range(45)])
+
+        # per_page è limitato a 500 come nell'API vera
+        self.assertEqual(self._get('inventory', 101, per_page=10000)[1]['per_page'], 500)
+
+    def test_client_walks_every_page(self):
+        client = PrepBusinessClient(api_key='k', company_domain=self.server.netloc, scheme='http')
+        shipments = list(client.iter_inbound_shipments(merchant_id=102, per_page=20))
+        self.assertEqual([shipment.id for shipment in shipments],
+                         [self.data.make_id(102, 'inbound', index) for index in range(45)])
+        self.assertEqual({shipment.team_id for shipment in shipments}, {102})
+
+    def test_routes(self):
+        inventory_id = self.data.make_id(101, 'inventory', 7)
+        inbound_id = self.data.make_id(101, 'inbound', 2)
+        outbound_id = self.data.make_id(101, 'outbound', 1)
+
+        self.assertEqual([m['id'] for m in self._get('merchants')[1]['data']], [101, 102])
+        self.assertEqual(self._get(f'inventory/{inventory_id}', 101)[1]['data']['merchant_sku'], 'SKU-101-000007')
+        self.assertEqual(self._get(f'shipments/inbound/{inbound_id}', 101)[1]['shipment']['id'], inbound_id)
+        self.assertEqual(len(self._get(f'shipments/inbound/{inbound_id}/items', 101)[1]['items']), 3)
+        self.assertEqual(self._get(f'shipments/outbound/{outbound_id}', 101)[1]['shipment']['id'], outbound_id)
+        self.assertEqual(len(self._get(f'shipments/outbound/{outbound_id}/outbound-shipment-item', 101)[1]['items']), 3)
+
+        # Un indice su quattro è archiviato; le due liste si dividono le spedizioni e q filtra per nome
+        active = self._get('shipments/outbound', 101, per_page=50)[1]
+        archived = self._get('shipments/outbound/archived', 101, per_page=50)[1]
+        self.assertEqual((active['total'], archived['total']), (9, 3))
+        found = self._get('shipments/outbound', 101, q='101-00005')[1]['data']
+        self.assertEqual([shipment['name'] for shipment in found], ['Spedizione 101-00005'])
+
+        found = self._get('inventory', 101, q='SKU-101-00001')[1]
+        self.assertEqual(found['total'], 10)
+        response = requests.post(f'{self.server.url}/inventory/search', json={'q': 'B0101000'},
+                                 headers={'X-Selected-Client-Id': '101'}, timeout=5)
+        self.assertEqual(len(response.json()['items']), 30)
+
+    def test_merchant_scoping_and_not_found(self):
+        item_of_102 = self.data.make_id(102, 'inventory', 0)
+        self.assertEqual(self._get('inventory', 102)[1]['data'][0]['id'], item_of_102)
+        # Senza header si usa il primo merchant
+        self.assertEqual(self._get('inventory')[1]['data'][0]['id'], self.data.make_id(101, 'inventory', 0))
+        self.assertEqual(self._get('inventory', 999)[0], 404)
+        self.assertEqual(self._get(f'inventory/{self.data.make_id(101, "inventory", 30)}', 101)[0], 404)
+        self.assertEqual(self._get('shipments/unknown', 101)[0], 404)
+
+    def test_writes_are_acknowledged_without_changing_data(self):
+        before = self._get('shipments/inbound', 101)[1]['total']
+        ids = [
+            requests.post(f'{self.server.url}/shipments/inbound', json={'name': 'x'}, timeout=5).json()['shipment_id'],
+            requests.delete(f'{self.server.url}/shipments/inbound/1', timeout=5).json()['shipment_id'],
+        ]
+        self.assertEqual(ids[1], ids[0] + 1)
+        self.assertEqual(self._get('shipments/inbound', 101)[1]['total'], before)
+
+    def test_injected_errors_and_stats(self):
+        from libs.prepbusiness.standin import StandInServer
+
+        with StandInServer(self.data, error_rate=1.0) as server:
+            response = requests.get(f'{server.url}/merchants', timeout=5)
+            self.assertEqual(response.status_code, 503)
+            client = PrepBusinessClient(api_key='k', company_domain=server.netloc, scheme='http')
+            with self.assertRaises(PrepBusinessError):
+                client.get_merchants()
+            self.assertEqual(server.stats, {'error': 2})
+
+        with StandInServer(self.data, latency_ms=30) as server:
+            started = time.monotonic()
+            requests.get(f'{server.url}/merchants', timeout=5)
+            requests.get(f'{server.url}/nowhere', timeout=5)
+            self.assertGreaterEqual(time.monotonic() - started, 0.06)
+            self.assertEqual(server.stats, {'merchants': 1, 'not_found': 1})
+
+
+class _WebhookQueueMixin:
+    """
+    Coda dei webhook senza Celery, API PrepBusiness e handler reali: ``process_event``
+    riesce o fallisce secondo ``self.outcomes`` (di default riesce) e registra gli id in ``self.handled``.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.outcomes = []
+        self.handled = []
+
+        def process_event(processor, update_id):
+            success = self.outcomes.pop(0) if self.outcomes else True
+            self.handled.append(update_id)
+            update = ShipmentStatusUpdate.objects.get(id=update_id)
+            update.processed, update.process_success = True, success
+            update.processed_at = timezone.now()
+            update.processing_status = 'done' if success else 'failed'
+            update.save()
+            return {'success': success, 'message': 'ok' if success else 'API non raggiungibile'}
+
+        patches = [
+            mock.patch('prep_management.utils.webhook_queue.dispatch_lanes'),
+            mock.patch('prep_management.utils.webhook_queue.get_merchant_directory'),
+            mock.patch('prep_management.utils.webhook_queue.upsert_from_webhook'),
+            mock.patch('prep_management.event_handlers.WebhookEventProcessor._initialize_client', return_value=None),
+            mock.patch('prep_management.event_handlers.WebhookEventProcessor.process_event',
+                       autospec=True, side_effect=process_event),
+        ]
+        self.dispatch_lanes = patches[0].start()
+        patches[1].start().return_value.name.return_value = 'Merchant 101'
+        for patcher in patches[2:]:
+            patcher.start()
+        for patcher in patches:
+            self.addCleanup(patcher.stop)
+
+    def _queued(self, shipment_id='500', event_type='inbound_shipment.shipped', lane=0, **fields):
+        data = {'id': shipment_id, 'event': event_type, 'seq': ShipmentStatusUpdate.objects.count()}
+        return ShipmentStatusUpdate.objects.create(
+            shipment_id=shipment_id, event_type=event_type, new_status='created', merchant_id='101',
+            merchant_name='Merchant 101', payload={'data': data}, processing_status='queued', lane=lane,
+            idempotency_key=wq.idempotency_key(event_type, data), **fields
+        )
+
+    def _status(self, update):
+        update.refresh_from_db()
+        return update.processing_status
+
+
+class WebhookRetryTest(_WebhookQueueMixin, TransactionTestCase):
+    """Retry con backoff, dead letter e rielaborazione con ``replay_webhooks``."""
+
+    def test_failure_is_retried_with_backoff(self):
+        update = self._queued()
+        self.outcomes = [False]
+        wq.process_update(update.id)
+        update.refresh_from_db()
+        self.assertEqual(update.processing_status, 'queued')
+        self.assertEqual(update.attempts, 1)
+        self.assertTrue(update.process_message.startswith(f'Tentativo 1/{wq.PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS} fallito'))
+        delay = (update.not_before - timezone.now()).total_seconds()
+        # Primo retry: metà fissa più metà casuale della base
+        base = wq.PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS
+        self.assertTrue(base / 2 - 5 <= delay <= base, delay)
+
+        # In backoff il webhook non è elaborabile, e blocca quelli dopo della stessa spedizione
+        later = self._queued()
+        self.assertIsNone(wq._next_due(ShipmentStatusUpdate.objects.filter(lane=0)))
+        self.assertEqual(self._status(later), 'queued')
+
+    def test_retry_delay_grows_and_is_capped(self):
+        with mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS', 10), \
+                mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_RETRY_MAX_SECONDS', 60):
+            for attempts, ceiling in ((1, 10), (2, 20), (3, 40), (4, 60), (9, 60)):
+                delay = wq.retry_delay(attempts)
+                self.assertTrue(ceiling / 2 <= delay <= ceiling, (attempts, delay))
+
+    def test_dead_letter_after_max_attempts(self):
+        update = self._queued(attempts=wq.PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS - 1)
+        self.outcomes = [False]
+        self.assertTrue(wq.process_update(update.id)['dead_letter'])
+        update.refresh_from_db()
+        self.assertEqual(update.processing_status, 'dead_letter')
+        self.assertEqual(update.attempts, wq.PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS)
+        self.assertIsNone(update.processing_started_at)
+
+    def test_unexpected_error_goes_through_retry(self):
+        update = self._queued()
+        with mock.patch('prep_management.utils.webhook_queue.find_duplicate', side_effect=RuntimeError('boom')):
+            wq.process_update(update.id)
+        update.refresh_from_db()
+        self.assertEqual((update.processing_status, update.attempts), ('queued', 1))
+        self.assertIn('boom', update.process_message)
+
+    def test_retry_is_not_superseded(self):
+        # Il not_before del retry è il backoff, non una finestra di accorpamento: con o senza
+        # debounce il webhook riprovato va elaborato anche se dopo ne è arrivato un altro
+        for debounce in (0, 30):
+            with self.subTest(debounce=debounce), mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS', debounce):
+                ShipmentStatusUpdate.objects.all().delete()
+                self.handled.clear()
+                retried = self._queued(attempts=1, not_before=timezone.now() - timedelta(seconds=1))
+                # Stessa famiglia ma tipo diverso: non è un duplicato del primo
+                newer = self._queued(event_type='inbound_shipment.received')
+                self.assertEqual(wq.drain_lane(0, 'test')['processed'], 2)
+                self.assertEqual(self.handled, [retried.id, newer.id])
+                self.assertEqual((self._status(retried), self._status(newer)), ('done', 'done'))
+
+    def test_replay_webhooks_command(self):
+        from django.core.management import call_command
+
+        dead = [self._queued(shipment_id=str(600 + i), lane=i % 2) for i in range(4)]
+        ShipmentStatusUpdate.objects.filter(id__in=[u.id for u in dead]).update(
+            processing_status='dead_letter', attempts=wq.PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS,
+            not_before=timezone.now() + timedelta(hours=1)
+        )
+        done = self._queued(shipment_id='700')
+        ShipmentStatusUpdate.objects.filter(id=done.id).update(processing_status='done')
+
+        out = io.StringIO()
+        # Una corsia alla volta: il database sqlite in memoria dei test blocca le tabelle
+        # alle scritture concorrenti di più thread
+        call_command('replay_webhooks', '--concurrency', '1', stdout=out)
+        self.assertIn('corsia 0: 2 elaborati', out.getvalue())
+        self.assertIn('corsia 1: 2 elaborati', out.getvalue())
+        self.assertIn('4 webhook rimessi in coda', out.getvalue())
+        self.assertEqual(sorted(self.handled), sorted(u.id for u in dead))
+        for update in dead:
+            update.refresh_from_db()
+            # Nuovo budget di tentativi: il replay riparte da zero
+            self.assertEqual((update.processing_status, update.attempts), ('done', 1))
+        self.assertEqual(self._status(done), 'done')
+
+        # --dry-run non tocca nulla
+        ShipmentStatusUpdate.objects.filter(id=dead[0].id).update(processing_status='dead_letter')
+        call_command('replay_webhooks', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(self._status(dead[0]), 'dead_letter')
+
+
+class WebhookIntakeTest(_WebhookQueueMixin, TestCase):
+    """La view dei webhook salva in coda e risponde 202; l'elaborazione parte al commit."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client(HTTP_HOST='localhost')
+
+    def _post(self, data):
+        return self.client.post('/prep_management/webhook/', data=json.dumps({'data': data}), content_type='application/json')
+
+    def test_accepted_and_queued(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self._post(_inbound_payload())
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual((body['status'], body['event_type']), ('accepted', 'inbound_shipment.created'))
+        self.assertEqual(body['status_url'], reverse('webhook_update_status', args=[body['update_id']]))
+
+        update = ShipmentStatusUpdate.objects.get(id=body['update_id'])
+        self.assertEqual(update.processing_status, 'queued')
+        self.assertEqual((update.shipment_id, update.merchant_id), ('51234', '101'))
+        self.assertEqual(update.lane, wq.lane_for('51234'))
+        self.assertEqual(update.idempotency_key, wq.idempotency_key('inbound_shipment.created', _inbound_payload()))
+        self.assertEqual(update.payload['products_info']['total_quantity'], 12)
+        self.assertIsNone(update.not_before)
+
+        # La corsia viene accodata solo al commit, quando il worker può già vedere la riga
+        self.dispatch_lanes.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.dispatch_lanes.assert_called_once_with([update.lane], countdown=None)
+        self.assertEqual(self.handled, [])
+
+    def test_debounced_webhook_is_dispatched_at_window_end(self):
+        with mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS', 30), \
+                self.captureOnCommitCallbacks(execute=True):
+            body = self._post(_inbound_payload(status='shipped', shipped_at='2025-03-05T08:00:00.000000Z')).json()
+        update = ShipmentStatusUpdate.objects.get(id=body['update_id'])
+        self.assertIsNotNone(update.not_before)
+        (lanes,), kwargs = self.dispatch_lanes.call_args
+        self.assertEqual(lanes, [update.lane])
+        self.assertTrue(25 <= kwargs['countdown'] <= 30, kwargs['countdown'])
+
+    def test_status_url_follows_processing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ok = self._post(_inbound_payload()).json()
+            failing = self._post(_outbound_payload()).json()
+
+        status = self.client.get(ok['status_url']).json()['update']
+        self.assertEqual((status['processing_status'], status['processed']), ('queued', False))
+
+        self.outcomes = [True, False]
+        self.assertTrue(wq.process_update(ok['update_id'])['success'])
+        self.assertIn('retry_in', wq.process_update(failing['update_id']))
+
+        status = self.client.get(ok['status_url']).json()['update']
+        self.assertEqual((status['processing_status'], status['process_success']), ('done', True))
+        status = self.client.get(failing['status_url']).json()['update']
+        # Fallito al primo tentativo: torna in coda per il retry
+        self.assertEqual((status['processing_status'], status['process_success']), ('queued', False))
+        self.assertEqual(self.client.get(reverse('webhook_update_status', args=[0])).status_code, 404)
+
+    def test_failed_webhook_after_last_attempt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            body = self._post(_outbound_payload()).json()
+        self.outcomes = [False]
+        with mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS', 1):
+            wq.process_update(body['update_id'])
+        update = ShipmentStatusUpdate.objects.get(id=body['update_id'])
+        self.assertEqual((update.processing_status, update.processed, update.process_success), ('dead_letter', True, False))
+
+    def test_invalid_json(self):
+        response = self.client.post('/prep_management/webhook/', data='{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShipmentStatusUpdate.objects.exists())
+
+
+class WebhookIdempotencyTest(_WebhookQueueMixin, TestCase):
+    """Consegne ripetute (chiave di idempotenza) e duplicati recenti (``find_duplicate``)."""
+
+    def _post(self, data):
+        return Client(HTTP_HOST='localhost').post(
+            '/prep_management/webhook/', data=json.dumps({'data': data}), content_type='application/json'
+        )
+
+    def test_idempotency_key_is_unique(self):
+        from django.db import IntegrityError, transaction
+
+        update = self._queued()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ShipmentStatusUpdate.objects.create(
+                shipment_id=update.shipment_id, event_type=update.event_type, new_status='created',
+                idempotency_key=update.idempotency_key
+            )
+        # Senza chiave (webhook storici) nessun vincolo
+        for _ in range(2):
+            ShipmentStatusUpdate.objects.create(shipment_id='1', event_type='other', new_status='created')
+
+    def test_key_is_canonical(self):
+        data = _inbound_payload()
+        reordered = dict(reversed(list(data.items())))
+        self.assertEqual(wq.idempotency_key('inbound_shipment.created', data), wq.idempotency_key('inbound_shipment.created', reordered))
+        self.assertNotEqual(wq.idempotency_key('inbound_shipment.created', data), wq.idempotency_key('inbound_shipment.shipped', data))
+        self.assertNotEqual(wq.idempotency_key('inbound_shipment.created', data),
+                            wq.idempotency_key('inbound_shipment.created', _inbound_payload(notes='x')))
+
+    def test_repeated_delivery_is_duplicate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self._post(_inbound_payload())
+            again = self._post(_inbound_payload())
+        self.assertEqual((first.status_code, again.status_code), (202, 200))
+        body = again.json()
+        self.assertEqual(body['status'], 'duplicate')
+        self.assertEqual(body['update_id'], first.json()['update_id'])
+        self.assertEqual(body['status_url'], first.json()['status_url'])
+        self.assertEqual(ShipmentStatusUpdate.objects.count(), 1)
+        # Solo la prima consegna accoda la corsia
+        self.assertEqual(self.dispatch_lanes.call_count, 1)
+
+        # Un cambiamento qualsiasi nei dati è un webhook nuovo
+        self.assertEqual(self._post(_inbound_payload(notes='Arrivato')).status_code, 202)
+        self.assertEqual(ShipmentStatusUpdate.objects.count(), 2)
+
+    def test_recent_duplicate_in_database(self):
+        first = self._queued()
+        ShipmentStatusUpdate.objects.filter(id=first.id).update(processing_status='done')
+        second = self._queued()
+        with mock.patch.object(wq, '_shared_cache', return_value=False):
+            self.assertEqual(wq.find_duplicate(second), first)
+            # Vince sempre il più vecchio
+            self.assertIsNone(wq.find_duplicate(first))
+
+            # I duplicati e i superati non fanno da originale
+            ShipmentStatusUpdate.objects.filter(id=first.id).update(processing_status='duplicate')
+            self.assertIsNone(wq.find_duplicate(second))
+            ShipmentStatusUpdate.objects.filter(id=first.id).update(processing_status='done')
+
+            # Fuori dalla finestra non è più un duplicato
+            ShipmentStatusUpdate.objects.filter(id=first.id).update(created_at=second.created_at - wq.DEDUP_WINDOW - timedelta(seconds=1))
+            self.assertIsNone(wq.find_duplicate(second))
+
+            result = wq.process_update(second.id)
+        self.assertNotIn('duplicate', result)
+
+    def test_process_update_marks_duplicate(self):
+        first = self._queued()
+        second = self._queued()
+        with mock.patch.object(wq, '_shared_cache', return_value=False):
+            wq.process_update(first.id)
+            result = wq.process_update(second.id)
+        self.assertEqual(result, {'duplicate': True, 'update_id': second.id, 'duplicate_of': first.id})
+        second.refresh_from_db()
+        self.assertEqual((second.processing_status, second.processed), ('duplicate', True))
+        self.assertEqual(self.handled, [first.id])
+
+    def test_always_processed_events(self):
+        self._queued(event_type='outbound_shipment.closed')
+        second = self._queued(event_type='outbound_shipment.closed')
+        for shared in (False, True):
+            with mock.patch.object(wq, '_shared_cache', return_value=shared):
+                self.assertIsNone(wq.find_duplicate(second))
+
+    def test_recent_duplicate_in_shared_cache(self):
+        from django.core.cache import cache
+
+        first = self._queued()
+        second = self._queued()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with mock.patch.object(wq, '_shared_cache', return_value=True):
+            # Il primo crea la chiave della finestra, il secondo la trova
+            self.assertIsNone(wq.find_duplicate(first))
+            self.assertEqual(wq.find_duplicate(second), first)
+            # Una nuova consegna dello stesso task non è un duplicato di sé stessa
+            self.assertIsNone(wq.find_duplicate(first))
+            # Il primo webhook di un'altra spedizione passa senza query: la finestra è tutta nella cache
+            other = self._queued(shipment_id='501')
+            with self.assertNumQueries(0):
+                self.assertIsNone(wq.find_duplicate(other))
+
+
+class WebhookLaneTest(_WebhookQueueMixin, TestCase):
+    """Corsie: ordine per spedizione, lease e recupero dei webhook interrotti."""
+
+    def _lane(self, lane=0):
+        return ShipmentStatusUpdate.objects.filter(lane=lane)
+
+    def test_arrival_order(self):
+        a1, b1, a2 = self._queued(shipment_id='1'), self._queued(shipment_id='2'), self._queued(shipment_id='1', event_type='inbound_shipment.received')
+        self.assertEqual(wq.drain_lane(0, 'worker-a'), {'lane': 0, 'processed': 3})
+        self.assertEqual(self.handled, [a1.id, b1.id, a2.id])
+        self.dispatch_lanes.assert_not_called()
+
+    def test_waiting_shipment_blocks_only_itself(self):
+        later = timezone.now() + timedelta(seconds=30)
+        a1 = self._queued(shipment_id='1', not_before=later)
+        a2 = self._queued(shipment_id='1', event_type='inbound_shipment.received')
+        b1 = self._queued(shipment_id='2')
+        self.assertEqual(wq._next_due(self._lane()), b1.id)
+
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 1)
+        self.assertEqual(self.handled, [b1.id])
+        self.assertEqual((self._status(a1), self._status(a2)), ('queued', 'queued'))
+        # La corsia viene ripresa alla fine dell'attesa
+        (lanes,), kwargs = self.dispatch_lanes.call_args
+        self.assertEqual(lanes, [0])
+        self.assertTrue(25 <= kwargs['countdown'] <= 30, kwargs['countdown'])
+
+    def test_long_waiting_head_does_not_stall_lane(self):
+        later = timezone.now() + timedelta(seconds=30)
+        ShipmentStatusUpdate.objects.bulk_create(
+            ShipmentStatusUpdate(shipment_id=str(i), event_type='inbound_shipment.shipped', new_status='created',
+                                 processing_status='queued', lane=0, not_before=later)
+            for i in range(1000, 1600)
+        )
+        blocked = self._queued(shipment_id='1000')
+        due = self._queued(shipment_id='9')
+        self.assertEqual(wq._next_due(self._lane()), due.id)
+        ShipmentStatusUpdate.objects.filter(id=due.id).update(processing_status='done')
+        self.assertIsNone(wq._next_due(self._lane()))
+        self.assertEqual(self._status(blocked), 'queued')
+
+    def test_lease(self):
+        self.assertTrue(wq.acquire_lane(0, 'worker-a'))
+        # Rinnovo da parte dello stesso worker, rifiuto per gli altri
+        self.assertTrue(wq.acquire_lane(0, 'worker-a'))
+        self.assertFalse(wq.acquire_lane(0, 'worker-b'))
+        self._queued()
+        self.assertEqual(wq.drain_lane(0, 'worker-b'), {'lane': 0, 'skipped': True})
+        self.assertEqual(self.handled, [])
+
+        # Lease scaduto: la corsia passa a chi la chiede
+        WebhookLane.objects.filter(lane=0).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(wq.drain_lane(0, 'worker-b')['processed'], 1)
+        lane = WebhookLane.objects.get(lane=0)
+        self.assertIsNone(lane.owner)
+        self.assertEqual(lane.processed_count, 1)
+        self.assertIsNotNone(lane.last_drained_at)
+
+        # Il rilascio vale solo per il proprietario
+        self.assertTrue(wq.acquire_lane(0, 'worker-a'))
+        wq.release_lane(0, 'worker-b')
+        self.assertEqual(WebhookLane.objects.get(lane=0).owner, 'worker-a')
+
+    def test_lease_lost_mid_drain(self):
+        first, second = self._queued(shipment_id='1'), self._queued(shipment_id='2')
+        process_update = wq.process_update
+
+        def steal_after_first(update_id):
+            result = process_update(update_id)
+            # Il lease scade durante l'elaborazione e un altro worker prende la corsia
+            WebhookLane.objects.filter(lane=0).update(owner='worker-b', lease_expires_at=timezone.now() + timedelta(minutes=5))
+            return result
+
+        with mock.patch.object(wq, 'process_update', side_effect=steal_after_first):
+            result = wq.drain_lane(0, 'worker-a')
+        self.assertEqual(result, {'lane': 0, 'processed': 1, 'lease_lost': True})
+        self.assertEqual(self.handled, [first.id])
+        self.assertEqual(self._status(second), 'queued')
+        # Il lease del nuovo proprietario resta suo
+        self.assertEqual(WebhookLane.objects.get(lane=0).owner, 'worker-b')
+
+    def test_lease_outlives_drain_task(self):
+        from prep_management.tasks import drain_webhook_lane, process_webhook_update
+
+        # Il lease rinnovato prima di un webhook scade solo dopo il limite rigido del task
+        self.assertGreater(wq.LANE_LEASE.total_seconds(), wq.DRAIN_TIME_LIMIT)
+        self.assertEqual(drain_webhook_lane.time_limit, wq.DRAIN_TIME_LIMIT)
+        self.assertEqual(process_webhook_update.time_limit, wq.DRAIN_TIME_LIMIT)
+
+        self._queued()
+        before = timezone.now()
+        wq.drain_lane(0, 'worker-a')
+        self.assertTrue(wq.acquire_lane(0, 'worker-a'))
+        lease = WebhookLane.objects.get(lane=0).lease_expires_at
+        self.assertGreater(lease, before + timedelta(seconds=wq.DRAIN_TIME_LIMIT))
+
+    def test_slow_webhook_keeps_lane(self):
+        slow, other = self._queued(shipment_id='1'), self._queued(shipment_id='2')
+        process_update = wq.process_update
+        seen = {}
+
+        def slow_update(update_id):
+            result = process_update(update_id)
+            if update_id == slow.id:
+                # Il webhook è ancora in processing oltre la vecchia durata del lease
+                later = timezone.now() + timedelta(seconds=wq.PREP_BUSINESS_WEBHOOK_STUCK_SECONDS + 1)
+                ShipmentStatusUpdate.objects.filter(id=slow.id).update(processing_status='processing',
+                                                                        processing_started_at=timezone.now())
+                with mock.patch('django.utils.timezone.now', return_value=later):
+                    seen['acquired'] = wq.acquire_lane(0, 'worker-b')
+                ShipmentStatusUpdate.objects.filter(id=slow.id).update(processing_status='done')
+            return result
+
+        with mock.patch.object(wq, 'process_update', side_effect=slow_update):
+            self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 2)
+        self.assertFalse(seen['acquired'])
+        self.assertEqual(self.handled, [slow.id, other.id])
+
+    def test_drain_stops_after_time_budget(self):
+        first, second = self._queued(shipment_id='1'), self._queued(shipment_id='2')
+        clock = iter([0.0, 1.0, wq.DRAIN_BUDGET_SECONDS + 1])
+        with mock.patch.object(wq.time, 'monotonic', side_effect=lambda: next(clock)):
+            self.assertEqual(wq.drain_lane(0, 'worker-a'), {'lane': 0, 'processed': 1})
+        self.assertEqual(self.handled, [first.id])
+        self.assertEqual(self._status(second), 'queued')
+        # La corsia torna in coda per i webhook rimasti
+        self.dispatch_lanes.assert_called_once_with([0])
+
+    def test_orphans_requeued_first(self):
+        orphan = self._queued(shipment_id='1')
+        ShipmentStatusUpdate.objects.filter(id=orphan.id).update(processing_status='processing', processing_started_at=timezone.now(), attempts=1)
+        newer = self._queued(shipment_id='1', event_type='inbound_shipment.received')
+        other_lane = self._queued(shipment_id='2', lane=1)
+        ShipmentStatusUpdate.objects.filter(id=other_lane.id).update(processing_status='processing')
+
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 2)
+        self.assertEqual(self.handled, [orphan.id, newer.id])
+        orphan.refresh_from_db()
+        self.assertEqual((orphan.processing_status, orphan.attempts), ('done', 2))
+        # Le altre corsie non si toccano: hanno il loro lease
+        self.assertEqual(self._status(other_lane), 'processing')
+
+    def test_lane_for_is_stable(self):
+        self.assertEqual(wq.lane_for('51234'), wq.lane_for(51234))
+        lanes = {wq.lane_for(i) for i in range(1000)}
+        self.assertEqual(lanes, set(range(wq.PREP_BUSINESS_WEBHOOK_LANES)))
+
+
+class WebhookDebounceTest(_WebhookQueueMixin, TestCase):
+    """Accorpamento delle raffiche: della stessa spedizione e famiglia resta solo l'ultimo webhook."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS', 30)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _burst(self, *event_types, shipment_id='500'):
+        """Webhook ricevuti in raffica, con la finestra di accorpamento già scaduta."""
+        expired = timezone.now() - timedelta(seconds=1)
+        return [
+            self._queued(shipment_id=shipment_id, event_type=event_type,
+                         not_before=expired if wq.debounce_until(event_type) else None)
+            for event_type in event_types
+        ]
+
+    def test_window(self):
+        received = timezone.now()
+        self.assertEqual(wq.debounce_until('inbound_shipment.shipped', received), received + timedelta(seconds=30))
+        self.assertIsNone(wq.debounce_until('outbound_shipment.closed', received))
+        with mock.patch.object(wq, 'PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS', 0):
+            self.assertIsNone(wq.debounce_until('inbound_shipment.shipped', received))
+
+    def test_burst_keeps_latest(self):
+        shipped, received = self._burst('inbound_shipment.shipped', 'inbound_shipment.received')
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 2)
+        self.assertEqual(self.handled, [received.id])
+        shipped.refresh_from_db()
+        self.assertEqual((shipped.processing_status, shipped.processed), ('superseded', True))
+        self.assertEqual(shipped.process_message, f'Superato dal webhook {received.id}')
+        self.assertEqual(self._status(received), 'done')
+
+    def test_two_bursts(self):
+        first = self._burst('inbound_shipment.shipped', 'inbound_shipment.notes_updated')
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 2)
+        second = self._burst('inbound_shipment.notes_updated', 'inbound_shipment.received')
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 2)
+        statuses = [self._status(update) for update in first + second]
+        self.assertEqual(statuses, ['superseded', 'done', 'superseded', 'done'])
+        self.assertEqual(self.handled, [first[1].id, second[1].id])
+
+    def test_other_shipments_and_families_are_kept(self):
+        inbound, outbound = self._burst('inbound_shipment.shipped', 'outbound_shipment.shipped')
+        other = self._burst('inbound_shipment.received', shipment_id='501')[0]
+        wq.drain_lane(0, 'worker-a')
+        self.assertEqual(sorted(self.handled), sorted([inbound.id, outbound.id, other.id]))
+
+    def test_closed_is_never_coalesced(self):
+        shipped, closed, notes = self._burst('outbound_shipment.shipped', 'outbound_shipment.closed', 'outbound_shipment.notes_updated')
+        self.assertIsNone(closed.not_before)
+        wq.drain_lane(0, 'worker-a')
+        # shipped è superato da notes_updated, mai da closed; closed è sempre elaborato
+        self.assertEqual(self._status(shipped), 'superseded')
+        self.assertEqual(self.handled, [closed.id, notes.id])
+
+        closed_again, _ = self._burst('outbound_shipment.closed', 'outbound_shipment.notes_updated', shipment_id='501')
+        wq.drain_lane(0, 'worker-a')
+        self.assertEqual(self._status(closed_again), 'done')
+
+    def test_created_is_not_coalesced_with_its_family(self):
+        created, shipped = self._burst('outbound_shipment.created', 'outbound_shipment.shipped')
+        notes, created_later = self._burst('outbound_shipment.notes_updated', 'outbound_shipment.created', shipment_id='501')
+        wq.drain_lane(0, 'worker-a')
+        self.assertEqual(sorted(self.handled), sorted([created.id, shipped.id, notes.id, created_later.id]))
+
+        # Con il suo handler dedicato si accorpa solo con un altro created
+        first, second = self._burst('outbound_shipment.created', 'outbound_shipment.created', shipment_id='502')
+        wq.drain_lane(0, 'worker-a')
+        self.assertEqual((self._status(first), self._status(second)), ('superseded', 'done'))
+
+    def test_not_superseded_before_window_ends(self):
+        waiting = self._queued(event_type='inbound_shipment.shipped', not_before=timezone.now() + timedelta(seconds=30))
+        self._burst('inbound_shipment.received')
+        self.assertEqual(wq.drain_lane(0, 'worker-a')['processed'], 0)
+        self.assertEqual(self._status(waiting), 'queued')
+
+
+def _inbound_shipment(shipment_id, updated_at, **fields):
+    """InboundShipment dell'API (come restituita da iter_inbound_shipments) aggiornata a ``updated_at``."""
+    from libs.prepbusiness.models import InboundShipment
+
+    fields.setdefault('name', f'Spedizione {shipment_id}')
+    data = {k: v for k, v in _inbound_payload(id=shipment_id, **fields).items() if k != 'items'}
+    data['updated_at'] = updated_at.isoformat()
+    return InboundShipment.model_validate(data)
+
+
+class _MirrorClient:
+    """Client PrepBusiness finto per il mirror: spedizioni inbound dalla più recente e items per spedizione."""
+
+    def __init__(self, inbound=(), items=None):
+        self.inbound = list(inbound)
+        self.items = items or {}
+        self.read = 0
+        self.streamed = False
+        self.item_requests = []
+
+    def iter_inbound_shipments(self, merchant_id, per_page=100, prefetch=False):
+        for shipment in self.inbound:
+            self.read += 1
+            yield shipment
+
+    def stream_inbound_shipments(self, merchant_id, per_page=500):
+        self.streamed = True
+        return self.iter_inbound_shipments(merchant_id, per_page=per_page)
+
+    def get_inbound_shipment_items(self, shipment_id, merchant_id=None):
+        self.item_requests.append(shipment_id)
+        return type('ItemsResponse', (), {'items': self.items.get(shipment_id, [])})()
+
+
+class MirrorTest(TestCase):
+    """Mirror locale delle spedizioni: upsert, items, webhook e sincronizzazione incrementale."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.t0 = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def test_out_of_order_update_is_ignored(self):
+        from prep_management.utils.mirror import upsert_shipment
+
+        shipment, changed = upsert_shipment('inbound', _inbound_shipment(1, self.t0 + timedelta(hours=2), status='shipped'))
+        self.assertTrue(changed)
+        # Webhook arrivato in ritardo con lo stato precedente
+        stale, changed = upsert_shipment('inbound', _inbound_payload(id=1, status='open', updated_at=self.t0.isoformat()), source='webhook')
+        self.assertFalse(changed)
+        shipment.refresh_from_db()
+        self.assertEqual((shipment.status, shipment.source), ('shipped', 'sync'))
+        self.assertEqual(shipment.remote_updated_at, self.t0 + timedelta(hours=2))
+
+        # Stessa versione: nessun cambiamento; versione più recente: aggiornata
+        self.assertFalse(upsert_shipment('inbound', _inbound_shipment(1, self.t0 + timedelta(hours=2), status='shipped'))[1])
+        shipment, changed = upsert_shipment('inbound', _inbound_shipment(1, self.t0 + timedelta(hours=3), status='received'))
+        self.assertTrue(changed)
+        self.assertEqual(shipment.status, 'received')
+        self.assertEqual(shipment.normalized_name, 'spedizione 1')
+
+    def test_replace_items(self):
+        from prep_management.utils.mirror import replace_items, upsert_shipment
+
+        shipment, _ = upsert_shipment('inbound', _inbound_shipment(1, self.t0))
+        self.assertTrue(shipment.items_stale)
+        saved = replace_items(shipment, [
+            {'id': 10, 'item_id': 9001, 'expected': {'quantity': 12}, 'actual': {'quantity': 11},
+             'item': {'merchant_sku': 'SKU-1', 'title': 'Tazza', 'identifiers': [{'identifier_type': 'ASIN', 'identifier': 'B000TEST01'}]}},
+            {'id': 11, 'quantity': 3, 'item': {'id': 9002, 'merchant_sku': 'SKU-2', 'fnsku': 'X000TEST02'}},
+        ])
+        self.assertEqual(saved, 2)
+        items = {item.line_id: item for item in shipment.items.all()}
+        self.assertEqual((items[10].item_id, items[10].asin, items[10].quantity, items[10].actual_quantity), (9001, 'B000TEST01', 12, 11))
+        self.assertEqual((items[11].item_id, items[11].fnsku, items[11].quantity, items[11].actual_quantity), (9002, 'X000TEST02', 3, None))
+        shipment.refresh_from_db()
+        self.assertEqual(shipment.items_updated_at, self.t0)
+        self.assertFalse(shipment.items_stale)
+
+        # Sostituzione, non aggiunta
+        self.assertEqual(replace_items(shipment, [{'id': 12, 'item_id': 9003, 'quantity': 1}]), 1)
+        self.assertEqual(list(shipment.items.values_list('line_id', flat=True)), [12])
+
+    def test_upsert_from_webhook(self):
+        from prep_management.utils.mirror import upsert_from_webhook
+
+        inbound = upsert_from_webhook('inbound_shipment.created', _inbound_payload(updated_at=self.t0.isoformat()))
+        self.assertEqual((inbound.shipment_type, inbound.shipment_id, inbound.merchant_id, inbound.source), ('inbound', 51234, 101, 'webhook'))
+        self.assertEqual(list(inbound.items.values_list('item_id', 'quantity')), [(9001, 12)])
+        self.assertNotIn('items', inbound.payload)
+
+        outbound = upsert_from_webhook('outbound_shipment.closed', _outbound_payload(status='closed', updated_at=self.t0.isoformat()))
+        self.assertEqual((outbound.shipment_type, outbound.status), ('outbound', 'closed'))
+        self.assertEqual(list(outbound.items.values_list('item_id', 'quantity')), [(9001, 12)])
+
+        # Webhook senza items: la spedizione cambia, gli items restano da riscaricare
+        data = {k: v for k, v in _inbound_payload(status='shipped', updated_at=(self.t0 + timedelta(hours=1)).isoformat()).items() if k != 'items'}
+        inbound = upsert_from_webhook('inbound_shipment.shipped', data)
+        self.assertEqual(inbound.status, 'shipped')
+        self.assertTrue(inbound.items_stale)
+
+        self.assertIsNone(upsert_from_webhook('order.created', {'id': 1}))
+        self.assertIsNone(upsert_from_webhook('inbound_shipment.created', {}))
+
+    def test_sync_watermark(self):
+        from prep_management.models import MirrorShipment, MirrorSyncState
+        from prep_management.utils import mirror
+
+        client = _MirrorClient(
+            [_inbound_shipment(i, self.t0 - timedelta(hours=i)) for i in range(1, 4)],
+            items={1: [{'id': 10, 'item_id': 9001, 'quantity': 5}]},
+        )
+        summary = mirror.sync_shipments(client, 101, 'inbound')
+        self.assertEqual((summary['seen'], summary['updated'], summary['items_refreshed']), (3, 3, 3))
+        state = MirrorSyncState.objects.get(key='inbound:101')
+        self.assertEqual(state.watermark, self.t0 - timedelta(hours=1))
+        self.assertIsNotNone(state.last_success_at)
+        self.assertTrue(mirror.is_mirror_ready(101, 'inbound'))
+        self.assertEqual(MirrorShipment.objects.get(shipment_id=1).items.count(), 1)
+
+        # Incrementale: una spedizione nuova, poi una lunga coda di spedizioni già note
+        # (più vecchie del watermark oltre il margine): si ferma dopo STALE_RUN_LIMIT
+        client = _MirrorClient(
+            [_inbound_shipment(100, self.t0 + timedelta(hours=1))]
+            + [_inbound_shipment(200 + i, self.t0 - timedelta(hours=2, minutes=i)) for i in range(20)]
+        )
+        with mock.patch.object(mirror, 'STALE_RUN_LIMIT', 5):
+            summary = mirror.sync_shipments(client, 101, 'inbound', refresh_items=False)
+        self.assertEqual(client.read, 1 + 5)
+        self.assertEqual((summary['updated'], summary['items_refreshed']), (1, 0))
+        self.assertEqual(MirrorSyncState.objects.get(key='inbound:101').watermark, self.t0 + timedelta(hours=1))
+        self.assertFalse(MirrorShipment.objects.filter(shipment_id__gte=200).exists())
+        self.assertEqual(client.item_requests, [])
+
+        # full=True ignora il watermark
+        with mock.patch.object(mirror, 'STALE_RUN_LIMIT', 5):
+            summary = mirror.sync_shipments(client, 101, 'inbound', full=True, refresh_items=False)
+        self.assertEqual(summary['seen'], 21)
+
+    def test_sync_unordered_list_is_read_to_the_end(self):
+        from prep_management.models import MirrorShipment
+        from prep_management.utils import mirror
+
+        mirror.sync_shipments(_MirrorClient([_inbound_shipment(1, self.t0)]), 101, 'inbound')
+        # Lista dalla meno recente: la spedizione nuova in fondo non va persa
+        client = _MirrorClient(
+            [_inbound_shipment(200 + i, self.t0 - timedelta(hours=2, minutes=10 - i)) for i in range(10)]
+            + [_inbound_shipment(300, self.t0 + timedelta(hours=1))]
+        )
+        with mock.patch.object(mirror, 'STALE_RUN_LIMIT', 3), self.assertLogs('prep_management', 'WARNING') as logs:
+            summary = mirror.sync_shipments(client, 101, 'inbound', refresh_items=False)
+        self.assertEqual((summary['seen'], summary['updated']), (11, 1))
+        self.assertTrue(MirrorShipment.objects.filter(shipment_id=300).exists())
+        self.assertIn('non ordinata', logs.output[0])
+
+    def test_sync_inside_overlap_is_reread(self):
+        from prep_management.utils import mirror
+
+        mirror.sync_shipments(_MirrorClient([_inbound_shipment(1, self.t0)]), 101, 'inbound')
+        # Aggiornata poco prima del watermark (orologi diversi): rientra nel margine e viene letta
+        client = _MirrorClient([_inbound_shipment(2, self.t0 - timedelta(minutes=5))])
+        self.assertEqual(mirror.sync_shipments(client, 101, 'inbound', refresh_items=False)['updated'], 1)
+
+    def test_sync_error_is_recorded(self):
+        from prep_management.models import MirrorSyncState
+        from prep_management.utils import mirror
+
+        client = _MirrorClient([_inbound_shipment(1, self.t0)])
+        client.get_inbound_shipment_items = mock.Mock(side_effect=PrepBusinessError('API giù'))
+        with self.assertRaises(PrepBusinessError):
+            mirror.sync_shipments(client, 101, 'inbound')
+        state = MirrorSyncState.objects.get(key='inbound:101')
+        self.assertEqual((state.last_error, state.watermark, state.last_success_at), ('API giù', None, None))
+
+
+class ShipmentSearchIndexTest(TestCase):
+    """Ricerca spedizioni per prodotto sull'indice full-text del mirror e sul fallback ORM."""
+
+    def setUp(self):
+        from prep_management.utils.mirror import replace_items, upsert_shipment
+
+        def shipment(shipment_id, name, titles, merchant_id=101, **fields):
+            data = _outbound_payload(id=shipment_id, name=name, team_id=merchant_id, **fields)
+            created, _ = upsert_shipment('outbound', data)
+            replace_items(created, [
+                {'id': shipment_id * 10 + i, 'item_id': 9000 + i, 'quantity': i + 1,
+                 'item': {'title': title, 'merchant_sku': f'SKU-{shipment_id}-{i}'}}
+                for i, title in enumerate(titles)
+            ])
+            return created
+
+        self.tazze = shipment(1, 'Spedizione Tazze', ['Tazza rossa'])
+        self.piatti = shipment(2, 'Spedizione Piatti', ['Piatto bianco'])
+        self.mista = shipment(3, 'Spedizione Mista', ['Tazza blu', 'Piatto fondo'], archived_at='2025-03-10T00:00:00Z')
+        self.other_merchant = shipment(4, 'Tazze altro cliente', ['Tazza verde'], merchant_id=102)
+
+    def _search(self, keywords, search_type='OR', **filters):
+        from prep_management.utils import search_index
+
+        filters.setdefault('merchant_id', 101)
+        return {s.shipment_id for s in search_index.search(keywords, search_type=search_type, shipment_type='outbound', **filters)}
+
+    def _check_or_and(self):
+        self.assertEqual(self._search(['tazza', 'piatto']), {1, 2, 3})
+        self.assertEqual(self._search(['tazza', 'piatto'], 'AND'), {3})
+        self.assertEqual(self._search(['tazza', 'piatto'], archived=False), {1, 2})
+        self.assertEqual(self._search(['tazza', 'piatto'], 'AND', archived=False), set())
+        self.assertEqual(self._search(['tazza'], archived=True), {3})
+        self.assertEqual(self._search(['tazza'], merchant_id=None), {1, 3, 4})
+        self.assertEqual(self._search(['sku-2-0']), {2})
+
+    def test_fts5_backend(self):
+        from prep_management.utils import search_index
+
+        if search_index._backend() != 'fts5':
+            self.skipTest('SQLite senza FTS5')
+        self._check_or_and()
+        # Parole intere o prefisso, non sottostringhe; più parole cercano la frase
+        self.assertEqual(self._search(['tazz']), {1, 3})
+        self.assertEqual(self._search(['azza']), set())
+        self.assertEqual(self._search(['tazza rossa']), {1})
+        self.assertEqual(self._search(['rossa tazza']), set())
+        # Il nome pesa più del titolo di un item
+        ranked = search_index.search(['tazze', 'tazza'], merchant_id=101, shipment_type='outbound')
+        self.assertEqual(ranked[0].shipment_id, 1)
+
+    def test_orm_fallback(self):
+        with mock.patch('prep_management.utils.search_index._backend', return_value='orm'):
+            self._check_or_and()
+            # Come la ricerca via API: sottostringa
+            self.assertEqual(self._search(['azza']), {1, 3})
+
+    def test_reindex_after_changes(self):
+        from prep_management.utils import search_index
+        from prep_management.utils.mirror import replace_items, upsert_shipment
+
+        if search_index._backend() != 'fts5':
+            self.skipTest('SQLite senza FTS5')
+        replace_items(self.piatti, [{'id': 99, 'item_id': 9100, 'quantity': 1, 'item': {'title': 'Tazza gialla'}}])
+        self.assertEqual(self._search(['gialla']), {2})
+        self.assertEqual(self._search(['bianco']), set())
+
+        upsert_shipment('outbound', _outbound_payload(
+            id=1, name='Spedizione Bicchieri', archived_at='2025-03-11T00:00:00Z', updated_at='2025-03-11T00:00:00Z'
+        ))
+        self.assertEqual(self._search(['bicchieri'], archived=True), {1})
+        self.assertEqual(self._search(['tazze']), set())
+
+        # La ricostruzione da zero dà lo stesso indice
+        self.assertEqual(search_index.rebuild_index(), 4)
+        self.assertEqual(self._search(['tazza'], archived=False), {2})
+
+    def test_search_task_on_index(self):
+        from prep_management.tasks import _search_shipments_in_index
+
+        created = _search_shipments_in_index('s1', ['tazza', 'piatto'], 'OR', 101, 'open', 10)
+        results = list(SearchResultItem.objects.filter(search_id='s1').order_by('-id'))
+        self.assertEqual(created, 2)
+        self.assertEqual({r.shipment_name for r in results}, {'Spedizione Tazze', 'Spedizione Piatti'})
+
+        created = _search_shipments_in_index('s2', ['tazza', 'piatto'], 'AND', 101, 'archived', 10)
+        self.assertEqual(created, 2)
+        self.assertEqual(set(SearchResultItem.objects.filter(search_id='s2').values_list('product_title', flat=True)),
+                         {'Tazza blu', 'Piatto fondo'})
+
+        # max_results limita le spedizioni restituite, non quelle analizzate
+        self.assertEqual(_search_shipments_in_index('s3', ['spedizione'], 'OR', 101, 'open', 1), 1)
+
+
+class _InventoryClient:
+    """Client PrepBusiness finto: inventario del merchant, ricerca e creazione di spedizioni inbound."""
+
+    def __init__(self, inventory, rejected_item_ids=()):
+        self.inventory = inventory
+        self.rejected_item_ids = set(rejected_item_ids)
+        self.created_later = []
+        self.loads = 0
+        self.searches = []
+        self.added = []
+
+    def stream_inventory(self, merchant_id, per_page=500):
+        self.loads += 1
+        return iter(self.inventory)
+
+    def search_inventory(self, query, merchant_id=None):
+        self.searches.append(query)
+        # Come l'API: ricerca per sottostringa, non per codice esatto
+        matches = [item for item in self.inventory + self.created_later if query.lower() in item['merchant_sku'].lower()]
+        return type('SearchResponse', (), {'items': matches})()
+
+    def create_inbound_shipment(self, name, warehouse_id, notes, merchant_id):
+        return type('CreateResponse', (), {'shipment_id': 900})()
+
+    def add_item_to_shipment(self, shipment_id, item_id, quantity, merchant_id):
+        if item_id in self.rejected_item_ids:
+            raise PrepBusinessError('Item not found')
+        self.added.append((item_id, quantity))
+        return type('AddResponse', (), {'item_id': None})()
+
+    def update_shipment_item(self, **kwargs):
+        pass
+
+    def submit_inbound_shipment(self, **kwargs):
+        pass
+
+
+class InventoryIndexTest(TestCase):
+    """Indice SKU/FNSKU/ASIN → item_id per merchant e sua applicazione alle spedizioni RESIDUAL/PARTIAL."""
+
+    INVENTORY = [
+        {'id': 9001, 'merchant_sku': 'SKU-1', 'fnsku': 'X00000001', 'asin': 'B000000001', 'identifiers': []},
+        {'id': 9002, 'merchant_sku': 'SKU-2', 'fnsku': None, 'asin': None,
+         'identifiers': [{'identifier_type': 'ASIN', 'identifier': 'B000000002'}]},
+    ]
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = _InventoryClient([dict(item) for item in self.INVENTORY])
+
+    def test_cache_hit(self):
+        from prep_management.utils.inventory_index import resolve_item_id
+
+        self.assertEqual(resolve_item_id(self.client, 101, 'sku-1'), 9001)
+        self.assertEqual(resolve_item_id(self.client, 101, None, fnsku='X00000001'), 9001)
+        self.assertEqual(resolve_item_id(self.client, 101, None, asin='B000000002'), 9002)
+        # Codice sconosciuto ma FNSKU noto: vale il primo codice trovato
+        self.assertEqual(resolve_item_id(self.client, 101, 'SKU-9', fnsku='X00000001'), 9001)
+        self.assertEqual(self.client.loads, 1)
+        self.assertEqual(self.client.searches, [])
+        self.assertIsNone(resolve_item_id(self.client, 101, None))
+
+    def test_miss_searches_exact_code(self):
+        from prep_management.utils.inventory_index import resolve_item_id
+
+        resolve_item_id(self.client, 101, 'SKU-1')
+        # Item creato dopo il caricamento dell'indice
+        self.client.created_later = [{'id': 9003, 'merchant_sku': 'SKU-3'}, {'id': 9010, 'merchant_sku': 'SKU-10'}]
+        self.assertEqual(resolve_item_id(self.client, 101, 'SKU-3'), 9003)
+        self.assertEqual(self.client.searches, ['SKU-3'])
+        # Ora è nell'indice
+        self.assertEqual(resolve_item_id(self.client, 101, 'SKU-3'), 9003)
+        self.assertEqual(len(self.client.searches), 1)
+
+        # La ricerca dell'API è per sottostringa: SKU-1, SKU-3, SKU-10 non sono corrispondenze esatte di 'SKU'
+        self.assertIsNone(resolve_item_id(self.client, 101, 'SKU'))
+        self.assertEqual(self.client.loads, 1)
+
+    def test_forget_stale_entry(self):
+        from prep_management.utils import inventory_index
+
+        self.assertEqual(inventory_index.resolve_item_id(self.client, 101, 'SKU-1'), 9001)
+        self.client.inventory[0]['id'] = 9101
+        inventory_index.forget(101, 'SKU-1', 'X00000001', 'B000000001')
+        self.assertEqual(inventory_index.resolve_item_id(self.client, 101, 'SKU-1'), 9101)
+        self.assertEqual(self.client.searches, ['SKU-1'])
+        # Gli altri merchant hanno il loro indice
+        self.assertEqual(inventory_index.resolve_item_id(self.client, 102, 'SKU-2'), 9002)
+        self.assertEqual(self.client.loads, 2)
+
+    def test_remember_items(self):
+        from prep_management.utils import inventory_index
+
+        rows = [{'id': 1, 'item_id': 9004, 'quantity': 3, 'item': {'id': 9004, 'merchant_sku': 'SKU-4'}}]
+        # Senza indice in cache non c'è nulla da aggiornare: verrà caricato in blocco
+        self.assertEqual(inventory_index.remember_items(101, rows), 0)
+        inventory_index.get_index(self.client, 101)
+        self.assertEqual(inventory_index.remember_items(101, rows), 1)
+        # La riga di spedizione senza item annidato non è un item di inventario
+        self.assertEqual(inventory_index.remember_items(101, [{'id': 2, 'item_id': 9005, 'merchant_sku': 'SKU-5'}]), 0)
+        self.assertEqual(inventory_index.resolve_item_id(self.client, 101, 'SKU-4'), 9004)
+        self.assertEqual(self.client.searches, [])
+
+    def _processor(self):
+        from prep_management.event_handlers import WebhookEventProcessor
+
+        with mock.patch.object(WebhookEventProcessor, '_initialize_client', return_value=self.client):
+            return WebhookEventProcessor()
+
+    def test_item_id_passed_through_residual_and_partial(self):
+        processor = self._processor()
+        inbound = [
+            {'item_id': 9001, 'expected': {'quantity': 10}, 'actual': {'quantity': 10}, 'item': {'merchant_sku': 'SKU-1'}},
+            {'item_id': 9002, 'expected': {'quantity': 4}, 'actual': {'quantity': 4}, 'item': {'merchant_sku': 'SKU-2'}},
+        ]
+        outbound = [{'item_id': 9001, 'quantity': 6, 'item': {'merchant_sku': 'SKU-1'}}]
+        residual = processor._calculate_residual_items(inbound, outbound)
+        partial = processor._calculate_partial_items_optimized(outbound, residual)
+        self.assertEqual([(i['sku'], i['item_id'], i['expected_quantity']) for i in residual], [('SKU-1', 9001, 4), ('SKU-2', 9002, 4)])
+        self.assertEqual([(i['sku'], i['item_id'], i['expected_quantity']) for i in partial], [('SKU-1', 9001, 6)])
+
+        result = processor._create_shipment('S - RESIDUAL', residual, 1, 61234, 101, 'residual')
+        self.assertTrue(result['success'])
+        self.assertEqual(self.client.added, [(9001, 4), (9002, 4)])
+        # item_id già nelle righe: nessun caricamento dell'inventario
+        self.assertEqual((self.client.loads, self.client.searches), (0, []))
+
+    def test_item_id_resolved_and_forgotten(self):
+        from prep_management.utils import inventory_index
+
+        processor = self._processor()
+        items = [
+            {'sku': 'SKU-1', 'item_id': None, 'expected_quantity': 2, 'actual_quantity': 2},
+            {'sku': 'SKU-9', 'item_id': None, 'expected_quantity': 1, 'actual_quantity': 1},
+        ]
+        processor._create_shipment('S - PARTIAL', items, 1, 61234, 101, 'partial')
+        # SKU-9 non esiste nell'inventario del merchant: la riga viene saltata
+        self.assertEqual(self.client.added, [(9001, 2)])
+        self.assertEqual(self.client.searches, ['SKU-9'])
+
+        # L'API rifiuta l'item_id risolto dall'indice: la voce viene dimenticata
+        self.client.rejected_item_ids = {9001}
+        result = processor._create_shipment('S2 - PARTIAL', items[:1], 1, 61234, 101, 'partial')
+        self.assertFalse(result['success'])
+        self.assertNotIn('SKU-1', inventory_index.get_index(self.client, 101))
+
+
+class _MerchantsClient:
+    """Client PrepBusiness finto con la lista dei merchant nell'ordine dell'API."""
+
+    def __init__(self, merchants):
+        self.merchants = merchants
+        self.calls = 0
+
+    def get_merchants(self):
+        self.calls += 1
+        return [dict(merchant) for merchant in self.merchants]
+
+
+class MerchantDirectoryTest(TestCase):
+    """Directory dei merchant: indici per id ed email e nome da mostrare per un'email condivisa."""
+
+    def _directory(self, merchants):
+        from prep_management.utils.merchant_directory import MerchantDirectory
+
+        client = _MerchantsClient(merchants)
+        directory = MerchantDirectory()
+        patcher = mock.patch('prep_management.utils.merchant_directory.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return directory, client
+
+    def test_name_for_shared_email(self):
+        directory, _ = self._directory([
+            {'id': 30, 'name': 'Verdi SRL - GERMANIA', 'primaryEmail': 'info@verdi.it'},
+            {'id': 20, 'name': 'Verdi SRL', 'primaryEmail': 'Info@Verdi.it'},
+            {'id': 10, 'name': 'Rossi SRL', 'primaryEmail': 'info@verdi.it'},
+        ])
+        directory.refresh()
+        # Stesso punteggio (nome senza suffissi, stessa lunghezza): vince il primo nella lista dell'API,
+        # anche se ha l'id più alto; il merchant per paese perde comunque
+        self.assertEqual(directory.name_for_email(' INFO@verdi.it '), 'Verdi SRL')
+        self.assertEqual([m['id'] for m in directory.by_email('info@verdi.it')], [20, 10, 30])
+
+        # Dopo la rilettura dalla tabella l'ordine resta quello dell'API
+        directory.load()
+        self.assertEqual(directory.name_for_email('info@verdi.it'), 'Verdi SRL')
+
+    def test_lookup_by_id(self):
+        directory, client = self._directory([
+            {'id': 10, 'name': 'Rossi SRL', 'primaryEmail': 'rossi@example.com', 'enabled': False},
+            {'id': 20, 'name': 'Verdi SRL', 'primaryEmail': 'verdi@example.com'},
+        ])
+        self.assertEqual(directory.name(20), 'Verdi SRL')
+        self.assertEqual(directory.email('10'), 'rossi@example.com')
+        self.assertEqual([m['id'] for m in directory.all()], [10, 20])
+        self.assertEqual([m['id'] for m in directory.all(active_only=True)], [20])
+        self.assertEqual(client.calls, 1)
+
+        # Merchant appena creato: un solo aggiornamento dall'API, poi niente fino a MISS_REFRESH_SECONDS
+        client.merchants = client.merchants[1:] + [{'id': 30, 'name': 'Bianchi SRL', 'primaryEmail': 'b@example.com'}]
+        self.assertEqual(directory.name(30), 'Bianchi SRL')
+        self.assertIsNone(directory.name(40))
+        self.assertIsNone(directory.name(50))
+        self.assertEqual(client.calls, 2)
+        # I merchant non più restituiti dall'API escono dalla directory
+        self.assertIsNone(directory.get(10))
+        self.assertIsNone(directory.get('abc'))
+
+
+class FindShipmentByNameTest(TestCase):
+    """Ricerca dell'inbound originale per nome: lookup sul mirror, sync incrementale o lettura dall'API."""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.t0 = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def _ready(self, shipments=()):
+        from prep_management.utils import mirror
+
+        mirror.sync_shipments(_MirrorClient(shipments), 101, 'inbound', refresh_items=False)
+
+    def _find(self, client, name):
+        from prep_management.utils.mirror import find_shipment_by_name
+
+        return find_shipment_by_name(client, '101', 'inbound', name)
+
+    def test_normalized_lookup(self):
+        self._ready([_inbound_shipment(1, self.t0, name='Spedizione  101-00042 ')])
+        client = _MirrorClient()
+        with self.assertNumQueries(2):
+            shipment = self._find(client, 'SPEDIZIONE 101-00042')
+        self.assertEqual(shipment.shipment_id, 1)
+        self.assertEqual(client.read, 0)
+        self.assertIsNone(self._find(client, '   '))
+
+    def test_same_name_returns_most_recent(self):
+        older = _inbound_shipment(1, self.t0, name='Ordine')
+        newer = _inbound_shipment(2, self.t0, name='ordine', created_at=(self.t0 + timedelta(hours=1)).isoformat())
+        self._ready([older, newer])
+        self.assertEqual(self._find(None, 'Ordine').shipment_id, 2)
+
+    def test_miss_runs_incremental_sync(self):
+        self._ready([_inbound_shipment(1, self.t0)])
+        # Spedizione creata dopo l'ultima sincronizzazione
+        client = _MirrorClient([_inbound_shipment(2, self.t0 + timedelta(hours=1), name='Nuova'), _inbound_shipment(1, self.t0)])
+        self.assertEqual(self._find(client, 'nuova').shipment_id, 2)
+        self.assertEqual(client.read, 2)
+        # refresh_items=False: nessun download degli items
+        self.assertEqual(client.item_requests, [])
+        self.assertFalse(client.streamed)
+
+        self.assertIsNone(self._find(_MirrorClient(), 'inesistente'))
+
+    def test_mirror_not_ready_streams_from_api(self):
+        from prep_management.models import MirrorShipment
+
+        client = _MirrorClient([_inbound_shipment(i, self.t0, name=f'Spedizione {i}') for i in range(1, 6)])
+        shipment = self._find(client, 'spedizione 2')
+        self.assertEqual(shipment.shipment_id, 2)
+        self.assertTrue(client.streamed)
+        # Si ferma alla prima corrispondenza e la salva nel mirror
+        self.assertEqual(client.read, 2)
+        self.assertEqual(list(MirrorShipment.objects.values_list('shipment_id', flat=True)), [2])
+
+        self.assertIsNone(self._find(_MirrorClient(), 'spedizione 9'))
+        # Senza client resta la lookup su quello che il mirror ha già
+        self.assertEqual(self._find(None, 'Spedizione 2').shipment_id, 2)
+
+
+class DebugPayloadViewTest(TestCase):
+    """Le view di debug mostrano il payload del webhook come JSON indentato."""
+
+    def test_debug_views(self):
+        update = ShipmentStatusUpdate.objects.create(
+            shipment_id='99998', event_type='outbound_shipment.closed', new_status='closed', notes='test2',
+            payload={'data': _outbound_payload(id=99998), 'products_info': {'total_quantity': 12}}
+        )
+        client = Client(HTTP_HOST='localhost')
+        for url in (f'/prep_management/debug/webhook/{update.id}/', '/prep_management/api/debug-test2-payload/',
+                    '/prep_management/api/debug-latest-test2-raw/'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['success'])
+                self.assertIn(b'\n  "', response.content)
+        body = client.get(f'/prep_management/debug/webhook/{update.id}/').json()
+        self.assertEqual((body['outbound_items_count'], body['total_quantity']), (1, 12))
+        self.assertEqual(client.get('/prep_management/debug/webhook/0/').status_code, 404)
+
+
+class _FakeZstandard:
+    """Sostituto del modulo zstandard (non installato nei test): stessa API, zlib con un'intestazione propria."""
+
+    MAGIC = b'FZST'
+
+    class ZstdCompressor:
+        def __init__(self, level):
+            self.level = level
+
+        def compress(self, raw):
+            return _FakeZstandard.MAGIC + zlib.compress(raw)
+
+    class ZstdDecompressor:
+        def decompress(self, data):
+            assert data.startswith(_FakeZstandard.MAGIC)
+            return zlib.decompress(data[len(_FakeZstandard.MAGIC):])
+
+
+class PayloadArchiveTest(TestCase):
+    """Archivio compresso dei payload dei webhook: archiviazione, lettura, ripristino ed eliminazione per mese."""
+
+    def _update(self, days_ago, processing_status='done', shipment_id='500'):
+        payload = {'data': _outbound_payload(id=int(shipment_id), notes='Consegna già prevista – però urgente')}
+        update = ShipmentStatusUpdate.objects.create(
+            shipment_id=shipment_id, event_type='outbound_shipment.closed', new_status='closed',
+            payload=payload, processing_status=processing_status
+        )
+        ShipmentStatusUpdate.objects.filter(id=update.id).update(created_at=timezone.now() - timedelta(days=days_ago))
+        update.refresh_from_db()
+        return update, payload
+
+    def _round_trip(self, codec):
+        from prep_management.models import WebhookPayloadArchive
+        from prep_management.utils import payload_archive
+
+        old, payload = self._update(40)
+        queued, _ = self._update(40, processing_status='queued')
+        recent, _ = self._update(5)
+
+        stats = payload_archive.archive_payloads(days=30)
+        self.assertEqual(stats['archived'], 1)
+        self.assertLess(stats['compressed_bytes'], stats['raw_bytes'])
+
+        archived = ShipmentStatusUpdate.objects.get(id=old.id)
+        self.assertEqual((archived.payload, archived.payload_archived), (None, True))
+        archive = WebhookPayloadArchive.objects.get(update_id=old.id)
+        self.assertEqual((archive.codec, archive.month), (codec, payload_archive.month_key(old.created_at)))
+        # In coda o recenti: il payload resta nella tabella
+        for update in (queued, recent):
+            update.refresh_from_db()
+            self.assertFalse(update.payload_archived)
+
+        # Lettura trasparente, decompressa una volta sola
+        self.assertEqual(archived.get_payload(), payload)
+        with self.assertNumQueries(0):
+            self.assertEqual(archived.get_payload(), payload)
+
+        # Il ripristino lo riporta nella tabella e toglie la riga d'archivio
+        self.assertEqual(payload_archive.restore_payload(archived), payload)
+        archived.refresh_from_db()
+        self.assertEqual((archived.payload, archived.payload_archived), (payload, False))
+        self.assertFalse(WebhookPayloadArchive.objects.filter(update_id=old.id).exists())
+        # Alla prossima archiviazione torna nell'archivio
+        self.assertEqual(payload_archive.archive_payloads(days=30)['archived'], 1)
+        return archived
+
+    def test_round_trip_zlib(self):
+        from prep_management.utils import payload_archive
+
+        with mock.patch.object(payload_archive, 'ZSTD_AVAILABLE', False):
+            self._round_trip('zlib')
+
+    def test_round_trip_zstd(self):
+        from prep_management.utils import payload_archive
+
+        with mock.patch.object(payload_archive, 'ZSTD_AVAILABLE', True), \
+                mock.patch.object(payload_archive, 'zstandard', _FakeZstandard):
+            archived = self._round_trip('zstd')
+        # Senza la libreria le righe zstd non sono leggibili: errore esplicito, non un payload vuoto
+        with mock.patch.object(payload_archive, 'ZSTD_AVAILABLE', False):
+            with self.assertRaises(RuntimeError):
+                ShipmentStatusUpdate.objects.get(id=archived.id).get_payload()
+
+    @skipUnless(importlib.util.find_spec('zstandard'), 'zstandard non installato')
+    def test_real_zstd(self):
+        from prep_management.utils import payload_archive
+
+        codec, data, raw_size = payload_archive.compress({'a': [1, 2, 3] * 100})
+        self.assertEqual(codec, 'zstd')
+        self.assertEqual(payload_archive.decompress(codec, data), {'a': [1, 2, 3] * 100})
+
+    def test_batches_and_limit(self):
+        from prep_management.utils import payload_archive
+
+        for i in range(5):
+            self._update(40, shipment_id=str(600 + i))
+        self.assertEqual(payload_archive.archive_payloads(days=30, batch_size=2, limit=3)['archived'], 3)
+        self.assertEqual(payload_archive.archive_payloads(days=30, batch_size=2)['archived'], 2)
+        self.assertEqual(payload_archive.archive_payloads(days=30)['archived'], 0)
+
+    def test_purge_month_cutoff(self):
+        from prep_management.models import WebhookPayloadArchive
+        from prep_management.utils import payload_archive
+
+        today = timezone.localdate()
+        updates = {}
+        for months_ago in range(5):
+            update, _ = self._update(40, shipment_id=str(700 + months_ago))
+            year, month = divmod(today.year * 12 + today.month - 1 - months_ago, 12)
+            codec, data, raw_size = payload_archive.compress(update.payload)
+            WebhookPayloadArchive.objects.create(update=update, month=f'{year:04d}-{month + 1:02d}', codec=codec, data=data, raw_size=raw_size)
+            ShipmentStatusUpdate.objects.filter(id=update.id).update(payload=None, payload_archived=True)
+            updates[months_ago] = update.id
+
+        self.assertEqual(payload_archive.purge_archive(0), 0)
+        # Restano il mese corrente e i due precedenti
+        self.assertEqual(payload_archive.purge_archive(2), 2)
+        self.assertEqual(len(payload_archive.archive_stats()), 3)
+        self.assertIsNone(ShipmentStatusUpdate.objects.get(id=updates[3]).get_payload())
+        self.assertIsNotNone(ShipmentStatusUpdate.objects.get(id=updates[2]).get_payload())
+
+    def test_command(self):
+        from django.core.management import call_command
+
+        self._update(40)
+        out = io.StringIO()
+        call_command('archive_webhook_payloads', '--days', '30', stdout=out)
+        self.assertIn('1 payload archiviati', out.getvalue())
+        out = io.StringIO()
+        call_command('archive_webhook_payloads', '--stats', stdout=out)
+        self.assertIn(timezone.localtime(timezone.now() - timedelta(days=40)).strftime('%Y-%m'), out.getvalue())
@@ -11,6 +11,8 @@ urlpatterns = [
     path('merchants/', views.merchants_list, name='merchants_list'),
     path('api-debug/', views.api_config_debug, name='api_config_debug'),
     path('webhook/', views.shipment_status_webhook, name='shipment_status_webhook'),
+    path('webhook/status/', views.webhook_queue_status, name='webhook_queue_status'),
+    path('webhook/status/<int:update_id>/', views.webhook_update_status, name='webhook_update_status'),
     path('test-webhook/', views.test_webhook, name='test_webhook'),
     path('shipment-updates/', views.shipment_status_updates, name='shipment_status_updates'),
     path('webhook/manage/', views.manage_webhooks, name='manage_webhooks'),
@@ -57,6 +59,8 @@ urlpatterns = [
     path('api/test-partial-inbound/', views.test_partial_inbound_creation, name='test_partial_inbound_creation'),
     path('api/test-partial-only/', views.test_partial_only_creation, name='test_partial_only_creation'),
     path('version-file/', views.version_file, name='version_file'),
+    path('api/prepbusiness/status/', views.prepbusiness_client_status, name='prepbusiness_client_status'),
+    path('api/prepbusiness/metrics/', views.prepbusiness_metrics, name='prepbusiness_metrics'),
 
     path('api/test-outbound-closed-test2/', views.test_outbound_closed_test2, name='test_outbound_closed_test2'),
     path('api/debug-test2-payload/', views.debug_test2_payload, name='debug_test2_payload'),
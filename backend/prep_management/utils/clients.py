@@ -1,10 +1,106 @@
+import logging
+
 from libs.prepbusiness.client import PrepBusinessClient
-from libs.config import PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_URL
+from libs.prepbusiness.registry import get_shared_client, get_shared_cache
+from libs.config import (
+    PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_URL, PREP_BUSINESS_API_TIMEOUT, PREP_BUSINESS_POOL_MAXSIZE,
+    PREP_BUSINESS_CACHE_ENABLED, PREP_BUSINESS_CACHE_MAXSIZE, PREP_BUSINESS_CACHE_REDIS_URL,
+    PREP_BUSINESS_CACHE_TTLS, PREP_BUSINESS_MAX_RETRIES, PREP_BUSINESS_RETRY_BACKOFF,
+    PREP_BUSINESS_RATE_LIMIT, PREP_BUSINESS_RATE_BURST,
+    PREP_BUSINESS_MERCHANT_RATE_LIMIT, PREP_BUSINESS_MERCHANT_RATE_BURST, PREP_BUSINESS_CACHE_STALE_TTL,
+    PREP_BUSINESS_CIRCUIT_FAILURES, PREP_BUSINESS_CIRCUIT_SLOW_SECONDS, PREP_BUSINESS_CIRCUIT_RESET_SECONDS,
+    PREP_BUSINESS_VALIDATION_MODE, PREP_BUSINESS_FAST_JSON, PREP_BUSINESS_TRANSPORT
+)
+
+logger = logging.getLogger('prep_management')
+
+
+def _domain_from_url(api_url):
+    """Estrae il dominio dall'URL API (es. https://dominio/api -> dominio)."""
+    return api_url.replace('https://', '').replace('http://', '').split('/')[0]
+
+
+def _scheme_from_url(api_url):
+    """Schema dell'URL API: http solo per stand-in locali (es. http://127.0.0.1:8765/api)."""
+    return 'http' if api_url.startswith('http://') else 'https'
+
+
+def _client_options():
+    """Opzioni comuni dei client condivisi: pool, cache, retry sui 429, rate limiter, circuit breaker, parsing e transport."""
+    return {
+        'pool_maxsize': PREP_BUSINESS_POOL_MAXSIZE,
+        'cache': _response_cache(),
+        'max_retries': PREP_BUSINESS_MAX_RETRIES,
+        'retry_backoff': PREP_BUSINESS_RETRY_BACKOFF,
+        'rate_limit': PREP_BUSINESS_RATE_LIMIT or None,
+        'rate_burst': PREP_BUSINESS_RATE_BURST,
+        'merchant_rate_limit': PREP_BUSINESS_MERCHANT_RATE_LIMIT or None,
+        'merchant_rate_burst': PREP_BUSINESS_MERCHANT_RATE_BURST,
+        'circuit_failure_threshold': PREP_BUSINESS_CIRCUIT_FAILURES or None,
+        'circuit_slow_call_seconds': PREP_BUSINESS_CIRCUIT_SLOW_SECONDS or None,
+        'circuit_reset_timeout': PREP_BUSINESS_CIRCUIT_RESET_SECONDS,
+        'validation_mode': PREP_BUSINESS_VALIDATION_MODE,
+        'fast_json': PREP_BUSINESS_FAST_JSON,
+        'transport': PREP_BUSINESS_TRANSPORT or None,
+    }
+
 
-def get_client():
-    # Estrai il dominio dall'URL API
-    domain = PREP_BUSINESS_API_URL.replace('https://', '').replace('http://', '').split('/')[0]
-    return PrepBusinessClient(
+def _response_cache():
+    """Cache condivisa delle risposte (None se disabilitata da PREP_BUSINESS_CACHE_ENABLED)."""
+    if not PREP_BUSINESS_CACHE_ENABLED:
+        return None
+    return get_shared_cache(
+        maxsize=PREP_BUSINESS_CACHE_MAXSIZE,
+        redis_url=PREP_BUSINESS_CACHE_REDIS_URL or None,
+        ttls=PREP_BUSINESS_CACHE_TTLS,
+        stale_ttl=PREP_BUSINESS_CACHE_STALE_TTL
+    )
+
+
+def get_client() -> PrepBusinessClient:
+    """
+    Restituisce il client PrepBusiness condiviso del processo, configurato dalle variabili d'ambiente.
+    Il client (e il suo pool di connessioni keep-alive) viene creato una sola volta per processo.
+    """
+    return get_shared_client(
         api_key=PREP_BUSINESS_API_KEY,
-        company_domain=domain
-    ) 
\ No newline at end of file
+        company_domain=_domain_from_url(PREP_BUSINESS_API_URL),
+        timeout=PREP_BUSINESS_API_TIMEOUT,
+        scheme=_scheme_from_url(PREP_BUSINESS_API_URL),
+        **_client_options()
+    )
+
+
+def get_configured_client():
+    """
+    Restituisce il client condiviso usando la configurazione attiva nel DB (PrepBusinessConfig),
+    con fallback sulle variabili d'ambiente. Restituisce None se nessuna configurazione è valida.
+    """
+    from ..models import PrepBusinessConfig
+
+    config = PrepBusinessConfig.objects.filter(is_active=True).first()
+    if config and config.api_url and config.api_key:
+        return get_shared_client(
+            api_key=config.api_key,
+            company_domain=_domain_from_url(config.api_url),
+            timeout=config.api_timeout,
+            scheme=_scheme_from_url(config.api_url),
+            **_client_options()
+        )
+
+    if PREP_BUSINESS_API_KEY and PREP_BUSINESS_API_URL:
+        logger.warning("Configurazione DB non trovata. Fallback su variabili d'ambiente.")
+        return get_client()
+
+    return None
+
+
+def invalidate_prepbusiness_cache(endpoint=None, merchant_id=None, path=None):
+    """
+    Hook di invalidazione della cache delle risposte PrepBusiness, ad es. dopo aver
+    modificato un merchant o un item dalla dashboard. Agisce su entrambi i livelli
+    (locale e Redis), quindi vale per tutti i processi.
+    """
+    cache = _response_cache()
+    if cache is not None:
+        cache.invalidate(name=endpoint, merchant_id=merchant_id, path=path)
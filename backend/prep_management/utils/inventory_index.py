@@ -0,0 +1,149 @@
+"""
+Indice SKU/FNSKU/ASIN → item_id dell'inventario PrepBusiness, per merchant.
+
+Serve alla creazione delle spedizioni RESIDUAL/PARTIAL, che prima facevano una
+``search_inventory`` per ogni riga (e prendevano il primo risultato senza
+guardare il merchant).
+
+- L'indice di un merchant vive nella cache Django (``INDEX_TTL``) e viene
+  caricato in blocco leggendo tutte le pagine di ``/inventory``.
+- I webhook delle spedizioni e gli items già scaricati dagli handler lo
+  aggiornano con ``remember_items`` senza chiamate aggiuntive.
+- Un codice che non è nell'indice viene cercato con ``search_inventory``
+  sul merchant e aggiunto; un item_id che l'API rifiuta va rimosso con ``forget``.
+"""
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from django.core.cache import cache
+
+logger = logging.getLogger('prep_management')
+
+CACHE_KEY = 'prep_management:inventory_index:{merchant_id}'
+# Dopo questo tempo l'indice viene ricaricato in blocco alla prima risoluzione
+INDEX_TTL = 6 * 3600
+
+
+def _key(merchant_id: Any) -> str:
+    return CACHE_KEY.format(merchant_id=int(merchant_id))
+
+
+def _normalize(code: Any) -> Optional[str]:
+    code = str(code or '').strip().upper()
+    return code or None
+
+
+def _as_dict(item: Any) -> Dict[str, Any]:
+    if hasattr(item, 'model_dump'):
+        return item.model_dump()
+    return item if isinstance(item, dict) else {}
+
+
+def _codes(inventory_item: Dict[str, Any]) -> Iterable[str]:
+    yield inventory_item.get('merchant_sku')
+    yield inventory_item.get('fnsku')
+    yield inventory_item.get('asin')
+    for identifier in inventory_item.get('identifiers') or []:
+        yield _as_dict(identifier).get('identifier')
+
+
+def _add(index: Dict[str, int], inventory_item: Any) -> bool:
+    inventory_item = _as_dict(inventory_item)
+    item_id = inventory_item.get('id')
+    if not item_id:
+        return False
+    for code in _codes(inventory_item):
+        code = _normalize(code)
+        if code:
+            index[code] = int(item_id)
+    return True
+
+
+def load_index(client: Any, merchant_id: Any) -> Dict[str, int]:
+    """Scarica tutto l'inventario del merchant e salva l'indice in cache."""
+    index: Dict[str, int] = {}
+    count = 0
+    for inventory_item in client.stream_inventory(merchant_id=int(merchant_id), per_page=500):
+        count += _add(index, inventory_item)
+    cache.set(_key(merchant_id), index, timeout=INDEX_TTL)
+    logger.info(f"[INVENTORY_INDEX] Merchant {merchant_id}: indicizzati {count} items ({len(index)} codici)")
+    return index
+
+
+def get_index(client: Any, merchant_id: Any) -> Dict[str, int]:
+    """Indice del merchant dalla cache, caricato in blocco se manca o è scaduto."""
+    index = cache.get(_key(merchant_id))
+    if index is None:
+        index = load_index(client, merchant_id)
+    return index
+
+
+def remember_items(merchant_id: Any, raw_items: Iterable[Any]) -> int:
+    """
+    Aggiorna l'indice già in cache con gli items di una spedizione (righe con
+    l'item di inventario annidato in ``item``) o con items di inventario.
+    Se l'indice del merchant non è in cache non fa nulla: verrà caricato in blocco.
+
+    Returns:
+        Numero di items registrati
+    """
+    if not merchant_id or not raw_items:
+        return 0
+    index = cache.get(_key(merchant_id))
+    if index is None:
+        return 0
+    count = 0
+    for raw in raw_items:
+        raw = _as_dict(raw)
+        if isinstance(raw.get('item'), dict):
+            count += _add(index, raw['item'])
+        elif 'merchant_sku' in raw and 'item_id' not in raw:
+            # Item di inventario (l'id di una riga di spedizione non è un item_id)
+            count += _add(index, raw)
+    if count:
+        cache.set(_key(merchant_id), index, timeout=INDEX_TTL)
+    return count
+
+
+def forget(merchant_id: Any, *codes: Any) -> None:
+    """Rimuove dall'indice i codici il cui item_id non è più valido."""
+    index = cache.get(_key(merchant_id))
+    if not index:
+        return
+    for code in codes:
+        index.pop(_normalize(code), None)
+    cache.set(_key(merchant_id), index, timeout=INDEX_TTL)
+
+
+def resolve_item_id(
+    client: Any,
+    merchant_id: Any,
+    sku: Optional[str],
+    fnsku: Optional[str] = None,
+    asin: Optional[str] = None
+) -> Optional[int]:
+    """
+    item_id di inventario del merchant per SKU (o, in mancanza, FNSKU/ASIN).
+
+    Returns:
+        L'item_id, o None se l'item non esiste nell'inventario del merchant
+    """
+    codes = [code for code in (_normalize(sku), _normalize(fnsku), _normalize(asin)) if code]
+    if not codes:
+        return None
+    index = get_index(client, merchant_id)
+    for code in codes:
+        if code in index:
+            return index[code]
+
+    # Miss: item creato dopo il caricamento dell'indice. Cerca solo tra gli items del merchant
+    # e accetta solo una corrispondenza esatta su uno dei codici
+    logger.info(f"[INVENTORY_INDEX] Merchant {merchant_id}: {codes[0]} non in indice, cerco nell'inventario")
+    response = client.search_inventory(sku or fnsku or asin, merchant_id=int(merchant_id))
+    for inventory_item in response.items:
+        inventory_item = _as_dict(inventory_item)
+        if any(_normalize(code) in codes for code in _codes(inventory_item)):
+            _add(index, inventory_item)
+            cache.set(_key(merchant_id), index, timeout=INDEX_TTL)
+            return int(inventory_item['id'])
+    return None
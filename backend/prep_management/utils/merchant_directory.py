@@ -0,0 +1,206 @@
+"""
+Directory dei merchant PrepBusiness.
+
+L'anagrafica merchant cambia di rado ma veniva riscaricata (e scorsa in modo
+lineare) a ogni webhook, notifica e pagina. La directory la tiene:
+
+- in tabella (``MerchantDirectoryEntry``), aggiornata dal task periodico
+  ``refresh_merchant_directory``;
+- in memoria in ogni processo, indicizzata per id e per email in minuscolo,
+  riletta dalla tabella al massimo ogni ``RELOAD_SECONDS``.
+
+Il nome da mostrare per un'email condivisa da più merchant (``name_score``)
+è calcolato una volta al caricamento invece che a ogni richiesta.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from django.db import transaction
+
+from ..models import MerchantDirectoryEntry
+from .clients import get_client
+
+logger = logging.getLogger('prep_management')
+
+# Ogni processo rilegge la tabella al massimo ogni N secondi
+RELOAD_SECONDS = 60
+# Un merchant_id sconosciuto forza un aggiornamento dall'API al massimo ogni N secondi
+MISS_REFRESH_SECONDS = 300
+
+# Suffissi tipici dei merchant secondari (per paese, account "NO", ...)
+_SECONDARY_NAME_MARKERS = [' - ', '- ', ' -', 'GERMANIA', 'FRANCIA', 'SPAGNA', ' NO']
+
+
+def name_score(name: str) -> int:
+    """
+    Punteggio del nome di un merchant tra quelli con la stessa email:
+    nome senza suffissi, poi più corto, poi senza caratteri speciali.
+    """
+    name = name or ''
+    score = 0
+    # Penalizza nomi con suffissi geografici o "NO"
+    if not any(marker in name.upper() for marker in _SECONDARY_NAME_MARKERS):
+        score += 100
+    # Preferisci nomi più corti (meno specifici)
+    score += max(0, 50 - len(name))
+    # Preferisci nomi che non contengono caratteri speciali
+    if name.replace(' ', '').replace('.', '').isalnum():
+        score += 10
+    return score
+
+
+def _merchant_dicts(response: Any) -> List[Dict[str, Any]]:
+    # La risposta può essere una lista, un MerchantsResponse (.data) o una struttura annidata (.data.data)
+    if isinstance(response, list):
+        merchant_list = response
+    elif hasattr(response, 'data'):
+        data = response.data
+        merchant_list = data.data if hasattr(data, 'data') else data if isinstance(data, list) else []
+    elif hasattr(response, 'merchants'):
+        merchant_list = response.merchants
+    else:
+        logger.warning(f"[MERCHANT_DIRECTORY] Tipo di risposta non riconosciuto: {type(response)}")
+        merchant_list = []
+    return [m.model_dump(mode='json') if hasattr(m, 'model_dump') else dict(m) for m in merchant_list]
+
+
+class MerchantDirectory:
+    """Indici in memoria della tabella MerchantDirectoryEntry, condivisi dai thread del processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_email: Dict[str, List[Dict[str, Any]]] = {}
+        self._name_by_email: Dict[str, str] = {}
+        self._loaded_at: Optional[float] = None
+        self._last_miss_refresh: Optional[float] = None
+
+    def _build(self, entries: List[MerchantDirectoryEntry]) -> None:
+        by_id, by_email = {}, {}
+        for entry in entries:
+            merchant = dict(entry.payload or {})
+            merchant.update(id=entry.merchant_id, name=entry.name, primaryEmail=entry.email, enabled=entry.enabled)
+            by_id[entry.merchant_id] = merchant
+            if entry.email_lower:
+                by_email.setdefault(entry.email_lower, []).append(((-entry.name_score, entry.api_position, entry.merchant_id), merchant))
+        # A parità di punteggio vince il primo nella lista dell'API
+        by_email = {
+            email: [m for _, m in sorted(scored, key=lambda pair: pair[0])]
+            for email, scored in by_email.items()
+        }
+        self._by_id = by_id
+        self._by_email = by_email
+        self._name_by_email = {email: merchants[0]['name'] for email, merchants in by_email.items()}
+        self._loaded_at = time.monotonic()
+
+    def load(self) -> None:
+        """Rilegge la tabella; se è vuota (primo avvio) la popola dall'API."""
+        entries = list(MerchantDirectoryEntry.objects.order_by('merchant_id'))
+        if not entries:
+            self.refresh()
+            return
+        with self._lock:
+            self._build(entries)
+
+    def refresh(self, client: Any = None) -> int:
+        """
+        Scarica i merchant dall'API, aggiorna la tabella e gli indici in memoria.
+
+        Returns:
+            Numero di merchant in directory
+        """
+        client = client or get_client()
+        # La lista dei merchant del client ha una sua cache: qui serve quella aggiornata
+        if hasattr(client, 'invalidate_cache'):
+            client.invalidate_cache('merchants')
+        merchants = _merchant_dicts(client.get_merchants())
+        if not merchants:
+            logger.warning("[MERCHANT_DIRECTORY] L'API non ha restituito merchant, directory invariata")
+            with self._lock:
+                if self._loaded_at is None:
+                    self._build([])
+            return len(self._by_id)
+
+        with transaction.atomic():
+            for position, merchant in enumerate(merchants):
+                email = (merchant.get('primaryEmail') or '').strip()
+                MerchantDirectoryEntry.objects.update_or_create(
+                    merchant_id=int(merchant['id']),
+                    defaults={
+                        'name': merchant.get('name') or '',
+                        'email': email,
+                        'email_lower': email.lower(),
+                        'enabled': bool(merchant.get('enabled', True)),
+                        'name_score': name_score(merchant.get('name')),
+                        'api_position': position,
+                        'payload': merchant,
+                    }
+                )
+            MerchantDirectoryEntry.objects.exclude(merchant_id__in=[int(m['id']) for m in merchants]).delete()
+        with self._lock:
+            self._build(list(MerchantDirectoryEntry.objects.order_by('merchant_id')))
+        logger.info(f"[MERCHANT_DIRECTORY] Aggiornata: {len(merchants)} merchant")
+        return len(merchants)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > RELOAD_SECONDS:
+            self.load()
+
+    def all(self, active_only: bool = False) -> List[Dict[str, Any]]:
+        """Tutti i merchant (dizionari come restituiti dall'API), ordinati per id."""
+        self._ensure_loaded()
+        merchants = [dict(m) for m in self._by_id.values()]
+        if active_only:
+            merchants = [m for m in merchants if m.get('enabled', True)]
+        return merchants
+
+    def get(self, merchant_id: Any) -> Optional[Dict[str, Any]]:
+        """Merchant per id; un id sconosciuto (merchant appena creato) aggiorna la directory dall'API."""
+        try:
+            merchant_id = int(merchant_id)
+        except (TypeError, ValueError):
+            return None
+        self._ensure_loaded()
+        merchant = self._by_id.get(merchant_id)
+        if merchant is None and (
+            self._last_miss_refresh is None or time.monotonic() - self._last_miss_refresh > MISS_REFRESH_SECONDS
+        ):
+            self._last_miss_refresh = time.monotonic()
+            logger.info(f"[MERCHANT_DIRECTORY] Merchant {merchant_id} non in directory, aggiorno dall'API")
+            self.refresh()
+            merchant = self._by_id.get(merchant_id)
+        return merchant
+
+    def name(self, merchant_id: Any) -> Optional[str]:
+        merchant = self.get(merchant_id)
+        return merchant.get('name') if merchant else None
+
+    def email(self, merchant_id: Any) -> Optional[str]:
+        merchant = self.get(merchant_id)
+        return merchant.get('primaryEmail') if merchant else None
+
+    def by_email(self, email: str) -> List[Dict[str, Any]]:
+        """Merchant con questa email, dal nome più adatto da mostrare."""
+        self._ensure_loaded()
+        return [dict(m) for m in self._by_email.get((email or '').strip().lower(), [])]
+
+    def name_for_email(self, email: str) -> Optional[str]:
+        """Nome da mostrare per l'email (tra più merchant, quello con name_score più alto)."""
+        self._ensure_loaded()
+        return self._name_by_email.get((email or '').strip().lower())
+
+
+_directory: Optional[MerchantDirectory] = None
+_directory_lock = threading.Lock()
+
+
+def get_merchant_directory() -> MerchantDirectory:
+    """Directory condivisa del processo."""
+    global _directory
+    if _directory is None:
+        with _directory_lock:
+            if _directory is None:
+                _directory = MerchantDirectory()
+    return _directory
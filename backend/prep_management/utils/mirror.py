@@ -0,0 +1,388 @@
+"""
+Mirror locale delle spedizioni PrepBusiness (inbound e outbound) e dei loro items.
+
+- I webhook di ``shipment_status_webhook`` aggiornano subito la spedizione
+  (``upsert_from_webhook``); se il payload contiene gli items li sostituisce,
+  altrimenti gli items restano marcati come da riscaricare.
+- Il task periodico ``sync_shipment_mirror`` riconcilia il mirror con l'API:
+  scorre le liste dalla più recente e si ferma dopo ``STALE_RUN_LIMIT``
+  spedizioni consecutive non più recenti del watermark (``MirrorSyncState``);
+  gli items vengono riscaricati solo per le spedizioni cambiate.
+
+Ricerche, calcolo dei residuali e dashboard possono così leggere le tabelle
+locali indicizzate invece di riscaricare centinaia di spedizioni; nome e items
+di ogni spedizione finiscono anche nell'indice full-text (``utils.search_index``).
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import MirrorShipment, MirrorShipmentItem, MirrorSyncState
+from . import inventory_index
+from .search_index import index_shipment
+
+logger = logging.getLogger('prep_management')
+
+SHIPMENT_TYPES = ('inbound', 'outbound')
+
+# Spedizioni consecutive già note dopo le quali la sincronizzazione incrementale si ferma.
+# Presuppone che l'API elenchi le spedizioni dalla più recente per aggiornamento (l'endpoint
+# non ha un parametro di ordinamento): appena due spedizioni lette smentiscono l'ordine,
+# sync_shipments smette di fermarsi in anticipo e legge tutta la lista
+STALE_RUN_LIMIT = 100
+# Margine sul watermark per tollerare differenze di orologio e aggiornamenti concorrenti
+WATERMARK_OVERLAP = timedelta(minutes=10)
+# Spedizioni con items da riscaricare processate al massimo per esecuzione (per merchant e tipo)
+MAX_ITEM_REFRESHES = 200
+
+
+def _parse_dt(value: Any) -> Optional[datetime]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _as_dict(obj: Any) -> Dict[str, Any]:
+    """Dict JSON-serializzabile da un modello Pydantic o da un dict del webhook."""
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(mode='json')
+    return dict(obj)
+
+
+def normalize_name(name: Any) -> str:
+    """Nome confrontabile: minuscolo (casefold) e spazi compattati."""
+    return ' '.join(str(name or '').split()).casefold()
+
+
+def _identifier(inventory_item: Dict[str, Any], identifier_type: str) -> Optional[str]:
+    for identifier in inventory_item.get('identifiers') or []:
+        if isinstance(identifier, dict) and identifier.get('identifier_type') == identifier_type:
+            return identifier.get('identifier')
+    return None
+
+
+def _shipment_fields(shipment_type: str, data: Dict[str, Any], source: str) -> Dict[str, Any]:
+    status = (data.get('status') or '')
+    merchant_id = data.get('team_id')
+    return {
+        'merchant_id': int(merchant_id) if merchant_id not in (None, '') else None,
+        'name': (data.get('name') or '')[:255],
+        'normalized_name': normalize_name(data.get('name'))[:255],
+        'status': status[:50],
+        'notes': data.get('notes'),
+        'archived': status == 'archived' or bool(data.get('archived_at')),
+        'remote_created_at': _parse_dt(data.get('created_at')),
+        'remote_updated_at': _parse_dt(data.get('updated_at')),
+        'shipped_at': _parse_dt(data.get('shipped_at')),
+        'received_at': _parse_dt(data.get('received_at')),
+        'payload': {k: v for k, v in data.items() if k not in ('outbound_items', 'inbound_items', 'items')},
+        'source': source,
+    }
+
+
+def _item_fields(shipment_type: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+    inventory_item = raw.get('item') if isinstance(raw.get('item'), dict) else {}
+    if shipment_type == 'inbound':
+        expected = raw.get('expected') if isinstance(raw.get('expected'), dict) else {}
+        actual = raw.get('actual') if isinstance(raw.get('actual'), dict) else {}
+        quantity = expected.get('quantity', raw.get('quantity')) or 0
+        actual_quantity = actual.get('quantity')
+    else:
+        quantity = raw.get('quantity') or 0
+        actual_quantity = None
+    item_id = raw.get('item_id') or inventory_item.get('id')
+    return {
+        'line_id': raw.get('id'),
+        'item_id': int(item_id) if item_id else None,
+        'merchant_sku': inventory_item.get('merchant_sku') or raw.get('merchant_sku') or raw.get('sku'),
+        'asin': inventory_item.get('asin') or _identifier(inventory_item, 'ASIN') or raw.get('asin'),
+        'fnsku': inventory_item.get('fnsku') or _identifier(inventory_item, 'FNSKU') or raw.get('fnsku'),
+        'title': ((inventory_item.get('title') or raw.get('title') or raw.get('name')) or '')[:500] or None,
+        'quantity': int(quantity),
+        'actual_quantity': int(actual_quantity) if actual_quantity is not None else None,
+    }
+
+
+def upsert_shipment(
+    shipment_type: str,
+    data: Any,
+    source: str = 'sync'
+) -> Tuple[MirrorShipment, bool]:
+    """
+    Crea o aggiorna la spedizione nel mirror.
+
+    Un aggiornamento più vecchio di quello già salvato (webhook arrivato in
+    ritardo) viene ignorato.
+
+    Returns:
+        (spedizione, changed) - changed è True se la versione remota è cambiata
+    """
+    data = _as_dict(data)
+    fields = _shipment_fields(shipment_type, data, source)
+    shipment_id = int(data['id'])
+
+    with transaction.atomic():
+        existing = (
+            MirrorShipment.objects.select_for_update()
+            .filter(shipment_type=shipment_type, shipment_id=shipment_id)
+            .first()
+        )
+        if existing is None:
+            shipment = MirrorShipment.objects.create(shipment_type=shipment_type, shipment_id=shipment_id, **fields)
+            index_shipment(shipment)
+            return shipment, True
+
+        remote_updated_at = fields['remote_updated_at']
+        if existing.remote_updated_at and remote_updated_at and remote_updated_at < existing.remote_updated_at:
+            logger.debug(f"[MIRROR] {shipment_type} {shipment_id}: aggiornamento più vecchio di quello salvato, ignorato")
+            return existing, False
+
+        changed = existing.remote_updated_at != remote_updated_at or existing.status != fields['status']
+        reindex = existing.name != fields['name'] or existing.archived != fields['archived']
+        for name, value in fields.items():
+            setattr(existing, name, value)
+        existing.save()
+        if reindex:
+            index_shipment(existing)
+        return existing, changed
+
+
+def replace_items(shipment: MirrorShipment, raw_items: Iterable[Any]) -> int:
+    """Sostituisce gli items della spedizione nel mirror. Restituisce il numero di righe salvate."""
+    rows = [
+        MirrorShipmentItem(shipment=shipment, **_item_fields(shipment.shipment_type, _as_dict(raw)))
+        for raw in raw_items
+    ]
+    with transaction.atomic():
+        shipment.items.all().delete()
+        MirrorShipmentItem.objects.bulk_create(rows)
+        shipment.items_updated_at = shipment.remote_updated_at or timezone.now()
+        shipment.save(update_fields=['items_updated_at'])
+        index_shipment(shipment)
+    return len(rows)
+
+
+def upsert_from_webhook(event_type: str, data: Dict[str, Any]) -> Optional[MirrorShipment]:
+    """
+    Aggiorna il mirror con il payload di un webhook di spedizione.
+
+    Args:
+        event_type: event_type inferito dal webhook (es. 'outbound_shipment.closed')
+        data: Dati della spedizione (``payload['data']``)
+
+    Returns:
+        La spedizione aggiornata, o None se l'evento non riguarda una spedizione
+    """
+    if not event_type or not data or not data.get('id'):
+        return None
+    if event_type.startswith('inbound_shipment'):
+        shipment_type, raw_items = 'inbound', data.get('inbound_items') or data.get('items')
+    elif event_type.startswith('outbound_shipment'):
+        shipment_type, raw_items = 'outbound', data.get('outbound_items')
+    else:
+        return None
+
+    shipment, changed = upsert_shipment(shipment_type, data, source='webhook')
+    if isinstance(raw_items, list) and raw_items and (changed or shipment.items_stale):
+        replace_items(shipment, raw_items)
+    if isinstance(raw_items, list):
+        inventory_index.remember_items(shipment.merchant_id, raw_items)
+    logger.info(
+        f"[MIRROR] Webhook {event_type}: {shipment_type} {shipment.shipment_id} aggiornata "
+        f"(items {'aggiornati' if not shipment.items_stale else 'da riscaricare'})"
+    )
+    return shipment
+
+
+def _fetch_items(client: Any, shipment: MirrorShipment) -> List[Any]:
+    if shipment.shipment_type == 'inbound':
+        return list(client.get_inbound_shipment_items(shipment.shipment_id, merchant_id=shipment.merchant_id).items)
+    return list(client.get_outbound_shipment_items(shipment.shipment_id, merchant_id=shipment.merchant_id).items)
+
+
+def _iter_remote(client: Any, merchant_id: int, shipment_type: str, full: bool) -> Iterable[Iterable[Any]]:
+    # Una sorgente per lista: per gli outbound anche le archiviate
+    if shipment_type == 'inbound':
+        return [client.iter_inbound_shipments(merchant_id=merchant_id, per_page=100, prefetch=full)]
+    return [
+        client.iter_outbound_shipments(merchant_id=merchant_id, per_page=100, prefetch=full),
+        client.iter_outbound_shipments(merchant_id=merchant_id, per_page=100, archived=True, prefetch=full),
+    ]
+
+
+def sync_shipments(
+    client: Any,
+    merchant_id: int,
+    shipment_type: str,
+    full: bool = False,
+    refresh_items: bool = True
+) -> Dict[str, Any]:
+    """
+    Riconcilia il mirror di un merchant per un tipo di spedizione.
+
+    Args:
+        client: PrepBusinessClient
+        merchant_id: ID del merchant
+        shipment_type: 'inbound' o 'outbound'
+        full: Scorre tutte le spedizioni invece di fermarsi al watermark
+        refresh_items: Riscarica gli items delle spedizioni cambiate (False: solo le
+            spedizioni, gli items restano da riscaricare alla prossima sincronizzazione)
+
+    Returns:
+        Riepilogo: spedizioni lette, aggiornate, items riscaricati, nuovo watermark
+    """
+    state, _ = MirrorSyncState.objects.get_or_create(key=f"{shipment_type}:{merchant_id}")
+    threshold = state.watermark - WATERMARK_OVERLAP if state.watermark and not full else None
+    newest = state.watermark
+    seen = updated = refreshed = 0
+    state.last_run_at = timezone.now()
+
+    try:
+        for source in _iter_remote(client, merchant_id, shipment_type, full):
+            stale_run = 0
+            ordered, previous = True, None
+            for remote in source:
+                seen += 1
+                remote_updated_at = _parse_dt(getattr(remote, 'updated_at', None))
+                if ordered and previous is not None and remote_updated_at is not None and remote_updated_at > previous:
+                    ordered = False
+                    logger.warning(
+                        f"[MIRROR] Lista {shipment_type} del merchant {merchant_id} non ordinata per aggiornamento: "
+                        f"la leggo tutta"
+                    )
+                previous = remote_updated_at or previous
+                if threshold is not None and remote_updated_at is not None and remote_updated_at <= threshold:
+                    if not ordered:
+                        continue
+                    stale_run += 1
+                    if stale_run >= STALE_RUN_LIMIT:
+                        break
+                    continue
+                stale_run = 0
+
+                shipment, changed = upsert_shipment(shipment_type, remote)
+                if changed:
+                    updated += 1
+                if remote_updated_at and (newest is None or remote_updated_at > newest):
+                    newest = remote_updated_at
+
+        # Items da riscaricare: spedizioni cambiate ora o segnalate dai webhook senza items
+        stale = MirrorShipment.objects.filter(merchant_id=merchant_id, shipment_type=shipment_type).filter(
+            Q(items_updated_at__isnull=True) | Q(items_updated_at__lt=F('remote_updated_at'))
+        ).order_by('-remote_updated_at')[:MAX_ITEM_REFRESHES if refresh_items else 0]
+        for shipment in stale:
+            replace_items(shipment, _fetch_items(client, shipment))
+            refreshed += 1
+    except Exception as e:
+        state.last_error = str(e)[:2000]
+        state.save()
+        raise
+
+    state.watermark = newest
+    state.last_success_at = timezone.now()
+    state.last_error = None
+    state.shipments_synced = updated
+    state.save()
+
+    summary = {
+        'merchant_id': merchant_id,
+        'shipment_type': shipment_type,
+        'full': full,
+        'seen': seen,
+        'updated': updated,
+        'items_refreshed': refreshed,
+        'watermark': newest.isoformat() if newest else None,
+    }
+    logger.info(f"[MIRROR] Sync {shipment_type} merchant {merchant_id}: {summary}")
+    return summary
+
+
+def sync_all(client: Any, full: bool = False, shipment_types: Iterable[str] = SHIPMENT_TYPES) -> Dict[str, Any]:
+    """
+    Riconcilia il mirror per tutti i merchant. L'errore di un merchant non
+    blocca gli altri: viene riportato nel riepilogo e in MirrorSyncState.
+    """
+    merchant_ids = [m.id for m in client.get_merchants().data]
+    results, errors = [], []
+    for merchant_id in merchant_ids:
+        for shipment_type in shipment_types:
+            try:
+                results.append(sync_shipments(client, merchant_id, shipment_type, full=full))
+            except Exception as e:
+                logger.error(f"[MIRROR] Sync {shipment_type} merchant {merchant_id} fallita: {e}")
+                errors.append({'merchant_id': merchant_id, 'shipment_type': shipment_type, 'error': str(e)})
+    return {
+        'merchants': len(merchant_ids),
+        'updated': sum(r['updated'] for r in results),
+        'items_refreshed': sum(r['items_refreshed'] for r in results),
+        'results': results,
+        'errors': errors,
+    }
+
+
+def is_mirror_ready(merchant_id: Any, shipment_type: str) -> bool:
+    """True se il mirror del merchant per questo tipo è stato sincronizzato almeno una volta."""
+    return MirrorSyncState.objects.filter(
+        key=f"{shipment_type}:{merchant_id}", last_success_at__isnull=False
+    ).exists()
+
+
+def find_shipment_by_name(
+    client: Any,
+    merchant_id: Any,
+    shipment_type: str,
+    name: str
+) -> Optional[MirrorShipment]:
+    """
+    Spedizione del merchant con questo nome (confronto su ``normalize_name``).
+
+    Se il mirror del merchant è pronto la ricerca è una lookup sull'indice
+    (merchant_id, shipment_type, normalized_name); se non trova nulla esegue una
+    sincronizzazione incrementale (la spedizione può essere appena stata creata)
+    e riprova. Se il mirror non è ancora stato sincronizzato scorre le spedizioni
+    dall'API e salva nel mirror quella trovata.
+
+    Con più spedizioni con lo stesso nome restituisce la più recente.
+    """
+    normalized = normalize_name(name)
+    if not normalized:
+        return None
+    merchant_id = int(merchant_id)
+
+    def lookup() -> Optional[MirrorShipment]:
+        return MirrorShipment.objects.filter(
+            merchant_id=merchant_id, shipment_type=shipment_type, normalized_name=normalized
+        ).order_by('-remote_created_at', '-shipment_id').first()
+
+    if is_mirror_ready(merchant_id, shipment_type):
+        shipment = lookup()
+        if shipment is None and client is not None:
+            logger.info(f"[MIRROR] '{name}' non nel mirror {shipment_type} del merchant {merchant_id}, sync incrementale")
+            sync_shipments(client, merchant_id, shipment_type, refresh_items=False)
+            shipment = lookup()
+        return shipment
+
+    if client is None:
+        return lookup()
+    if shipment_type == 'inbound':
+        remotes = client.stream_inbound_shipments(merchant_id=merchant_id, per_page=500)
+    else:
+        remotes = client.iter_outbound_shipments(merchant_id=merchant_id, per_page=100)
+    for remote in remotes:
+        if normalize_name(getattr(remote, 'name', '')) == normalized:
+            shipment, _ = upsert_shipment(shipment_type, remote)
+            return shipment
+    return None
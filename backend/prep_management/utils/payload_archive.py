@@ -0,0 +1,158 @@
+"""
+Archivio compresso dei payload dei webhook delle spedizioni.
+
+Ogni ``ShipmentStatusUpdate`` conserva il JSON completo del webhook (con
+``products_info``): dopo ``PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS``
+giorni dall'elaborazione il payload viene compresso (zstd se ``zstandard`` è
+installato, altrimenti zlib) in ``WebhookPayloadArchive`` e tolto dalla
+tabella dei webhook, che resta piccola per dashboard, deduplicazione e coda.
+
+Lettura trasparente: ``ShipmentStatusUpdate.get_payload()`` decomprime al primo
+accesso; rielaborare un webhook archiviato (``restore_payload``) lo riporta
+nella tabella, e alla prossima archiviazione torna nell'archivio.
+
+L'archivio è raggruppato per mese di ricezione: con
+``PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS`` > 0 i mesi più vecchi vengono
+eliminati interi (``purge_archive``).
+"""
+import json
+import logging
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from libs.config import PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS, PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS
+from ..models import ShipmentStatusUpdate, WebhookPayloadArchive
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    # Senza zstandard si archivia con zlib; le righe zstd esistenti restano leggibili solo con la libreria
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger('prep_management')
+
+# Solo webhook con elaborazione conclusa: quelli in coda o in retry servono ancora al worker
+ARCHIVABLE_STATUSES = ('done', 'failed', 'duplicate', 'superseded', 'dead_letter')
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 9
+
+
+def compress(payload: Any) -> Tuple[str, bytes, int]:
+    """Codec, payload compresso e dimensione del JSON non compresso."""
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if ZSTD_AVAILABLE:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), len(raw)
+    return 'zlib', zlib.compress(raw, ZLIB_LEVEL), len(raw)
+
+
+def decompress(codec: str, data: bytes) -> Any:
+    if codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Payload archiviato con zstd: installare la libreria zstandard per leggerlo")
+        raw = zstandard.ZstdDecompressor().decompress(bytes(data))
+    else:
+        raw = zlib.decompress(bytes(data))
+    return json.loads(raw)
+
+
+def month_key(received_at: Any) -> str:
+    return timezone.localtime(received_at).strftime('%Y-%m')
+
+
+def load_payload(update_id: int) -> Optional[Any]:
+    """Payload archiviato del webhook (None se non c'è o il suo mese è stato eliminato)."""
+    archive = WebhookPayloadArchive.objects.filter(update_id=update_id).values_list('codec', 'data').first()
+    if archive is None:
+        return None
+    return decompress(*archive)
+
+
+def restore_payload(update: ShipmentStatusUpdate) -> Optional[Any]:
+    """Riporta il payload archiviato nella tabella dei webhook (es. prima di rielaborarlo)."""
+    if not update.payload_archived:
+        return update.payload
+    with transaction.atomic():
+        payload = load_payload(update.id)
+        ShipmentStatusUpdate.objects.filter(id=update.id).update(payload=payload, payload_archived=False)
+        WebhookPayloadArchive.objects.filter(update_id=update.id).delete()
+    update.payload, update.payload_archived = payload, False
+    logger.info(f"[PAYLOAD_ARCHIVE] Payload del webhook {update.id} ripristinato dall'archivio")
+    return payload
+
+
+def archive_payloads(days: int = PREP_BUSINESS_WEBHOOK_PAYLOAD_RETENTION_DAYS, batch_size: int = 500,
+                     limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Sposta nell'archivio i payload dei webhook conclusi ricevuti da più di ``days`` giorni.
+
+    Returns:
+        Webhook archiviati, byte JSON originali e byte compressi
+    """
+    candidates = ShipmentStatusUpdate.objects.filter(
+        processing_status__in=ARCHIVABLE_STATUSES,
+        created_at__lt=timezone.now() - timedelta(days=days),
+        payload_archived=False,
+        payload__isnull=False,
+    )
+    stats = {'archived': 0, 'raw_bytes': 0, 'compressed_bytes': 0}
+    while limit is None or stats['archived'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats['archived'])
+        with transaction.atomic():
+            # Righe bloccate fino al commit: un replay concorrente non le rimette in coda a metà
+            batch = list(candidates.select_for_update(skip_locked=True).order_by('id').values_list(
+                'id', 'created_at', 'payload'
+            )[:size])
+            if not batch:
+                break
+            archives = []
+            for update_id, created_at, payload in batch:
+                codec, data, raw_size = compress(payload)
+                archives.append(WebhookPayloadArchive(
+                    update_id=update_id, month=month_key(created_at), codec=codec, data=data, raw_size=raw_size
+                ))
+                stats['raw_bytes'] += raw_size
+                stats['compressed_bytes'] += len(data)
+            WebhookPayloadArchive.objects.bulk_create(archives)
+            ShipmentStatusUpdate.objects.filter(id__in=[row[0] for row in batch]).update(payload=None, payload_archived=True)
+        stats['archived'] += len(batch)
+    if stats['archived']:
+        logger.info(
+            f"[PAYLOAD_ARCHIVE] {stats['archived']} payload archiviati: "
+            f"{stats['raw_bytes'] / 1024:.0f} KB → {stats['compressed_bytes'] / 1024:.0f} KB"
+        )
+    return stats
+
+
+def purge_archive(months: int = PREP_BUSINESS_WEBHOOK_ARCHIVE_PURGE_MONTHS) -> int:
+    """
+    Elimina l'archivio dei mesi di ricezione precedenti agli ultimi ``months`` (0 = nessuno).
+    I webhook restano, con ``get_payload()`` che restituisce None.
+    """
+    if months <= 0:
+        return 0
+    today = timezone.localdate()
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    deleted, _ = WebhookPayloadArchive.objects.filter(month__lt=f'{year:04d}-{month + 1:02d}').delete()
+    if deleted:
+        logger.info(f"[PAYLOAD_ARCHIVE] Eliminati {deleted} payload archiviati più vecchi di {months} mesi")
+    return deleted
+
+
+def archive_stats() -> Dict[str, Dict[str, int]]:
+    """Per mese: payload archiviati, byte JSON originali e byte compressi."""
+    rows = WebhookPayloadArchive.objects.values('month').annotate(
+        count=Count('update_id'), raw_bytes=Sum('raw_size'), compressed_bytes=Sum(Length('data'))
+    ).order_by('month')
+    return {
+        row['month']: {'count': row['count'], 'raw_bytes': row['raw_bytes'] or 0, 'compressed_bytes': row['compressed_bytes'] or 0}
+        for row in rows
+    }
@@ -0,0 +1,244 @@
+"""
+Indice full-text delle spedizioni del mirror locale (nome spedizione e
+titolo/SKU/ASIN/FNSKU degli items), usato dalla ricerca spedizioni per prodotto.
+
+- PostgreSQL: tabella ``prep_management_mirrorshipment_search`` con una colonna
+  ``tsvector`` e indice GIN; ranking con ``ts_rank_cd``.
+- SQLite: tabella virtuale FTS5 ``prep_management_mirrorshipment_fts``;
+  ranking con ``bm25``.
+- Altri database (o SQLite senza FTS5): filtro ``icontains`` sull'ORM,
+  ordinato per data di aggiornamento.
+
+Le tabelle vengono create dalla migrazione 0027; il mirror (``utils.mirror``)
+reindicizza la spedizione ogni volta che nome o items cambiano. Per
+ricostruire l'indice da zero: ``python manage.py rebuild_shipment_search_index``.
+"""
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from ..models import MirrorShipment
+
+logger = logging.getLogger('prep_management')
+
+PG_TABLE = 'prep_management_mirrorshipment_search'
+FTS_TABLE = 'prep_management_mirrorshipment_fts'
+
+# Peso delle colonne nel ranking: un match sul nome o su un codice (SKU/ASIN/FNSKU)
+# conta più di un match sul titolo di uno degli items
+FTS_WEIGHTS = (4.0, 1.0, 4.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Backend rilevato per alias di database (la presenza della tabella FTS5 non cambia a runtime)
+_backends: Dict[str, str] = {}
+
+
+def parse_keywords(search_terms: str) -> List[str]:
+    """Keywords separate da virgola, in minuscolo e senza quelle vuote."""
+    return [kw.strip().lower() for kw in (search_terms or '').split(',') if kw.strip()]
+
+
+def _tokens(keyword: str) -> List[str]:
+    return _TOKEN_RE.findall(keyword.lower())
+
+
+def _backend() -> str:
+    alias = connection.alias
+    if alias not in _backends:
+        if connection.vendor == 'postgresql':
+            backend = 'postgresql' if PG_TABLE in connection.introspection.table_names() else 'orm'
+        elif connection.vendor == 'sqlite':
+            backend = 'fts5' if FTS_TABLE in connection.introspection.table_names() else 'orm'
+        else:
+            backend = 'orm'
+        _backends[alias] = backend
+    return _backends[alias]
+
+
+def _document(shipment: MirrorShipment) -> Dict[str, Any]:
+    titles, codes = [], []
+    for title, sku, asin, fnsku in shipment.items.values_list('title', 'merchant_sku', 'asin', 'fnsku'):
+        if title:
+            titles.append(title)
+        codes.extend(code for code in (sku, asin, fnsku) if code)
+    return {
+        'name': shipment.name or '',
+        'titles': '\n'.join(titles),
+        'codes': ' '.join(codes),
+    }
+
+
+def index_shipment(shipment: MirrorShipment) -> None:
+    """Aggiorna la voce della spedizione nell'indice full-text."""
+    backend = _backend()
+    if backend == 'orm':
+        return
+    doc = _document(shipment)
+    with connection.cursor() as cursor:
+        if backend == 'postgresql':
+            cursor.execute(
+                f"""
+                INSERT INTO {PG_TABLE} (shipment_pk, merchant_id, shipment_type, archived, document)
+                VALUES (%s, %s, %s, %s,
+                        setweight(to_tsvector('simple', %s), 'A') ||
+                        setweight(to_tsvector('simple', %s), 'A') ||
+                        setweight(to_tsvector('simple', %s), 'B'))
+                ON CONFLICT (shipment_pk) DO UPDATE SET
+                    merchant_id = EXCLUDED.merchant_id,
+                    shipment_type = EXCLUDED.shipment_type,
+                    archived = EXCLUDED.archived,
+                    document = EXCLUDED.document
+                """,
+                [shipment.pk, shipment.merchant_id, shipment.shipment_type, shipment.archived,
+                 doc['name'], doc['codes'], doc['titles']]
+            )
+        else:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [shipment.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, titles, codes, merchant_id, shipment_type, archived) "
+                f"VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                [shipment.pk, doc['name'], doc['titles'], doc['codes'],
+                 shipment.merchant_id, shipment.shipment_type, int(shipment.archived)]
+            )
+
+
+def rebuild_index(batch_size: int = 500) -> int:
+    """Svuota e ricostruisce l'indice per tutte le spedizioni del mirror. Restituisce quante ne ha indicizzate."""
+    _backends.pop(connection.alias, None)
+    backend = _backend()
+    if backend == 'orm':
+        logger.info("[SEARCH_INDEX] Nessun indice full-text disponibile su questo database, ricostruzione saltata")
+        return 0
+    count = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {PG_TABLE if backend == 'postgresql' else FTS_TABLE}")
+        for shipment in MirrorShipment.objects.order_by('pk').iterator(chunk_size=batch_size):
+            index_shipment(shipment)
+            count += 1
+    logger.info(f"[SEARCH_INDEX] Indice ricostruito ({backend}): {count} spedizioni")
+    return count
+
+
+def _pg_query(keywords: Iterable[str], operator: str):
+    # Una parola sola cerca per prefisso; più parole (o un codice come SKU-101-00005) cercano la
+    # frase esatta, con lo stesso parser usato per indicizzare. Tra keyword vale OR/AND.
+    fragments, params = [], []
+    for keyword in keywords:
+        tokens = _tokens(keyword)
+        if len(tokens) == 1:
+            fragments.append("to_tsquery('simple', %s)")
+            params.append(f"{tokens[0]}:*")
+        elif tokens:
+            fragments.append("phraseto_tsquery('simple', %s)")
+            params.append(keyword)
+    return f" {'&&' if operator == 'AND' else '||'} ".join(fragments), params
+
+
+def _fts_query(keywords: Iterable[str], operator: str) -> str:
+    # Frase con prefisso sull'ultima parola: "prova 7" trova anche "prova 70"
+    phrases = [' '.join(_tokens(keyword)) for keyword in keywords]
+    return f" {operator} ".join(f'"{phrase}"*' for phrase in phrases if phrase)
+
+
+def _filters(merchant_id: Any, shipment_type: Optional[str], archived: Optional[bool], archived_as_int: bool):
+    clauses, params = [], []
+    if merchant_id not in (None, ''):
+        clauses.append('merchant_id = %s')
+        params.append(int(merchant_id))
+    if shipment_type:
+        clauses.append('shipment_type = %s')
+        params.append(shipment_type)
+    if archived is not None:
+        clauses.append('archived = %s')
+        params.append(int(archived) if archived_as_int else archived)
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def _search_orm(keywords, operator, merchant_id, shipment_type, archived, limit) -> List[int]:
+    queryset = MirrorShipment.objects.all()
+    if merchant_id not in (None, ''):
+        queryset = queryset.filter(merchant_id=int(merchant_id))
+    if shipment_type:
+        queryset = queryset.filter(shipment_type=shipment_type)
+    if archived is not None:
+        queryset = queryset.filter(archived=archived)
+
+    # Come la ricerca via API: la keyword è una sottostringa di nome, titolo o codice
+    conditions = [
+        Q(name__icontains=keyword) | Q(items__title__icontains=keyword) |
+        Q(items__merchant_sku__icontains=keyword) | Q(items__asin__icontains=keyword) |
+        Q(items__fnsku__icontains=keyword)
+        for keyword in keywords
+    ]
+    if operator == 'AND':
+        # Ogni keyword può essere soddisfatta da un item diverso: un filter() per keyword
+        for condition in conditions:
+            queryset = queryset.filter(pk__in=MirrorShipment.objects.filter(condition).values('pk'))
+    else:
+        combined = Q()
+        for condition in conditions:
+            combined |= condition
+        queryset = queryset.filter(pk__in=MirrorShipment.objects.filter(combined).values('pk'))
+    return list(queryset.order_by('-remote_updated_at', '-pk').values_list('pk', flat=True)[:limit])
+
+
+def search(
+    keywords: Iterable[str],
+    search_type: str = 'OR',
+    merchant_id: Any = None,
+    shipment_type: Optional[str] = None,
+    archived: Optional[bool] = None,
+    limit: int = 100
+) -> List[MirrorShipment]:
+    """
+    Cerca le spedizioni del mirror per keyword, in ordine di rilevanza.
+
+    Args:
+        keywords: Keywords (vedi ``parse_keywords``); una parola sola cerca per
+            prefisso, più parole cercano la frase
+        search_type: 'OR' (almeno una keyword) o 'AND' (tutte le keyword)
+        merchant_id: Limita al merchant indicato
+        shipment_type: 'inbound' o 'outbound'
+        archived: Limita alle spedizioni archiviate (True) o attive (False)
+        limit: Numero massimo di spedizioni restituite
+
+    Returns:
+        Spedizioni ordinate dalla più rilevante
+    """
+    keywords = [kw for kw in keywords if _tokens(kw)]
+    if not keywords:
+        return []
+    operator = 'AND' if str(search_type).upper() == 'AND' else 'OR'
+    backend = _backend()
+
+    if backend == 'orm':
+        ids = _search_orm(keywords, operator, merchant_id, shipment_type, archived, limit)
+    else:
+        with connection.cursor() as cursor:
+            if backend == 'postgresql':
+                tsquery, query_params = _pg_query(keywords, operator)
+                where, params = _filters(merchant_id, shipment_type, archived, archived_as_int=False)
+                cursor.execute(
+                    f"SELECT shipment_pk FROM {PG_TABLE}, (SELECT {tsquery} AS query) q "
+                    f"WHERE document @@ q.query{where} "
+                    f"ORDER BY ts_rank_cd(document, q.query) DESC, shipment_pk DESC LIMIT %s",
+                    [*query_params, *params, limit]
+                )
+            else:
+                where, params = _filters(merchant_id, shipment_type, archived, archived_as_int=True)
+                weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+                cursor.execute(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{where} "
+                    f"ORDER BY bm25({FTS_TABLE}, {weights}), rowid DESC LIMIT %s",
+                    [_fts_query(keywords, operator), *params, limit]
+                )
+            ids = [row[0] for row in cursor.fetchall()]
+
+    # Le voci di spedizioni cancellate dal mirror nel frattempo vengono scartate
+    shipments = MirrorShipment.objects.in_bulk(ids)
+    return [shipments[pk] for pk in ids if pk in shipments]
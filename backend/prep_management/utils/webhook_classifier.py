@@ -0,0 +1,141 @@
+"""
+Classificazione dei webhook delle spedizioni PrepBusiness.
+
+I webhook reali arrivano come ``{"data": {...}}`` senza tipo di evento: il tipo
+(``inbound_shipment.created``, ``outbound_shipment.closed``, ...) si ricava dai
+campi della spedizione in due passi, entrambi guidati da tabelle:
+
+1. direzione (inbound/outbound): ``DIRECTION_RULES``, la prima regola che
+   scatta decide; se nessuna scatta la spedizione è inbound;
+2. evento: ``EVENT_RULES`` della direzione, in base a status e shipped_at.
+
+Le regole guardano solo campi di primo livello del payload (chiavi e un
+numero fisso di campi testo), mai gli items: il costo non cresce con il numero
+di prodotti. In precedenza il marcatore "outbound" veniva cercato in
+``str(payload).lower()``, payload intero compreso ogni item.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger('prep_management')
+
+INBOUND = 'inbound'
+OUTBOUND = 'outbound'
+
+# Campi testo di primo livello in cui un marcatore ("outbound", "residual", ...) è significativo
+MARKER_TEXT_FIELDS = ('name', 'notes', 'internal_notes', 'type', 'shipment_type', 'entity_type', 'object')
+# Campi presenti solo nelle spedizioni outbound
+OUTBOUND_ONLY_FIELDS = ('ship_from_address_id',)
+OUTBOUND_FLAGS = ('is_case_forwarding', 'is_case_packed')
+
+
+@dataclass(frozen=True)
+class ShipmentFacts:
+    """Campi del payload usati dalle regole, estratti una volta sola."""
+    status: str
+    shipped: bool
+    name: str
+    notes: str
+    keys: frozenset
+    payload: Mapping[str, Any]
+
+    @classmethod
+    def from_payload(cls, data: Mapping[str, Any]) -> 'ShipmentFacts':
+        return cls(
+            status=str(data.get('status') or '').lower(),
+            shipped=bool(data.get('shipped_at')),
+            name=str(data.get('name') or '').upper(),
+            notes=str(data.get('notes') or '').lower(),
+            keys=frozenset(data.keys()),
+            payload=data,
+        )
+
+
+@dataclass(frozen=True)
+class Classification:
+    event_type: str
+    direction: str
+    # Regola di direzione che ha deciso (None = default inbound)
+    rule: Optional[str]
+
+
+def _is_residual(facts: ShipmentFacts) -> bool:
+    return 'RESIDUAL' in facts.name or 'residual' in facts.notes
+
+
+def _is_partial(facts: ShipmentFacts) -> bool:
+    return 'PARTIAL' in facts.name or 'partial' in facts.notes
+
+
+def _has_outbound_key(facts: ShipmentFacts) -> bool:
+    # outbound_items, outbound_shipment_id, ... (numero di chiavi fisso, non dipende dagli items)
+    return any('outbound' in key.lower() for key in facts.keys)
+
+
+def _has_outbound_text(facts: ShipmentFacts) -> bool:
+    payload = facts.payload
+    return any(
+        isinstance(payload.get(field), str) and 'outbound' in payload[field].lower()
+        for field in MARKER_TEXT_FIELDS
+    )
+
+
+def _has_outbound_fields(facts: ShipmentFacts) -> bool:
+    payload = facts.payload
+    return any(field in facts.keys for field in OUTBOUND_ONLY_FIELDS) or any(
+        payload.get(flag) for flag in OUTBOUND_FLAGS
+    )
+
+
+# (nome, condizione, direzione): valutate in ordine, la prima vera decide
+DIRECTION_RULES: Tuple[Tuple[str, Callable[[ShipmentFacts], bool], str], ...] = (
+    # RESIDUAL e PARTIAL sono sempre inbound, anche se il payload parla di outbound
+    ('residual', _is_residual, INBOUND),
+    ('partial', _is_partial, INBOUND),
+    ('outbound_items', lambda f: 'outbound_items' in f.keys, OUTBOUND),
+    ('outbound_marker', lambda f: _has_outbound_key(f) or _has_outbound_text(f), OUTBOUND),
+    # Gli inbound raramente hanno status="closed" (più spesso "received")
+    ('closed_and_shipped', lambda f: f.status == 'closed' and f.shipped, OUTBOUND),
+    ('outbound_fields', _has_outbound_fields, OUTBOUND),
+)
+
+# Per direzione: (condizione, azione) valutate in ordine; l'ultima regola è il default
+EVENT_RULES: Dict[str, Tuple[Tuple[Callable[[ShipmentFacts], bool], str], ...]] = {
+    INBOUND: (
+        (lambda f: f.status == 'open', 'created'),
+        (lambda f: f.status == 'received', 'received'),
+        (lambda f: f.shipped, 'shipped'),
+        (lambda f: True, 'updated'),
+    ),
+    OUTBOUND: (
+        (lambda f: f.status == 'open', 'created'),
+        (lambda f: f.status == 'closed' and f.shipped, 'closed'),
+        (lambda f: f.shipped, 'shipped'),
+        (lambda f: True, 'updated'),
+    ),
+}
+
+
+def classify(data: Mapping[str, Any]) -> Classification:
+    """Direzione e tipo di evento di un webhook dai campi della spedizione (``payload['data']``)."""
+    facts = ShipmentFacts.from_payload(data or {})
+    direction, rule = INBOUND, None
+    for name, condition, rule_direction in DIRECTION_RULES:
+        if condition(facts):
+            direction, rule = rule_direction, name
+            break
+    for condition, action in EVENT_RULES[direction]:
+        if condition(facts):
+            return Classification(f'{direction}_shipment.{action}', direction, rule)
+    raise AssertionError('EVENT_RULES senza regola di default')  # pragma: no cover
+
+
+def infer_event_type(data: Mapping[str, Any]) -> str:
+    """Tipo di evento del webhook (vedi ``classify``)."""
+    classification = classify(data)
+    logger.info(
+        f"[infer_event_type] Shipment {(data or {}).get('id')}: {classification.event_type} "
+        f"(regola={classification.rule or 'default'})"
+    )
+    return classification.event_type
@@ -0,0 +1,486 @@
+"""
+Coda di elaborazione dei webhook delle spedizioni.
+
+La view ``shipment_status_webhook`` salva il payload grezzo in un
+``ShipmentStatusUpdate`` con ``processing_status='queued'`` e risponde subito
+202; tutto il resto (nome del merchant, deduplicazione, mirror, handler degli
+eventi) gira sui worker della coda Celery ``webhooks``.
+
+Ordine per spedizione: ogni webhook ha una corsia (``lane``), crc32 dello
+shipment_id modulo ``PREP_BUSINESS_WEBHOOK_LANES``. Il task
+``drain_webhook_lane`` prende il lease della corsia (``WebhookLane``) ed
+elabora i webhook in coda uno alla volta in ordine di id: ``created`` e
+``closed`` della stessa spedizione non vanno mai in parallelo, spedizioni su
+corsie diverse sì.
+
+Accorpamento (``PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS`` > 0): un webhook non
+viene elaborato prima di ``not_before``; se nel frattempo è arrivato un webhook
+più recente della stessa spedizione e della stessa famiglia di eventi
+(``event_family``) viene segnato ``superseded`` senza chiamate API né
+notifiche, e resta solo l'ultimo stato della raffica.
+
+Retry: un'elaborazione fallita torna in coda con ``not_before`` spostato di un
+backoff esponenziale con jitter (``retry_delay``); dopo
+``PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS`` tentativi il webhook passa in
+``dead_letter``. Lo sweeper riprende i retry scaduti; per rielaborare in blocco
+webhook falliti: ``python manage.py replay_webhooks``.
+
+Semantica at-least-once:
+
+- il task usa ``acks_late``: se il worker muore il messaggio torna sul broker
+  e, con lo stesso task id, riprende il lease della corsia;
+- un worker prende in carico un webhook solo passando atomicamente da
+  ``queued`` a ``processing`` (due consegne dello stesso messaggio non lo
+  elaborano due volte);
+- la stessa consegna ripetuta dal mittente (stesso tipo evento e stessi dati)
+  ha la stessa ``idempotency_key`` e viene rifiutata alla ricezione dal
+  vincolo unique, anche tra processi gunicorn diversi;
+- lo sweeper periodico (``sweep_webhook_updates``) rimette in coda i webhook
+  che nessun worker ha preso (broker non raggiungibile al momento della
+  ricezione) e quelli rimasti in ``processing`` oltre
+  ``PREP_BUSINESS_WEBHOOK_STUCK_SECONDS``;
+- i task che svuotano le corsie hanno come limite rigido
+  ``PREP_BUSINESS_WEBHOOK_STUCK_SECONDS`` (``DRAIN_TIME_LIMIT``) e il lease dura
+  di più: un webhook lento non perde la corsia né viene ripreso dallo sweeper
+  mentre il suo task è ancora vivo.
+"""
+import hashlib
+import json
+import logging
+import random
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+
+from libs.config import (
+    PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS, PREP_BUSINESS_WEBHOOK_LANES, PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS,
+    PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS, PREP_BUSINESS_WEBHOOK_RETRY_MAX_SECONDS,
+    PREP_BUSINESS_WEBHOOK_STUCK_SECONDS
+)
+from ..models import ShipmentStatusUpdate, WebhookLane
+from .merchant_directory import get_merchant_directory
+from .mirror import upsert_from_webhook
+from .payload_archive import restore_payload
+
+logger = logging.getLogger('prep_management')
+
+# Finestra entro cui un webhook con stessi shipment_id ed event_type è considerato duplicato
+DEDUP_WINDOW = timedelta(minutes=5)
+# Un webhook appena salvato viene lasciato al task accodato dalla view per questo tempo
+# prima che lo sweeper lo consideri perso
+QUEUED_GRACE = timedelta(seconds=30)
+# Chiave in cache della finestra di deduplicazione (SETNX con TTL su Redis)
+DEDUP_CACHE_KEY = 'prep_management:webhook_dedup:{shipment_id}:{event_type}'
+# Backend di cache che non sono condivisi tra processi
+_PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Limite rigido (time_limit Celery) dei task che svuotano una corsia: un webhook in processing
+# da più di PREP_BUSINESS_WEBHOOK_STUCK_SECONDS appartiene per forza a un task già terminato
+DRAIN_TIME_LIMIT = PREP_BUSINESS_WEBHOOK_STUCK_SECONDS
+# Passata metà del limite un task non prende altri webhook e rimette in coda la corsia,
+# così quello in corso ha sempre almeno l'altra metà per finire
+DRAIN_BUDGET_SECONDS = DRAIN_TIME_LIMIT / 2
+# Durata del lease di una corsia, rinnovato prima di ogni webhook. È più lungo del limite rigido
+# del task: finché il task che lo tiene è vivo, anche durante un webhook lento, nessun altro
+# drain prende la corsia e rimette in coda il webhook in elaborazione
+LANE_LEASE = timedelta(seconds=DRAIN_TIME_LIMIT + 60)
+# Webhook elaborati per task prima di lasciare la corsia a un nuovo task (le altre corsie non aspettano)
+MAX_UPDATES_PER_DRAIN = 100
+# Eventi sempre elaborati: outbound_shipment.closed può cambiare i prodotti e richiedere nuove spedizioni
+ALWAYS_PROCESS_EVENTS = ('outbound_shipment.closed',)
+# Eventi con un handler dedicato: si accorpano solo con eventi dello stesso tipo
+DEDICATED_HANDLER_EVENTS = ('outbound_shipment.created',)
+
+
+def idempotency_key(event_type: str, data: Any) -> str:
+    """SHA-256 di tipo evento e dati del webhook (JSON canonico, chiavi ordinate)."""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{event_type}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+def event_family(event_type: str) -> Optional[str]:
+    """
+    Famiglia di eventi entro cui una raffica viene accorpata: l'entità
+    (``inbound_shipment``, ``outbound_shipment``, ...) o il tipo stesso per gli
+    eventi con handler dedicato. None per gli eventi che non si accorpano mai.
+    """
+    if not event_type or event_type in ALWAYS_PROCESS_EVENTS:
+        return None
+    if event_type in DEDICATED_HANDLER_EVENTS:
+        return event_type
+    return event_type.split('.', 1)[0]
+
+
+def _same_family(family: str) -> Q:
+    if family in DEDICATED_HANDLER_EVENTS:
+        return Q(event_type=family)
+    return Q(event_type__startswith=f'{family}.') & ~Q(event_type__in=ALWAYS_PROCESS_EVENTS + DEDICATED_HANDLER_EVENTS)
+
+
+def debounce_until(event_type: str, received_at: Optional[Any] = None) -> Optional[Any]:
+    """``not_before`` di un webhook appena ricevuto, o None se non va accorpato."""
+    if PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS <= 0 or event_family(event_type) is None:
+        return None
+    return (received_at or timezone.now()) + timedelta(seconds=PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS)
+
+
+def find_superseding(update: ShipmentStatusUpdate) -> Optional[int]:
+    """
+    Id del webhook più recente in coda della stessa spedizione e famiglia, se c'è.
+    Solo con l'accorpamento attivo e al primo tentativo: il ``not_before`` di un retry è
+    il backoff (``_fail``), non una finestra di accorpamento, e il retry va eseguito.
+    """
+    family = event_family(update.event_type)
+    if PREP_BUSINESS_WEBHOOK_DEBOUNCE_SECONDS <= 0 or family is None:
+        return None
+    # claim ha già contato il tentativo in corso
+    if update.not_before is None or update.attempts > 1:
+        return None
+    return ShipmentStatusUpdate.objects.filter(
+        _same_family(family), lane=update.lane, shipment_id=update.shipment_id,
+        processing_status='queued', id__gt=update.id
+    ).order_by('-id').values_list('id', flat=True).first()
+
+
+def lane_for(shipment_id: Any) -> int:
+    """Corsia della spedizione. Cambiando il numero di corsie l'ordine vale solo per i webhook nuovi."""
+    return zlib.crc32(str(shipment_id).encode('utf-8')) % max(PREP_BUSINESS_WEBHOOK_LANES, 1)
+
+
+def dispatch_lanes(lanes: Iterable[int], countdown: Optional[float] = None) -> int:
+    """
+    Accoda lo svuotamento delle corsie indicate sulla coda ``webhooks``.
+    Un broker non raggiungibile non è un errore: i webhook restano ``queued``
+    e li riprende lo sweeper.
+
+    Returns:
+        Numero di corsie accodate
+    """
+    from ..tasks import drain_webhook_lane
+
+    count = 0
+    for lane in sorted(set(lanes)):
+        try:
+            drain_webhook_lane.apply_async((lane,), countdown=countdown)
+            count += 1
+        except Exception as e:
+            logger.error(f"[WEBHOOK_QUEUE] Impossibile accodare la corsia {lane}, la riprenderà lo sweeper: {e}")
+            break
+    return count
+
+
+def enqueue(update_ids: Iterable[int]) -> int:
+    """Accoda lo svuotamento delle corsie dei webhook indicati. Restituisce il numero di corsie accodate."""
+    update_ids = list(update_ids)
+    if not update_ids:
+        return 0
+    lanes = ShipmentStatusUpdate.objects.filter(id__in=update_ids).values_list('lane', flat=True).distinct()
+    return dispatch_lanes(lanes)
+
+
+def enqueue_on_commit(lane: int, not_before: Optional[Any] = None) -> None:
+    """
+    Accoda la corsia del webhook dopo il commit della transazione che l'ha salvato
+    (alla fine della finestra di accorpamento, se il webhook ne ha una).
+    """
+    countdown = max((not_before - timezone.now()).total_seconds(), 0) if not_before else None
+    transaction.on_commit(lambda: dispatch_lanes([lane], countdown=countdown))
+
+
+def claim(update_id: int) -> bool:
+    """
+    Prende in carico il webhook (queued → processing) contando il tentativo.
+    False se un altro worker l'ha già preso.
+    """
+    return ShipmentStatusUpdate.objects.filter(id=update_id, processing_status='queued').update(
+        processing_status='processing', processing_started_at=timezone.now(), attempts=F('attempts') + 1
+    ) == 1
+
+
+def _finish(update_id: int, processing_status: str, **fields: Any) -> None:
+    ShipmentStatusUpdate.objects.filter(id=update_id).update(processing_status=processing_status, **fields)
+
+
+def retry_delay(attempts: int) -> float:
+    """Secondi prima del tentativo successivo al numero ``attempts``: backoff esponenziale con jitter."""
+    delay = min(PREP_BUSINESS_WEBHOOK_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), PREP_BUSINESS_WEBHOOK_RETRY_MAX_SECONDS)
+    # Metà fissa e metà casuale: i webhook falliti insieme (API giù) non ritornano tutti nello stesso istante
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _fail(update_id: int, attempts: int, message: Any) -> Dict[str, Any]:
+    """Rimette in coda il webhook con backoff o, esauriti i tentativi, lo manda in dead letter."""
+    if attempts < PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS:
+        delay = retry_delay(attempts)
+        _finish(update_id, 'queued', processing_started_at=None, process_success=False,
+                not_before=timezone.now() + timedelta(seconds=delay),
+                process_message=f"Tentativo {attempts}/{PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS} fallito: {message}")
+        logger.warning(
+            f"[WEBHOOK_QUEUE] Webhook {update_id}: tentativo {attempts}/{PREP_BUSINESS_WEBHOOK_MAX_ATTEMPTS} "
+            f"fallito, nuovo tentativo tra {delay:.0f}s: {message}"
+        )
+        return {'update_id': update_id, 'success': False, 'retry_in': round(delay, 1)}
+    _finish(update_id, 'dead_letter', processing_started_at=None, process_success=False,
+            process_message=f"Dead letter dopo {attempts} tentativi: {message}")
+    logger.error(f"[WEBHOOK_QUEUE] Webhook {update_id} in dead letter dopo {attempts} tentativi: {message}")
+    return {'update_id': update_id, 'success': False, 'dead_letter': True}
+
+
+def _shared_cache() -> bool:
+    return settings.CACHES.get('default', {}).get('BACKEND') not in _PROCESS_LOCAL_CACHES
+
+
+def find_duplicate(update: ShipmentStatusUpdate) -> Optional[ShipmentStatusUpdate]:
+    """
+    Webhook con stessi shipment_id ed event_type già elaborato nei DEDUP_WINDOW
+    precedenti, se c'è.
+
+    Con una cache condivisa (Redis) la finestra è una chiave con TTL creata con
+    ``cache.add``: atomica tra worker e senza query. Altrimenti una query sull'indice
+    (shipment_id, event_type, created_at): vince sempre il webhook con id minore.
+    """
+    if update.event_type in ALWAYS_PROCESS_EVENTS:
+        return None
+    if _shared_cache():
+        key = DEDUP_CACHE_KEY.format(shipment_id=update.shipment_id, event_type=update.event_type)
+        if cache.add(key, update.id, timeout=int(DEDUP_WINDOW.total_seconds())):
+            return None
+        owner_id = cache.get(key)
+        # Una nuova consegna dello stesso task trova la chiave creata da sé stesso
+        if owner_id in (None, update.id):
+            return None
+        return ShipmentStatusUpdate.objects.filter(id=owner_id).first()
+    return ShipmentStatusUpdate.objects.filter(
+        shipment_id=update.shipment_id,
+        event_type=update.event_type,
+        created_at__gte=update.created_at - DEDUP_WINDOW,
+        created_at__lte=update.created_at,
+        id__lt=update.id,
+    ).exclude(processing_status__in=('duplicate', 'superseded')).order_by('-id').first()
+
+
+def process_update(update_id: int) -> Dict[str, Any]:
+    """
+    Elabora un webhook in coda: nome del merchant, deduplicazione, aggiornamento
+    del mirror e handler dell'evento (``WebhookEventProcessor``).
+    """
+    from ..event_handlers import WebhookEventProcessor
+
+    if not claim(update_id):
+        logger.info(f"[WEBHOOK_QUEUE] Webhook {update_id} già preso in carico o elaborato, salto")
+        return {'skipped': True, 'update_id': update_id}
+
+    try:
+        update = ShipmentStatusUpdate.objects.get(id=update_id)
+
+        superseded_by = find_superseding(update)
+        if superseded_by:
+            logger.info(
+                f"[WEBHOOK_QUEUE] Webhook {update_id} superato dal {superseded_by} "
+                f"(shipment_id={update.shipment_id}, event_type={update.event_type})"
+            )
+            _finish(update_id, 'superseded', processed=True, processed_at=timezone.now(),
+                    process_message=f"Superato dal webhook {superseded_by}")
+            return {'superseded': True, 'update_id': update_id, 'superseded_by': superseded_by}
+
+        if update.merchant_id and not update.merchant_name:
+            try:
+                update.merchant_name = get_merchant_directory().name(update.merchant_id)
+                if update.merchant_name:
+                    ShipmentStatusUpdate.objects.filter(id=update_id).update(merchant_name=update.merchant_name)
+            except Exception as e:
+                logger.error(f"Errore nel recupero del nome del merchant: {str(e)}")
+
+        duplicate_of = find_duplicate(update)
+        if duplicate_of:
+            logger.warning(
+                f"[webhook_dedup_smart] 🛡️ WEBHOOK DUPLICATO RECENTE - shipment_id={update.shipment_id}, "
+                f"event_type={update.event_type}, existing_id={duplicate_of.id}, created_at={duplicate_of.created_at}"
+            )
+            _finish(update_id, 'duplicate', processed=True, processed_at=timezone.now(),
+                    process_message=f"Duplicato del webhook {duplicate_of.id}")
+            return {'duplicate': True, 'update_id': update_id, 'duplicate_of': duplicate_of.id}
+
+        # Aggiorna il mirror locale delle spedizioni: un errore qui non deve bloccare l'elaborazione
+        payload = restore_payload(update) or {}
+        try:
+            upsert_from_webhook(update.event_type, payload.get('data', payload))
+        except Exception as e:
+            logger.error(f"[webhook_mirror] Errore aggiornamento mirror per shipment_id={update.shipment_id}: {e}")
+
+        # process_event segna il webhook come done/failed; un fallimento (anche prima di
+        # arrivare all'handler, es. client non disponibile) passa dalla politica di retry
+        result = WebhookEventProcessor().process_event(update_id)
+        if not result.get('success', False):
+            return _fail(update_id, update.attempts, result.get('message'))
+        return {'update_id': update_id, 'success': True}
+    except Exception as e:
+        logger.error(f"[WEBHOOK_QUEUE] Errore nell'elaborazione del webhook {update_id}: {e}", exc_info=True)
+        attempts = ShipmentStatusUpdate.objects.filter(id=update_id).values_list('attempts', flat=True).first() or 1
+        return _fail(update_id, attempts, e)
+
+
+def acquire_lane(lane: int, owner: str) -> bool:
+    """
+    Prende (o rinnova) il lease della corsia. Riesce se la corsia è libera, se il
+    lease è scaduto o se è già di ``owner``.
+    """
+    WebhookLane.objects.get_or_create(lane=lane)
+    now = timezone.now()
+    return WebhookLane.objects.filter(lane=lane).filter(
+        Q(owner__isnull=True) | Q(lease_expires_at__lt=now) | Q(owner=owner)
+    ).update(owner=owner, lease_expires_at=now + LANE_LEASE) == 1
+
+
+def release_lane(lane: int, owner: str, processed: int = 0) -> None:
+    WebhookLane.objects.filter(lane=lane, owner=owner).update(
+        owner=None, lease_expires_at=None, last_drained_at=timezone.now(),
+        processed_count=F('processed_count') + processed
+    )
+
+
+def _next_due(queue) -> Optional[int]:
+    """
+    Primo webhook della corsia elaborabile adesso: il più vecchio in coda la cui finestra
+    di accorpamento è scaduta e che non ha davanti un webhook della stessa spedizione in attesa.
+    """
+    now = timezone.now()
+    queued = queue.filter(processing_status='queued')
+    # Tutto in SQL: anche centinaia di webhook in attesa in testa alla corsia non la fermano
+    waiting_before = queued.filter(not_before__gt=now, shipment_id=OuterRef('shipment_id'), id__lt=OuterRef('id'))
+    return queued.filter(Q(not_before__isnull=True) | Q(not_before__lte=now)).filter(
+        ~Exists(waiting_before)
+    ).order_by('id').values_list('id', flat=True).first()
+
+
+def drain_lane(lane: int, owner: str, max_updates: int = MAX_UPDATES_PER_DRAIN) -> Dict[str, Any]:
+    """
+    Elabora in ordine di arrivo i webhook in coda della corsia, tenendone il lease.
+    Se un altro task ha il lease non fa nulla: i webhook nuovi li vedrà lui.
+    """
+    if not acquire_lane(lane, owner):
+        return {'lane': lane, 'skipped': True}
+
+    queue = ShipmentStatusUpdate.objects.filter(lane=lane)
+    # Con il lease in mano, un webhook della corsia ancora in processing è di un worker morto:
+    # torna in coda per primo, prima di quelli arrivati dopo
+    orphaned = queue.filter(processing_status='processing').update(processing_status='queued', processing_started_at=None)
+    if orphaned:
+        logger.warning(f"[WEBHOOK_QUEUE] Corsia {lane}: {orphaned} webhook interrotti rimessi in coda")
+
+    processed = 0
+    started = time.monotonic()
+    try:
+        while processed < max_updates and time.monotonic() - started < DRAIN_BUDGET_SECONDS:
+            update_id = _next_due(queue)
+            if update_id is None:
+                break
+            if not acquire_lane(lane, owner):
+                logger.warning(f"[WEBHOOK_QUEUE] Corsia {lane}: lease perso, interrompo")
+                return {'lane': lane, 'processed': processed, 'lease_lost': True}
+            process_update(update_id)
+            processed += 1
+    finally:
+        release_lane(lane, owner, processed)
+
+    # Un webhook arrivato mentre il lease veniva rilasciato (o oltre max_updates o il budget) non resta fermo;
+    # quelli ancora nella finestra di accorpamento vengono ripresi alla scadenza
+    if _next_due(queue) is not None:
+        dispatch_lanes([lane])
+    else:
+        next_at = queue.filter(processing_status='queued', not_before__gt=timezone.now()).aggregate(
+            next_at=Min('not_before')
+        )['next_at']
+        if next_at:
+            dispatch_lanes([lane], countdown=max((next_at - timezone.now()).total_seconds(), 0))
+    return {'lane': lane, 'processed': processed}
+
+
+def replay(update_ids: Iterable[int]) -> int:
+    """
+    Rimette in coda i webhook indicati (tranne quelli in elaborazione) con un nuovo
+    budget di tentativi. Non li accoda: vedi ``enqueue`` o ``drain_lane``.
+
+    Returns:
+        Numero di webhook rimessi in coda
+    """
+    return ShipmentStatusUpdate.objects.filter(id__in=list(update_ids)).exclude(processing_status='processing').update(
+        processing_status='queued', processing_started_at=None, not_before=None, attempts=0
+    )
+
+
+def sweep(stuck_seconds: int = PREP_BUSINESS_WEBHOOK_STUCK_SECONDS, limit: int = 500) -> Dict[str, int]:
+    """
+    Rimette in coda i webhook rimasti ``queued`` oltre QUEUED_GRACE e quelli
+    in ``processing`` da più di ``stuck_seconds``. Con ``stuck_seconds`` non
+    inferiore a ``DRAIN_TIME_LIMIT`` il task che li elaborava è già stato terminato.
+    """
+    now = timezone.now()
+    stuck_ids = list(ShipmentStatusUpdate.objects.filter(
+        processing_status='processing', processing_started_at__lt=now - timedelta(seconds=stuck_seconds)
+    ).order_by('created_at').values_list('id', flat=True)[:limit])
+    if stuck_ids:
+        logger.warning(f"[WEBHOOK_QUEUE] {len(stuck_ids)} webhook bloccati in elaborazione, li rimetto in coda")
+        ShipmentStatusUpdate.objects.filter(id__in=stuck_ids, processing_status='processing').update(
+            processing_status='queued', processing_started_at=None
+        )
+
+    queued_ids = list(ShipmentStatusUpdate.objects.filter(
+        Q(not_before__isnull=True) | Q(not_before__lt=now - QUEUED_GRACE),
+        processing_status='queued', created_at__lt=now - QUEUED_GRACE
+    ).exclude(id__in=stuck_ids).order_by('created_at').values_list('id', flat=True)[:limit])
+    lanes = enqueue(stuck_ids + queued_ids)
+    if stuck_ids or queued_ids:
+        logger.info(f"[WEBHOOK_QUEUE] Sweep: {len(stuck_ids) + len(queued_ids)} webhook fermi, {lanes} corsie rimesse in coda")
+    return {'stuck': len(stuck_ids), 'queued': len(queued_ids), 'lanes': lanes}
+
+
+def queue_stats() -> Dict[str, Any]:
+    """Webhook per stato di elaborazione ed età del più vecchio ancora in coda."""
+    counts = dict(
+        ShipmentStatusUpdate.objects.order_by().values_list('processing_status').annotate(total=Count('id'))
+    )
+    oldest = ShipmentStatusUpdate.objects.filter(processing_status='queued').order_by('created_at').values_list(
+        'created_at', flat=True
+    ).first()
+    return {
+        'counts': {status: counts.get(status, 0) for status, _ in ShipmentStatusUpdate.PROCESSING_STATUS_CHOICES},
+        'oldest_queued_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else None,
+        'lanes': lane_stats(),
+    }
+
+
+def lane_stats() -> List[Dict[str, Any]]:
+    """
+    Per corsia: profondità (webhook in coda o in elaborazione), ritardo (età del più
+    vecchio) e lease corrente. Le corsie vuote e mai usate sono omesse.
+    """
+    now = timezone.now()
+    backlog = {
+        row['lane']: row for row in ShipmentStatusUpdate.objects.filter(
+            processing_status__in=('queued', 'processing')
+        ).order_by().values('lane').annotate(depth=Count('id'), oldest=Min('created_at'))
+    }
+    leases = {lane.lane: lane for lane in WebhookLane.objects.all()}
+    stats = []
+    for lane in sorted(set(backlog) | set(leases)):
+        row, lease = backlog.get(lane, {}), leases.get(lane)
+        held = bool(lease and lease.owner and lease.lease_expires_at and lease.lease_expires_at > now)
+        stats.append({
+            'lane': lane,
+            'depth': row.get('depth', 0),
+            'lag_seconds': round((now - row['oldest']).total_seconds(), 1) if row.get('oldest') else 0.0,
+            'owner': lease.owner if held else None,
+            'processed': lease.processed_count if lease else 0,
+            'last_drained_at': lease.last_drained_at.isoformat() if lease and lease.last_drained_at else None,
+        })
+    return stats
@@ -26,6 +26,7 @@ from .event_handlers import WebhookEventProcessor
 from django.utils import timezone
 from datetime import timedelta, datetime
 from libs.prepbusiness.client import PrepBusinessClient
+from libs.prepbusiness.models import RateLimitError, CircuitOpenError
 from libs.config import PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_URL
 from enum import Enum
 from functools import wraps
@@ -35,6 +36,8 @@ from django.core.cache import cache
 from .tasks import process_shipment_batch, echo_task, process_shipment_search_task
 from .utils.extractors import extract_product_info_from_dict
 from .utils.clients import get_client
+from .utils.webhook_classifier import infer_event_type
+from .utils.webhook_queue import debounce_until, enqueue_on_commit, idempotency_key, lane_for, queue_stats
 # from django.contrib.auth.decorators import login_required
 
 from libs.config import (
@@ -48,7 +51,9 @@ import re
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from rest_framework.permissions import AllowAny
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.urls import reverse
 from libs.prepbusiness.client import PrepBusinessClient as OfficialPrepBusinessClient
 from libs.config import PREP_BUSINESS_API_URL, PREP_BUSINESS_API_KEY, PREP_BUSINESS_API_TIMEOUT
 from .models import PrepBusinessConfig
@@ -114,14 +119,9 @@ def open_shipments(request):
     return JsonResponse(data, safe=False)
 
 def get_prep_business_client():
-    """Helper function to initialize the official client."""
+    """Helper function returning the process-wide shared official client."""
     try:
-        domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-        return OfficialPrepBusinessClient(
-            api_key=PREP_BUSINESS_API_KEY,
-            company_domain=domain,
-            timeout=PREP_BUSINESS_API_TIMEOUT
-        )
+        return get_client()
     except Exception as e:
         logger.error(f"Errore inizializzazione client PrepBusiness in views: {e}")
         return None
@@ -190,7 +190,8 @@ def shipment_status_webhook(request):
     Webhook per ricevere notifiche di cambio stato delle spedizioni.
     
     Questo endpoint riceve notifiche POST quando lo stato di una spedizione cambia.
-    Salva i dati ricevuti nel database per essere visualizzati e processati.
+    Salva il payload nel database e risponde 202: l'elaborazione avviene sui worker
+    della coda 'webhooks' (stato su webhook/status/<id>/).
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST method allowed'}, status=405)
@@ -204,86 +205,7 @@ def shipment_status_webhook(request):
         # I webhook reali hanno formato: {"data": {...}} senza event_type
         data = webhook_data.get('data', webhook_data)  # Fallback se non c'è 'data'
         
-        # Inferisci l'event_type dai dati della spedizione
-        def infer_event_type(shipment_data):
-            """Inferisce il tipo di evento dai dati della spedizione"""
-            status = shipment_data.get('status', '').lower()
-            shipped_at = shipment_data.get('shipped_at')
-            shipment_id = shipment_data.get('id')
-            shipment_name = shipment_data.get('name', '')
-            notes = shipment_data.get('notes', '')
-            
-            # Determina se è inbound o outbound dai campi presenti
-            has_outbound_items = 'outbound_items' in shipment_data
-            has_inbound_items = 'inbound_items' in shipment_data or 'items' in shipment_data
-            
-            # CONTROLLO PRIORITARIO: Se è un RESIDUAL o PARTIAL, è sempre INBOUND
-            is_residual = 'RESIDUAL' in shipment_name.upper() or 'residual' in notes.lower()
-            is_partial = 'PARTIAL' in shipment_name.upper() or 'partial' in notes.lower()
-            
-            if is_residual or is_partial:
-                shipment_type = "RESIDUAL" if is_residual else "PARTIAL"
-                logger.info(f"[infer_event_type] 🎯 Shipment {shipment_id}: {shipment_type} rilevato → FORZATO INBOUND")
-                # Per i residual e partial, determina solo il tipo di evento inbound
-                if status == 'open':
-                    return 'inbound_shipment.created'
-                elif status == 'received':
-                    return 'inbound_shipment.received'
-                elif shipped_at:
-                    return 'inbound_shipment.shipped'
-                else:
-                    return 'inbound_shipment.updated'
-            
-            # MIGLIORAMENTO: Logica più intelligente per riconoscere outbound shipments
-            # 1. Se ha outbound_items espliciti
-            is_outbound = has_outbound_items
-            
-            # 2. Se contiene "outbound" nel payload (MA NON nei residual o partial)
-            if not is_outbound:
-                payload_str = str(shipment_data).lower()
-                # Escludi i residual e partial da questa logica
-                if 'outbound' in payload_str and not (is_residual or is_partial):
-                    is_outbound = True
-            
-            # 3. Se è status="closed" con shipped_at, probabilmente è outbound
-            # (gli inbound raramente hanno status="closed", più spesso "received")
-            if not is_outbound and status == 'closed' and shipped_at:
-                logger.info(f"[infer_event_type] 🔍 Shipment {shipment_id}: status=closed + shipped_at presente → probabilmente OUTBOUND")
-                is_outbound = True
-            
-            # 4. Controllo più specifico per outbound
-            # Se ha ship_from_address_id o è case_forwarding, è probabilmente outbound
-            if not is_outbound and ('ship_from_address_id' in shipment_data or 
-                                   shipment_data.get('is_case_forwarding') or 
-                                   shipment_data.get('is_case_packed')):
-                logger.info(f"[infer_event_type] 🔍 Shipment {shipment_id}: caratteristiche outbound specifiche → OUTBOUND")
-                is_outbound = True
-            
-            # Logica per determinare il tipo di evento
-            if is_outbound:
-                # È una spedizione outbound
-                logger.info(f"[infer_event_type] ✅ Shipment {shipment_id} riconosciuto come OUTBOUND (status={status}, shipped_at={bool(shipped_at)})")
-                if status == 'open':
-                    return 'outbound_shipment.created'
-                elif status == 'closed' and shipped_at:
-                    return 'outbound_shipment.closed'
-                elif shipped_at and not status == 'closed':
-                    return 'outbound_shipment.shipped'
-                else:
-                    return 'outbound_shipment.updated'
-            else:
-                # È una spedizione inbound (default)
-                logger.info(f"[infer_event_type] ✅ Shipment {shipment_id} riconosciuto come INBOUND (status={status}, shipped_at={bool(shipped_at)})")
-                if status == 'open':
-                    return 'inbound_shipment.created'
-                elif status == 'received':
-                    return 'inbound_shipment.received'
-                elif shipped_at:
-                    return 'inbound_shipment.shipped'
-                else:
-                    return 'inbound_shipment.updated'
-        
-        # Inferisci l'event_type
+        # Inferisci l'event_type dai campi della spedizione (vedi utils/webhook_classifier.py)
         event_type = infer_event_type(data)
         
         logger.info(f"[webhook_parsing] Webhook ricevuto per shipment {data.get('id')}: status={data.get('status')}, shipped_at={data.get('shipped_at')}, inferred_event_type={event_type}")
@@ -332,87 +254,56 @@ def shipment_status_webhook(request):
             'products_info': products_info
         }
         
-        # Crea il processore degli eventi
-        processor = WebhookEventProcessor()
+        # Arricchisci il payload con le informazioni sui prodotti
+        enriched_payload = processed_webhook_data['payload']
+        if products_info:
+            enriched_payload['products_info'] = products_info
+            logger.info(f"[webhook_save] Arricchito payload con informazioni prodotti: {products_info}")
         
-        # Definisci la funzione di callback per salvare e processare subito i dati
-        def save_webhook_data(webhook_data):
-            # Recupera il nome del merchant usando il team_id
-            merchant_id = webhook_data.get('merchant_id')
-            merchant_name = None
-            if merchant_id:
-                try:
-                    merchants = get_merchants()
-                    merchant = next((m for m in merchants if str(m['id']) == str(merchant_id)), None)
-                    if merchant:
-                        merchant_name = merchant['name']
-                except Exception as e:
-                    logger.error(f"Errore nel recupero del nome del merchant: {str(e)}")
-
-            # 🛡️ DEDUPLICAZIONE INTELLIGENTE: Permetti outbound_shipment.closed sempre
-            # Per altri eventi, controlla duplicati solo se arrivano entro 5 minuti
-            shipment_id = webhook_data.get('shipment_id')
-            event_type = webhook_data.get('event_type', 'other')
-            
-            # REGOLA SPECIALE: outbound_shipment.closed può sempre essere processato
-            # perché può cambiare i prodotti e richiedere nuova creazione di shipment
-            if event_type == 'outbound_shipment.closed':
-                logger.info(f"[webhook_dedup_smart] ✅ OUTBOUND_CLOSED sempre permesso - shipment_id={shipment_id}")
-            else:
-                # Per altri eventi, controlla duplicati recenti (ultimi 5 minuti)
-                from django.utils import timezone
-                from datetime import timedelta
-                
-                five_minutes_ago = timezone.now() - timedelta(minutes=5)
-                recent_webhook = ShipmentStatusUpdate.objects.filter(
-                    shipment_id=shipment_id,
+        # Salva il webhook in coda e rispondi subito: nome del merchant, deduplicazione,
+        # mirror ed elaborazione dell'evento girano nel worker (vedi utils/webhook_queue.py).
+        # Una consegna ripetuta (stessa chiave di idempotenza) viene rifiutata dal vincolo unique
+        key = idempotency_key(event_type, data)
+        try:
+            with transaction.atomic():
+                shipment_update = ShipmentStatusUpdate.objects.create(
+                    shipment_id=processed_webhook_data['shipment_id'],
                     event_type=event_type,
-                    created_at__gte=five_minutes_ago
-                ).first()
-                
-                if recent_webhook:
-                    logger.warning(f"[webhook_dedup_smart] 🛡️ WEBHOOK DUPLICATO RECENTE - shipment_id={shipment_id}, event_type={event_type}, existing_id={recent_webhook.id}, created_at={recent_webhook.created_at}")
-                    return recent_webhook
-                else:
-                    logger.info(f"[webhook_dedup_smart] ✅ WEBHOOK PERMESSO - shipment_id={shipment_id}, event_type={event_type} (nessun duplicato recente)")
-            
-            # Arricchisci il payload con le informazioni sui prodotti (NUOVA FUNZIONALITÀ MANTENUTA)
-            enriched_payload = webhook_data.get('payload', {})
-            products_info = webhook_data.get('products_info', {})
-            if products_info:
-                enriched_payload['products_info'] = products_info
-                logger.info(f"[webhook_save] Arricchito payload con informazioni prodotti: {products_info}")
-            
-            # Salva nuovo webhook (sicuro perché abbiamo controllato prima)
-            shipment_update = ShipmentStatusUpdate(
-                shipment_id=shipment_id,
-                event_type=event_type,
-                entity_type=webhook_data.get('entity_type', ''),
-                previous_status=webhook_data.get('previous_status'),
-                new_status=webhook_data.get('new_status', 'other'),
-                merchant_id=merchant_id,
-                merchant_name=merchant_name,
-                tracking_number=webhook_data.get('tracking_number'),
-                carrier=webhook_data.get('carrier'),
-                notes=webhook_data.get('notes'),
-                payload=enriched_payload  # Usa il payload arricchito
-            )
-            shipment_update.save()
-            logger.info(f"[webhook_saved] ✅ NUOVO webhook salvato ID: {shipment_update.id} per shipment_id={shipment_id}, event_type={event_type}")
-            
-            # Elabora subito l'evento appena salvato
-            processor.process_event(shipment_update.id)
-            return shipment_update
-        
-        # Salva e processa il webhook
-        saved_update = save_webhook_data(processed_webhook_data)
+                    entity_type=processed_webhook_data['entity_type'],
+                    previous_status=processed_webhook_data['previous_status'],
+                    new_status=processed_webhook_data['new_status'],
+                    merchant_id=processed_webhook_data['merchant_id'],
+                    tracking_number=processed_webhook_data['tracking_number'],
+                    carrier=processed_webhook_data['carrier'],
+                    notes=processed_webhook_data['notes'],
+                    payload=enriched_payload,
+                    processing_status='queued',
+                    lane=lane_for(processed_webhook_data['shipment_id']),
+                    not_before=debounce_until(event_type),
+                    idempotency_key=key
+                )
+                enqueue_on_commit(shipment_update.lane, shipment_update.not_before)
+        except IntegrityError:
+            existing = ShipmentStatusUpdate.objects.filter(idempotency_key=key).first()
+            if existing is None:
+                raise
+            logger.warning(f"[webhook_dedup] 🛡️ Consegna ripetuta del webhook {existing.id} - shipment_id={existing.shipment_id}, event_type={event_type}")
+            return JsonResponse({
+                'status': 'duplicate',
+                'message': 'Webhook already received',
+                'update_id': existing.id,
+                'event_type': event_type,
+                'status_url': reverse('webhook_update_status', args=[existing.id])
+            })
+        logger.info(f"[webhook_saved] ✅ Webhook in coda ID: {shipment_update.id} per shipment_id={shipment_update.shipment_id}, event_type={event_type}")
         
         return JsonResponse({
-            'status': 'success',
-            'message': 'Webhook processed successfully',
-            'update_id': saved_update.id if saved_update else None,
-            'event_type': event_type
-        })
+            'status': 'accepted',
+            'message': 'Webhook queued for processing',
+            'update_id': shipment_update.id,
+            'event_type': event_type,
+            'status_url': reverse('webhook_update_status', args=[shipment_update.id])
+        }, status=202)
         
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON payload'}, status=400)
@@ -696,6 +587,10 @@ def retry_on_error(max_retries=3, delay=1, backoff=2):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except (RateLimitError, CircuitOpenError):
+                    # Il client ha già rispettato Retry-After e fatto backoff (o il circuito è
+                    # aperto): ripetere qui terrebbe solo occupato il worker web
+                    raise
                 except Exception as e:
                     last_exception = e
                     if attempt < max_retries - 1:
@@ -932,7 +827,8 @@ def search_shipments_by_products(request):
             search_terms,
             merchant_id,
             shipment_status,
-            max_shipments_to_analyze
+            max_shipments_to_analyze,
+            context['search_type']
         )
         logger.info(f"[VIEW_POST] Task Celery process_shipment_search_task lanciato per search_id={search_id}")
         return JsonResponse({
@@ -2371,8 +2267,8 @@ def debug_webhook_payload(request, update_id):
     try:
         update = ShipmentStatusUpdate.objects.get(id=update_id)
         
-        # Estrai informazioni sui prodotti dal payload
-        payload = update.payload or {}
+        # Estrai informazioni sui prodotti dal payload (anche se già archiviato)
+        payload = update.get_payload() or {}
         data = payload.get('data', {})
         
         # Cerca outbound_items
@@ -2387,13 +2283,14 @@ def debug_webhook_payload(request, update_id):
             'merchant_id': update.merchant_id,
             'processed': update.processed,
             'process_success': update.process_success,
+            'payload_archived': update.payload_archived,
             'payload': payload,
             'outbound_items': outbound_items,
             'outbound_items_count': len(outbound_items),
             'total_quantity': sum(item.get('quantity', 0) for item in outbound_items),
             'products_info': products_info,
             'created_at': update.created_at.isoformat()
-        }, indent=2)
+        }, json_dumps_params={'indent': 2})
         
     except ShipmentStatusUpdate.DoesNotExist:
         return JsonResponse({
@@ -2582,7 +2479,7 @@ def debug_test2_payload(request):
                 'message': 'Nessun update test2 trovato'
             })
         
-        payload = last_update.payload or {}
+        payload = last_update.get_payload() or {}
         data = payload.get('data', {})
         
         return JsonResponse({
@@ -2595,7 +2492,7 @@ def debug_test2_payload(request):
             'outbound_items_in_data': data.get('outbound_items', []),
             'outbound_items_count': len(data.get('outbound_items', [])),
             'full_payload': payload
-        }, indent=2)
+        }, json_dumps_params={'indent': 2})
         
     except Exception as e:
         return JsonResponse({
@@ -2623,7 +2520,7 @@ def debug_latest_test2_raw(request):
                 'message': 'Nessun update test2 trovato'
             })
         
-        payload = last_update.payload or {}
+        payload = last_update.get_payload() or {}
         
         return JsonResponse({
             'success': True,
@@ -2639,7 +2536,7 @@ def debug_latest_test2_raw(request):
             'outbound_items_present': 'outbound_items' in payload.get('data', {}) if payload else False,
             'outbound_items_count': len(payload.get('data', {}).get('outbound_items', [])) if payload else 0,
             'outbound_items': payload.get('data', {}).get('outbound_items', []) if payload else []
-        }, indent=2)
+        }, json_dumps_params={'indent': 2})
         
     except Exception as e:
         logger.exception("Errore nel debug latest test2")
@@ -2731,6 +2628,7 @@ def debug_webhook_payload_simple(request, update_id):
     """
     try:
         update = ShipmentStatusUpdate.objects.get(id=update_id)
+        payload = update.get_payload()
         
         return JsonResponse({
             'update_id': update.id,
@@ -2739,10 +2637,11 @@ def debug_webhook_payload_simple(request, update_id):
             'processed': update.processed,
             'process_success': update.process_success,
             'process_message': update.process_message,
-            'payload': update.payload,
-            'payload_keys': list(update.payload.keys()) if update.payload else [],
-            'payload_has_data': 'data' in (update.payload or {}),
-            'payload_root_keys': list(update.payload.keys()) if update.payload else [],
+            'payload_archived': update.payload_archived,
+            'payload': payload,
+            'payload_keys': list(payload.keys()) if payload else [],
+            'payload_has_data': 'data' in (payload or {}),
+            'payload_root_keys': list(payload.keys()) if payload else [],
         })
         
     except ShipmentStatusUpdate.DoesNotExist:
@@ -3108,6 +3007,67 @@ def version_file(request):
         logger.error(f"Errore lettura file versione: {e}")
         return HttpResponse('error', content_type='text/plain')
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def prepbusiness_client_status(request):
+    """
+    Stato del client PrepBusiness condiviso del processo: hit/miss del registro,
+    riuso delle connessioni keep-alive (new_connections = handshake TLS effettuati)
+    e stato del circuit breaker (closed / open / half_open).
+    """
+    from libs.prepbusiness.registry import get_registry_stats
+
+    try:
+        return JsonResponse({
+            'success': True,
+            'circuit': get_client().circuit_stats(),
+            'registry': get_registry_stats(),
+        })
+    except Exception as e:
+        logger.error(f"Errore nel recupero stato client PrepBusiness: {e}", exc_info=True)
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def prepbusiness_metrics(request):
+    """
+    Istogrammi per-processo delle chiamate all'API PrepBusiness (latenza, byte
+    ricevuti, retry) per metodo, endpoint normalizzato e status (senza merchant:
+    l'endpoint è pubblico e non deve elencarli).
+    Con ?output=prometheus risponde nel formato testo di Prometheus, altrimenti
+    JSON con p50/p95 per serie, dalle più lente alle più veloci.
+    """
+    from libs.prepbusiness.metrics import get_request_metrics
+
+    metrics = get_request_metrics()
+    if request.GET.get('output') == 'prometheus':
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    return JsonResponse({'success': True, 'metrics': metrics.snapshot()})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def webhook_update_status(request, update_id):
+    """
+    Stato di elaborazione di un webhook accettato da shipment_status_webhook
+    (queued / processing / done / failed / duplicate), da interrogare dalla dashboard.
+    """
+    update = ShipmentStatusUpdate.objects.filter(id=update_id).values(
+        'id', 'shipment_id', 'event_type', 'processing_status', 'processed', 'process_success',
+        'process_message', 'created_at', 'processing_started_at', 'processed_at'
+    ).first()
+    if update is None:
+        return JsonResponse({'success': False, 'error': f'Update {update_id} non trovato'}, status=404)
+    return JsonResponse({'success': True, 'update': update})
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def webhook_queue_status(request):
+    """
+    Webhook per stato di elaborazione, età del più vecchio ancora in coda e, per
+    ogni corsia, profondità, ritardo e worker che la sta svuotando.
+    """
+    return JsonResponse({'success': True, 'queue': queue_stats()})
+
 @api_view(['POST'])
 @permission_classes([])
 def test_partial_inbound_creation(request):
@@ -3276,13 +3236,8 @@ def test_outbound_closed_process(request):
         
         # Inizializza client come nell'event processor
         try:
-            config = PrepBusinessConfig.objects.filter(is_active=True).first()
-            if config and config.api_url and config.api_key:
-                domain = config.api_url.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=config.api_key, company_domain=domain, timeout=config.api_timeout)
-            else:
-                domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=PREP_BUSINESS_API_KEY, company_domain=domain, timeout=PREP_BUSINESS_API_TIMEOUT)
+            from .utils.clients import get_configured_client
+            client = get_configured_client()
         except Exception as e:
             logger.error(f"Errore inizializzazione client: {e}")
             return JsonResponse({'error': f'Errore inizializzazione client: {e}'}, status=500)
@@ -3363,7 +3318,7 @@ def debug_last_update(request):
             'process_success': last_update.process_success,
             'process_message': last_update.process_message,
             'process_result': last_update.process_result,  # ✅ Campo corretto
-            'payload': last_update.payload
+            'payload': last_update.get_payload()
         })
         
     except Exception as e:
@@ -3387,13 +3342,8 @@ def debug_api_steps(request):
         
         # Inizializza client
         try:
-            config = PrepBusinessConfig.objects.filter(is_active=True).first()
-            if config and config.api_url and config.api_key:
-                domain = config.api_url.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=config.api_key, company_domain=domain, timeout=config.api_timeout)
-            else:
-                domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=PREP_BUSINESS_API_KEY, company_domain=domain, timeout=PREP_BUSINESS_API_TIMEOUT)
+            from .utils.clients import get_configured_client
+            client = get_configured_client()
         except Exception as e:
             return JsonResponse({'error': f'Errore inizializzazione client: {e}'}, status=500)
         
@@ -3484,13 +3434,8 @@ def test_partial_submit(request):
         
         # Inizializza client
         try:
-            config = PrepBusinessConfig.objects.filter(is_active=True).first()
-            if config and config.api_url and config.api_key:
-                domain = config.api_url.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=config.api_key, company_domain=domain, timeout=config.api_timeout)
-            else:
-                domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=PREP_BUSINESS_API_KEY, company_domain=domain, timeout=PREP_BUSINESS_API_TIMEOUT)
+            from .utils.clients import get_configured_client
+            client = get_configured_client()
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'Errore inizializzazione client: {e}'}, status=500)
         
@@ -3586,13 +3531,8 @@ def test_submit_approaches(request):
         
         # Inizializza client
         try:
-            config = PrepBusinessConfig.objects.filter(is_active=True).first()
-            if config and config.api_url and config.api_key:
-                domain = config.api_url.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=config.api_key, company_domain=domain, timeout=config.api_timeout)
-            else:
-                domain = PREP_BUSINESS_API_URL.replace('https://', '').split('/api')[0]
-                client = PrepBusinessClient(api_key=PREP_BUSINESS_API_KEY, company_domain=domain, timeout=PREP_BUSINESS_API_TIMEOUT)
+            from .utils.clients import get_configured_client
+            client = get_configured_client()
         except Exception as e:
             return JsonResponse({'error': f'Errore inizializzazione client: {e}'}, status=500)
         